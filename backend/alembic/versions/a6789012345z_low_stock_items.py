@@ -0,0 +1,64 @@
+"""Live low-stock list.
+
+Revision ID: a6789012345z
+Revises: z5678901234y
+Create Date: 2026-10-19
+
+`low_stock_items` holds one row per balance that has gone at or below its
+reorder level. `app.services.low_stock` maintains it from
+`apply_stock_movement` when a balance crosses the level. A row with no
+`cleared_at` is currently low. A cleared row is kept so that its
+`last_alerted_at` keeps debouncing alerts for that (warehouse, item).
+
+The backfill seeds the balances that are low today, without marking them as
+alerted.
+"""
+from alembic import op
+
+revision = 'a6789012345z'
+down_revision = 'z5678901234y'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS low_stock_items (
+            stock_level_id UUID PRIMARY KEY
+                REFERENCES stock_levels(id) ON DELETE CASCADE,
+            warehouse_id UUID NOT NULL,
+            product_id UUID,
+            raw_material_id UUID,
+            reorder_level NUMERIC(18,6) NOT NULL,
+            became_low_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            last_alerted_at TIMESTAMP WITH TIME ZONE,
+            cleared_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_low_stock_items_live
+            ON low_stock_items (became_low_at DESC)
+         WHERE cleared_at IS NULL
+    """)
+    op.execute("""
+        INSERT INTO low_stock_items
+            (stock_level_id, warehouse_id, product_id, raw_material_id,
+             reorder_level)
+        SELECT id, warehouse_id, product_id, raw_material_id, reorder_level
+          FROM (
+            SELECT sl.id, sl.warehouse_id, sl.product_id, sl.raw_material_id,
+                   sl.current_stock,
+                   CASE WHEN sl.product_id IS NOT NULL
+                        THEN COALESCE(NULLIF(sl.min_stock, 0), 10)
+                        ELSE COALESCE(NULLIF(rm.reorder_level::integer, 0), 10)
+                   END AS reorder_level
+              FROM stock_levels sl
+              LEFT JOIN raw_materials rm ON rm.id = sl.raw_material_id
+          ) levels
+         WHERE current_stock <= reorder_level
+        ON CONFLICT (stock_level_id) DO NOTHING
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS low_stock_items")
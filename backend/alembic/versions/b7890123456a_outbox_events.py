@@ -0,0 +1,49 @@
+"""Transactional outbox.
+
+Revision ID: b7890123456a
+Revises: a6789012345z
+Create Date: 2026-10-19
+
+`outbox_events` holds side effects (push notifications, reverse geocoding,
+MAPD retries, activity entries) written in the same transaction as the
+change that causes them. `app.services.outbox` delivers them afterwards.
+An event is pending while both `dispatched_at` and `failed_at` are NULL;
+the partial index covers exactly those rows, so the dispatcher's claim
+query stays small however much history is kept.
+"""
+from alembic import op
+
+revision = 'b7890123456a'
+down_revision = 'a6789012345z'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS outbox_events (
+            id BIGSERIAL PRIMARY KEY,
+            kind VARCHAR(40) NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            dispatched_at TIMESTAMP WITH TIME ZONE,
+            failed_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_outbox_events_pending
+            ON outbox_events (available_at, id)
+         WHERE dispatched_at IS NULL AND failed_at IS NULL
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_outbox_events_dispatched_at
+            ON outbox_events (dispatched_at)
+         WHERE dispatched_at IS NOT NULL
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS outbox_events")
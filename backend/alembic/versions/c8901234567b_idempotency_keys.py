@@ -0,0 +1,42 @@
+"""Idempotency keys for order, payment and intake writes.
+
+Revision ID: c8901234567b
+Revises: b7890123456a
+Create Date: 2026-10-19
+
+One row per (caller, route, Idempotency-Key), written by
+`app.services.idempotency`. `status_code` is NULL while the first attempt is
+running, and is then set together with the response to replay. Rows are
+pruned once `expires_at` passes.
+"""
+from alembic import op
+
+revision = 'c8901234567b'
+down_revision = 'b7890123456a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope_key CHAR(64) PRIMARY KEY,
+            request_hash CHAR(64) NOT NULL,
+            method VARCHAR(10) NOT NULL,
+            path VARCHAR(255) NOT NULL,
+            status_code INTEGER,
+            content_type VARCHAR(255),
+            response_body BYTEA,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            completed_at TIMESTAMP WITH TIME ZONE,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at
+            ON idempotency_keys (expires_at)
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS idempotency_keys")
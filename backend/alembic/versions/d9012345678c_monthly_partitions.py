@@ -0,0 +1,401 @@
+"""Monthly range partitions for the append-only tables.
+
+Revision ID: d9012345678c
+Revises: c8901234567b
+Create Date: 2026-10-19
+
+Stock movements, journal lines, attendance, Wi-Fi logs and sessions, the
+activity log, chat and the regulatory audit trail only ever grow. This
+migration converts each into a table partitioned by month on its timestamp,
+so a query bounded in time reads only the months it names. Old months can
+then be archived whole (`app.services.partitions`, `scripts/partitions.py`).
+
+Four SQL functions do the work, and the application calls them too:
+
+* `attach_month_partition(parent, part, month)` attaches a table as
+  `month`'s partition. Any rows of that month in the parent's DEFAULT
+  partition are moved into it through the parent, so row triggers see a
+  delete and a matching insert.
+* `create_month_partition(parent, month)` creates `<parent>_YYYYMM` and
+  attaches it. It does nothing if the partition already exists.
+* `default_partition_months(parent)` lists the months that have rows
+  waiting in the DEFAULT partition.
+* `partition_by_month(parent, key, months_ahead)` rebuilds a plain table as
+  a partitioned one: a DEFAULT partition, one partition per month from the
+  oldest row to `months_ahead` months from now, then the rows, primary key
+  (widened with the partition key), indexes, foreign keys and triggers.
+  It does nothing if the table is missing or already partitioned.
+
+Month boundaries are UTC midnights. `gl_journal_lines` gains `entry_date`,
+copied from its entry, so that it can be partitioned by posting date.
+`bump_change_version` now reports a partition's changes under its root table.
+
+The conversion rewrites each table once and holds an exclusive lock on it
+while it does. Run it in a maintenance window on a large database. The
+downgrade rebuilds plain tables the same way.
+"""
+from alembic import op
+
+revision = 'd9012345678c'
+down_revision = 'c8901234567b'
+branch_labels = None
+depends_on = None
+
+# Keep in step with app.services.partitions.TABLES.
+TABLES = {
+    'stock_movements': 'created_at',
+    'gl_journal_lines': 'entry_date',
+    'attendance': 'clock_in',
+    'wifi_auth_logs': 'timestamp',
+    'wifi_sessions': 'login_time',
+    'audit_logs': 'created_at',
+    'chat_messages': 'created_at',
+    'reg_audit_trail': 'created_at',
+}
+MONTHS_AHEAD = 3
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS partition_archives (
+            id SERIAL PRIMARY KEY,
+            parent_table VARCHAR(63) NOT NULL,
+            partition_name VARCHAR(63) NOT NULL,
+            range_start DATE NOT NULL,
+            range_end DATE NOT NULL,
+            file_path TEXT NOT NULL,
+            row_count BIGINT NOT NULL,
+            file_bytes BIGINT NOT NULL,
+            sha256 CHAR(64) NOT NULL,
+            archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            restored_at TIMESTAMP WITH TIME ZONE
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_partition_archives_parent_range
+            ON partition_archives (parent_table, range_start)
+    """)
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION attach_month_partition(
+            parent text, part text, month date) RETURNS void
+        SET timezone = 'UTC' AS $$
+        DECLARE
+            lo date := date_trunc('month', month)::date;
+            hi date := (date_trunc('month', month) + interval '1 month')::date;
+            dflt regclass := to_regclass(parent || '_default');
+            key text;
+            moved bigint := 0;
+        BEGIN
+            SELECT a.attname INTO key
+              FROM pg_partitioned_table p
+              JOIN pg_attribute a
+                ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+             WHERE p.partrelid = parent::regclass;
+            -- The default may not hold rows of a month being attached, so
+            -- they are set aside first and go back in through the parent
+            -- once the month is attached. Row triggers then see each
+            -- delete matched by an insert: inserting straight into the
+            -- unattached table fires nothing, and the daily balances
+            -- (trg_gl_daily_balance) would lose the moved lines.
+            IF dflt IS NOT NULL THEN
+                EXECUTE format('CREATE TEMP TABLE attach_moving (LIKE %I) '
+                               'ON COMMIT DROP', parent);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM %s WHERE %I >= %L AND %I < %L '
+                    'RETURNING *) INSERT INTO attach_moving SELECT * FROM moved',
+                    dflt, key, lo, key, hi);
+                GET DIAGNOSTICS moved = ROW_COUNT;
+            END IF;
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent, part, lo, hi);
+            IF dflt IS NOT NULL THEN
+                IF moved > 0 THEN
+                    EXECUTE format('INSERT INTO %I SELECT * FROM attach_moving',
+                                   parent);
+                END IF;
+                DROP TABLE attach_moving;
+            END IF;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION create_month_partition(
+            parent text, month date) RETURNS boolean
+        SET timezone = 'UTC' AS $$
+        DECLARE
+            part text := parent || '_' || to_char(month, 'YYYYMM');
+        BEGIN
+            IF to_regclass(part) IS NOT NULL THEN
+                RETURN false;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                part, parent);
+            PERFORM attach_month_partition(parent, part, month);
+            RETURN true;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION default_partition_months(parent text)
+        RETURNS SETOF date
+        SET timezone = 'UTC' AS $$
+        DECLARE
+            dflt regclass := to_regclass(parent || '_default');
+            key text;
+        BEGIN
+            IF dflt IS NULL THEN
+                RETURN;
+            END IF;
+            SELECT a.attname INTO key
+              FROM pg_partitioned_table p
+              JOIN pg_attribute a
+                ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+             WHERE p.partrelid = parent::regclass;
+            RETURN QUERY EXECUTE format(
+                'SELECT DISTINCT date_trunc(''month'', %I)::date FROM %s '
+                'WHERE %I IS NOT NULL ORDER BY 1', key, dflt, key);
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION partition_by_month(
+            parent text, key text, months_ahead integer DEFAULT 3)
+        RETURNS bigint
+        SET timezone = 'UTC' AS $$
+        DECLARE
+            rel regclass := to_regclass(parent);
+            legacy text := left(parent, 48) || '_unpartitioned';
+            pk text;
+            rebuild text[] := '{}';
+            stmt text;
+            r record;
+            m date;
+            moved bigint;
+        BEGIN
+            IF rel IS NULL OR (SELECT relkind FROM pg_class WHERE oid = rel) <> 'r' THEN
+                RETURN NULL;
+            END IF;
+            IF EXISTS (SELECT 1 FROM pg_constraint
+                        WHERE confrelid = rel AND contype = 'f') THEN
+                RAISE EXCEPTION '% is referenced by a foreign key', parent;
+            END IF;
+
+            -- What the new parent needs once the rows are in. The
+            -- definitions name `parent`, which is the new table by then.
+            SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY k.ord) INTO pk
+              FROM pg_index i
+             CROSS JOIN unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+              JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+             WHERE i.indrelid = rel AND i.indisprimary;
+            FOR r IN SELECT c.relname, i.indisprimary, i.indisunique,
+                            pg_get_indexdef(i.indexrelid) AS def
+                       FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                      WHERE i.indrelid = rel
+            LOOP
+                IF r.indisunique AND NOT r.indisprimary THEN
+                    RAISE EXCEPTION 'unique index % on % cannot be partitioned',
+                        r.relname, parent;
+                END IF;
+                IF NOT r.indisprimary THEN
+                    rebuild := rebuild || r.def;
+                END IF;
+                -- Free the name for the new table's index.
+                EXECUTE format('ALTER INDEX %I RENAME TO %I',
+                               r.relname, left(r.relname, 50) || '_unpart');
+            END LOOP;
+            FOR r IN SELECT conname, pg_get_constraintdef(oid) AS def
+                       FROM pg_constraint WHERE conrelid = rel AND contype = 'f'
+            LOOP
+                rebuild := rebuild || format('ALTER TABLE %I ADD CONSTRAINT %I %s',
+                                             parent, r.conname, r.def);
+            END LOOP;
+            FOR r IN SELECT pg_get_triggerdef(oid) AS def
+                       FROM pg_trigger WHERE tgrelid = rel AND NOT tgisinternal
+            LOOP
+                rebuild := rebuild || r.def;
+            END LOOP;
+
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', parent, legacy);
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+                'INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE (%I)',
+                parent, legacy, key);
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT',
+                           parent || '_default', parent);
+
+            EXECUTE format('SELECT date_trunc(''month'', min(%I))::date FROM %I',
+                           key, legacy) INTO m;
+            m := COALESCE(m, date_trunc('month', now())::date);
+            WHILE m <= date_trunc('month', now() + make_interval(months => months_ahead))
+            LOOP
+                PERFORM create_month_partition(parent, m);
+                m := (m + interval '1 month')::date;
+            END LOOP;
+
+            EXECUTE format('INSERT INTO %I SELECT * FROM %I', parent, legacy);
+            GET DIAGNOSTICS moved = ROW_COUNT;
+
+            IF pk IS NOT NULL THEN
+                IF quote_ident(key) <> ALL (string_to_array(pk, ', ')) THEN
+                    pk := pk || ', ' || quote_ident(key);
+                END IF;
+                EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (%s)',
+                               parent, parent || '_pkey', pk);
+            END IF;
+            FOREACH stmt IN ARRAY rebuild LOOP
+                EXECUTE stmt;
+            END LOOP;
+
+            -- Sequences owned by a column would go with the old table.
+            FOR r IN SELECT d.objid::regclass AS seq, a.attname
+                       FROM pg_depend d
+                       JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+                       JOIN pg_attribute a
+                         ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+                      WHERE d.classid = 'pg_class'::regclass
+                        AND d.refobjid = legacy::regclass AND d.deptype = 'a'
+            LOOP
+                EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.%I',
+                               r.seq, parent, r.attname);
+            END LOOP;
+
+            EXECUTE format('DROP TABLE %I', legacy);
+            RETURN moved;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    # A row trigger cloned onto a partition reports the partition's name;
+    # change versions are kept per root table.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_change_version() RETURNS trigger AS $$
+        DECLARE
+            tbl text := COALESCE(
+                (SELECT relname FROM pg_class
+                  WHERE oid = pg_partition_root(TG_RELID)),
+                TG_TABLE_NAME);
+        BEGIN
+            -- Once per table per transaction, however many rows changed.
+            IF current_setting('change_versions.' || tbl, true) = 'on'
+            THEN
+                RETURN NULL;
+            END IF;
+            PERFORM set_config('change_versions.' || tbl, 'on', true);
+            UPDATE change_versions
+               SET version = version + 1, changed_at = NOW()
+             WHERE table_name = tbl;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        DO $$ BEGIN
+            IF to_regclass('public.gl_journal_lines') IS NOT NULL THEN
+                ALTER TABLE gl_journal_lines
+                    ADD COLUMN IF NOT EXISTS entry_date DATE;
+                UPDATE gl_journal_lines l
+                   SET entry_date = e.entry_date
+                  FROM gl_journal_entries e
+                 WHERE e.id = l.entry_id AND l.entry_date IS NULL;
+                ALTER TABLE gl_journal_lines ALTER COLUMN entry_date SET NOT NULL;
+            END IF;
+        END $$
+    """)
+    for table, key in TABLES.items():
+        op.execute(f"SELECT partition_by_month('{table}', '{key}', {MONTHS_AHEAD})")
+
+
+def downgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION pg_temp.unpartition(parent text, key text)
+        RETURNS void AS $$
+        DECLARE
+            rel regclass := to_regclass(parent);
+            legacy text := left(parent, 48) || '_partitioned';
+            pk text;
+            rebuild text[] := '{}';
+            stmt text;
+            r record;
+        BEGIN
+            IF rel IS NULL OR (SELECT relkind FROM pg_class WHERE oid = rel) <> 'p' THEN
+                RETURN;
+            END IF;
+            SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY k.ord) INTO pk
+              FROM pg_index i
+             CROSS JOIN unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+              JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+             WHERE i.indrelid = rel AND i.indisprimary AND a.attname <> key;
+            FOR r IN SELECT c.relname, i.indisprimary,
+                            pg_get_indexdef(i.indexrelid) AS def
+                       FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                      WHERE i.indrelid = rel
+            LOOP
+                IF NOT r.indisprimary THEN
+                    rebuild := rebuild || replace(r.def, ' ON ONLY ', ' ON ');
+                END IF;
+                EXECUTE format('ALTER INDEX %I RENAME TO %I',
+                               r.relname, left(r.relname, 50) || '_part');
+            END LOOP;
+            FOR r IN SELECT conname, pg_get_constraintdef(oid) AS def
+                       FROM pg_constraint WHERE conrelid = rel AND contype = 'f'
+            LOOP
+                rebuild := rebuild || format('ALTER TABLE %I ADD CONSTRAINT %I %s',
+                                             parent, r.conname, r.def);
+            END LOOP;
+            FOR r IN SELECT pg_get_triggerdef(oid) AS def
+                       FROM pg_trigger WHERE tgrelid = rel AND NOT tgisinternal
+            LOOP
+                rebuild := rebuild || r.def;
+            END LOOP;
+
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', parent, legacy);
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+                'INCLUDING STORAGE INCLUDING COMMENTS)', parent, legacy);
+            EXECUTE format('INSERT INTO %I SELECT * FROM %I', parent, legacy);
+            IF pk IS NOT NULL THEN
+                EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (%s)',
+                               parent, parent || '_pkey', pk);
+            END IF;
+            FOREACH stmt IN ARRAY rebuild LOOP
+                EXECUTE stmt;
+            END LOOP;
+            EXECUTE format('DROP TABLE %I CASCADE', legacy);
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table, key in TABLES.items():
+        op.execute(f"SELECT pg_temp.unpartition('{table}', '{key}')")
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_change_version() RETURNS trigger AS $$
+        BEGIN
+            -- Once per table per transaction, however many rows changed.
+            IF current_setting('change_versions.' || TG_TABLE_NAME, true) = 'on'
+            THEN
+                RETURN NULL;
+            END IF;
+            PERFORM set_config('change_versions.' || TG_TABLE_NAME, 'on', true);
+            UPDATE change_versions
+               SET version = version + 1, changed_at = NOW()
+             WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP FUNCTION IF EXISTS partition_by_month(text, text, integer)")
+    op.execute("DROP FUNCTION IF EXISTS default_partition_months(text)")
+    op.execute("DROP FUNCTION IF EXISTS create_month_partition(text, date)")
+    op.execute("DROP FUNCTION IF EXISTS attach_month_partition(text, text, date)")
+    op.execute("DROP TABLE IF EXISTS partition_archives")
+    op.execute("""
+        DO $$ BEGIN
+            IF to_regclass('public.gl_journal_lines') IS NOT NULL THEN
+                ALTER TABLE gl_journal_lines DROP COLUMN IF EXISTS entry_date;
+            END IF;
+        END $$
+    """)
@@ -0,0 +1,115 @@
+"""Monthly stock checkpoints for point-in-time positions.
+
+Revision ID: e0123456789d
+Revises: d9012345678c
+Create Date: 2026-10-19
+
+`stock_checkpoints` holds, for every month start (UTC midnight, where the
+stock_movements partitions divide), the position of every (warehouse, item)
+built from all movements before it. Alongside the quantity
+it keeps the running costed-inbound quantity and value, so a weighted average
+cost as of that day can be derived too. The rows are written by
+`app.services.stock_history`; `stock_checkpoint_months` lists the months
+that are complete.
+
+A movement inserted, changed or deleted with a timestamp before the newest
+built month makes every later checkpoint wrong. The trigger below records
+the earliest such timestamp in `stock_checkpoint_stale`, and the next build
+rewrites the checkpoints from there. Detaching or dropping an archived
+partition fires no trigger, so archiving keeps the checkpoints.
+"""
+from alembic import op
+
+revision = 'e0123456789d'
+down_revision = 'd9012345678c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS stock_checkpoint_months (
+            as_of DATE PRIMARY KEY,
+            starts_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            items INTEGER NOT NULL DEFAULT 0,
+            built_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_stock_checkpoint_months_starts_at
+            ON stock_checkpoint_months (starts_at)
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS stock_checkpoints (
+            as_of DATE NOT NULL
+                REFERENCES stock_checkpoint_months (as_of) ON DELETE CASCADE,
+            warehouse_id UUID NOT NULL,
+            product_id UUID,
+            raw_material_id UUID,
+            quantity NUMERIC(18, 6) NOT NULL,
+            in_qty NUMERIC(18, 6) NOT NULL DEFAULT 0,
+            in_value NUMERIC(20, 6) NOT NULL DEFAULT 0,
+            CONSTRAINT ck_stock_checkpoints_one_item_type
+                CHECK ((product_id IS NULL) <> (raw_material_id IS NULL))
+        )
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_stock_checkpoints_product
+            ON stock_checkpoints (as_of, warehouse_id, product_id)
+         WHERE product_id IS NOT NULL
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_stock_checkpoints_raw_material
+            ON stock_checkpoints (as_of, warehouse_id, raw_material_id)
+         WHERE raw_material_id IS NOT NULL
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS stock_checkpoint_stale (
+            id BIGSERIAL PRIMARY KEY,
+            since TIMESTAMP WITH TIME ZONE NOT NULL,
+            marked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        )
+    """)
+
+    # One index probe per movement; ordinary writes, stamped NOW(), are
+    # never before the newest month and mark nothing.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION mark_stock_checkpoints_stale()
+        RETURNS trigger AS $$
+        DECLARE
+            t TIMESTAMPTZ;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                t := NEW.created_at;
+            ELSIF TG_OP = 'DELETE' THEN
+                t := OLD.created_at;
+            ELSE
+                t := LEAST(OLD.created_at, NEW.created_at);
+            END IF;
+            IF t IS NULL
+               OR t < (SELECT MAX(starts_at) FROM stock_checkpoint_months) THEN
+                INSERT INTO stock_checkpoint_stale (since)
+                VALUES (COALESCE(t, '-infinity'));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        DROP TRIGGER IF EXISTS trg_stock_movements_checkpoints ON stock_movements
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_stock_movements_checkpoints
+            AFTER INSERT OR UPDATE OR DELETE ON stock_movements
+            FOR EACH ROW EXECUTE FUNCTION mark_stock_checkpoints_stale()
+    """)
+
+
+def downgrade():
+    op.execute("""
+        DROP TRIGGER IF EXISTS trg_stock_movements_checkpoints ON stock_movements
+    """)
+    op.execute("DROP FUNCTION IF EXISTS mark_stock_checkpoints_stale()")
+    op.execute("DROP TABLE IF EXISTS stock_checkpoint_stale")
+    op.execute("DROP TABLE IF EXISTS stock_checkpoints")
+    op.execute("DROP TABLE IF EXISTS stock_checkpoint_months")
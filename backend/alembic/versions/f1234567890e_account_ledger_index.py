@@ -0,0 +1,30 @@
+"""Index journal lines by account and date for the paged account ledger.
+
+Revision ID: f1234567890e
+Revises: e0123456789d
+Create Date: 2026-10-19
+
+`ledger.account_ledger` pages an account's lines by (entry date, entry
+sequence, line number). The existing `account_id` index returned every line
+on the account, so each page of a busy account like 1100 Cash sorted its
+whole history. With the lines' entry date (migration d9012345678c) next to
+the account, a page reads its lines in date order from the cursor onwards.
+Only lines sharing a date are then sorted by sequence.
+"""
+from alembic import op
+
+revision = 'f1234567890e'
+down_revision = 'e0123456789d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_gl_journal_lines_account_date
+            ON gl_journal_lines (account_id, entry_date)
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_gl_journal_lines_account_date")
@@ -0,0 +1,51 @@
+"""Background report exports.
+
+Revision ID: g2345678901f
+Revises: f1234567890e
+Create Date: 2026-10-19
+
+One row per export started with POST /api/exports/{report}/jobs. The row
+holds the report, its format and the query string it was started with, and
+how far the export has got. The file itself is written under EXPORT_DIR by
+`app.services.exports`, which also deletes the row and file once they
+expire.
+"""
+from alembic import op
+
+revision = 'g2345678901f'
+down_revision = 'f1234567890e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id UUID PRIMARY KEY,
+            report VARCHAR(64) NOT NULL,
+            format VARCHAR(8) NOT NULL,
+            params JSONB NOT NULL DEFAULT '{}',
+            created_by UUID NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'queued',
+            rows BIGINT NOT NULL DEFAULT 0,
+            bytes BIGINT,
+            error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT ck_export_jobs_status
+                CHECK (status IN ('queued', 'running', 'done', 'failed'))
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_export_jobs_created_by
+            ON export_jobs (created_by, created_at DESC)
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_export_jobs_created_at
+            ON export_jobs (created_at)
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS export_jobs")
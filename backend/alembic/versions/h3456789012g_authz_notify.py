@@ -0,0 +1,67 @@
+"""Notify every worker when authorization data changes.
+
+Revision ID: h3456789012g
+Revises: g2345678901f
+Create Date: 2026-10-19
+
+`app.services.authz` caches each user's grants per worker process. The
+admin endpoints that edit them clear the cache of the worker they run on;
+every other worker LISTENs on the `authz_grants` channel, which these
+triggers NOTIFY whenever role permissions, module access, warehouse
+grants or a user's role change. NOTIFY is delivered on commit, and
+repeated notifications within one transaction are folded into one.
+"""
+from alembic import op
+
+revision = 'h3456789012g'
+down_revision = 'g2345678901f'
+branch_labels = None
+depends_on = None
+
+_TABLES = ("role_permissions", "user_module_access", "user_warehouses")
+
+
+def upgrade():
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_authz_change() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('authz_grants', '');
+            RETURN NULL;
+        END
+        $$
+    """)
+    for table in _TABLES:
+        op.execute(f"""
+            DO $$
+            BEGIN
+                IF to_regclass('{table}') IS NOT NULL THEN
+                    DROP TRIGGER IF EXISTS trg_authz_notify ON {table};
+                    CREATE TRIGGER trg_authz_notify
+                        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_authz_change();
+                END IF;
+            END
+            $$
+        """)
+    # Only the role: logins update users constantly.
+    op.execute("""
+        DROP TRIGGER IF EXISTS trg_authz_notify ON users;
+        CREATE TRIGGER trg_authz_notify
+            AFTER UPDATE OF role OR DELETE ON users
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_authz_change();
+    """)
+
+
+def downgrade():
+    for table in _TABLES + ("users",):
+        op.execute(f"""
+            DO $$
+            BEGIN
+                IF to_regclass('{table}') IS NOT NULL THEN
+                    DROP TRIGGER IF EXISTS trg_authz_notify ON {table};
+                END IF;
+            END
+            $$
+        """)
+    op.execute("DROP FUNCTION IF EXISTS notify_authz_change()")
@@ -0,0 +1,41 @@
+"""Shared rate-limit buckets and indexed login lookup.
+
+Revision ID: t9012345678s
+Revises: s8901234567r
+Create Date: 2026-10-19
+
+The captive portal's per-IP limiter lived in a process-local dict, so its
+budget multiplied by the worker count and reset on every restart.
+`rate_limit_buckets` holds one fixed-window counter per key, updated with a
+single upsert by app.services.rate_limit.
+
+RadiusService._find_user now resolves an employee by `lower(email)` OR
+`phone` in one statement. Neither predicate had an index: the unique index on
+`email` cannot serve `lower(email)`, and `phone` had none. Both are added so
+the lookup is a BitmapOr of two index probes instead of a sequential scan.
+"""
+from alembic import op
+
+revision = 't9012345678s'
+down_revision = 's8901234567r'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket_key VARCHAR(255) PRIMARY KEY,
+            window_start TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_users_email_lower "
+               "ON users (lower(email))")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_users_phone ON users (phone)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_users_phone")
+    op.execute("DROP INDEX IF EXISTS ix_users_email_lower")
+    op.execute("DROP TABLE IF EXISTS rate_limit_buckets")
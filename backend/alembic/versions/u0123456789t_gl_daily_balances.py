@@ -0,0 +1,123 @@
+"""Per-account daily balance store for period reporting.
+
+Revision ID: u0123456789t
+Revises: t9012345678s
+Create Date: 2026-10-19
+
+Every VAT return scanned `gl_journal_lines` twice (credits to 2300, net debits
+to 1360) for its date range, and the tax screens recompute returns
+repeatedly. `gl_account_daily_balances` holds one row per (account, day) with
+that day's total debits and credits, so any date-range figure for an account
+is a sum over at most one row per day -- and a year of monthly figures is one
+GROUP BY over a few hundred rows.
+
+The store is maintained by a trigger on `gl_journal_lines`, not by
+application code. `post_entry` is the only writer today, but a trigger keeps
+the store exact for any future writer (a backfill script, a manual repair)
+that does not know the store exists -- the same reasoning the MAPD tables use
+for their immutability triggers. Journal lines are never updated, so only
+INSERT and DELETE are handled.
+
+A posting transaction now holds the (account, day) row lock until it commits,
+so two postings to the same account on the same day serialise on that row.
+Posting transactions are short and already lock stock rows; this is the same
+shape of contention.
+
+The existing journal is backfilled here. `purchase_invoices.invoice_date`
+also gains an index, since input VAT is summed over it by date range.
+"""
+from alembic import op
+
+revision = 'u0123456789t'
+down_revision = 't9012345678s'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS gl_account_daily_balances (
+            account_id UUID NOT NULL REFERENCES gl_accounts(id),
+            entry_date DATE NOT NULL,
+            debit  NUMERIC(18,2) NOT NULL DEFAULT 0,
+            credit NUMERIC(18,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, entry_date)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_gl_daily_balances_date "
+               "ON gl_account_daily_balances (entry_date)")
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION gl_daily_balance_apply() RETURNS trigger AS $$
+        DECLARE
+            d DATE;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                SELECT entry_date INTO d FROM gl_journal_entries
+                 WHERE id = NEW.entry_id AND status <> 'DRAFT';
+                IF d IS NOT NULL THEN
+                    INSERT INTO gl_account_daily_balances
+                        (account_id, entry_date, debit, credit)
+                    VALUES (NEW.account_id, d, NEW.debit, NEW.credit)
+                    ON CONFLICT (account_id, entry_date) DO UPDATE
+                       SET debit  = gl_account_daily_balances.debit
+                                    + EXCLUDED.debit,
+                           credit = gl_account_daily_balances.credit
+                                    + EXCLUDED.credit;
+                END IF;
+                RETURN NEW;
+            END IF;
+
+            SELECT entry_date INTO d FROM gl_journal_entries
+             WHERE id = OLD.entry_id AND status <> 'DRAFT';
+            IF d IS NOT NULL THEN
+                UPDATE gl_account_daily_balances
+                   SET debit = debit - OLD.debit,
+                       credit = credit - OLD.credit
+                 WHERE account_id = OLD.account_id AND entry_date = d;
+            END IF;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS trg_gl_daily_balance "
+               "ON gl_journal_lines")
+    op.execute("""
+        CREATE TRIGGER trg_gl_daily_balance
+            AFTER INSERT OR DELETE ON gl_journal_lines
+            FOR EACH ROW EXECUTE FUNCTION gl_daily_balance_apply()
+    """)
+
+    # Backfill from the journal as it stands. Lines inserted after this point
+    # are picked up by the trigger.
+    op.execute("DELETE FROM gl_account_daily_balances")
+    op.execute("""
+        INSERT INTO gl_account_daily_balances
+            (account_id, entry_date, debit, credit)
+        SELECT l.account_id, e.entry_date,
+               COALESCE(SUM(l.debit), 0), COALESCE(SUM(l.credit), 0)
+          FROM gl_journal_lines l
+          JOIN gl_journal_entries e ON e.id = l.entry_id
+         WHERE e.status <> 'DRAFT'
+         GROUP BY l.account_id, e.entry_date
+    """)
+
+    # purchase_invoices is also created at runtime by procurement; only index
+    # it if it exists.
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('public.purchase_invoices') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS ix_purchase_invoices_invoice_date
+                    ON purchase_invoices (invoice_date);
+            END IF;
+        END $$
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_purchase_invoices_invoice_date")
+    op.execute("DROP TRIGGER IF EXISTS trg_gl_daily_balance "
+               "ON gl_journal_lines")
+    op.execute("DROP FUNCTION IF EXISTS gl_daily_balance_apply()")
+    op.execute("DROP TABLE IF EXISTS gl_account_daily_balances")
@@ -0,0 +1,57 @@
+"""Partial indexes on open invoice and legacy-debt balances.
+
+Revision ID: v1234567890u
+Revises: u0123456789t
+Create Date: 2026-10-19
+
+The debtors and reminders screens (app.services.debtors) now read the cached
+`paid_amount` columns instead of summing payments per invoice. They start from
+the documents that are still open, so these indexes cover only those rows:
+settled and cancelled invoices, which are most of the history, never enter
+them.
+
+`invoices.customer_id` also gains a plain index. Once the debtors are known,
+their totals are taken over all of their live invoices, and there was no
+index on the column at all.
+
+`legacy_debts` is created at runtime by its API module, which creates the same
+index; here it is only added if the table already exists.
+"""
+from alembic import op
+
+revision = 'v1234567890u'
+down_revision = 'u0123456789t'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_invoices_open_customer
+            ON invoices (customer_id)
+         WHERE status NOT IN ('cancelled', 'paid')
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_invoices_open_due
+            ON invoices (due_date)
+         WHERE status NOT IN ('cancelled', 'paid')
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_invoices_customer "
+               "ON invoices (customer_id)")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('public.legacy_debts') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_ld_open_customer
+                    ON legacy_debts (customer_id)
+                 WHERE status NOT IN ('cancelled', 'paid');
+            END IF;
+        END $$
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_ld_open_customer")
+    op.execute("DROP INDEX IF EXISTS ix_invoices_customer")
+    op.execute("DROP INDEX IF EXISTS ix_invoices_open_due")
+    op.execute("DROP INDEX IF EXISTS ix_invoices_open_customer")
@@ -0,0 +1,57 @@
+"""Trigram indexes for type-ahead search.
+
+Revision ID: w2345678901v
+Revises: v1234567890u
+Create Date: 2026-10-19
+
+Product, customer, staff and raw-material lookups filter with
+`ILIKE '%term%'`. A leading wildcard cannot use a btree index, so every
+keystroke on the sales and POS screens was a sequential scan -- twice, since
+the list endpoints repeat the filter in a COUNT(*).
+
+`pg_trgm` GIN indexes serve `ILIKE '%term%'` directly and also the
+`similarity()` ranking used by app.services.search. They are built on the raw
+columns rather than on lower(...), because trigram matching is already
+case-insensitive; that way the existing list endpoints' ILIKE filters pick up
+the same indexes without any change to their queries. For the same reason
+staff names are indexed per column, as the staff list filters them, as well
+as whole, as type-ahead matches them.
+"""
+from alembic import op
+
+revision = 'w2345678901v'
+down_revision = 'v1234567890u'
+branch_labels = None
+depends_on = None
+
+# (index name, table, indexed expression)
+INDEXES = [
+    ("ix_products_name_trgm", "products", "name"),
+    ("ix_products_sku_trgm", "products", "sku"),
+    ("ix_raw_materials_name_trgm", "raw_materials", "name"),
+    ("ix_raw_materials_sku_trgm", "raw_materials", "sku"),
+    ("ix_customers_name_trgm", "customers", "name"),
+    ("ix_customers_phone_trgm", "customers", "phone"),
+    ("ix_customers_email_trgm", "customers", "email"),
+    # The full name, for type-ahead ("ada obi"); both columns are NOT NULL.
+    # concat_ws would read better but is not IMMUTABLE, so cannot be indexed.
+    ("ix_employees_name_trgm", "employees",
+     "(first_name || ' ' || last_name)"),
+    ("ix_employees_first_name_trgm", "employees", "first_name"),
+    ("ix_employees_last_name_trgm", "employees", "last_name"),
+    ("ix_employees_number_trgm", "employees", "employee_number"),
+]
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, expr in INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} "
+                   f"ON {table} USING gin ({expr} gin_trgm_ops)")
+
+
+def downgrade():
+    for name, _, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    # The extension is left installed: other objects may have come to
+    # depend on it, and it costs nothing when unused.
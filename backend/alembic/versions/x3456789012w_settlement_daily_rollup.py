@@ -0,0 +1,100 @@
+"""Daily settlement rollup behind the distribution reports.
+
+Revision ID: x3456789012w
+Revises: w2345678901v
+Create Date: 2026-10-19
+
+`/api/reports/revenue` and `/api/finance/dashboard` grouped every settlement
+detail ever written on each call, and filtered with
+`CAST(s.distributed_at AS date)`, which no index can serve. They now read
+`settlement_daily_rollup`, which holds one row per distribution day and
+dimension key:
+
+  dimension      key_id
+  -------------  -------------------------------------------------------
+  product        settlement_details.product_id
+  account        settlement_details.financial_account_id
+  business_unit  the destination account's business unit
+  total          the nil UUID (the day as a whole)
+
+Each row carries the CASH and OBLIGATION sums and the number of distinct
+settlements behind them. A settlement is distributed on exactly one day, so
+summing `settlements` over a date range for one key is still an exact distinct
+count. That is why each dimension is kept separately instead of being derived
+from a single (product, account) grain.
+
+A missing product or business unit is stored under the nil UUID, which the
+reports label "Unknown product" and "Unassigned".
+
+app.services.settlement_rollup maintains the rows as settlements complete or
+are reversed. This migration backfills them from the COMPLETED settlements
+already on record.
+"""
+from alembic import op
+
+revision = 'x3456789012w'
+down_revision = 'w2345678901v'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS settlement_daily_rollup (
+            day DATE NOT NULL,
+            dimension VARCHAR(16) NOT NULL,
+            key_id UUID NOT NULL,
+            cash NUMERIC(18,2) NOT NULL DEFAULT 0,
+            obligations NUMERIC(18,2) NOT NULL DEFAULT 0,
+            settlements INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, dimension, key_id),
+            CONSTRAINT ck_settlement_rollup_dimension CHECK (dimension IN
+                ('product','account','business_unit','total'))
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_settlement_rollup_dimension "
+               "ON settlement_daily_rollup (dimension, day)")
+    # Rebuilding a range of days looks the completed settlements up by
+    # timestamp bounds.
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_settlements_distributed
+            ON settlements (distributed_at)
+         WHERE status = 'COMPLETED'
+    """)
+
+    op.execute("""
+        INSERT INTO settlement_daily_rollup
+            (day, dimension, key_id, cash, obligations, settlements)
+        SELECT x.day,
+               CASE WHEN GROUPING(x.product_id) = 0 THEN 'product'
+                    WHEN GROUPING(x.financial_account_id) = 0 THEN 'account'
+                    WHEN GROUPING(x.business_unit_id) = 0 THEN 'business_unit'
+                    ELSE 'total' END,
+               COALESCE(x.product_id, x.financial_account_id,
+                        x.business_unit_id,
+                        CAST('00000000-0000-0000-0000-000000000000' AS uuid)),
+               COALESCE(SUM(x.amount) FILTER
+                   (WHERE x.allocation_type = 'CASH'), 0),
+               COALESCE(SUM(x.amount) FILTER
+                   (WHERE x.allocation_type = 'OBLIGATION'), 0),
+               COUNT(DISTINCT x.settlement_id)
+          FROM (SELECT CAST(s.distributed_at AS date) AS day,
+                       d.settlement_id, d.product_id, d.financial_account_id,
+                       fa.business_unit_id, d.allocation_type, d.amount
+                  FROM settlements s
+                  JOIN settlement_details d ON d.settlement_id = s.id
+                  LEFT JOIN financial_accounts fa
+                         ON fa.id = d.financial_account_id
+                 WHERE s.status = 'COMPLETED'
+                   AND s.distributed_at IS NOT NULL) x
+         GROUP BY GROUPING SETS ((x.day, x.product_id),
+                                 (x.day, x.financial_account_id),
+                                 (x.day, x.business_unit_id),
+                                 (x.day))
+        ON CONFLICT (day, dimension, key_id) DO NOTHING
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_settlements_distributed")
+    op.execute("DROP TABLE IF EXISTS settlement_daily_rollup")
@@ -0,0 +1,35 @@
+"""Index completed attendance by clock-in time.
+
+Revision ID: y4567890123x
+Revises: x3456789012w
+Create Date: 2026-10-19
+
+The payroll dashboard and payroll runs total each staff member's completed
+hours for a pay period. They used to do it with a query per staff member,
+filtered on `DATE(clock_in)`, which no index could serve, so every staff
+member cost a scan of the attendance history. `payroll.attendance_totals`
+now answers for the whole workforce with one grouped query bounded on the
+bare `clock_in` column.
+
+This partial index covers that query: only completed rows, ordered by
+clock-in, carrying the staff id and hours so the totals are read from the
+index alone.
+"""
+from alembic import op
+
+revision = 'y4567890123x'
+down_revision = 'x3456789012w'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_attendance_completed_clock_in
+            ON attendance (clock_in) INCLUDE (staff_id, hours_worked)
+         WHERE status = 'completed'
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_attendance_completed_clock_in")
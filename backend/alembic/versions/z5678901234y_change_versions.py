@@ -0,0 +1,102 @@
+"""Per-table change counters for conditional GETs.
+
+Revision ID: z5678901234y
+Revises: y4567890123x
+Create Date: 2026-10-19
+
+The heavy read endpoints (stock levels, the product list, debtors, the
+executive dashboard) answer `If-None-Match` with 304 before running their
+queries. For that they need a cheap token that changes whenever their source
+tables do. Nothing on those tables gives one: raw-SQL writers do not always
+set `updated_at`, and neither a timestamp nor a sequence value taken before
+commit is safe. A writer that started earlier but commits later would slip in
+under a token a client already holds.
+
+`change_versions` keeps one counter per tracked table. A deferred constraint
+trigger bumps it at commit time, once per table per transaction however many
+rows changed, so the new version becomes visible together with the data. The
+counter row is locked only while the writing transaction commits.
+
+`track_changes(table)` installs the trigger and seeds the counter. Tables the
+schema bootstrap creates at runtime (legacy_debts, purchase_invoices) are
+tracked here if they already exist and by their bootstrap step otherwise. A
+table with no counter row is treated as untracked, and endpoints reading it
+send no ETag.
+"""
+from alembic import op
+
+revision = 'z5678901234y'
+down_revision = 'y4567890123x'
+branch_labels = None
+depends_on = None
+
+# Keep in step with the table lists in app.services.http_cache's callers.
+TRACKED = (
+    'stock_levels', 'products', 'product_pricing', 'warehouses',
+    'customers', 'invoices', 'legacy_debts',
+    'gl_accounts', 'gl_journal_entries', 'gl_journal_lines', 'budgets',
+    'purchase_invoices',
+)
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS change_versions (
+            table_name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        )
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_change_version() RETURNS trigger AS $$
+        BEGIN
+            -- Once per table per transaction, however many rows changed.
+            IF current_setting('change_versions.' || TG_TABLE_NAME, true) = 'on'
+            THEN
+                RETURN NULL;
+            END IF;
+            PERFORM set_config('change_versions.' || TG_TABLE_NAME, 'on', true);
+            UPDATE change_versions
+               SET version = version + 1, changed_at = NOW()
+             WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION track_changes(tbl regclass) RETURNS void AS $$
+        BEGIN
+            INSERT INTO change_versions (table_name)
+            SELECT relname FROM pg_class WHERE oid = tbl
+            ON CONFLICT (table_name) DO NOTHING;
+            EXECUTE format('DROP TRIGGER IF EXISTS trg_change_version ON %s', tbl);
+            EXECUTE format(
+                'CREATE CONSTRAINT TRIGGER trg_change_version '
+                'AFTER INSERT OR UPDATE OR DELETE ON %s '
+                'DEFERRABLE INITIALLY DEFERRED FOR EACH ROW '
+                'EXECUTE FUNCTION bump_change_version()', tbl);
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TRACKED:
+        op.execute(f"""
+            DO $$ BEGIN
+                IF to_regclass('public.{table}') IS NOT NULL THEN
+                    PERFORM track_changes('public.{table}');
+                END IF;
+            END $$
+        """)
+
+
+def downgrade():
+    for table in TRACKED:
+        op.execute(f"""
+            DO $$ BEGIN
+                IF to_regclass('public.{table}') IS NOT NULL THEN
+                    DROP TRIGGER IF EXISTS trg_change_version ON public.{table};
+                END IF;
+            END $$
+        """)
+    op.execute("DROP FUNCTION IF EXISTS track_changes(regclass)")
+    op.execute("DROP FUNCTION IF EXISTS bump_change_version()")
+    op.execute("DROP TABLE IF EXISTS change_versions")
@@ -14,12 +14,13 @@ from pydantic import BaseModel, Field
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_session
+from app.db import ReadSessionLocal, get_read_session, get_session
 from app.api.auth import require_authenticated_user, require_admin
 from app.models import User
+from app.services import exports
 from app.services.ledger import (
-    Line, post_entry, reverse_entry, trial_balance, profit_and_loss,
-    balance_sheet, account_ledger)
+    LEDGER_PAGE, Line, post_entry, reverse_entry, trial_balance,
+    profit_and_loss, balance_sheet, account_ledger, iter_account_ledger)
 
 router = APIRouter(prefix='/api/accounting', tags=['Accounting'])
 
@@ -224,7 +225,7 @@ async def get_journal_entry(
 async def get_trial_balance(
     start: Optional[date] = Query(None),
     end: Optional[date] = Query(None),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     return await trial_balance(session, start=start, end=end)
@@ -234,7 +235,7 @@ async def get_trial_balance(
 async def get_profit_and_loss(
     start: Optional[date] = Query(None),
     end: Optional[date] = Query(None),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     return await profit_and_loss(session, start=start, end=end)
@@ -243,7 +244,7 @@ async def get_profit_and_loss(
 @router.get('/balance-sheet')
 async def get_balance_sheet(
     as_at: Optional[date] = Query(None),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     return await balance_sheet(session, as_at=as_at)
@@ -254,11 +255,48 @@ async def get_account_ledger(
     account_code: str,
     start: Optional[date] = Query(None),
     end: Optional[date] = Query(None),
-    session: AsyncSession = Depends(get_session),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(LEDGER_PAGE, ge=1, le=1000),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     return await account_ledger(
-        session, account_code=account_code, start=start, end=end)
+        session, account_code=account_code, start=start, end=end,
+        cursor=cursor, limit=limit)
+
+
+LEDGER_COLUMNS = ("entry_number", "date", "description", "source",
+                  "reference", "debit", "credit", "balance")
+
+
+@router.get('/accounts/{account_code}/ledger/export')
+async def export_account_ledger(
+    account_code: str,
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    session: AsyncSession = Depends(get_read_session),
+    _user: User = Depends(require_authenticated_user),
+):
+    """The whole window as CSV or XLSX, streamed from a server-side cursor."""
+    # Fail with a 404 now: once streaming starts the status is sent.
+    known = (await session.execute(
+        text("SELECT 1 FROM gl_accounts WHERE code = :c"), {"c": account_code}
+    )).first()
+    if known is None:
+        raise HTTPException(status_code=404, detail="Account not found.")
+
+    async def rows():
+        # The request's session is closed once this handler returns, so the
+        # stream reads through its own.
+        async with ReadSessionLocal() as s:
+            async for e in iter_account_ledger(
+                    s, account_code=account_code, start=start, end=end):
+                yield [e[c] for c in LEDGER_COLUMNS]
+
+    name = f"ledger-{account_code}-{start or 'start'}-{end or 'end'}"
+    return exports.file_response(format, name, LEDGER_COLUMNS, rows(),
+                                 sheet=f"Ledger {account_code}")
 
 
 # ---------------------------------------------------------------------------
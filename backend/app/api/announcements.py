@@ -10,22 +10,28 @@ Features:
     * MILD lateness      -> warning / coaching
     * SEVERE lateness    -> formal disciplinary notice
 - Stores audio under /app/uploads/announcements (or ./uploads fallback).
-- Auto-creates DB tables on first router call (no alembic migration needed).
+- DB tables are created by the schema bootstrap (no alembic migration needed).
+- Firing is scheduled server-side (app.services.announcement_scheduler):
+  each announcement fires once, and connected clients receive it over
+  GET /stream (server-sent events) and Web Push.
 """
 from fastapi import (
     APIRouter, Depends, HTTPException, UploadFile, File, Form, Query,
+    Request, Header,
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from typing import Optional, List
 from pathlib import Path
 from datetime import datetime, timezone, timedelta, time as time_cls, date as date_cls
+import asyncio
 import os
 import secrets
 import uuid
 
 from app.db import get_session
+from app.services import announcement_scheduler, bootstrap
 
 router = APIRouter(prefix='/api/announcements')
 
@@ -75,16 +81,46 @@ CREATE_INDEXES = [
 ]
 
 
-async def _ensure_tables(session: AsyncSession):
-    await session.execute(text(CREATE_ANNOUNCEMENTS_SQL))
-    await session.execute(text(CREATE_POLICY_SQL))
-    for sql in CREATE_INDEXES:
-        await session.execute(text(sql))
+# v2: server-side scheduling -- each announcement's next firing, and a record
+# of every firing so it happens once across workers.
+SCHEDULER_STATEMENTS = [
+    "ALTER TABLE announcements ADD COLUMN IF NOT EXISTS next_fire_at "
+    "TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS idx_ann_next_fire ON announcements(next_fire_at) "
+    "WHERE is_active AND next_fire_at IS NOT NULL",
+    """
+    CREATE TABLE IF NOT EXISTS announcement_fires (
+        id BIGSERIAL PRIMARY KEY,
+        announcement_id UUID NOT NULL
+            REFERENCES announcements(id) ON DELETE CASCADE,
+        fire_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        fired_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        title VARCHAR(200),
+        message TEXT,
+        audio_filename VARCHAR(255),
+        UNIQUE (announcement_id, fire_at)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_ann_fires_fired_at "
+    "ON announcement_fires(fired_at)",
+]
+
+
+bootstrap.register("announcements", 2, [
+    CREATE_ANNOUNCEMENTS_SQL,
+    CREATE_POLICY_SQL,
+    *CREATE_INDEXES,
     # Seed single policy row
-    await session.execute(text(
-        "INSERT INTO attendance_policy (id) VALUES (1) ON CONFLICT (id) DO NOTHING"
-    ))
-    await session.commit()
+    "INSERT INTO attendance_policy (id) VALUES (1) ON CONFLICT (id) DO NOTHING",
+    *SCHEDULER_STATEMENTS,
+], after=announcement_scheduler.schedule_unscheduled)
+
+SCHEDULE_FIELDS = {'scheduled_date', 'scheduled_time', 'repeat_type',
+                   'repeat_days', 'is_active'}
+
+
+async def _ensure_tables(session: AsyncSession):
+    await bootstrap.ensure(session, "announcements")
 
 
 def _ensure_audio_dir() -> Path:
@@ -227,7 +263,7 @@ async def list_announcements(
     rows = (await session.execute(text(
         f"SELECT id, title, message, audio_filename, scheduled_date, "
         f"scheduled_time, repeat_type, repeat_days, is_active, "
-        f"last_played_at, created_at, updated_at "
+        f"last_played_at, next_fire_at, created_at, updated_at "
         f"FROM announcements {where} ORDER BY scheduled_time ASC"
     ))).mappings().all()
     return [dict(r) for r in rows]
@@ -269,12 +305,15 @@ async def create_announcement(
         repeat_days = ','.join(str(x) for x in repeat_days)
 
     new_id = str(uuid.uuid4())
+    next_fire = announcement_scheduler.next_fire_at(
+        sched_date, sched_time, repeat_type, repeat_days,
+        datetime.now(timezone.utc))
     await session.execute(text(
         "INSERT INTO announcements "
         "(id, title, message, scheduled_date, scheduled_time, repeat_type, "
-        " repeat_days, is_active) "
+        " repeat_days, is_active, next_fire_at) "
         "VALUES (:id, :title, :message, :sched_date, :sched_time, "
-        "        :repeat_type, :repeat_days, TRUE)"
+        "        :repeat_type, :repeat_days, TRUE, :next_fire)"
     ), {
         'id': new_id,
         'title': title,
@@ -283,9 +322,11 @@ async def create_announcement(
         'sched_time': sched_time,
         'repeat_type': repeat_type,
         'repeat_days': repeat_days,
+        'next_fire': next_fire,
     })
     await session.commit()
-    return {'success': True, 'id': new_id}
+    return {'success': True, 'id': new_id,
+            'next_fire_at': next_fire.isoformat() if next_fire else None}
 
 
 @router.put('/{ann_id}')
@@ -323,6 +364,8 @@ async def update_announcement(
     await session.execute(text(
         f"UPDATE announcements SET {', '.join(sets)} WHERE id = :id"
     ), params)
+    if SCHEDULE_FIELDS & params.keys():
+        await announcement_scheduler.reschedule(session, ann_id)
     await session.commit()
     return {'success': True}
 
@@ -429,68 +472,69 @@ async def serve_audio(filename: str):
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Endpoint — DUE NOW (frontend polls this every 60s to play scheduled audio)
+# Endpoints — DELIVERY (fired by app.services.announcement_scheduler)
 # ─────────────────────────────────────────────────────────────────────────────
-def _is_due(row, local_now: datetime, window_seconds: int = 90) -> bool:
-    if not row['is_active']:
-        return False
-    sched_time: Optional[time_cls] = row['scheduled_time']
-    if sched_time is None:
-        return False
-    sched_date: Optional[date_cls] = row['scheduled_date']
-    repeat = (row['repeat_type'] or 'none').lower()
-    today_local = local_now.date()
-
-    # one-shot scheduled date
-    if sched_date and repeat == 'none' and sched_date != today_local:
-        return False
-    # weekly: only on listed weekdays (0=Mon..6=Sun)
-    if repeat == 'weekly':
-        days_str = (row['repeat_days'] or '').strip()
-        if days_str:
-            try:
-                allowed = {int(x) for x in days_str.split(',') if x.strip() != ''}
-                if today_local.weekday() not in allowed:
-                    return False
-            except ValueError:
-                return False
-    # monthly: same day-of-month as scheduled_date
-    if repeat == 'monthly':
-        if sched_date and sched_date.day != today_local.day:
-            return False
-
-    # Time window
-    target = local_now.replace(
-        hour=sched_time.hour, minute=sched_time.minute,
-        second=sched_time.second or 0, microsecond=0,
-    )
-    delta = (local_now - target).total_seconds()
-    return 0 <= delta <= window_seconds
-
-
 @router.get('/due')
 async def list_due(session: AsyncSession = Depends(get_session)):
-    """Return announcements due in the last ~90 seconds (Lagos local time)."""
+    """Announcements fired in the last ~90 seconds (Lagos local time).
+
+    Kept for older clients; GET /stream delivers them as they fire.
+    """
     await _ensure_tables(session)
-    rows = (await session.execute(text(
-        "SELECT id, title, message, audio_filename, scheduled_date, "
-        "scheduled_time, repeat_type, repeat_days, is_active "
-        "FROM announcements WHERE is_active = TRUE"
-    ))).mappings().all()
     local_now = datetime.now(LAGOS_TZ)
-    due = []
-    for r in rows:
-        d = dict(r)
-        if _is_due(d, local_now):
-            d['audio_url'] = (
-                f"/api/announcements/audio/{d['audio_filename']}"
-                if d['audio_filename'] else None
-            )
-            d['id'] = str(d['id'])
-            due.append(d)
+    due = await announcement_scheduler.recent_fires(
+        session, since=local_now - timedelta(seconds=90))
     return {'now_local': local_now.isoformat(), 'due': due}
 
 
+HEARTBEAT_SECONDS = 25
+# How far back a reconnecting client is caught up.
+REPLAY_WINDOW = timedelta(hours=1)
+
+
+@router.get('/stream')
+async def stream_announcements(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session),
+):
+    """Server-sent events: one `announcement` event per firing.
+
+    A reconnecting client sends Last-Event-ID and first receives the firings
+    it missed in the last hour. Holds no database connection while open.
+    """
+    await _ensure_tables(session)
+    queue = announcement_scheduler.subscribe()
+    missed = []
+    if last_event_id and last_event_id.isdigit():
+        missed = await announcement_scheduler.recent_fires(
+            session, after_id=int(last_event_id),
+            since=datetime.now(timezone.utc) - REPLAY_WINDOW)
+    await session.close()
+    sent = max((e['fire_id'] for e in missed), default=0)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            for event in missed:
+                yield announcement_scheduler.sse_message(event)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event['fire_id'] > sent:
+                    yield announcement_scheduler.sse_message(event)
+        finally:
+            announcement_scheduler.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Endpoint — CLOCK-IN GREETING (called by frontend after a successful clock-in)
 # ─────────────────────────────────────────────────────────────────────────────
@@ -10,8 +10,8 @@ import logging
 from app.db import get_session, AsyncSessionLocal
 from app.models import Attendance, Staff
 from app.schemas import AttendanceSchema, AttendanceCreate, PaginatedResponse, QuickAttendanceRequest, QuickAttendanceResponse
-from sqlalchemy import func, and_, or_, text
-from app.services.geocoding import reverse_geocode
+from sqlalchemy import func, and_, or_
+from app.services.geocoding import geotag
 
 router = APIRouter(prefix='/api/attendance')
 
@@ -36,23 +36,13 @@ async def clock_in(att: AttendanceCreate, session: AsyncSession = Depends(get_se
         now = datetime.now(timezone.utc)
         attendance = Attendance(staff_id=att.staff_id, clock_in=now, notes=att.notes)
         session.add(attendance)
+        await session.flush()
+        # Coordinates commit with the clock-in; the address is looked up by
+        # the outbox dispatcher (best-effort: failure can't block clock-in).
+        await geotag(session, "attendance.clock_in", attendance.id,
+                     att.latitude, att.longitude, att.accuracy)
         await session.commit()
         await session.refresh(attendance)
-        # Best-effort geo persist (separate UPDATE so failure can't block clock-in)
-        if att.latitude is not None and att.longitude is not None:
-            try:
-                address = await reverse_geocode(att.latitude, att.longitude)
-                await session.execute(text(
-                    "UPDATE attendance SET clock_in_lat=:lat, clock_in_lng=:lng, "
-                    "clock_in_accuracy=:acc, clock_in_address=:addr WHERE id=:id"
-                ), {
-                    'lat': att.latitude, 'lng': att.longitude,
-                    'acc': att.accuracy, 'addr': address,
-                    'id': attendance.id,
-                })
-                await session.commit()
-            except Exception:
-                await session.rollback()
         return attendance
     except HTTPException:
         await session.rollback()
@@ -86,23 +76,10 @@ async def clock_out(
         hours = round(delta.total_seconds() / 3600.0, 2)
         attendance.hours_worked = hours
         attendance.status = 'completed'
+        await geotag(session, "attendance.clock_out", attendance.id,
+                     latitude, longitude, accuracy)
         await session.commit()
         await session.refresh(attendance)
-        # Best-effort geo persist
-        if latitude is not None and longitude is not None:
-            try:
-                address = await reverse_geocode(latitude, longitude)
-                await session.execute(text(
-                    "UPDATE attendance SET clock_out_lat=:lat, clock_out_lng=:lng, "
-                    "clock_out_accuracy=:acc, clock_out_address=:addr WHERE id=:id"
-                ), {
-                    'lat': latitude, 'lng': longitude,
-                    'acc': accuracy, 'addr': address,
-                    'id': attendance.id,
-                })
-                await session.commit()
-            except Exception:
-                await session.rollback()
         return attendance
     except HTTPException:
         await session.rollback()
@@ -318,22 +295,10 @@ async def quick_attendance(request: QuickAttendanceRequest, session: AsyncSessio
                 notes=request.notes
             )
             session.add(attendance)
+            await session.flush()
+            await geotag(session, "attendance.clock_in", attendance.id,
+                         request.latitude, request.longitude, request.accuracy)
             await session.commit()
-            # Best-effort geo persist
-            if request.latitude is not None and request.longitude is not None:
-                try:
-                    address = await reverse_geocode(request.latitude, request.longitude)
-                    await session.execute(text(
-                        "UPDATE attendance SET clock_in_lat=:lat, clock_in_lng=:lng, "
-                        "clock_in_accuracy=:acc, clock_in_address=:addr WHERE id=:id"
-                    ), {
-                        'lat': request.latitude, 'lng': request.longitude,
-                        'acc': request.accuracy, 'addr': address,
-                        'id': attendance.id,
-                    })
-                    await session.commit()
-                except Exception:
-                    await session.rollback()
             
             return QuickAttendanceResponse(
                 success=True,
@@ -368,22 +333,9 @@ async def quick_attendance(request: QuickAttendanceRequest, session: AsyncSessio
             if request.notes:
                 attendance.notes = f"{attendance.notes or ''}\nClock-out: {request.notes}".strip()
             
+            await geotag(session, "attendance.clock_out", attendance.id,
+                         request.latitude, request.longitude, request.accuracy)
             await session.commit()
-            # Best-effort geo persist (clock-out)
-            if request.latitude is not None and request.longitude is not None:
-                try:
-                    address = await reverse_geocode(request.latitude, request.longitude)
-                    await session.execute(text(
-                        "UPDATE attendance SET clock_out_lat=:lat, clock_out_lng=:lng, "
-                        "clock_out_accuracy=:acc, clock_out_address=:addr WHERE id=:id"
-                    ), {
-                        'lat': request.latitude, 'lng': request.longitude,
-                        'acc': request.accuracy, 'addr': address,
-                        'id': attendance.id,
-                    })
-                    await session.commit()
-                except Exception:
-                    await session.rollback()
             
             return QuickAttendanceResponse(
                 success=True,
@@ -492,6 +444,66 @@ async def get_attendance_status(session: AsyncSession = Depends(get_session)):
         raise HTTPException(status_code=500, detail=f"Error fetching attendance status: {str(e)}")
 
 
+def _detailed_log_window(start_date: Optional[date], end_date: Optional[date]):
+    # Default to last 30 days if no dates provided
+    if not end_date:
+        end_date = date.today()
+    if not start_date:
+        start_date = end_date - timedelta(days=30)
+    query = select(Attendance, Staff).join(Staff, Attendance.staff_id == Staff.id)
+    query = query.where(func.date(Attendance.clock_in) >= start_date)
+    query = query.where(func.date(Attendance.clock_in) <= end_date)
+    return query.order_by(Attendance.clock_in.desc())
+
+
+def _detailed_log_entry(attendance: Attendance, staff: Staff) -> dict:
+    # Standard work time (9:00 AM)
+    STANDARD_START_TIME = time(9, 0)
+
+    # Make datetime timezone-naive if it's timezone-aware
+    clock_in_naive = attendance.clock_in.replace(tzinfo=None) if attendance.clock_in.tzinfo else attendance.clock_in
+    attendance_date = clock_in_naive.date()
+
+    # Calculate punctuality
+    expected_datetime = datetime.combine(attendance_date, STANDARD_START_TIME)
+    time_diff = (clock_in_naive - expected_datetime).total_seconds() / 60  # minutes
+
+    if time_diff <= 0:
+        punctuality_status = 'early'
+        punctuality_minutes = abs(int(time_diff))
+    elif time_diff <= 15:
+        punctuality_status = 'on_time'
+        punctuality_minutes = int(time_diff)
+    elif time_diff <= 30:
+        punctuality_status = 'slightly_late'
+        punctuality_minutes = int(time_diff)
+    else:
+        punctuality_status = 'late'
+        punctuality_minutes = int(time_diff)
+
+    # Handle clock_out timezone
+    clock_out_str = None
+    if attendance.clock_out:
+        clock_out_naive = attendance.clock_out.replace(tzinfo=None) if attendance.clock_out.tzinfo else attendance.clock_out
+        clock_out_str = clock_out_naive.strftime('%H:%M:%S')
+
+    return {
+        'attendance_id': str(attendance.id),
+        'staff_id': str(staff.id),
+        'employee_id': staff.employee_id,
+        'staff_name': f"{staff.first_name} {staff.last_name}",
+        'position': staff.position,
+        'date': attendance_date.strftime('%Y-%m-%d'),
+        'clock_in': clock_in_naive.strftime('%H:%M:%S'),
+        'clock_out': clock_out_str,
+        'hours_worked': attendance.hours_worked,
+        'punctuality_status': punctuality_status,
+        'punctuality_minutes': punctuality_minutes,
+        'status': attendance.status,
+        'notes': attendance.notes
+    }
+
+
 @router.get('/detailed-log', response_model=List[dict])
 async def get_detailed_attendance_log(
     start_date: Optional[date] = Query(None),
@@ -500,77 +512,24 @@ async def get_detailed_attendance_log(
 ):
     """Get detailed attendance log with punctuality analysis"""
     try:
-        # Default to last 30 days if no dates provided
-        if not end_date:
-            end_date = date.today()
-        if not start_date:
-            start_date = end_date - timedelta(days=30)
-        
-        # Standard work time (9:00 AM)
-        STANDARD_START_TIME = time(9, 0)
-        
-        # Get all attendance records in date range
-        query = select(Attendance, Staff).join(Staff, Attendance.staff_id == Staff.id)
-        query = query.where(func.date(Attendance.clock_in) >= start_date)
-        query = query.where(func.date(Attendance.clock_in) <= end_date)
-        query = query.order_by(Attendance.clock_in.desc())
-        
-        result = await session.execute(query)
-        records = result.all()
-        
-        detailed_log = []
-        for attendance, staff in records:
-            # Make datetime timezone-naive if it's timezone-aware
-            clock_in_naive = attendance.clock_in.replace(tzinfo=None) if attendance.clock_in.tzinfo else attendance.clock_in
-            clock_in_time = clock_in_naive.time()
-            attendance_date = clock_in_naive.date()
-            
-            # Calculate punctuality
-            expected_datetime = datetime.combine(attendance_date, STANDARD_START_TIME)
-            actual_datetime = clock_in_naive
-            
-            time_diff = (actual_datetime - expected_datetime).total_seconds() / 60  # minutes
-            
-            if time_diff <= 0:
-                punctuality_status = 'early'
-                punctuality_minutes = abs(int(time_diff))
-            elif time_diff <= 15:
-                punctuality_status = 'on_time'
-                punctuality_minutes = int(time_diff)
-            elif time_diff <= 30:
-                punctuality_status = 'slightly_late'
-                punctuality_minutes = int(time_diff)
-            else:
-                punctuality_status = 'late'
-                punctuality_minutes = int(time_diff)
-            
-            # Handle clock_out timezone
-            clock_out_str = None
-            if attendance.clock_out:
-                clock_out_naive = attendance.clock_out.replace(tzinfo=None) if attendance.clock_out.tzinfo else attendance.clock_out
-                clock_out_str = clock_out_naive.strftime('%H:%M:%S')
-            
-            detailed_log.append({
-                'attendance_id': str(attendance.id),
-                'staff_id': str(staff.id),
-                'employee_id': staff.employee_id,
-                'staff_name': f"{staff.first_name} {staff.last_name}",
-                'position': staff.position,
-                'date': attendance_date.strftime('%Y-%m-%d'),
-                'clock_in': clock_in_naive.strftime('%H:%M:%S'),
-                'clock_out': clock_out_str,
-                'hours_worked': attendance.hours_worked,
-                'punctuality_status': punctuality_status,
-                'punctuality_minutes': punctuality_minutes,
-                'status': attendance.status,
-                'notes': attendance.notes
-            })
-        
-        return detailed_log
+        result = await session.execute(_detailed_log_window(start_date, end_date))
+        return [_detailed_log_entry(attendance, staff)
+                for attendance, staff in result.all()]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching detailed log: {str(e)}")
 
 
+async def iter_detailed_log(session: AsyncSession, *,
+                            start_date: Optional[date] = None,
+                            end_date: Optional[date] = None):
+    """The detailed log streamed from a server-side cursor, for exports."""
+    result = await session.stream(
+        _detailed_log_window(start_date, end_date)
+        .execution_options(yield_per=1000))
+    async for attendance, staff in result:
+        yield _detailed_log_entry(attendance, staff)
+
+
 @router.get('/best-performers', response_model=List[dict])
 async def get_best_performing_staff(
     start_date: Optional[date] = Query(None),
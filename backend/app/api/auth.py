@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
+from sqlalchemy import select
 from app.db import get_session
-from app.models import User, UserSession, AuditLog, RolePermission, UserModuleAccess, user_warehouses, Warehouse
+from app.models import User, UserSession, AuditLog, UserModuleAccess, user_warehouses, Warehouse
 from sqlalchemy import delete, and_
 from pydantic import BaseModel, EmailStr
 from typing import Optional
@@ -16,7 +16,8 @@ import os
 import secrets
 import bcrypt
 from jose import jwt, JWTError
-from app.services.geocoding import reverse_geocode
+from app.services import authz
+from app.services.geocoding import geotag
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
@@ -308,39 +309,16 @@ async def login(credentials: UserLogin, request: Request, db: AsyncSession = Dep
         user_agent=(request.headers.get('user-agent') if request else None),
     )
     db.add(audit_log)
-    
-    await db.commit()
+    # Coordinates commit with the log entry; the address is filled in later
+    # by the outbox dispatcher, so geocoding no longer delays the login.
+    await geotag(db, "audit_logs", audit_log.id, credentials.latitude,
+                 credentials.longitude, credentials.accuracy)
 
-    # Best-effort geo enrichment for this audit log entry
-    if credentials.latitude is not None and credentials.longitude is not None:
-        try:
-            address = await reverse_geocode(credentials.latitude, credentials.longitude)
-            await db.execute(text(
-                "UPDATE audit_logs SET latitude=:lat, longitude=:lng, accuracy=:acc, "
-                "location_address=:addr WHERE id=:id"
-            ), {
-                'lat': credentials.latitude, 'lng': credentials.longitude,
-                'acc': credentials.accuracy, 'addr': address,
-                'id': audit_log.id,
-            })
-            await db.commit()
-        except Exception:
-            await db.rollback()
+    await db.commit()
     
-    # Fetch module access for user
-    access_result = await db.execute(
-        select(UserModuleAccess).where(UserModuleAccess.user_id == user.id)
-    )
-    access_rows = access_result.scalars().all()
-    access_map = {r.module_key: r.is_granted for r in access_rows}
-    is_admin = user.role == 'admin'
-    all_mods = [
-        'dashboard','staff','attendance','products','rawMaterials','stockManagement',
-        'production','productionCompletions','consumables','machinesEquipment','sales',
-        'paymentTracking','procurement','logistics','marketing','hrCustomerCare',
-        'reports','financial','userManagement','settings'
-    ]
-    module_access = {m: access_map.get(m, True if is_admin else (m == 'dashboard')) for m in all_mods}
+    # Module access for the menu, from the authorization cache
+    grants = await authz.grants_for(db, user.id)
+    module_access = dict(grants.modules) if grants else {}
     
     return {
         "access_token": access_token,
@@ -427,39 +405,15 @@ async def login_phone(credentials: PhoneLogin, request: Request, db: AsyncSessio
         user_agent=(request.headers.get('user-agent') if request else None),
     )
     db.add(audit_log)
-    
-    await db.commit()
+    # Same geotagging as the e-mail login.
+    await geotag(db, "audit_logs", audit_log.id, credentials.latitude,
+                 credentials.longitude, credentials.accuracy)
 
-    # Best-effort geo enrichment
-    if credentials.latitude is not None and credentials.longitude is not None:
-        try:
-            address = await reverse_geocode(credentials.latitude, credentials.longitude)
-            await db.execute(text(
-                "UPDATE audit_logs SET latitude=:lat, longitude=:lng, accuracy=:acc, "
-                "location_address=:addr WHERE id=:id"
-            ), {
-                'lat': credentials.latitude, 'lng': credentials.longitude,
-                'acc': credentials.accuracy, 'addr': address,
-                'id': audit_log.id,
-            })
-            await db.commit()
-        except Exception:
-            await db.rollback()
+    await db.commit()
     
-    # Fetch module access for user
-    access_result = await db.execute(
-        select(UserModuleAccess).where(UserModuleAccess.user_id == user.id)
-    )
-    access_rows = access_result.scalars().all()
-    access_map = {r.module_key: r.is_granted for r in access_rows}
-    is_admin = user.role == 'admin'
-    all_mods = [
-        'dashboard','staff','attendance','products','rawMaterials','stockManagement',
-        'production','productionCompletions','consumables','machinesEquipment','sales',
-        'paymentTracking','procurement','logistics','marketing','hrCustomerCare',
-        'reports','financial','userManagement','settings'
-    ]
-    module_access = {m: access_map.get(m, True if is_admin else (m == 'dashboard')) for m in all_mods}
+    # Module access for the menu, from the authorization cache
+    grants = await authz.grants_for(db, user.id)
+    module_access = dict(grants.modules) if grants else {}
     
     return {
         "access_token": access_token,
@@ -577,37 +531,12 @@ async def check_permission(
     payload = decode_token(token)
     user_id = payload.get("sub")
     
-    result = await db.execute(select(User).where(User.id == uuid.UUID(user_id)))
-    user = result.scalar_one_or_none()
+    grants = await authz.grants_for(db, uuid.UUID(user_id))
     
-    if not user:
+    if not grants:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if user.role == "admin":
-        return {"has_permission": True}
-    
-    result = await db.execute(
-        select(RolePermission).where(
-            RolePermission.role == user.role,
-            RolePermission.module == module
-        )
-    )
-    permission = result.scalar_one_or_none()
-    
-    if not permission:
-        return {"has_permission": False}
-    
-    action_map = {
-        "view": permission.can_view,
-        "create": permission.can_create,
-        "edit": permission.can_edit,
-        "delete": permission.can_delete,
-        "approve": permission.can_approve
-    }
-    
-    has_permission = action_map.get(action, False)
-    
-    return {"has_permission": has_permission}
+    return {"has_permission": grants.can(module, action)}
 
 
 # User Management Endpoints
@@ -683,6 +612,7 @@ async def reject_user(user_id: UUID, db: AsyncSession = Depends(get_session), _a
         
         await db.delete(user)
         await db.commit()
+        authz.invalidate_user(user_id)
         
         return {
             "success": True,
@@ -782,6 +712,7 @@ async def update_user_role(user_id: UUID, body: UpdateRoleRequest, db: AsyncSess
         )
         db.add(audit_log)
         await db.commit()
+        authz.invalidate_user(user_id)
         return {"success": True, "message": f"User {user.email} role changed to {body.role}"}
     except HTTPException:
         raise
@@ -821,13 +752,7 @@ async def admin_reset_password(user_id: UUID, db: AsyncSession = Depends(get_ses
 
 # ======================== MODULE ACCESS MANAGEMENT ========================
 
-ALL_MODULES = [
-    'dashboard', 'staff', 'attendance', 'products', 'rawMaterials',
-    'stockManagement', 'production', 'productionCompletions', 'consumables',
-    'machinesEquipment', 'transfers', 'sales', 'paymentTracking', 'procurement',
-    'logistics', 'marketing', 'hrCustomerCare', 'reports', 'financial',
-    'userManagement', 'settings'
-]
+ALL_MODULES = authz.ALL_MODULES
 
 MODULE_LABELS = {
     'dashboard': 'Dashboard', 'staff': 'Staff', 'attendance': 'Attendance',
@@ -864,13 +789,7 @@ async def get_user_module_access(user_id: UUID, db: AsyncSession = Depends(get_s
     # If no records exist yet, admin gets all, others get dashboard only
     user_result = await db.execute(select(User).where(User.id == user_id))
     user = user_result.scalar_one_or_none()
-    is_admin = user and user.role == 'admin'
-    modules = {}
-    for m in ALL_MODULES:
-        if m in access_map:
-            modules[m] = access_map[m]
-        else:
-            modules[m] = True if is_admin else (m == 'dashboard')
+    modules = authz.module_access(user.role if user else "", access_map)
     return {"user_id": str(user_id), "modules": modules}
 
 
@@ -890,14 +809,7 @@ async def get_all_users_module_access(db: AsyncSession = Depends(get_session), _
     result = []
     for u in users:
         uid = str(u.id)
-        is_admin = u.role == 'admin'
-        user_access = access_by_user.get(uid, {})
-        modules = {}
-        for m in ALL_MODULES:
-            if m in user_access:
-                modules[m] = user_access[m]
-            else:
-                modules[m] = True if is_admin else (m == 'dashboard')
+        modules = authz.module_access(u.role, access_by_user.get(uid, {}))
         result.append({
             "user_id": uid,
             "full_name": u.full_name,
@@ -941,6 +853,7 @@ async def set_user_module_access(user_id: UUID, body: ModuleAccessUpdate, db: As
         )
         db.add(audit_log)
         await db.commit()
+        authz.invalidate_user(user_id)
         return {"success": True, "message": "Module access updated successfully"}
     except Exception as e:
         await db.rollback()
@@ -1010,6 +923,7 @@ async def set_user_warehouse_access(user_id: UUID, body: WarehouseAccessUpdate,
         )
         db.add(audit_log)
         await db.commit()
+        authz.invalidate_user(user_id)
         return {"success": True, "message": "Warehouse access updated successfully"}
     except Exception as e:
         await db.rollback()
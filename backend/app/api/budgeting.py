@@ -15,7 +15,8 @@ from app.db import get_session
 from app.api.auth import require_authenticated_user, require_admin
 from app.models import User
 from app.services.budgeting import (
-    resolve_cost_centre, cost_centre_report, approve_budget, budget_variance)
+    resolve_cost_centre, cost_centre_report, approve_budget, budget_variance,
+    variance_grid)
 
 router = APIRouter(prefix='/api/budgeting', tags=['Budgeting'])
 
@@ -247,3 +248,15 @@ async def get_variance(
     return await budget_variance(
         session, fiscal_year=fiscal_year, start=start, end=end,
         cost_centre=cost_centre)
+
+
+@router.get('/variance/grid')
+async def get_variance_grid(
+    fiscal_year: int = Query(...),
+    session: AsyncSession = Depends(get_session),
+    _user: User = Depends(require_authenticated_user),
+):
+    """Budget against actual for every account, cost centre and month of a
+    fiscal year, served from a per-year cache until the year's journal moves.
+    """
+    return await variance_grid(session, fiscal_year=fiscal_year)
@@ -13,6 +13,7 @@ from datetime import datetime, timezone
 
 from app.db import get_session
 from app.api.auth import get_current_user
+from app.services import bootstrap
 from app.services.inventory import apply_stock_movement
 
 router = APIRouter(prefix='/api/damaged-transfers')
@@ -48,11 +49,11 @@ CREATE_INDEX_SQLS = [
 ]
 
 
+bootstrap.register("damaged_transfers", 1, [CREATE_TABLE_SQL, *CREATE_INDEX_SQLS])
+
+
 async def _ensure_table(session: AsyncSession):
-    await session.execute(text(CREATE_TABLE_SQL))
-    for idx_sql in CREATE_INDEX_SQLS:
-        await session.execute(text(idx_sql))
-    await session.commit()
+    await bootstrap.ensure(session, "damaged_transfers")
 
 
 async def _auth_user(authorization: Optional[str], session: AsyncSession):
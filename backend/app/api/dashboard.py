@@ -4,19 +4,28 @@ from __future__ import annotations
 from datetime import date
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import get_session
 from app.api.auth import require_authenticated_user
 from app.models import User
+from app.services import http_cache
 from app.services.dashboard import executive_summary
 
 router = APIRouter(prefix='/api/dashboard', tags=['Executive Dashboard'])
 
+# Everything executive_summary reads, for its ETag.
+SUMMARY_TABLES = (
+    'gl_accounts', 'gl_journal_entries', 'gl_journal_lines', 'budgets',
+    'invoices', 'purchase_invoices',
+)
+
 
 @router.get('/executive')
 async def executive(
+    request: Request,
+    response: Response,
     as_at: Optional[date] = Query(None),
     session: AsyncSession = Depends(get_session),
     _user: User = Depends(require_authenticated_user),
@@ -27,4 +36,8 @@ async def executive(
     (an unreconciled cash flow, unallocated cost, no approved budget) the
     dashboard returns a warning rather than presenting it as fact.
     """
+    cached = await http_cache.not_modified(
+        request, response, session, SUMMARY_TABLES, daily=True)
+    if cached is not None:
+        return cached
     return await executive_summary(session, as_at=as_at)
@@ -0,0 +1,178 @@
+"""Report exports: any registered report as a CSV or XLSX download.
+
+`GET /api/exports/{report}?format=csv&...` streams the report straight back;
+the remaining query parameters are the report's own filters, under the same
+names its on-screen endpoint uses. `POST /api/exports/{report}/jobs` runs
+the same export in the background and answers 202 with links to poll and to
+download it. See app.services.exports.
+"""
+from __future__ import annotations
+
+from datetime import date
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.accounting import LEDGER_COLUMNS
+from app.api.attendance import iter_detailed_log
+from app.api.auth import require_authenticated_user
+from app.api.settlements import iter_settlement_register
+from app.db import get_session
+from app.models import User
+from app.services import exports
+from app.services.debtors import iter_debtors
+from app.services.exports import Report, choice, flag, register
+from app.services.ledger import iter_account_ledger, iter_trial_balance
+from app.services.payables import iter_supplier_aging
+from app.services.stock_levels import (
+    iter_product_levels, iter_raw_material_levels)
+
+router = APIRouter(prefix='/api/exports', tags=['Exports'])
+
+DATES = {"start": date.fromisoformat, "end": date.fromisoformat}
+
+register(Report(
+    "trial_balance", "Trial balance",
+    ("code", "name", "account_type", "debit", "credit", "balance"),
+    iter_trial_balance, DATES))
+
+register(Report(
+    "account_ledger", "Account ledger", LEDGER_COLUMNS, iter_account_ledger,
+    {"account_code": str, **DATES}, required=("account_code",)))
+
+register(Report(
+    "debtors", "Debtors",
+    ("customer_name", "phone", "email", "address", "invoice_count",
+     "total_invoiced", "total_paid", "balance", "legacy_debt_balance",
+     "is_overdue", "days_overdue", "earliest_due_date", "last_invoice_date"),
+    iter_debtors,
+    {"search": str, "overdue_only": flag, "min_balance": float,
+     "sort": choice("balance", "days_overdue", "name"),
+     "as_of": date.fromisoformat}))
+
+register(Report(
+    "supplier_aging", "Supplier aging",
+    ("supplier_name", "po_number", "total_amount", "balance",
+     "days_overdue", "bucket"),
+    iter_supplier_aging, {"as_at": date.fromisoformat}))
+
+register(Report(
+    "settlements", "Settlements",
+    ("reference", "status", "created_at", "distributed_at", "invoice_number",
+     "order_number", "customer_name", "payment_method", "gross_amount",
+     "allocated_amount", "obligation_amount", "destinations",
+     "failure_reason"),
+    iter_settlement_register,
+    {"status": str, "account_code": str, **DATES}))
+
+register(Report(
+    "attendance_log", "Attendance log",
+    ("date", "employee_id", "staff_name", "position", "clock_in",
+     "clock_out", "hours_worked", "punctuality_status",
+     "punctuality_minutes", "status", "notes"),
+    iter_detailed_log,
+    {"start_date": date.fromisoformat, "end_date": date.fromisoformat}))
+
+STOCK_FILTERS = {"warehouse_id": UUID, "low_stock_only": flag}
+
+register(Report(
+    "product_levels", "Product stock",
+    ("warehouse_name", "product_sku", "product_name", "current_stock",
+     "reorder_level", "product_unit", "is_low_stock", "updated_at"),
+    iter_product_levels, STOCK_FILTERS))
+
+register(Report(
+    "raw_material_levels", "Raw material stock",
+    ("warehouse_name", "raw_material_sku", "raw_material_name",
+     "current_stock", "reorder_level", "unit", "is_low_stock", "updated_at"),
+    iter_raw_material_levels, STOCK_FILTERS))
+
+
+def _links(job_id) -> dict:
+    return {"status_url": f"{router.prefix}/jobs/{job_id}",
+            "download_url": f"{router.prefix}/jobs/{job_id}/download"}
+
+
+@router.get('')
+async def list_reports(_user: User = Depends(require_authenticated_user)):
+    return [
+        {"name": r.name, "title": r.title, "columns": list(r.columns),
+         "params": list(r.params), "required": list(r.required)}
+        for r in exports.REPORTS.values()
+    ]
+
+
+@router.get('/jobs')
+async def list_export_jobs(
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(require_authenticated_user),
+):
+    """The caller's recent export jobs, newest first."""
+    return [{**j, **_links(j["id"])}
+            for j in await exports.list_jobs(session, user.id)]
+
+
+@router.get('/jobs/{job_id}')
+async def get_export_job(
+    job_id: UUID,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(require_authenticated_user),
+):
+    job = await exports.get_job(session, job_id, user.id)
+    return {**job, **_links(job_id)}
+
+
+@router.get('/jobs/{job_id}/download')
+async def download_export_job(
+    job_id: UUID,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(require_authenticated_user),
+):
+    job = await exports.get_job(session, job_id, user.id)
+    if job["status"] != "done":
+        raise HTTPException(
+            status_code=409, detail=f"Export is {job['status']}, not ready")
+    path = exports.job_path(job_id, job["format"])
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Export file has expired")
+    report = exports.REPORTS.get(job["report"])
+    name = (report.filename(job["params"]) if report
+            else job["report"].replace("_", "-"))
+    return FileResponse(path, media_type=exports.FORMATS[job["format"]],
+                        filename=f"{name}.{job['format']}")
+
+
+@router.post('/{report}/jobs', status_code=202)
+async def start_export_job(
+    report: str,
+    request: Request,
+    format: str = Query("csv"),
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(require_authenticated_user),
+):
+    """Run the export in the background; poll `status_url` until done."""
+    spec = exports.get_report(report)
+    exports.check_format(format)
+    query = exports.job_query(spec, request.query_params)
+    job_id = await exports.create_job(session, spec, format, query, user.id)
+    await session.commit()
+    exports.start_job(job_id, spec, format, query)
+    return JSONResponse(status_code=202, content={
+        "id": str(job_id), "report": spec.name, "format": format,
+        "status": "queued", **_links(job_id)})
+
+
+@router.get('/{report}')
+async def export_report(
+    report: str,
+    request: Request,
+    format: str = Query("csv"),
+    _user: User = Depends(require_authenticated_user),
+):
+    """The report as a file, streamed from a server-side cursor."""
+    spec = exports.get_report(report)
+    exports.check_format(format)
+    params = exports.parse_params(spec, request.query_params)
+    return await exports.download(spec, format, params)
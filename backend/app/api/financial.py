@@ -1,11 +1,9 @@
 """
 Financial reporting API - Admin only access to company financial status
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy import func, and_, or_
 from typing import Dict, Any
 from decimal import Decimal
 from datetime import datetime, timedelta, timezone
@@ -22,294 +20,34 @@ from reportlab.platypus import (
 )
 import os
 
-from app.db import get_session
-from app.services.receivables import revenue_between, outstanding_receivables
-from app.models import (
-    SalesOrder, Product, RawMaterial, StockMovement,
-    Staff, Attendance, ProductionOrder, Customer, Warehouse,
-    StockLevel, ProductPricing
-)
+from app.db import get_read_session
+from app.services.company_status import company_status, compute_company_status
 from app.schemas import ApiResponse
 
 router = APIRouter(prefix='/api/financial')
 
 
 async def calculate_financial_metrics(session: AsyncSession) -> Dict[str, Any]:
-    """Calculate comprehensive financial metrics for the company using real data"""
-    from sqlalchemy import text
-    
-    # =====================================================================
-    # 1. REVENUE & SALES ANALYSIS (from sales_orders table)
-    # =====================================================================
-    # Revenue is cash actually collected, read from the `payments` rows -- the
-    # same source profits.py and payment-tracking use.
-    #
-    # This used to sum sales_orders.total_amount WHERE payment_status = 'paid',
-    # which had two independent errors: an order with 99% collected counted as
-    # ZERO revenue AND its full value as outstanding, and orders settled via
-    # sales.py's mark-paid path (which wrote no Payment row) were counted here
-    # but were invisible to profits.py. The two dashboards disagreed by the
-    # entire value of every such sale.
-    total_revenue = float(await revenue_between(session))
-
-    # Outstanding is computed per invoice from what remains uncollected,
-    # not from a status flag.
-    outstanding_payments = float(await outstanding_receivables(session))
-    
-    # Order counts
-    total_orders_result = await session.execute(select(func.count(SalesOrder.id)))
-    total_orders = total_orders_result.scalar() or 0
-    
-    paid_orders_result = await session.execute(
-        select(func.count(SalesOrder.id)).where(SalesOrder.payment_status == 'paid')
-    )
-    paid_orders_count = paid_orders_result.scalar() or 0
-    
-    unpaid_orders_result = await session.execute(
-        select(func.count(SalesOrder.id)).where(SalesOrder.payment_status.in_(['unpaid', 'partial']))
-    )
-    unpaid_orders_count = unpaid_orders_result.scalar() or 0
-    
-    # Revenue by month (last 12 calendar months).
-    #
-    # The old loop stepped back by timedelta(days=30*i). Calendar months are
-    # not 30 days, so buckets drifted: run on 1 March, i=1 gives 30 January,
-    # and February vanished from the chart entirely. On other dates the same
-    # month appeared twice. Twelve 30-day steps also span only 330 days, so
-    # the "last 12 months" was missing roughly a month at the far end.
-    #
-    # Walk real calendar months instead, and read the same payments source as
-    # the headline figure so the chart sums to the total above it.
-    revenue_by_month = []
-    now = datetime.now(timezone.utc)
-    year, month = now.year, now.month
-    for _ in range(12):
-        month_start = datetime(year, month, 1, tzinfo=timezone.utc)
-        if month == 12:
-            next_start = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-        else:
-            next_start = datetime(year, month + 1, 1, tzinfo=timezone.utc)
-
-        monthly_revenue = float(await revenue_between(
-            session, start=month_start, end=next_start))
-
-        revenue_by_month.append({
-            'month': month_start.strftime('%b %Y'),
-            'revenue': monthly_revenue
-        })
-
-        month -= 1
-        if month == 0:
-            month, year = 12, year - 1
+    """Calculate comprehensive financial metrics for the company using real data.
 
-    revenue_by_month.reverse()  # oldest first, as a time series should read
-    
-    # =====================================================================
-    # 2. PRODUCT INVENTORY VALUATION (from stock_levels + product_pricing)
-    # =====================================================================
-    # Use raw SQL: JOIN stock_levels -> products -> product_pricing
-    # Use the product's primary unit to find the matching cost_price from product_pricing
-    product_inv_sql = text("""
-        SELECT 
-            COALESCE(SUM(sl.current_stock * COALESCE(pp_match.cost_price, p.cost_price, 0)), 0) as total_value,
-            COALESCE(SUM(sl.current_stock), 0) as total_units,
-            COUNT(DISTINCT sl.product_id) as product_count
-        FROM stock_levels sl
-        JOIN products p ON sl.product_id = p.id
-        LEFT JOIN product_pricing pp_match ON pp_match.product_id = p.id AND pp_match.unit = p.unit
-        WHERE sl.product_id IS NOT NULL AND sl.current_stock > 0
-    """)
-    product_inv_result = await session.execute(product_inv_sql)
-    product_inv_row = product_inv_result.fetchone()
-    product_inventory_value = float(product_inv_row.total_value) if product_inv_row else 0.0
-    total_products_in_stock = int(product_inv_row.product_count) if product_inv_row else 0
-    total_product_units = float(product_inv_row.total_units) if product_inv_row else 0
-    
-    # =====================================================================
-    # 3. RAW MATERIAL INVENTORY VALUATION (from stock_levels + raw_materials)
-    # =====================================================================
-    raw_mat_inv_sql = text("""
-        SELECT 
-            COALESCE(SUM(sl.current_stock * COALESCE(rm.unit_cost, 0)), 0) as total_value,
-            COALESCE(SUM(sl.current_stock), 0) as total_units,
-            COUNT(DISTINCT sl.raw_material_id) as material_count
-        FROM stock_levels sl
-        JOIN raw_materials rm ON sl.raw_material_id = rm.id
-        WHERE sl.raw_material_id IS NOT NULL AND sl.current_stock > 0
-    """)
-    raw_mat_result = await session.execute(raw_mat_inv_sql)
-    raw_mat_row = raw_mat_result.fetchone()
-    raw_materials_value = float(raw_mat_row.total_value) if raw_mat_row else 0.0
-    total_raw_materials_in_stock = int(raw_mat_row.material_count) if raw_mat_row else 0
-    total_raw_material_units = float(raw_mat_row.total_units) if raw_mat_row else 0
-    
-    total_inventory_value = product_inventory_value + raw_materials_value
-    
-    # =====================================================================
-    # 4. PAYROLL EXPENSES (current month)
-    # =====================================================================
-    current_month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    staff_query = select(Staff)
-    staff_result = await session.execute(staff_query)
-    all_staff = staff_result.scalars().all()
-    
-    total_payroll = 0.0
-    for staff_member in all_staff:
-        attendance_query = select(Attendance).where(
-            and_(
-                Attendance.staff_id == staff_member.id,
-                Attendance.clock_in >= current_month_start
-            )
-        )
-        attendance_result = await session.execute(attendance_query)
-        attendance_records = attendance_result.scalars().all()
-        
-        total_hours = 0.0
-        for record in attendance_records:
-            if record.clock_out:
-                hours = (record.clock_out - record.clock_in).total_seconds() / 3600
-                total_hours += hours
-        
-        staff_pay = total_hours * float(staff_member.hourly_rate or 0)
-        total_payroll += staff_pay
-    
-    # =====================================================================
-    # 5. PRODUCTION ANALYSIS
-    # =====================================================================
-    prod_total = await session.execute(select(func.count(ProductionOrder.id)))
-    total_production = prod_total.scalar() or 0
-    
-    prod_completed = await session.execute(
-        select(func.count(ProductionOrder.id)).where(ProductionOrder.status == 'completed')
-    )
-    completed_production = prod_completed.scalar() or 0
-    
-    prod_in_progress = await session.execute(
-        select(func.count(ProductionOrder.id)).where(ProductionOrder.status == 'in_progress')
-    )
-    in_progress_production = prod_in_progress.scalar() or 0
-    
-    prod_pending = await session.execute(
-        select(func.count(ProductionOrder.id)).where(ProductionOrder.status == 'pending')
-    )
-    pending_production = prod_pending.scalar() or 0
-    
-    # =====================================================================
-    # 6. FINANCIAL POSITION
-    # =====================================================================
-    total_assets = total_inventory_value + outstanding_payments
-    total_liabilities = total_payroll
-    net_worth = total_revenue + total_inventory_value - total_payroll
-    
-    total_expenses = total_payroll
-    net_profit = total_revenue - total_expenses
-    profit_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
-    
-    # =====================================================================
-    # 7. ENTITY COUNTS
-    # =====================================================================
-    customers_result = await session.execute(select(func.count(Customer.id)))
-    total_customers = customers_result.scalar() or 0
-    
-    products_result = await session.execute(select(func.count(Product.id)))
-    total_products = products_result.scalar() or 0
-    
-    raw_materials_result = await session.execute(select(func.count(RawMaterial.id)))
-    total_raw_materials = raw_materials_result.scalar() or 0
-    
-    staff_count_result = await session.execute(select(func.count(Staff.id)))
-    total_staff = staff_count_result.scalar() or 0
-    
-    payment_collection_rate = (paid_orders_count / total_orders * 100) if total_orders > 0 else 0
-    
-    # =====================================================================
-    # 8. DETAILED PRODUCT INVENTORY BREAKDOWN (top items by value)
-    # =====================================================================
-    detailed_product_sql = text("""
-        SELECT p.name, p.unit, sl.current_stock, 
-               COALESCE(pp_match.cost_price, p.cost_price, 0) as unit_cost,
-               sl.current_stock * COALESCE(pp_match.cost_price, p.cost_price, 0) as line_value
-        FROM stock_levels sl
-        JOIN products p ON sl.product_id = p.id
-        LEFT JOIN product_pricing pp_match ON pp_match.product_id = p.id AND pp_match.unit = p.unit
-        WHERE sl.product_id IS NOT NULL AND sl.current_stock > 0
-        ORDER BY line_value DESC
-    """)
-    detailed_result = await session.execute(detailed_product_sql)
-    product_breakdown = []
-    for row in detailed_result:
-        product_breakdown.append({
-            'name': row.name,
-            'unit': row.unit,
-            'stock': float(row.current_stock),
-            'unit_cost': float(row.unit_cost),
-            'value': float(row.line_value)
-        })
-    
-    return {
-        # Revenue Metrics
-        'total_revenue': total_revenue,
-        'outstanding_payments': outstanding_payments,
-        'paid_orders_count': paid_orders_count,
-        'unpaid_orders_count': unpaid_orders_count,
-        'revenue_by_month': list(reversed(revenue_by_month)),
-        
-        # Inventory Metrics
-        'product_inventory_value': product_inventory_value,
-        'raw_materials_value': raw_materials_value,
-        'total_inventory_value': total_inventory_value,
-        'total_products_in_stock': total_products_in_stock,
-        'total_raw_materials_in_stock': total_raw_materials_in_stock,
-        'total_product_units': total_product_units,
-        'total_raw_material_units': total_raw_material_units,
-        'product_breakdown': product_breakdown,
-        
-        # Expense Metrics
-        'monthly_payroll': total_payroll,
-        'total_expenses': total_expenses,
-        
-        # Financial Position
-        'total_assets': total_assets,
-        'total_liabilities': total_liabilities,
-        'net_worth': net_worth,
-        
-        # Profitability
-        'net_profit': net_profit,
-        'profit_margin': profit_margin,
-        
-        # Sales
-        'total_sales': total_orders,
-        'paid_sales': paid_orders_count,
-        'total_customers': total_customers,
-        'payment_collection_rate': round(payment_collection_rate, 1),
-        
-        # Production
-        'total_production_orders': total_production,
-        'completed_production': completed_production,
-        'in_progress_production': in_progress_production,
-        'pending_production': pending_production,
-        
-        # Workforce
-        'total_products': total_products,
-        'total_raw_materials': total_raw_materials,
-        'total_staff': total_staff,
-        
-        # Timestamp
-        'generated_at': datetime.now(timezone.utc).isoformat()
-    }
+    Always recomputes; the endpoints below read the cached copy through
+    company_status.company_status.
+    """
+    return await compute_company_status(session)
 
 
 @router.get('/company-status', response_model=ApiResponse)
 async def get_company_financial_status(
-    session: AsyncSession = Depends(get_session)
+    refresh: bool = Query(False),
+    session: AsyncSession = Depends(get_read_session)
 ):
     """
     Get comprehensive company financial status
-    Admin only access - displays complete financial overview
+    Admin only access - displays complete financial overview.
+    Served from a cache for a few minutes; pass refresh=true to recompute.
     """
     try:
-        metrics = await calculate_financial_metrics(session)
+        metrics = await company_status(session, refresh=refresh)
         
         return ApiResponse(
             message="Company financial status retrieved successfully",
@@ -325,14 +63,14 @@ async def get_company_financial_status(
 
 @router.get('/company-status/export')
 async def export_financial_report(
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
     """
     Export company financial status as PDF
-    Admin only access
+    Admin only access. Renders the same cached figures as the overview.
     """
     try:
-        metrics = await calculate_financial_metrics(session)
+        metrics = await company_status(session)
         
         # Create PDF in memory
         buffer = io.BytesIO()
@@ -1,7 +1,7 @@
 """Geo-tagging support for clock-in/out and access events.
 
 Provides:
-- Runtime DDL bootstrap to add lat/lng/accuracy/address columns to
+- Schema bootstrap step to add lat/lng/accuracy/address columns to
   `attendance` and `audit_logs` tables (idempotent — uses IF NOT EXISTS).
 - GET /api/geo/attendance — list staff clock-in/out events with location.
 - GET /api/geo/access     — list user access (login/logout) events with location.
@@ -17,12 +17,13 @@ from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import get_session
+from app.services import bootstrap
 
 router = APIRouter(prefix="/api/geo", tags=["geo"])
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# DDL bootstrap (runs at startup; safe to re-run)
+# DDL bootstrap (applied once by app.services.bootstrap)
 # ─────────────────────────────────────────────────────────────────────────────
 ATTENDANCE_ALTERS = [
     "ALTER TABLE attendance ADD COLUMN IF NOT EXISTS clock_in_lat DOUBLE PRECISION",
@@ -48,16 +49,10 @@ INDEXES = [
 ]
 
 
-async def bootstrap_geo_schema(session: AsyncSession) -> None:
-    """Idempotently add geo columns + indexes. Call once at startup."""
-    for sql in (*ATTENDANCE_ALTERS, *AUDIT_ALTERS, *INDEXES):
-        try:
-            await session.execute(text(sql))
-        except Exception:  # pragma: no cover - best effort
-            # Some Postgres versions/perm issues — continue.
-            await session.rollback()
-            continue
-    await session.commit()
+# Best effort: some Postgres versions/permissions refuse a statement; the
+# rest still apply.
+bootstrap.register("geo", 1, [*ATTENDANCE_ALTERS, *AUDIT_ALTERS, *INDEXES],
+                   tolerant=True)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
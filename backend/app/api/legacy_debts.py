@@ -2,7 +2,8 @@
 Previous / Legacy Debts Module API
 Records and tracks debts that existed before the ERP system was deployed.
 These debts are integrated with the main debtors dashboard and WhatsApp reminders.
-Auto-creates the legacy_debts and legacy_debt_payments tables if they don't exist.
+The legacy_debts and legacy_debt_payments tables are created by the schema
+bootstrap (app.services.bootstrap).
 """
 from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,6 +15,7 @@ from decimal import Decimal
 
 from app.db import get_session
 from app.api.auth import get_current_user
+from app.services import bootstrap
 
 router = APIRouter(prefix='/api/legacy-debts')
 
@@ -52,15 +54,20 @@ CREATE_INDEX_SQLS = [
     "CREATE INDEX IF NOT EXISTS idx_ld_customer ON legacy_debts(customer_id)",
     "CREATE INDEX IF NOT EXISTS idx_ld_status ON legacy_debts(status)",
     "CREATE INDEX IF NOT EXISTS idx_ldp_debt ON legacy_debt_payments(legacy_debt_id)",
+    # Open balances only; the debtors dashboard starts from these.
+    "CREATE INDEX IF NOT EXISTS idx_ld_open_customer ON legacy_debts(customer_id) "
+    "WHERE status NOT IN ('cancelled', 'paid')",
 ]
 
 
+bootstrap.register("legacy_debts", 2, [
+    CREATE_TABLE_SQL, CREATE_PAYMENTS_TABLE_SQL, *CREATE_INDEX_SQLS,
+    bootstrap.track_changes("legacy_debts"),
+])
+
+
 async def _ensure_tables(session: AsyncSession):
-    await session.execute(text(CREATE_TABLE_SQL))
-    await session.execute(text(CREATE_PAYMENTS_TABLE_SQL))
-    for idx_sql in CREATE_INDEX_SQLS:
-        await session.execute(text(idx_sql))
-    await session.commit()
+    await bootstrap.ensure(session, "legacy_debts")
 
 
 async def _auth_user(authorization: Optional[str], session: AsyncSession):
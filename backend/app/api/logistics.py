@@ -15,6 +15,7 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from app.db import get_session
+from app.services import bootstrap, logistics_rollup
 import io, os
 
 router = APIRouter(prefix="/api/logistics", tags=["Logistics"])
@@ -116,17 +117,19 @@ TABLE_STATEMENTS = [
     "CREATE INDEX IF NOT EXISTS idx_dm_status ON delivery_manifests(status)",
     "CREATE INDEX IF NOT EXISTS idx_mc_manifest ON manifest_customers(manifest_id)",
     "CREATE INDEX IF NOT EXISTS idx_mi_mc ON manifest_items(manifest_customer_id)",
+    # Daily read model behind /dashboard and /analytics
+    *logistics_rollup.ROLLUP_STATEMENTS,
 ]
 
 
-@router.on_event("startup")
-async def init_logistics_tables():
-    from app.db import AsyncSessionLocal
-    async with AsyncSessionLocal() as session:
-        for stmt in TABLE_STATEMENTS:
-            await session.execute(text(stmt))
-        await session.commit()
-        print("Logistics tables ready")
+async def _backfill_rollup(session: AsyncSession):
+    if await logistics_rollup.needs_backfill(session):
+        await logistics_rollup.rebuild(session)
+        print("Logistics rollup backfilled from existing manifests")
+
+
+# Applied once by the schema bootstrap at start-up (app.services.bootstrap).
+bootstrap.register("logistics", 1, TABLE_STATEMENTS, after=_backfill_rollup)
 
 
 @router.post('/manifests')
@@ -205,6 +208,7 @@ async def create_manifest(data: dict, session: AsyncSession = Depends(get_sessio
                     'unit': item.get('unit', 'each'),
                 })
 
+        await logistics_rollup.refresh_days(session, [dd_val])
         await session.commit()
         return {
             "message": f"Delivery Manifest {mf_num} created with {len(customers)} customer(s)",
@@ -370,15 +374,13 @@ async def confirm_customer_delivery(mc_id: UUID, data: dict, session: AsyncSessi
             FROM manifest_customers WHERE manifest_id = :mid
         """), {"mid": manifest_id})
         cr = check.fetchone()
-        if cr.total == cr.done:
-            await session.execute(text(
-                "UPDATE delivery_manifests SET status = 'completed', updated_at = NOW() WHERE id = :mid"
-            ), {"mid": manifest_id})
-        else:
-            await session.execute(text(
-                "UPDATE delivery_manifests SET status = 'in_transit', updated_at = NOW() WHERE id = :mid"
-            ), {"mid": manifest_id})
+        new_status = 'completed' if cr.total == cr.done else 'in_transit'
+        dd = (await session.execute(text(
+            "UPDATE delivery_manifests SET status = :status, updated_at = NOW() "
+            "WHERE id = :mid RETURNING delivery_date"
+        ), {"status": new_status, "mid": manifest_id})).scalar()
 
+        await logistics_rollup.refresh_days(session, [dd])
         await session.commit()
         return {"message": "Delivery confirmed for customer", "all_delivered": cr.total == cr.done}
     except HTTPException:
@@ -395,12 +397,13 @@ async def update_manifest_status(manifest_id: UUID, data: dict, session: AsyncSe
         new_status = data.get('status', 'dispatched')
         sql = text("""
             UPDATE delivery_manifests SET status = :status, updated_at = NOW()
-            WHERE id = :id RETURNING id, manifest_number
+            WHERE id = :id RETURNING id, manifest_number, delivery_date
         """)
         result = await session.execute(sql, {"status": new_status, "id": str(manifest_id)})
         row = result.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Manifest not found")
+        await logistics_rollup.refresh_days(session, [row.delivery_date])
         await session.commit()
         return {"message": f"Manifest {row.manifest_number} updated to {new_status}"}
     except HTTPException:
@@ -421,7 +424,7 @@ async def update_manifest_cost(manifest_id: UUID, data: dict, session: AsyncSess
             UPDATE delivery_manifests SET
                 transport_cost = :tc, additional_charges = :ac, total_cost = :tot,
                 updated_at = NOW()
-            WHERE id = :id RETURNING id, manifest_number
+            WHERE id = :id RETURNING id, manifest_number, delivery_date
         """)
         result = await session.execute(sql, {
             'tc': transport, 'ac': additional, 'tot': total,
@@ -430,6 +433,7 @@ async def update_manifest_cost(manifest_id: UUID, data: dict, session: AsyncSess
         row = result.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Manifest not found")
+        await logistics_rollup.refresh_days(session, [row.delivery_date])
         await session.commit()
         return {"message": f"Cost updated for manifest {row.manifest_number}", "total_cost": total}
     except HTTPException:
@@ -444,7 +448,7 @@ async def delete_manifest(manifest_id: UUID, session: AsyncSession = Depends(get
     """Permanently delete a delivery manifest and all related records (admin only)."""
     try:
         # Check manifest exists
-        check = await session.execute(text("SELECT id, manifest_number FROM delivery_manifests WHERE id = :id"), {"id": str(manifest_id)})
+        check = await session.execute(text("SELECT id, manifest_number, delivery_date FROM delivery_manifests WHERE id = :id"), {"id": str(manifest_id)})
         row = check.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Manifest not found")
@@ -461,6 +465,7 @@ async def delete_manifest(manifest_id: UUID, session: AsyncSession = Depends(get
             await session.execute(text("DELETE FROM manifest_customers WHERE manifest_id = :mid"), {"mid": str(manifest_id)})
 
         await session.execute(text("DELETE FROM delivery_manifests WHERE id = :id"), {"id": str(manifest_id)})
+        await logistics_rollup.refresh_days(session, [row.delivery_date])
         await session.commit()
         return {"message": f"Manifest {manifest_number} permanently deleted"}
     except HTTPException:
@@ -683,72 +688,9 @@ async def generate_manifest_pdf(manifest_id: UUID, session: AsyncSession = Depen
 
 @router.get('/dashboard')
 async def logistics_dashboard(session: AsyncSession = Depends(get_session)):
-    """Get logistics summary dashboard using manifests."""
+    """Get logistics summary dashboard from the daily manifest rollup."""
     try:
-        stats = {}
-
-        dq = await session.execute(text("""
-            SELECT
-                COUNT(*) as total_manifests,
-                COUNT(*) FILTER (WHERE status = 'completed') as completed,
-                COUNT(*) FILTER (WHERE status = 'preparing') as preparing,
-                COUNT(*) FILTER (WHERE status IN ('dispatched','in_transit')) as in_transit,
-                COUNT(*) FILTER (WHERE status = 'cancelled') as cancelled,
-                COALESCE(SUM(total_cost), 0) as total_logistics_cost,
-                COALESCE(AVG(total_cost), 0) as avg_manifest_cost
-            FROM delivery_manifests
-        """))
-        dr = dq.fetchone()
-        stats['summary'] = {
-            "total_manifests": dr.total_manifests,
-            "completed": dr.completed, "preparing": dr.preparing,
-            "in_transit": dr.in_transit, "cancelled": dr.cancelled,
-            "total_logistics_cost": float(dr.total_logistics_cost),
-            "avg_manifest_cost": round(float(dr.avg_manifest_cost), 2),
-        }
-
-        cq = await session.execute(text("""
-            SELECT
-                (SELECT COUNT(*) FROM manifest_customers) as total_drops,
-                (SELECT COUNT(*) FROM manifest_customers WHERE status = 'delivered') as delivered_drops,
-                (SELECT COALESCE(SUM(mi.quantity), 0) FROM manifest_items mi
-                    JOIN manifest_customers mc ON mc.id = mi.manifest_customer_id
-                    WHERE mc.status = 'delivered') as items_delivered
-        """))
-        cr = cq.fetchone()
-        stats['delivery_stats'] = {
-            "total_customer_drops": cr.total_drops,
-            "delivered_drops": cr.delivered_drops,
-            "items_delivered": float(cr.items_delivered),
-        }
-
-        oq = await session.execute(text("""
-            SELECT logistics_officer,
-                COUNT(*) as manifests,
-                COALESCE(SUM(total_cost), 0) as total_cost
-            FROM delivery_manifests
-            GROUP BY logistics_officer ORDER BY manifests DESC LIMIT 10
-        """))
-        stats['by_officer'] = [
-            {"officer": r.logistics_officer, "manifests": r.manifests,
-             "total_cost": float(r.total_cost)}
-            for r in oq.fetchall()
-        ]
-
-        mq = await session.execute(text("""
-            SELECT TO_CHAR(delivery_date, 'YYYY-MM') as month,
-                COUNT(*) as manifests,
-                COALESCE(SUM(total_cost), 0) as total_cost
-            FROM delivery_manifests
-            WHERE delivery_date >= CURRENT_DATE - INTERVAL '6 months'
-            GROUP BY TO_CHAR(delivery_date, 'YYYY-MM')
-            ORDER BY month DESC
-        """))
-        stats['monthly_trend'] = [
-            {"month": r.month, "manifests": r.manifests,
-             "total_cost": float(r.total_cost)}
-            for r in mq.fetchall()
-        ]
+        stats = await logistics_rollup.dashboard_totals(session)
 
         rq = await session.execute(text("""
             SELECT dm.id, dm.manifest_number, dm.logistics_officer, dm.delivery_date,
@@ -889,68 +831,24 @@ body {{ font-family: Georgia, 'Times New Roman', serif; font-size: 12px; width:
         raise HTTPException(status_code=500, detail=f"Error generating thermal print: {str(e)}")
 
 
+def _parse_date(value: str, field: str):
+    try:
+        return date_type.fromisoformat(value) if value else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} must be YYYY-MM-DD")
+
+
 @router.get('/analytics')
 async def logistics_analytics(
     date_from: str = None,
     date_to: str = None,
     session: AsyncSession = Depends(get_session)
 ):
-    """Cost analytics for manifests."""
+    """Cost analytics for manifests, read from the daily rollup."""
+    df = _parse_date(date_from, 'date_from')
+    dt = _parse_date(date_to, 'date_to')
     try:
-        where, params = [], {}
-        if date_from:
-            where.append("delivery_date >= :df"); params['df'] = date_from
-        if date_to:
-            where.append("delivery_date <= :dt"); params['dt'] = date_to
-        wc = " AND ".join(where) if where else "1=1"
-
-        tmq = await session.execute(text(f"""
-            SELECT transport_mode,
-                COUNT(*) as count,
-                COALESCE(SUM(total_cost), 0) as total,
-                COALESCE(AVG(total_cost), 0) as avg_cost
-            FROM delivery_manifests
-            WHERE {wc}
-            GROUP BY transport_mode ORDER BY total DESC
-        """), params)
-        by_mode = [
-            {"mode": r.transport_mode, "count": r.count,
-             "total": float(r.total), "avg_cost": round(float(r.avg_cost), 2)}
-            for r in tmq.fetchall()
-        ]
-
-        cq = await session.execute(text(f"""
-            SELECT mc.customer_name, COUNT(DISTINCT mc.manifest_id) as manifests,
-                COUNT(*) as drops
-            FROM manifest_customers mc
-            JOIN delivery_manifests dm ON dm.id = mc.manifest_id
-            WHERE {wc.replace('delivery_date', 'dm.delivery_date')}
-            GROUP BY mc.customer_name ORDER BY drops DESC LIMIT 10
-        """), params)
-        top_customers = [
-            {"customer": r.customer_name, "manifests": r.manifests, "drops": r.drops}
-            for r in cq.fetchall()
-        ]
-
-        dq = await session.execute(text(f"""
-            SELECT TO_CHAR(delivery_date, 'Day') as day_name,
-                EXTRACT(DOW FROM delivery_date) as dow,
-                COUNT(*) as count,
-                COALESCE(SUM(total_cost), 0) as total
-            FROM delivery_manifests
-            WHERE {wc}
-            GROUP BY TO_CHAR(delivery_date, 'Day'), EXTRACT(DOW FROM delivery_date)
-            ORDER BY dow
-        """), params)
-        by_day = [
-            {"day": r.day_name.strip(), "count": r.count, "total": float(r.total)}
-            for r in dq.fetchall()
-        ]
-
-        return {
-            "by_transport_mode": by_mode,
-            "top_customers": top_customers,
-            "by_day_of_week": by_day,
-        }
+        return await logistics_rollup.cost_analytics(
+            session, date_from=df, date_to=dt)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
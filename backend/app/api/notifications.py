@@ -14,6 +14,7 @@ import uuid
 import json
 import os
 from datetime import datetime
+from contextvars import ContextVar
 import sqlalchemy as sa
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -57,6 +58,7 @@ class NotificationType:
     PRODUCTION = "production"
     PAYMENT = "payment"
     SYSTEM = "system"
+    ANNOUNCEMENT = "announcement"
 
 # Persistent subscription store backed by JSON file so subscriptions
 # survive backend restarts.
@@ -223,8 +225,38 @@ async def send_test_notification(
     }
 
 
+class _Delivery:
+    """An outbox delivery: which subscriptions to send to, and which failed."""
+
+    def __init__(self, endpoints: Optional[List[str]]):
+        self.only = set(endpoints) if endpoints is not None else None
+        self.unreached: List[str] = []
+
+
+# Set while the outbox delivers a push, so that a retry goes only to the
+# subscriptions the last attempt did not reach.
+_delivery: ContextVar[Optional[_Delivery]] = ContextVar("push_delivery", default=None)
+
+
+async def deliver_push(coro, endpoints: Optional[List[str]] = None) -> List[str]:
+    """Await a notify_* coroutine for the outbox; returns the endpoints missed.
+
+    With `endpoints`, only those subscriptions are sent to. Subscriptions
+    answering 404/410 are dropped and do not count as missed. A missing
+    pywebpush or VAPID key misses nobody: trying again would not help.
+    """
+    delivery = _Delivery(endpoints)
+    token = _delivery.set(delivery)
+    try:
+        await coro
+    finally:
+        _delivery.reset(token)
+    return delivery.unreached
+
+
 async def broadcast_push_notification(payload: dict):
     """Send push notification to all active subscriptions"""
+    delivery = _delivery.get()
     try:
         # Try to import pywebpush (optional dependency)
         try:
@@ -244,6 +276,8 @@ async def broadcast_push_notification(payload: dict):
                     return
             
             for endpoint, sub_data in list(push_subscriptions.items()):
+                if delivery and delivery.only is not None and endpoint not in delivery.only:
+                    continue
                 try:
                     subscription = sub_data["subscription"]
                     webpush(
@@ -254,8 +288,15 @@ async def broadcast_push_notification(payload: dict):
                     )
                 except WebPushException as e:
                     # Remove invalid subscriptions (410 Gone, 404 Not Found)
-                    if e.response and e.response.status_code in [404, 410]:
+                    if e.response is not None and e.response.status_code in [404, 410]:
                         failed_endpoints.append(endpoint)
+                    elif delivery:
+                        delivery.unreached.append(endpoint)
+                    print(f"Push failed for {endpoint}: {e}")
+                except Exception as e:
+                    # One bad subscription must not stop the rest.
+                    if delivery:
+                        delivery.unreached.append(endpoint)
                     print(f"Push failed for {endpoint}: {e}")
             
             # Clean up failed subscriptions
@@ -287,6 +328,19 @@ async def notify_low_stock(product_name: str, current_stock: float, reorder_leve
     await broadcast_push_notification(payload)
 
 
+async def notify_announcement(title: str, message: str, audio_url: Optional[str] = None):
+    """Send a scheduled announcement as it fires"""
+    payload = {
+        "title": title or "Announcement",
+        "body": message,
+        "icon": "/logo192.png",
+        "url": "/",
+        "tag": f"announcement-{title}",
+        "data": {"type": NotificationType.ANNOUNCEMENT, "audio_url": audio_url}
+    }
+    await broadcast_push_notification(payload)
+
+
 async def notify_order_update(order_number: str, status: str, customer_name: str):
     """Send order status update notification"""
     payload = {
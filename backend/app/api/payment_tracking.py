@@ -3,7 +3,7 @@ Payment Tracking & Reconciliation API
 Unified payment system tied to invoices -> sales_orders -> customers
 Tracks partial payments, balances, debt reminders, WhatsApp messages
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text, func, and_
 from app.db import get_session
@@ -19,6 +19,8 @@ from app.services.receivables import (
     delete_payment as delete_payment_svc,
     recompute_invoice_paid, reconciliation_report,
     revenue_between, outstanding_receivables, ensure_invoice_for_order)
+from app.services import http_cache, outbox
+from app.services.debtors import debtors_page, overdue_reminders
 from app.models import Invoice, InvoiceLine, Payment, SalesOrder, SalesOrderLine, Customer, Product, StockLevel, StockMovement
 from uuid import UUID
 from datetime import datetime, timezone, timedelta
@@ -26,7 +28,6 @@ from decimal import Decimal
 from typing import Optional
 import uuid
 
-from app.api.notifications import fire_notification, notify_payment_received
 
 router = APIRouter(prefix='/api/payment-tracking')
 
@@ -373,45 +374,42 @@ async def record_payment(
         inv = (await session.execute(
             select(Invoice).where(Invoice.id == invoice_id))).scalars().first()
 
-        await session.commit()
+        # The payment-received push commits with the payment and is delivered
+        # by the outbox dispatcher, not on this request.
+        customer_name = "Customer"
+        order_number = getattr(inv, 'invoice_number', None) or str(inv.id)
+        if inv.sales_order_id:
+            so = (await session.execute(
+                select(SalesOrder).where(SalesOrder.id == inv.sales_order_id)
+            )).scalars().first()
+            if so:
+                order_number = so.order_number or order_number
+                if so.customer_id:
+                    cust = (await session.execute(
+                        select(Customer).where(Customer.id == so.customer_id)
+                    )).scalars().first()
+                    if cust and cust.name:
+                        customer_name = cust.name
+        await outbox.enqueue_push(
+            session, "payment_received",
+            order_number=order_number,
+            amount=float(amount),
+            customer_name=customer_name,
+        )
 
-        # Fire payment received notification (non-blocking)
-        try:
-            customer_name = "Customer"
-            order_number = getattr(inv, 'invoice_number', None) or str(inv.id)
-            if inv.sales_order_id:
-                so_res = await session.execute(
-                    select(SalesOrder).where(SalesOrder.id == inv.sales_order_id)
-                )
-                so = so_res.scalars().first()
-                if so:
-                    order_number = so.order_number or order_number
-                    if so.customer_id:
-                        cust_res = await session.execute(
-                            select(Customer).where(Customer.id == so.customer_id)
-                        )
-                        cust = cust_res.scalars().first()
-                        if cust and cust.name:
-                            customer_name = cust.name
-            fire_notification(notify_payment_received(
-                order_number=order_number,
-                amount=float(amount),
-                customer_name=customer_name,
-            ))
-        except Exception as _notif_err:
-            print(f"[payment_tracking] notification dispatch error: {_notif_err}")
+        await session.commit()
 
         return {
             "message": f"Payment of NGN {amount:,.2f} recorded successfully",
             "payment": {
-                "id": str(payment.id),
+                "id": str(result["payment_id"]),
                 "amount": amount,
                 "payment_date": payment_date.isoformat(),
                 "payment_method": payment_method,
                 "reference": reference,
             },
             "invoice_summary": {
-                "total_amount": total_amount,
+                "total_amount": float(inv.total_amount or 0),
                 "total_paid": new_total_paid,
                 "balance": max(new_balance, 0),
                 "status": inv.status,
@@ -464,136 +462,32 @@ async def _legacy_debts_table_exists(session: AsyncSession) -> bool:
 # ─── DEBTORS DASHBOARD ──────────────────────────────────────────────────────
 @router.get('/debtors')
 async def get_debtors_dashboard(
+    request: Request,
+    response: Response,
+    search: Optional[str] = Query(None, description="Name, phone or email contains"),
+    overdue_only: bool = Query(False),
+    min_balance: Optional[float] = Query(None, ge=0),
+    sort: str = Query('balance', pattern='^(balance|days_overdue|name)$'),
+    limit: Optional[int] = Query(None, ge=1, le=1000,
+                                 description="Page size; omit for every debtor"),
+    offset: int = Query(0, ge=0),
     session: AsyncSession = Depends(get_session)
 ):
-    """Get all customers with outstanding balances (debtors dashboard) - includes legacy debts"""
-    try:
-        # Invoice-based debts
-        inv_sql = text("""
-            SELECT 
-                c.id as customer_id, c.name as customer_name, c.phone, c.email, c.address,
-                COUNT(DISTINCT i.id) as total_invoices,
-                COALESCE(SUM(i.total_amount), 0) as total_invoiced,
-                COALESCE(SUM(
-                    (SELECT COALESCE(SUM(p.amount), 0) FROM payments p WHERE p.invoice_id = i.id)
-                ), 0) as total_paid,
-                MIN(i.invoice_date) as first_invoice_date,
-                MAX(i.invoice_date) as last_invoice_date,
-                MIN(i.due_date) as earliest_due_date
-            FROM customers c
-            JOIN invoices i ON i.customer_id = c.id
-            WHERE i.status != 'cancelled'
-            GROUP BY c.id, c.name, c.phone, c.email, c.address
-            HAVING COALESCE(SUM(i.total_amount), 0) - COALESCE(SUM(
-                (SELECT COALESCE(SUM(p.amount), 0) FROM payments p WHERE p.invoice_id = i.id)
-            ), 0) > 0.01
-        """)
-        inv_result = await session.execute(inv_sql)
-        inv_rows = inv_result.fetchall()
-
-        # Build a dict keyed by customer_id
-        debtors_map = {}
-        for r in inv_rows:
-            cid = str(r.customer_id)
-            total_inv = float(r.total_invoiced or 0)
-            total_pd = float(r.total_paid or 0)
-            balance = total_inv - total_pd
-            is_overdue = r.earliest_due_date and r.earliest_due_date < datetime.now(timezone.utc)
-            days_overdue = (datetime.now(timezone.utc) - r.earliest_due_date).days if is_overdue else 0
-
-            debtors_map[cid] = {
-                "customer_id": cid,
-                "customer_name": r.customer_name,
-                "phone": r.phone,
-                "email": r.email,
-                "address": r.address,
-                "invoice_count": r.total_invoices,
-                "total_invoiced": total_inv,
-                "total_paid": total_pd,
-                "balance": balance,
-                "legacy_debt_count": 0,
-                "legacy_debt_total": 0,
-                "legacy_debt_paid": 0,
-                "legacy_debt_balance": 0,
-                "is_overdue": bool(is_overdue),
-                "days_overdue": max(days_overdue, 0),
-                "earliest_due_date": r.earliest_due_date.isoformat() if r.earliest_due_date else None,
-                "last_invoice_date": r.last_invoice_date.isoformat() if r.last_invoice_date else None,
-            }
-
-        # Legacy debts (if table exists)
-        has_legacy = await _legacy_debts_table_exists(session)
-        if has_legacy:
-            ld_sql = text("""
-                SELECT 
-                    c.id as customer_id, c.name as customer_name, c.phone, c.email, c.address,
-                    COUNT(DISTINCT ld.id) as legacy_count,
-                    COALESCE(SUM(ld.original_amount), 0) as legacy_total,
-                    COALESCE(SUM(
-                        (SELECT COALESCE(SUM(ldp.amount), 0) FROM legacy_debt_payments ldp WHERE ldp.legacy_debt_id = ld.id)
-                    ), 0) as legacy_paid,
-                    MIN(ld.due_date) as legacy_earliest_due
-                FROM customers c
-                JOIN legacy_debts ld ON ld.customer_id = c.id
-                WHERE ld.status != 'paid'
-                GROUP BY c.id, c.name, c.phone, c.email, c.address
-                HAVING COALESCE(SUM(ld.original_amount), 0) - COALESCE(SUM(
-                    (SELECT COALESCE(SUM(ldp.amount), 0) FROM legacy_debt_payments ldp WHERE ldp.legacy_debt_id = ld.id)
-                ), 0) > 0.01
-            """)
-            ld_result = await session.execute(ld_sql)
+    """Customers with outstanding balances (debtors dashboard) - includes legacy debts.
 
-            for r in ld_result.fetchall():
-                cid = str(r.customer_id)
-                ld_total = float(r.legacy_total or 0)
-                ld_paid = float(r.legacy_paid or 0)
-                ld_balance = ld_total - ld_paid
-                ld_overdue = r.legacy_earliest_due and r.legacy_earliest_due < datetime.now(timezone.utc).date()
-                ld_days = (datetime.now(timezone.utc).date() - r.legacy_earliest_due).days if ld_overdue else 0
-
-                if cid in debtors_map:
-                    # Merge with existing invoice debtor
-                    debtors_map[cid]["legacy_debt_count"] = r.legacy_count
-                    debtors_map[cid]["legacy_debt_total"] = ld_total
-                    debtors_map[cid]["legacy_debt_paid"] = ld_paid
-                    debtors_map[cid]["legacy_debt_balance"] = ld_balance
-                    debtors_map[cid]["total_invoiced"] += ld_total
-                    debtors_map[cid]["total_paid"] += ld_paid
-                    debtors_map[cid]["balance"] += ld_balance
-                    if ld_overdue and ld_days > debtors_map[cid]["days_overdue"]:
-                        debtors_map[cid]["is_overdue"] = True
-                        debtors_map[cid]["days_overdue"] = ld_days
-                else:
-                    # Customer only has legacy debts, no invoices
-                    debtors_map[cid] = {
-                        "customer_id": cid,
-                        "customer_name": r.customer_name,
-                        "phone": r.phone,
-                        "email": r.email,
-                        "address": r.address,
-                        "invoice_count": 0,
-                        "total_invoiced": ld_total,
-                        "total_paid": ld_paid,
-                        "balance": ld_balance,
-                        "legacy_debt_count": r.legacy_count,
-                        "legacy_debt_total": ld_total,
-                        "legacy_debt_paid": ld_paid,
-                        "legacy_debt_balance": ld_balance,
-                        "is_overdue": bool(ld_overdue),
-                        "days_overdue": max(ld_days, 0),
-                        "earliest_due_date": r.legacy_earliest_due.isoformat() if r.legacy_earliest_due else None,
-                        "last_invoice_date": None,
-                    }
-
-        # Sort by balance descending
-        debtors = sorted(debtors_map.values(), key=lambda d: d["balance"], reverse=True)
-        total_outstanding = sum(d["balance"] for d in debtors)
-
-        return {
-            "debtors": debtors,
-            "total_debtors": len(debtors),
-            "total_outstanding": total_outstanding,
-        }
+    Reads the cached paid totals on invoices and legacy debts; totals cover
+    every debtor matching the filters, not just the page returned.
+    """
+    # Days overdue move with the calendar, so the tag turns over daily too.
+    cached = await http_cache.not_modified(
+        request, response, session,
+        ('customers', 'invoices', 'legacy_debts'), daily=True)
+    if cached is not None:
+        return cached
+    try:
+        return await debtors_page(
+            session, search=search, overdue_only=overdue_only,
+            min_balance=min_balance, sort=sort, limit=limit, offset=offset)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching debtors: {str(e)}")
 
@@ -1019,54 +913,13 @@ async def generate_reminder_message(
 # ─── OVERDUE REMINDERS (auto-generated for invoices 14+ days old) ────────────
 @router.get('/reminders')
 async def get_overdue_reminders(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
     session: AsyncSession = Depends(get_session)
 ):
     """Get all customers with overdue invoices (due date passed) for reminder sending"""
     try:
-        sql = text("""
-            SELECT 
-                c.id as customer_id, c.name as customer_name, c.phone, c.email,
-                COUNT(DISTINCT i.id) as overdue_invoices,
-                COALESCE(SUM(i.total_amount), 0) as total_invoiced,
-                COALESCE(SUM(
-                    (SELECT COALESCE(SUM(p.amount), 0) FROM payments p WHERE p.invoice_id = i.id)
-                ), 0) as total_paid,
-                MIN(i.due_date) as earliest_due_date
-            FROM customers c
-            JOIN invoices i ON i.customer_id = c.id
-            WHERE i.status NOT IN ('cancelled', 'paid')
-              AND i.due_date < NOW()
-              AND (i.total_amount - COALESCE(
-                  (SELECT COALESCE(SUM(p.amount), 0) FROM payments p WHERE p.invoice_id = i.id)
-              , 0)) > 0.01
-            GROUP BY c.id, c.name, c.phone, c.email
-            ORDER BY (COALESCE(SUM(i.total_amount), 0) - COALESCE(SUM(
-                (SELECT COALESCE(SUM(p.amount), 0) FROM payments p WHERE p.invoice_id = i.id)
-            ), 0)) DESC
-        """)
-        result = await session.execute(sql)
-        rows = result.fetchall()
-
-        reminders = []
-        for r in rows:
-            total = float(r.total_invoiced or 0)
-            paid = float(r.total_paid or 0)
-            balance = total - paid
-            days_overdue = (datetime.now(timezone.utc) - r.earliest_due_date).days if r.earliest_due_date else 0
-
-            reminders.append({
-                "customer_id": str(r.customer_id),
-                "customer_name": r.customer_name,
-                "phone": r.phone,
-                "email": r.email,
-                "overdue_invoices": r.overdue_invoices,
-                "total_invoiced": total,
-                "total_paid": paid,
-                "balance": balance,
-                "days_overdue": max(days_overdue, 0),
-            })
-
-        return {"reminders": reminders, "total": len(reminders)}
+        return await overdue_reminders(session, limit=limit, offset=offset)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching reminders: {str(e)}")
 
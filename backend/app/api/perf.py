@@ -0,0 +1,41 @@
+"""Request profiling summary: which endpoints are slow, which are chatty."""
+from __future__ import annotations
+
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+
+from app.api.auth import require_admin
+from app.db import pool_metrics
+from app.models import User
+from app.services import perf
+
+router = APIRouter(prefix='/api/admin', tags=['Admin'])
+
+
+@router.get('/perf')
+async def perf_summary(
+    limit: int = Query(20, ge=1, le=200),
+    sort: Literal['p95_ms', 'p95_queries', 'max_queries',
+                  'p95_db_ms'] = Query('p95_ms'),
+    _admin: User = Depends(require_admin),
+):
+    """The worst endpoints served by this worker, by p95 latency or query count.
+
+    Each endpoint keeps a rolling window of its most recent requests, so a fix
+    shows up here as soon as the old samples age out. `pools` shows how busy
+    each connection pool is and how long checkouts have been waiting.
+    """
+    return {
+        "enabled": perf.enabled(),
+        "window": perf.WINDOW,
+        "endpoints": perf.endpoint_stats.summary(limit=limit, sort=sort),
+        "pools": pool_metrics(),
+    }
+
+
+@router.delete('/perf')
+async def perf_reset(_admin: User = Depends(require_admin)):
+    """Start a fresh window, e.g. before measuring a change."""
+    perf.endpoint_stats.reset()
+    return {"success": True}
@@ -16,6 +16,7 @@ from decimal import Decimal
 from app.db import get_session
 from app.models import User
 from app.api.auth import require_authenticated_user, require_admin
+from app.services import bootstrap
 from app.services.inventory import apply_stock_movement
 from app.services.posting import post_purchase, post_supplier_payment
 from app.services.payables import (
@@ -154,15 +155,9 @@ TABLE_STATEMENTS = [
 ]
 
 
-@router.on_event("startup")
-async def init_procurement_tables():
-    from app.db import AsyncSessionLocal
-    async with AsyncSessionLocal() as session:
-        for stmt in TABLE_STATEMENTS:
-            await session.execute(text(stmt))
-        await session.commit()
-        print("Procurement tables ready")
-        print("Procurement tables ready")
+# Applied once by the schema bootstrap at start-up (app.services.bootstrap).
+bootstrap.register("procurement", 2, [
+    *TABLE_STATEMENTS, bootstrap.track_changes("purchase_invoices")])
 
 
 # ─── PURCHASE REQUESTS ──────────────────────────────────────────────────────
@@ -7,7 +7,7 @@ from datetime import datetime, date
 from app.db import get_session
 from app.api.auth import require_authenticated_user
 from app.models import User
-from app.services.inventory import apply_stock_movement
+from app.services import production_completion
 from app.services.posting import (
     post_production_completion, post_inventory_writeoff)
 
@@ -182,29 +182,16 @@ async def create_production_completion(
         consumables_list = data.get('consumables', [])  # [{consumable_id, quantity}]
         materials_list = data.get('materials', [])  # [{raw_material_id, quantity}]
 
-        # Calculate raw material cost from BOM or provided materials
-        raw_material_cost = 0.0
-        for mat in materials_list:
-            rm_r = await session.execute(
-                text("SELECT unit_cost FROM raw_materials WHERE id = :id"),
-                {"id": mat['raw_material_id']}
-            )
-            rm = rm_r.fetchone()
-            unit_cost = _safe_float(rm.unit_cost) if rm else 0.0
-            qty = _safe_float(mat.get('quantity'))
-            raw_material_cost += unit_cost * qty
-
-        # Calculate consumables cost
-        consumables_cost = 0.0
-        for con in consumables_list:
-            con_r = await session.execute(
-                text("SELECT unit_cost FROM production_consumables WHERE id = :id"),
-                {"id": con['consumable_id']}
-            )
-            c = con_r.fetchone()
-            unit_cost = _safe_float(c.unit_cost) if c else 0.0
-            qty = _safe_float(con.get('quantity'))
-            consumables_cost += unit_cost * qty
+        # Every line is priced in two queries, whatever the batch size.
+        materials, consumables = await production_completion.price_lines(
+            session,
+            [(m['raw_material_id'], _safe_float(m.get('quantity')))
+             for m in materials_list],
+            [(c['consumable_id'], _safe_float(c.get('quantity')))
+             for c in consumables_list],
+        )
+        raw_material_cost = sum((line.cost for line in materials), 0.0)
+        consumables_cost = sum((line.cost for line in consumables), 0.0)
 
         # Total production cost
         total_production_cost = raw_material_cost + consumables_cost + energy_cost + lunch_cost + total_wages_paid
@@ -247,124 +234,21 @@ async def create_production_completion(
         )
         completion_id = str(result.fetchone().id)
 
-        # Insert consumable line items and deduct stock
-        for con in consumables_list:
-            con_r = await session.execute(
-                text("SELECT unit_cost FROM production_consumables WHERE id = :id"),
-                {"id": con['consumable_id']}
-            )
-            c = con_r.fetchone()
-            uc = _safe_float(c.unit_cost) if c else 0.0
-            qty = _safe_float(con.get('quantity'))
-            await session.execute(
-                text("""
-                    INSERT INTO production_completion_consumables (id, completion_id, consumable_id, quantity, unit_cost, total_cost)
-                    VALUES (gen_random_uuid(), :cid, :con_id, :qty, :uc, :tc)
-                """),
-                {"cid": completion_id, "con_id": con['consumable_id'], "qty": qty, "uc": uc, "tc": round(uc * qty, 2)}
-            )
-            # Deduct consumable stock. Previously this clamped with
-            # GREATEST(..., 0), which did not prevent over-consumption -- it
-            # hid it, discarding the exact discrepancy that signals a mis-key
-            # or shrinkage. Reject instead.
-            if qty > 0:
-                updated = await session.execute(
-                    text("""
-                        UPDATE production_consumables
-                           SET current_stock = current_stock - :qty
-                         WHERE id = :id AND current_stock >= :qty
-                     RETURNING id
-                    """),
-                    {"id": con['consumable_id'], "qty": qty}
-                )
-                if updated.fetchone() is None:
-                    avail = (await session.execute(
-                        text("SELECT name, current_stock FROM production_consumables WHERE id = :id"),
-                        {"id": con['consumable_id']}
-                    )).fetchone()
-                    raise HTTPException(
-                        status_code=400,
-                        detail=(f"Insufficient consumable stock for "
-                                f"{avail.name if avail else con['consumable_id']}: "
-                                f"available {avail.current_stock if avail else 0}, "
-                                f"required {qty}.")
-                    )
-
-        # Insert raw material line items and consume them from stock.
-        for mat in materials_list:
-            rm_r = await session.execute(
-                text("SELECT unit_cost FROM raw_materials WHERE id = :id"),
-                {"id": mat['raw_material_id']}
-            )
-            rm = rm_r.fetchone()
-            uc = _safe_float(rm.unit_cost) if rm else 0.0
-            qty = _safe_float(mat.get('quantity'))
-            await session.execute(
-                text("""
-                    INSERT INTO production_completion_materials (id, completion_id, raw_material_id, quantity, unit_cost, total_cost)
-                    VALUES (gen_random_uuid(), :cid, :rm_id, :qty, :uc, :tc)
-                """),
-                {"cid": completion_id, "rm_id": mat['raw_material_id'], "qty": qty, "uc": uc, "tc": round(uc * qty, 2)}
-            )
-            # Raw materials physically leave the warehouse when consumed.
-            # Without this the ledger showed materials still on hand after
-            # they had been used, and the finished goods appeared from nowhere.
-            if qty > 0:
-                await apply_stock_movement(
-                    session,
-                    warehouse_id=warehouse_id,
-                    raw_material_id=mat['raw_material_id'],
-                    movement_type='PRODUCTION_OUT',
-                    quantity=qty,
-                    unit_cost=uc,
-                    reference=f"PRODCOMP-{completion_id}",
-                    notes="Consumed by production completion",
-                    created_by=user_id,
-                )
-
-        # Book the finished goods into the warehouse, at the cost actually
-        # incurred by this batch. unit_cost is snapshotted here on purpose:
-        # it is the historical cost of these units and must not be re-derived
-        # from a later price change.
-        if qty_produced > 0:
-            await apply_stock_movement(
-                session,
-                warehouse_id=warehouse_id,
-                product_id=product_id,
-                movement_type='PRODUCTION_IN',
-                quantity=qty_produced,
-                unit_cost=round(cost_per_unit, 2),
-                reference=f"PRODCOMP-{completion_id}",
-                notes="Finished goods from production completion",
-                created_by=user_id,
-            )
-
-        # Damaged output is booked in, then written off, so the loss is
-        # traceable rather than silently never existing.
-        if qty_damaged > 0:
-            await apply_stock_movement(
-                session,
-                warehouse_id=warehouse_id,
-                product_id=product_id,
-                movement_type='PRODUCTION_IN',
-                quantity=qty_damaged,
-                unit_cost=round(cost_per_unit, 2),
-                reference=f"PRODCOMP-{completion_id}",
-                notes="Damaged output booked in prior to write-off",
-                created_by=user_id,
-            )
-            await apply_stock_movement(
-                session,
-                warehouse_id=warehouse_id,
-                product_id=product_id,
-                movement_type='DAMAGE',
-                quantity=qty_damaged,
-                unit_cost=round(cost_per_unit, 2),
-                reference=f"PRODCOMP-{completion_id}",
-                notes=f"Damaged during production: {damage_notes}" if damage_notes
-                      else "Damaged during production",
-                created_by=user_id,
-            )
+        # Line items, consumable deductions and every stock movement are
+        # written in batches, so the balance rows are locked only briefly.
+        await production_completion.book(
+            session,
+            completion_id=completion_id,
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            materials=materials,
+            consumables=consumables,
+            qty_produced=qty_produced,
+            qty_damaged=qty_damaged,
+            cost_per_unit=cost_per_unit,
+            damage_notes=damage_notes,
+            created_by=user_id,
+        )
 
         # Move the value from raw materials into finished goods. The good
         # units are capitalised at the cost actually incurred; the damaged
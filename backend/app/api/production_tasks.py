@@ -6,7 +6,8 @@ Production Tasks Module
 - Production Manager (admin / production_staff role) confirms or rejects each
   completed task.
 
-Auto-creates the underlying tables on first request.
+The underlying tables are created by the schema bootstrap
+(app.services.bootstrap).
 """
 from fastapi import APIRouter, Depends, HTTPException, Header, Body
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -19,6 +20,7 @@ import uuid
 
 from app.db import get_session
 from app.api.auth import decode_token
+from app.services import bootstrap
 
 router = APIRouter(prefix="/api/production-tasks")
 
@@ -150,12 +152,12 @@ CREATE_INDEX_SQLS = [
 ]
 
 
+bootstrap.register("production_tasks", 1,
+                   [CREATE_ASSIGNMENTS_SQL, CREATE_ITEMS_SQL, *CREATE_INDEX_SQLS])
+
+
 async def _ensure_tables(session: AsyncSession):
-    await session.execute(text(CREATE_ASSIGNMENTS_SQL))
-    await session.execute(text(CREATE_ITEMS_SQL))
-    for s in CREATE_INDEX_SQLS:
-        await session.execute(text(s))
-    await session.commit()
+    await bootstrap.ensure(session, "production_tasks")
 
 
 # ─── AUTH HELPERS ────────────────────────────────────────────────────────────
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -13,6 +13,7 @@ from datetime import datetime
 
 from app.db import get_session
 from app.models import Product, ProductPricing, StockLevel, StockMovement, Warehouse
+from app.services import http_cache
 from app.schemas import (
     ProductSchema,
     ProductCreate,
@@ -150,12 +151,18 @@ async def create_product(
 
 @router.get('/')
 async def list_products(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     size: int = Query(50, ge=1, le=1000),
     search: Optional[str] = Query(None, description="Search by SKU or name"),
     session: AsyncSession = Depends(get_session)
 ):
     """List products with pagination and search"""
+    cached = await http_cache.not_modified(
+        request, response, session, ('products', 'product_pricing'))
+    if cached is not None:
+        return cached
     from sqlalchemy.orm import selectinload
     
     offset = (page - 1) * size
@@ -27,7 +27,7 @@ Settlement workflow
 
 Weekly settlements: one settlement covers one ISO week (Mon→Sun).
 
-Tables auto-created on first request:
+Tables created by the schema bootstrap (app.services.bootstrap):
    profit_settlements
    profit_settlement_payments  (link table: settlement_id, payment_id)
 """
@@ -42,6 +42,7 @@ import uuid
 
 from app.db import get_session
 from app.api.auth import decode_token
+from app.services import bootstrap
 
 router = APIRouter(prefix="/api/profits")
 
@@ -91,12 +92,12 @@ CREATE_INDEX_SQLS = [
 ]
 
 
+bootstrap.register(
+    "profits", 1, [CREATE_SETTLEMENTS_SQL, CREATE_LINK_SQL, *CREATE_INDEX_SQLS])
+
+
 async def _ensure_tables(session: AsyncSession):
-    await session.execute(text(CREATE_SETTLEMENTS_SQL))
-    await session.execute(text(CREATE_LINK_SQL))
-    for s in CREATE_INDEX_SQLS:
-        await session.execute(text(s))
-    await session.commit()
+    await bootstrap.ensure(session, "profits")
 
 
 # ─── AUTH HELPERS ────────────────────────────────────────────────────────────
@@ -41,7 +41,7 @@ from app.models import (
     SalesOrderLine,
     StockLevel,
 )
-from app.api.notifications import notify_sale_created, fire_notification
+from app.services import outbox
 
 router = APIRouter(prefix="/api/public", tags=["public"])
 
@@ -437,20 +437,16 @@ async def create_public_order(
         total += line_total
 
     order.total_amount = total.quantize(Decimal("0.01"))
+    # Delivered by the outbox once this order has committed.
+    await outbox.enqueue_push(
+        session, "sale_created",
+        order_number=order.order_number,
+        customer_name=customer.name,
+        total_amount=float(order.total_amount),
+        line_count=len(payload.items),
+    )
     await session.commit()
 
-    try:
-        fire_notification(
-            notify_sale_created(
-                order_number=order.order_number,
-                customer_name=customer.name,
-                total_amount=float(order.total_amount),
-                line_count=len(payload.items),
-            )
-        )
-    except Exception:
-        pass
-
     msg_lines = [
         f"Hello, I just placed order {order.order_number} on the "
         f"BONNESANTE MEDICALS portal.",
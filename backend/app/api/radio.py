@@ -8,7 +8,7 @@ Aggregates a unified, time-ordered feed of business events that the frontend
   * new sales orders / invoices / payments
   * new production orders & completions
   * new raw-material entries (stock IN movements)
-  * scheduled announcements that are due now
+  * scheduled announcements as they fire
 
 Endpoint:
   GET /api/radio/feed?since=<iso8601>&limit=50
@@ -25,11 +25,10 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional, List, Dict, Any
 
 from app.db import get_session
+from app.services import announcement_scheduler
 
 router = APIRouter(prefix='/api/radio')
 
-LAGOS_TZ = timezone(timedelta(hours=1))
-
 
 def _parse_since(since: Optional[str]) -> datetime:
     if since:
@@ -232,52 +231,20 @@ async def feed(
         except Exception:
             pass
 
-    # ── Due scheduled announcements ──────────────────────────────────
-    if await _table_exists(session, 'announcements'):
+    # ── Fired scheduled announcements ────────────────────────────────
+    # Fired once, server-side, by app.services.announcement_scheduler.
+    if await _table_exists(session, 'announcement_fires'):
         try:
-            now_local = datetime.now(LAGOS_TZ)
-            today_local = now_local.date()
-            current_min = now_local.hour * 60 + now_local.minute
-            window = 2  # ± minutes
-            rows = (await session.execute(text("""
-                SELECT id::text AS id, title, message, audio_filename,
-                       scheduled_date, scheduled_time, repeat_type, repeat_days
-                FROM announcements WHERE is_active = true
-            """))).mappings().all()
-            weekday = today_local.weekday()
-            for a in rows:
-                t = a['scheduled_time']
-                if t is None:
-                    continue
-                t_min = t.hour * 60 + t.minute
-                if abs(t_min - current_min) > window:
-                    continue
-                rt = (a['repeat_type'] or 'once').lower()
-                ok = False
-                if rt == 'once':
-                    if a['scheduled_date'] and a['scheduled_date'] == today_local:
-                        ok = True
-                elif rt == 'daily':
-                    ok = True
-                elif rt == 'weekly':
-                    days = [int(x) for x in (a['repeat_days'] or '').split(',') if x.strip().isdigit()]
-                    ok = weekday in days
-                elif rt == 'monthly':
-                    if a['scheduled_date']:
-                        ok = a['scheduled_date'].day == today_local.day
-                if not ok:
-                    continue
-                audio_url = f"/api/announcements/audio/{a['audio_filename']}" if a['audio_filename'] else None
-                # Bucket by minute so each due slot fires once per minute window
-                bucket = now_local.strftime('%Y%m%d%H%M')
+            for a in await announcement_scheduler.recent_fires(
+                    session, since=since_dt, limit=limit):
                 events.append({
-                    "id": f"announce:{a['id']}:{bucket}",
+                    "id": f"announce:{a['fire_id']}",
                     "type": "announcement",
                     "title": a['title'] or "Announcement",
                     "message": a['message'] or "",
-                    "audio_url": audio_url,
+                    "audio_url": a['audio_url'],
                     "priority": 5,
-                    "created_at": now.isoformat(),
+                    "created_at": a['fired_at'],
                 })
         except Exception:
             pass
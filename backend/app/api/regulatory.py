@@ -10,7 +10,7 @@ Provides:
 - GMP-styled PDF export with watermark, QR, controlled-copy stamp.
 - Dashboard counters.
 
-All tables are created at startup via `bootstrap_regulatory_schema`.
+All tables are created by the schema bootstrap (app.services.bootstrap).
 """
 from __future__ import annotations
 
@@ -27,7 +27,7 @@ from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import get_session
-from app.services import sop_templates
+from app.services import bootstrap, sop_templates
 from app.services.gmp_pdf import build_document_pdf
 
 router = APIRouter(prefix="/api/regulatory", tags=["regulatory"])
@@ -89,6 +89,15 @@ DDL_STATEMENTS: List[str] = [
     )
     """,
     "CREATE INDEX IF NOT EXISTS idx_reg_audit_doc ON reg_audit_trail(document_id)",
+    # Partitioned by month like the other append-only tables, once migration
+    # d9012345678c has installed the function (app.services.partitions).
+    """
+    DO $$ BEGIN
+        IF to_regprocedure('partition_by_month(text, text, integer)') IS NOT NULL THEN
+            PERFORM partition_by_month('reg_audit_trail', 'created_at');
+        END IF;
+    END $$
+    """,
 
     # Deviations / CAPA
     """
@@ -132,16 +141,9 @@ DDL_STATEMENTS: List[str] = [
 ]
 
 
-async def bootstrap_regulatory_schema(session: AsyncSession) -> None:
-    """Run DDL once at startup. Per-statement try/rollback so a single bad
-    grant doesn't poison the whole transaction."""
-    for sql in DDL_STATEMENTS:
-        try:
-            await session.execute(text(sql))
-        except Exception:
-            await session.rollback()
-            continue
-    await session.commit()
+# Applied once by the schema bootstrap. Tolerant, so a single bad grant
+# doesn't poison the whole step.
+bootstrap.register("regulatory", 2, DDL_STATEMENTS, tolerant=True)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -30,7 +30,6 @@ from app.models import (
     SalesOrder,
     SalesOrderLine,
     Product,
-    user_warehouses,
     StockLevel,
     StockMovement,
 )
@@ -40,11 +39,7 @@ from app.schemas import (
     PaginatedResponse, ApiResponse
 )
 from app.api.auth import get_current_user
-from app.api.notifications import (
-    fire_notification,
-    notify_sale_created,
-    notify_payment_received,
-)
+from app.services import authz, outbox
 from decimal import Decimal
 from sqlalchemy import and_
 
@@ -354,12 +349,8 @@ async def create_sales_order(
             except Exception:
                 raise HTTPException(status_code=401, detail="Invalid user context")
 
-            access_stmt = select(user_warehouses.c.warehouse_id).where(
-                user_warehouses.c.user_id == user_uuid,
-                user_warehouses.c.warehouse_id == order_data.warehouse_id,
-            )
-            access_result = await session.execute(access_stmt)
-            if access_result.scalar_one_or_none() is None:
+            grants = await authz.grants_for(session, user_uuid)
+            if grants is None or not grants.in_warehouse(order_data.warehouse_id):
                 raise HTTPException(status_code=403, detail="You do not have access to the selected warehouse")
         
         # Generate order number
@@ -434,6 +425,30 @@ async def create_sales_order(
         await post_sale(session, order_id=sales_order.id,
                         created_by=sales_order.created_by)
 
+        # Push notifications and the activity entry commit with the order
+        # and are delivered by the outbox dispatcher, not on this request.
+        customer_name = customer.name if customer else "Customer"
+        await outbox.enqueue_push(
+            session, "sale_created",
+            order_number=order_number,
+            customer_name=customer_name,
+            total_amount=float(total_amount or 0),
+            line_count=len(order_lines),
+        )
+        if sales_order.payment_status == 'paid':
+            await outbox.enqueue_push(
+                session, "payment_received",
+                order_number=order_number,
+                amount=float(total_amount or 0),
+                customer_name=customer_name,
+            )
+        await outbox.enqueue_activity(
+            session, action="SALE_CREATED", module="sales",
+            record_id=sales_order.id, user_id=user_id,
+            details=f"Sales order {order_number} for {customer_name}: "
+                    f"{money(total_amount)}",
+        )
+
         await session.commit()
 
         # Reload with relationships
@@ -443,24 +458,7 @@ async def create_sales_order(
             .where(SalesOrder.id == sales_order.id)
         )
         order = result.scalars().first()
-        
-        # Fire push notification (non-blocking)
-        try:
-            fire_notification(notify_sale_created(
-                order_number=order.order_number,
-                customer_name=customer.name if customer else "Customer",
-                total_amount=float(order.total_amount or 0),
-                line_count=len(order.lines or []),
-            ))
-            if order.payment_status == 'paid':
-                fire_notification(notify_payment_received(
-                    order_number=order.order_number,
-                    amount=float(order.total_amount or 0),
-                    customer_name=customer.name if customer else "Customer",
-                ))
-        except Exception as _notif_err:
-            print(f"[sales] notification dispatch error: {_notif_err}")
-        
+
         return ApiResponse(
             message=f"Sales order {order.order_number} created successfully",
             data=SalesOrderSchema.model_validate(order)
@@ -1114,21 +1112,24 @@ async def mark_order_paid(
             # derived flags rather than inventing a zero-value payment.
             await recompute_invoice_paid(session, invoice_id)
 
+        customer_name = order.customer.name if order.customer else "Customer"
+        await outbox.enqueue_push(
+            session, "payment_received",
+            order_number=order.order_number,
+            amount=float(order.total_amount or 0),
+            customer_name=customer_name,
+        )
+        await outbox.enqueue_activity(
+            session, action="PAYMENT_RECEIVED", module="sales",
+            record_id=order.id,
+            details=f"Order {order.order_number} marked paid "
+                    f"({money(order.total_amount or 0)})",
+        )
+
         await session.commit()
         await session.refresh(order)
         await session.refresh(order)
-        
-        # Fire payment notification
-        try:
-            customer_name = order.customer.name if order.customer else "Customer"
-            fire_notification(notify_payment_received(
-                order_number=order.order_number,
-                amount=float(order.total_amount or 0),
-                customer_name=customer_name,
-            ))
-        except Exception as _notif_err:
-            print(f"[sales] notification dispatch error: {_notif_err}")
-        
+
         return ApiResponse(
             message=f"Order {order.order_number} marked as paid. Receipt can be generated.",
             data=SalesOrderSchema.model_validate(order)
@@ -0,0 +1,36 @@
+"""Unified type-ahead search for the sales, POS and HR pickers."""
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import get_session
+from app.api.auth import require_authenticated_user
+from app.models import User
+from app.services.search import ENTITIES, MAX_LIMIT, search
+
+router = APIRouter(prefix='/api/search', tags=['Search'])
+
+
+@router.get('')
+async def type_ahead(
+    q: str = Query('', max_length=100),
+    types: Optional[str] = Query(
+        None, description="Comma-separated: " + ", ".join(ENTITIES)),
+    limit: int = Query(10, ge=1, le=MAX_LIMIT),
+    session: AsyncSession = Depends(get_session),
+    _user: User = Depends(require_authenticated_user),
+):
+    """Ranked matches per entity type: exact, then prefix, then substring."""
+    kinds = None
+    if types:
+        kinds = [t.strip() for t in types.split(',') if t.strip()]
+        unknown = sorted(set(kinds) - set(ENTITIES))
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown search type(s): {', '.join(unknown)}. "
+                       f"Use any of: {', '.join(ENTITIES)}.")
+    return await search(session, term=q, kinds=kinds, limit=limit)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db import get_session
+from app.services import authz
 from app.models import SystemSettings, RolePermission, CustomField, User, AuditLog
 from pydantic import BaseModel
 from typing import Optional, List
@@ -259,6 +260,7 @@ async def create_permission(data: RolePermissionSchema, db: AsyncSession = Depen
     )
     db.add(permission)
     await db.commit()
+    authz.invalidate_roles()
     return {"success": True, "id": str(permission.id)}
 
 @router.get("/permissions/{role}")
@@ -445,4 +447,5 @@ async def initialize_permissions(db: AsyncSession = Depends(get_session)):
             db.add(perm)
     
     await db.commit()
+    authz.invalidate_roles()
     return {"success": True, "message": "Default permissions initialized"}
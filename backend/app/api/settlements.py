@@ -21,7 +21,7 @@ against, and one compromised session should not be enough to do it.
 """
 from __future__ import annotations
 
-from datetime import date
+from datetime import date, timedelta
 from typing import List, Optional
 from uuid import UUID, uuid4
 
@@ -30,11 +30,12 @@ from pydantic import BaseModel, Field, model_validator
 from sqlalchemy import func, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_session
+from app.db import get_read_session, get_session
 from app.api.auth import require_admin, require_authenticated_user, verify_password
 from app.models import User
 from app.services.encryption import decrypt_secret, encrypt_secret, has_secret
 from app.services.ledger import money
+from app.services import settlement_rollup
 from app.services.receivables import ensure_invoice_for_order, record_payment
 from app.services.settlement import (
     build_plan, distribute_payment, mapd_audit, mapd_schema_ready,
@@ -53,6 +54,15 @@ async def _require_schema(session: AsyncSession) -> None:
                    "database. Run the s8901234567r migration.")
 
 
+async def _require_rollup(session: AsyncSession) -> None:
+    await _require_schema(session)
+    if not await settlement_rollup.rollup_ready(session):
+        raise HTTPException(
+            status_code=503,
+            detail="The settlement reports need the daily rollup. Run the "
+                   "x3456789012w migration.")
+
+
 def _mask(account_number_enc: Optional[str]) -> Optional[str]:
     """Show the last four digits only.
 
@@ -1432,14 +1442,15 @@ async def toggle_rule(
 async def finance_dashboard(
     start: Optional[date] = Query(None),
     end: Optional[date] = Query(None),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     """The distribution dashboard: collections, destinations, and what failed."""
-    await _require_schema(session)
-    params = {"start": start, "end": end}
+    await _require_rollup(session)
+    params = {"start": start,
+              "end_excl": end + timedelta(days=1) if end else None}
     window = ("AND s.created_at >= CAST(:start AS date) " if start else "") + \
-             ("AND s.created_at < CAST(:end AS date) + INTERVAL '1 day' " if end else "")
+             ("AND s.created_at < CAST(:end_excl AS date) " if end else "")
 
     totals = (await session.execute(
         text(f"""
@@ -1455,59 +1466,20 @@ async def finance_dashboard(
               FROM settlements s WHERE TRUE {window}
         """), params)).first()
 
-    by_account = (await session.execute(
-        text(f"""
-            SELECT fa.code, fa.name, fa.status,
-                   bu.name AS business_unit,
-                   COALESCE(SUM(d.amount), 0) AS total,
-                   COUNT(DISTINCT s.id) AS settlements
-              FROM financial_accounts fa
-              LEFT JOIN settlement_details d ON d.financial_account_id = fa.id
-              LEFT JOIN settlements s
-                     ON s.id = d.settlement_id AND s.status = 'COMPLETED' {window}
-              LEFT JOIN business_units bu ON bu.id = fa.business_unit_id
-             GROUP BY fa.code, fa.name, fa.status, bu.name
-             ORDER BY total DESC
-        """), params)).fetchall()
-
-    by_product = (await session.execute(
-        text(f"""
-            SELECT pr.name AS product, pr.sku,
-                   COALESCE(SUM(d.amount), 0) AS total
-              FROM settlement_details d
-              JOIN settlements s ON s.id = d.settlement_id
-              LEFT JOIN products pr ON pr.id = d.product_id
-             WHERE s.status = 'COMPLETED' AND d.allocation_type = 'CASH' {window}
-             GROUP BY pr.name, pr.sku
-             ORDER BY total DESC LIMIT 20
-        """), params)).fetchall()
-
-    by_unit = (await session.execute(
-        text(f"""
-            SELECT COALESCE(bu.name, 'Unassigned') AS business_unit,
-                   COALESCE(SUM(d.amount), 0) AS total
-              FROM settlement_details d
-              JOIN settlements s ON s.id = d.settlement_id
-              LEFT JOIN financial_accounts fa ON fa.id = d.financial_account_id
-              LEFT JOIN business_units bu ON bu.id = fa.business_unit_id
-             WHERE s.status = 'COMPLETED' AND d.allocation_type = 'CASH' {window}
-             GROUP BY bu.name ORDER BY total DESC
-        """), params)).fetchall()
-
-    daily = (await session.execute(
-        text(f"""
-            SELECT CAST(s.created_at AS date) AS day,
-                   COALESCE(SUM(s.allocated_amount), 0) AS total
-              FROM settlements s
-             WHERE s.status = 'COMPLETED' {window}
-             GROUP BY CAST(s.created_at AS date)
-             ORDER BY day DESC LIMIT 30
-        """), params)).fetchall()
-
+    # Destinations, products, units and the daily trend come from the daily
+    # rollup rather than from every settlement detail on record.
+    breakdowns = await settlement_rollup.dashboard_breakdowns(
+        session, start=start, end=end)
+    by_account = breakdowns["by_account"]
+    by_product = breakdowns["by_product"]
+    by_unit = breakdowns["by_unit"]
+    daily = breakdowns["daily"]
+
+    # invoices.paid_amount is kept in step with the payments by
+    # receivables.recompute_invoice_paid.
     outstanding = money((await session.execute(
-        text("""SELECT COALESCE(SUM(GREATEST(i.total_amount - COALESCE((
-                        SELECT SUM(p.amount) FROM payments p
-                         WHERE p.invoice_id = i.id), 0), 0)), 0)
+        text("""SELECT COALESCE(SUM(GREATEST(
+                        i.total_amount - COALESCE(i.paid_amount, 0), 0)), 0)
                   FROM invoices i WHERE i.status <> 'cancelled'""")
     )).scalar())
 
@@ -1630,16 +1602,18 @@ async def revenue_report(
     start: Optional[date] = Query(None),
     end: Optional[date] = Query(None),
     group_by: str = Query('product'),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     """Distributed revenue, grouped the way the reader needs it.
 
     Reads the settlement details -- money that actually reached an account --
     rather than order totals or a payment-status flag. The three used to
-    disagree; this reports the one that is a record of an event.
+    disagree; this reports the one that is a record of an event. The details
+    are read through their daily rollup, so a long period costs no more than
+    a short one.
     """
-    await _require_schema(session)
+    await _require_rollup(session)
 
     # Validated here rather than with Query(pattern=...): that argument needs
     # FastAPI >= 0.100, and nothing else in this codebase requires it (staff.py
@@ -1656,46 +1630,14 @@ async def revenue_report(
             detail="group_by must be one of: product, account, "
                    "business_unit, day")
 
-    dimension = {
-        'product': ("COALESCE(pr.name, 'Unknown product')", "pr.sku"),
-        'account': ("fa.name", "fa.code"),
-        'business_unit': ("COALESCE(bu.name, 'Unassigned')", "bu.code"),
-        'day': ("CAST(s.distributed_at AS text)", "NULL"),
-    }[group_by]
-
-    label_expr = ("CAST(CAST(s.distributed_at AS date) AS text)"
-                  if group_by == 'day' else dimension[0])
-    key_expr = "NULL" if group_by == 'day' else dimension[1]
-
-    rows = (await session.execute(
-        text(f"""
-            SELECT {label_expr} AS label, {key_expr} AS key,
-                   COALESCE(SUM(d.amount) FILTER (
-                       WHERE d.allocation_type = 'CASH'), 0) AS cash,
-                   COALESCE(SUM(d.amount) FILTER (
-                       WHERE d.allocation_type = 'OBLIGATION'), 0) AS obligations,
-                   COUNT(DISTINCT s.id) AS settlements
-              FROM settlement_details d
-              JOIN settlements s ON s.id = d.settlement_id
-              LEFT JOIN products pr ON pr.id = d.product_id
-              LEFT JOIN financial_accounts fa ON fa.id = d.financial_account_id
-              LEFT JOIN business_units bu ON bu.id = fa.business_unit_id
-             WHERE s.status = 'COMPLETED'
-               AND (CAST(:start AS date) IS NULL
-                    OR CAST(s.distributed_at AS date) >= CAST(:start AS date))
-               AND (CAST(:end AS date) IS NULL
-                    OR CAST(s.distributed_at AS date) <= CAST(:end AS date))
-             GROUP BY 1, 2
-             ORDER BY 3 DESC
-        """),
-        {"start": start, "end": end},
-    )).fetchall()
+    rows = await settlement_rollup.revenue(
+        session, group_by=group_by, start=start, end=end)
 
     items = [
-        {"label": r.label, "key": r.key,
-         "cash": float(money(r.cash)),
-         "obligations": float(money(r.obligations)),
-         "settlements": int(r.settlements)}
+        {"label": r["label"], "key": r["key"],
+         "cash": float(money(r["cash"])),
+         "obligations": float(money(r["obligations"])),
+         "settlements": r["settlements"]}
         for r in rows
     ]
     return {
@@ -1708,21 +1650,10 @@ async def revenue_report(
     }
 
 
-@reports_router.get('/settlements')
-async def settlements_report(
-    start: Optional[date] = Query(None),
-    end: Optional[date] = Query(None),
-    status: Optional[str] = Query(None),
-    account_code: Optional[str] = Query(None),
-    limit: int = Query(200, ge=1, le=2000),
-    offset: int = Query(0, ge=0),
-    session: AsyncSession = Depends(get_session),
-    _user: User = Depends(require_authenticated_user),
-):
-    """The settlement register: every distribution, with its destinations."""
-    await _require_schema(session)
+def _settlement_register_sql(*, start, end, status, account_code,
+                             paged: bool):
     clauses = ["TRUE"]
-    params = {"lim": limit, "off": offset, "start": start, "end": end}
+    params = {"start": start}
     if status:
         clauses.append("s.status = :st"); params["st"] = status.upper()
     if account_code:
@@ -1732,57 +1663,95 @@ async def settlements_report(
                                    WHERE d2.settlement_id = s.id
                                      AND fa2.code = :acct)""")
         params["acct"] = account_code
-    clauses.append("(CAST(:start AS date) IS NULL "
-                   "OR CAST(s.created_at AS date) >= CAST(:start AS date))")
-    clauses.append("(CAST(:end AS date) IS NULL "
-                   "OR CAST(s.created_at AS date) <= CAST(:end AS date))")
+    # Bounds on the bare column so ix_settlements_created can serve them.
+    if start:
+        clauses.append("s.created_at >= CAST(:start AS date)")
+    if end:
+        clauses.append("s.created_at < CAST(:end_excl AS date)")
+        params["end_excl"] = end + timedelta(days=1)
+
+    return text(f"""
+        SELECT s.id, s.settlement_reference, s.status, s.gross_amount,
+               s.allocated_amount, s.obligation_amount, s.failure_reason,
+               s.payment_method, s.distributed_at, s.created_at,
+               i.invoice_number, c.name AS customer_name,
+               so.order_number,
+               (SELECT STRING_AGG(fa.code || ':' || d.amount, ' | '
+                                  ORDER BY fa.code)
+                  FROM settlement_details d
+                  JOIN financial_accounts fa
+                    ON fa.id = d.financial_account_id
+                 WHERE d.settlement_id = s.id) AS destinations
+          FROM settlements s
+          JOIN invoices i ON i.id = s.invoice_id
+          LEFT JOIN customers c ON c.id = i.customer_id
+          LEFT JOIN sales_orders so ON so.id = s.sales_order_id
+         WHERE {' AND '.join(clauses)}
+         ORDER BY s.created_at DESC
+         {'LIMIT :lim OFFSET :off' if paged else ''}
+    """), params
+
+
+def _settlement_register_row(r) -> dict:
+    return {
+        "id": str(r.id), "reference": r.settlement_reference,
+        "status": r.status,
+        "gross_amount": float(money(r.gross_amount)),
+        "allocated_amount": float(money(r.allocated_amount)),
+        "obligation_amount": float(money(r.obligation_amount)),
+        "failure_reason": r.failure_reason,
+        "payment_method": r.payment_method,
+        "invoice_number": r.invoice_number,
+        "order_number": r.order_number,
+        "customer_name": r.customer_name,
+        "destinations": r.destinations,
+        "distributed_at": r.distributed_at.isoformat() if r.distributed_at else None,
+        "created_at": r.created_at.isoformat() if r.created_at else None,
+    }
 
-    rows = (await session.execute(
-        text(f"""
-            SELECT s.id, s.settlement_reference, s.status, s.gross_amount,
-                   s.allocated_amount, s.obligation_amount, s.failure_reason,
-                   s.payment_method, s.distributed_at, s.created_at,
-                   i.invoice_number, c.name AS customer_name,
-                   so.order_number,
-                   (SELECT STRING_AGG(fa.code || ':' || d.amount, ' | '
-                                      ORDER BY fa.code)
-                      FROM settlement_details d
-                      JOIN financial_accounts fa
-                        ON fa.id = d.financial_account_id
-                     WHERE d.settlement_id = s.id) AS destinations
-              FROM settlements s
-              JOIN invoices i ON i.id = s.invoice_id
-              LEFT JOIN customers c ON c.id = i.customer_id
-              LEFT JOIN sales_orders so ON so.id = s.sales_order_id
-             WHERE {' AND '.join(clauses)}
-             ORDER BY s.created_at DESC
-             LIMIT :lim OFFSET :off
-        """),
-        params,
-    )).fetchall()
 
-    return [
-        {"id": str(r.id), "reference": r.settlement_reference,
-         "status": r.status,
-         "gross_amount": float(money(r.gross_amount)),
-         "allocated_amount": float(money(r.allocated_amount)),
-         "obligation_amount": float(money(r.obligation_amount)),
-         "failure_reason": r.failure_reason,
-         "payment_method": r.payment_method,
-         "invoice_number": r.invoice_number,
-         "order_number": r.order_number,
-         "customer_name": r.customer_name,
-         "destinations": r.destinations,
-         "distributed_at": r.distributed_at.isoformat() if r.distributed_at else None,
-         "created_at": r.created_at.isoformat() if r.created_at else None}
-        for r in rows
-    ]
+@reports_router.get('/settlements')
+async def settlements_report(
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    status: Optional[str] = Query(None),
+    account_code: Optional[str] = Query(None),
+    limit: int = Query(200, ge=1, le=2000),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_read_session),
+    _user: User = Depends(require_authenticated_user),
+):
+    """The settlement register: every distribution, with its destinations."""
+    await _require_schema(session)
+    sql, params = _settlement_register_sql(
+        start=start, end=end, status=status, account_code=account_code,
+        paged=True)
+    params.update(lim=limit, off=offset)
+    rows = (await session.execute(sql, params)).fetchall()
+    return [_settlement_register_row(r) for r in rows]
+
+
+async def iter_settlement_register(
+    session: AsyncSession, *, start: Optional[date] = None,
+    end: Optional[date] = None, status: Optional[str] = None,
+    account_code: Optional[str] = None,
+):
+    """The whole settlement register for the filters, from a server-side
+    cursor. Used by the report exports."""
+    await _require_schema(session)
+    sql, params = _settlement_register_sql(
+        start=start, end=end, status=status, account_code=account_code,
+        paged=False)
+    result = await session.stream(
+        sql.execution_options(yield_per=1000), params)
+    async for r in result:
+        yield _settlement_register_row(r)
 
 
 @reports_router.get('/refunds')
 async def refunds_report(
     limit: int = Query(200, ge=1, le=1000),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     _user: User = Depends(require_authenticated_user),
 ):
     await _require_schema(session)
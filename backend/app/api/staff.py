@@ -19,6 +19,7 @@ from sqlalchemy import func
 
 # Additional imports for staff payroll and attendance
 from app.models import Staff, PayrollEntry, Attendance
+from app.services.payroll import attendance_totals
 from app.schemas import StaffSchema, StaffCreate, StaffUpdate, PayrollEntrySchema, PayrollEntryCreate, AttendanceSchema
 from fastapi.responses import StreamingResponse
 from io import BytesIO
@@ -768,30 +769,25 @@ async def payroll_dashboard(
         result = await session.execute(select(Staff).where(Staff.is_active == True))
         all_staff = result.scalars().all()
 
+        # Attendance and existing payroll entries for the whole workforce,
+        # one query each rather than three per staff member.
+        attendance = await attendance_totals(
+            session, period_start=period_start, period_end=period_end)
+        entries_res = await session.execute(select(PayrollEntry).where(
+            PayrollEntry.pay_period_start == period_start,
+            PayrollEntry.pay_period_end == period_end,
+        ))
+        existing_by_staff = {}
+        for entry in entries_res.scalars().all():
+            existing_by_staff.setdefault(entry.staff_id, entry)
+
         dashboard = []
         total_due = Decimal('0')
         total_hours = Decimal('0')
 
         for staff in all_staff:
-            # Sum attendance hours in period
-            att_q = select(func.coalesce(func.sum(Attendance.hours_worked), 0)).where(
-                Attendance.staff_id == staff.id,
-                func.date(Attendance.clock_in) >= period_start,
-                func.date(Attendance.clock_in) <= period_end,
-                Attendance.status == 'completed'
-            )
-            att_res = await session.execute(att_q)
-            hours_worked = Decimal(str(att_res.scalar_one() or 0))
-
-            # Count attendance days
-            days_q = select(func.count(Attendance.id)).where(
-                Attendance.staff_id == staff.id,
-                func.date(Attendance.clock_in) >= period_start,
-                func.date(Attendance.clock_in) <= period_end,
-                Attendance.status == 'completed'
-            )
-            days_res = await session.execute(days_q)
-            days_worked = days_res.scalar_one() or 0
+            hours_worked, days_worked = attendance.get(
+                str(staff.id), (Decimal('0'), 0))
 
             # Calculate pay based on staff payment mode
             payment_mode = staff.payment_mode or 'monthly'
@@ -822,13 +818,7 @@ async def payroll_dashboard(
                 regular_pay = gross_pay - (overtime_hours * (monthly_salary / standard_hours * overtime_rate_multiplier) if monthly_salary > 0 else Decimal('0'))
 
             # Check if payroll already processed for this period
-            existing_q = select(PayrollEntry).where(
-                PayrollEntry.staff_id == staff.id,
-                PayrollEntry.pay_period_start == period_start,
-                PayrollEntry.pay_period_end == period_end,
-            )
-            existing_res = await session.execute(existing_q)
-            existing_payroll = existing_res.scalars().first()
+            existing_payroll = existing_by_staff.get(staff.id)
 
             payroll_status = existing_payroll.status if existing_payroll else 'not_processed'
             payroll_id = str(existing_payroll.id) if existing_payroll else None
@@ -944,15 +934,18 @@ async def bulk_calculate_payroll(
         standard_hours = Decimal('160')
         overtime_multiplier = Decimal('1.5')
 
-        for staff in all_staff:
-            # Check if already processed
-            existing_q = select(PayrollEntry).where(
-                PayrollEntry.staff_id == staff.id,
+        attendance = await attendance_totals(
+            session, period_start=period_start, period_end=period_end)
+        processed_res = await session.execute(
+            select(PayrollEntry.staff_id).where(
                 PayrollEntry.pay_period_start == period_start,
                 PayrollEntry.pay_period_end == period_end,
-            )
-            existing_res = await session.execute(existing_q)
-            if existing_res.scalars().first():
+            ))
+        already_processed = set(processed_res.scalars().all())
+
+        for staff in all_staff:
+            # Check if already processed
+            if staff.id in already_processed:
                 skipped.append({
                     'staff_id': str(staff.id),
                     'employee_id': staff.employee_id,
@@ -962,14 +955,7 @@ async def bulk_calculate_payroll(
                 continue
 
             # Sum attendance
-            att_q = select(func.coalesce(func.sum(Attendance.hours_worked), 0)).where(
-                Attendance.staff_id == staff.id,
-                func.date(Attendance.clock_in) >= period_start,
-                func.date(Attendance.clock_in) <= period_end,
-                Attendance.status == 'completed'
-            )
-            att_res = await session.execute(att_q)
-            total_hours_dec = Decimal(str(att_res.scalar_one() or 0))
+            total_hours_dec = attendance.get(str(staff.id), (Decimal('0'), 0))[0]
 
             regular_hours = min(total_hours_dec, standard_hours)
             overtime_hours = max(Decimal('0'), total_hours_dec - standard_hours)
@@ -3,12 +3,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import func, and_, or_, text
 from typing import List, Optional
+from datetime import date
 from decimal import Decimal
 import uuid
 
 from app.db import get_session
 from app.api.auth import require_authenticated_user
 from app.services.inventory import apply_stock_movement
+from app.services.stock_history import stock_as_of
 from app.models import (
     StockMovement, StockLevel, Product, RawMaterial, 
     Warehouse, User
@@ -321,6 +323,43 @@ async def get_inventory_valuation(
         "grand_total": float((rm_data.total_value or 0) + (prod_data.total_value or 0))
     }
 
+@router.get('/as-of', response_model=dict)
+async def get_stock_as_of(
+    on: date = Query(..., description="Business day; positions are at its close"),
+    warehouse_id: Optional[uuid.UUID] = Query(None),
+    product_id: Optional[uuid.UUID] = Query(None),
+    raw_material_id: Optional[uuid.UUID] = Query(None),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(require_authenticated_user)
+):
+    """Stock on hand and its value at the end of a past day.
+
+    Built from the nearest monthly checkpoint plus the movements since; see
+    app.services.stock_history.
+    """
+    result = await stock_as_of(session, on, warehouse_id=warehouse_id,
+                               product_id=product_id,
+                               raw_material_id=raw_material_id)
+    items = [{
+        "warehouse_id": str(p.warehouse_id),
+        "warehouse_name": p.warehouse_name,
+        "item_type": "product" if p.product_id else "raw_material",
+        "item_id": str(p.product_id or p.raw_material_id),
+        "sku": p.sku,
+        "name": p.name,
+        "quantity": float(p.quantity),
+        "unit_cost": float(p.unit_cost) if p.unit_cost is not None else None,
+        "value": float(p.value) if p.value is not None else None,
+    } for p in result.positions]
+    return {
+        "as_of": result.on.isoformat(),
+        "checkpoint": result.checkpoint.isoformat() if result.checkpoint else None,
+        "items": items,
+        "total_value": float(sum(p.value for p in result.positions
+                                 if p.value is not None)),
+        "unvalued_items": sum(1 for p in result.positions if p.value is None),
+    }
+
 @router.post('/intake/', response_model=ApiResponse)
 async def create_stock_intake(
     intake_data: StockIntakeCreate,
@@ -411,7 +450,10 @@ async def create_raw_material_stock_intake(
     )
     
     await session.commit()
-    await session.refresh(movement)
+
+    movement = (await session.execute(
+        select(StockMovement).where(StockMovement.id == movement_id)
+    )).scalar_one()
     
     return ApiResponse(
         message=f"Raw material stock intake for {raw_material.name} completed successfully. Added {intake_data.quantity} units.",
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import func, and_, or_, case, text
@@ -10,6 +10,7 @@ from pydantic import BaseModel
 
 from app.db import get_session
 from app.api.auth import require_authenticated_user
+from app.services import http_cache, low_stock, stock_levels
 from app.services.inventory import (
     apply_stock_movement, transfer_stock, get_available_stock)
 from app.models import (
@@ -19,6 +20,9 @@ from app.models import (
 
 router = APIRouter(prefix='/api/stock-management')
 
+# Source tables of the stock-level read endpoints, for their ETags.
+STOCK_LEVEL_TABLES = ('stock_levels', 'products', 'product_pricing', 'warehouses')
+
 # Pydantic schemas
 class ProductIntakeRequest(BaseModel):
     warehouse_id: UUID
@@ -132,65 +136,31 @@ async def raw_material_stock_intake(
 # Get Product Stock Levels
 @router.get('/product-levels')
 async def get_product_stock_levels(
-    warehouse_id: Optional[str] = None,
+    request: Request,
+    response: Response,
+    warehouse_id: Optional[UUID] = None,
     low_stock_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=1000,
+                                 description="Page size; omit for every row"),
+    offset: int = Query(0, ge=0),
     session: AsyncSession = Depends(get_session)
 ):
-    """Get current product stock levels (raw SQL for production schema compatibility)"""
+    """Current product stock levels, one page at a time.
+
+    The number of rows matching the filters is sent as X-Total-Count.
+    """
+    cached = await http_cache.not_modified(
+        request, response, session, STOCK_LEVEL_TABLES)
+    if cached is not None:
+        return cached
     try:
-        sql = """
-            SELECT sl.id, sl.warehouse_id, sl.product_id, sl.current_stock,
-                   COALESCE(sl.min_stock, 0) as min_stock,
-                   p.name as product_name, p.sku as product_sku,
-                   p.unit as product_unit,
-                   COALESCE(NULLIF(sl.min_stock, 0), 10) as reorder_level,
-                   sl.updated_at,
-                   w.name as warehouse_name,
-                   (SELECT string_agg(pp.unit, ', ' ORDER BY pp.unit)
-                    FROM product_pricing pp WHERE pp.product_id = sl.product_id) as available_units
-            FROM stock_levels sl
-            LEFT JOIN products p ON sl.product_id::text = p.id::text
-            LEFT JOIN warehouses w ON sl.warehouse_id::text = w.id::text
-            WHERE sl.product_id IS NOT NULL
-        """
-        params = {}
-        if warehouse_id:
-            sql += " AND sl.warehouse_id::text = :wh_id"
-            params['wh_id'] = str(warehouse_id)
-        
-        result = await session.execute(text(sql), params)
-        rows = result.fetchall()
-        
-        stock_levels = []
-        for row in rows:
-            current_stock = float(row.current_stock or 0)
-            reorder_level = float(row.reorder_level or 10)
-            is_low_stock = current_stock <= reorder_level
-            
-            if low_stock_only and not is_low_stock:
-                continue
-            
-            available_units = row.available_units or row.product_unit or 'each'
-            stock_levels.append({
-                'stock_level_id': str(row.id),
-                'warehouse_id': str(row.warehouse_id or ''),
-                'warehouse_name': row.warehouse_name or 'Default',
-                'product_id': str(row.product_id),
-                'product_name': row.product_name or 'Unknown',
-                'product_sku': row.product_sku or '',
-                'current_stock': current_stock,
-                'reserved_stock': 0,
-                'available_stock': current_stock,
-                'reorder_level': reorder_level,
-                'product_unit': row.product_unit or '',
-                'available_units': available_units,
-                'is_low_stock': is_low_stock,
-                'updated_at': row.updated_at.isoformat() if row.updated_at else None
-            })
-        
-        return stock_levels
+        levels, total = await stock_levels.product_levels(
+            session, warehouse_id=warehouse_id, low_stock_only=low_stock_only,
+            limit=limit, offset=offset)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching product stock levels: {str(e)}")
+    response.headers['X-Total-Count'] = str(total)
+    return levels
 
 
 # Admin Stock Level Adjustment
@@ -214,8 +184,8 @@ async def adjust_stock_level(
                  "COALESCE(p.name, rm.name, 'Unknown') as item_name, "
                  "COALESCE(p.sku, rm.sku, '') as item_sku "
                  "FROM stock_levels sl "
-                 "LEFT JOIN products p ON sl.product_id::text = p.id::text "
-                 "LEFT JOIN raw_materials rm ON sl.raw_material_id::text = rm.id::text "
+                 "LEFT JOIN products p ON p.id = sl.product_id "
+                 "LEFT JOIN raw_materials rm ON rm.id = sl.raw_material_id "
                  "WHERE sl.id = :slid"),
             {"slid": str(req.stock_level_id)}
         )).fetchone()
@@ -294,69 +264,66 @@ async def adjust_stock_level(
 # Get Raw Material Stock Levels
 @router.get('/raw-material-levels')
 async def get_raw_material_stock_levels(
-    warehouse_id: Optional[str] = None,
+    response: Response,
+    warehouse_id: Optional[UUID] = None,
     low_stock_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=1000,
+                                 description="Page size; omit for every row"),
+    offset: int = Query(0, ge=0),
     session: AsyncSession = Depends(get_session)
 ):
-    """Get current raw material stock levels (raw SQL for production schema compatibility)"""
+    """Current raw material stock levels, one page at a time.
+
+    Materials without a stock row are listed at zero. The number of rows
+    matching the filters is sent as X-Total-Count.
+    """
     try:
-        # Query raw materials with their stock levels (LEFT JOIN so materials without stock_levels show as 0)
-        sql = """
-            SELECT rm.id as raw_material_id,
-                   rm.name as rm_name,
-                   COALESCE(rm.sku, rm.name) as rm_sku,
-                   COALESCE(rm.reorder_level::integer, 10) as reorder_level,
-                   COALESCE(rm.unit, 'kg') as unit,
-                   COALESCE(sl.id, gen_random_uuid()) as stock_level_id,
-                   COALESCE(sl.current_stock, 0) as current_stock,
-                   COALESCE(sl.min_stock, 0) as min_stock,
-                   sl.warehouse_id,
-                   COALESCE(w.name, 'Default') as warehouse_name,
-                   sl.updated_at
-            FROM raw_materials rm
-            LEFT JOIN stock_levels sl ON sl.raw_material_id = rm.id
-            LEFT JOIN warehouses w ON sl.warehouse_id::text = w.id::text
-        """
-        params = {}
-        if warehouse_id:
-            sql += " WHERE sl.warehouse_id::text = :wh_id"
-            params['wh_id'] = str(warehouse_id)
-        
-        sql += " ORDER BY rm.name"
-        
-        result = await session.execute(text(sql), params)
-        rows = result.fetchall()
-        
-        stock_levels = []
-        for row in rows:
-            current_stock = float(row.current_stock or 0)
-            reorder_level = float(row.reorder_level or 10)
-            is_low_stock = current_stock <= reorder_level
-            
-            if low_stock_only and not is_low_stock:
-                continue
-            
-            stock_levels.append({
-                'stock_level_id': str(row.stock_level_id),
-                'warehouse_id': str(row.warehouse_id or ''),
-                'warehouse_name': row.warehouse_name or 'Default',
-                'raw_material_id': str(row.raw_material_id),
-                'raw_material_name': row.rm_name or 'Unknown',
-                'raw_material_sku': row.rm_sku or '',
-                'current_stock': current_stock,
-                'reserved_stock': 0,
-                'available_stock': current_stock,
-                'reorder_level': reorder_level,
-                'is_low_stock': is_low_stock,
-                'unit': row.unit or 'kg',
-                'updated_at': row.updated_at.isoformat() if row.updated_at else None
-            })
-        
-        return stock_levels
+        levels, total = await stock_levels.raw_material_levels(
+            session, warehouse_id=warehouse_id, low_stock_only=low_stock_only,
+            limit=limit, offset=offset)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching raw material stock levels: {str(e)}")
+    response.headers['X-Total-Count'] = str(total)
+    return levels
+
 
 
+@router.get('/low-stock')
+async def get_low_stock_items(
+    response: Response,
+    warehouse_id: Optional[UUID] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000,
+                                 description="Page size; omit for every row"),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_session)
+):
+    """Balances currently at or below their reorder level, newest first.
+
+    Read from the live low-stock list kept by every stock movement, so no
+    balance scan is involved. The number of rows is sent as X-Total-Count.
+    """
+    if not await low_stock.ready(session):
+        raise HTTPException(status_code=503,
+                            detail="Low-stock list not migrated yet")
+    items, total = await low_stock.live_items(
+        session, warehouse_id=warehouse_id, limit=limit, offset=offset)
+    response.headers['X-Total-Count'] = str(total)
+    return items
+
+
+@router.post('/low-stock/rebuild')
+async def rebuild_low_stock_items(
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(require_authenticated_user),
+):
+    """Resynchronise the low-stock list after reorder levels were edited."""
+    if not await low_stock.ready(session):
+        raise HTTPException(status_code=503,
+                            detail="Low-stock list not migrated yet")
+    live = await low_stock.rebuild(session)
+    await session.commit()
+    return {"low_stock_items": live}
+
 # Record Damaged Product
 @router.post('/damaged-product')
 async def record_damaged_product(
@@ -604,22 +571,27 @@ async def get_stock_analysis(session: AsyncSession = Depends(get_session)):
         r = await session.execute(text("SELECT COUNT(*) FROM stock_levels WHERE raw_material_id IS NOT NULL"))
         total_raw_material_items = r.scalar_one()
         
-        # Low stock products (use stock_levels.min_stock as reorder level, default 10)
-        r = await session.execute(text("""
-            SELECT COUNT(*) FROM stock_levels sl
-            WHERE sl.product_id IS NOT NULL
-              AND sl.current_stock <= COALESCE(NULLIF(sl.min_stock, 0), 10)
-        """))
-        low_stock_products = r.scalar_one()
-        
-        # Low stock raw materials
-        r = await session.execute(text("""
-            SELECT COUNT(*) FROM stock_levels sl
-            LEFT JOIN raw_materials rm ON sl.raw_material_id = rm.id
-            WHERE sl.raw_material_id IS NOT NULL
-              AND sl.current_stock <= COALESCE(rm.reorder_point, 10)
-        """))
-        low_stock_raw_materials = r.scalar_one()
+        # Low stock counts come from the live low-stock list; the balance
+        # scans remain for databases without it.
+        if await low_stock.ready(session):
+            low = await low_stock.counts(session)
+            low_stock_products = low["products"]
+            low_stock_raw_materials = low["raw_materials"]
+        else:
+            r = await session.execute(text("""
+                SELECT COUNT(*) FROM stock_levels sl
+                WHERE sl.product_id IS NOT NULL
+                  AND sl.current_stock <= COALESCE(NULLIF(sl.min_stock, 0), 10)
+            """))
+            low_stock_products = r.scalar_one()
+
+            r = await session.execute(text("""
+                SELECT COUNT(*) FROM stock_levels sl
+                LEFT JOIN raw_materials rm ON sl.raw_material_id = rm.id
+                WHERE sl.raw_material_id IS NOT NULL
+                  AND sl.current_stock <= COALESCE(rm.reorder_point, 10)
+            """))
+            low_stock_raw_materials = r.scalar_one()
         
         # Damaged items (last 30 days)
         r = await session.execute(text("""
@@ -649,7 +621,7 @@ async def get_stock_analysis(session: AsyncSession = Depends(get_session)):
             r = await session.execute(text("""
                 SELECT COALESCE(SUM(sl.current_stock * COALESCE(p.cost_price, 0)), 0)
                 FROM stock_levels sl
-                LEFT JOIN products p ON sl.product_id = p.id::text
+                LEFT JOIN products p ON p.id = sl.product_id
                 WHERE sl.product_id IS NOT NULL
             """))
             total_product_value = float(r.scalar_one() or 0)
@@ -13,7 +13,8 @@ from app.db import get_session
 from app.api.auth import require_authenticated_user, require_admin
 from app.models import User
 from app.services.tax import (
-    compute_vat_return, file_vat_return, record_vat_payment, list_vat_returns)
+    compute_vat_return, file_vat_return, record_vat_payment, list_vat_returns,
+    vat_returns_by_month)
 
 router = APIRouter(prefix='/api/tax', tags=['Tax'])
 
@@ -43,6 +44,16 @@ async def compute(
     return await compute_vat_return(session, start=start, end=end)
 
 
+@router.get('/vat/monthly')
+async def monthly(
+    year: int = Query(..., ge=2000, le=2100),
+    session: AsyncSession = Depends(get_session),
+    _user: User = Depends(require_authenticated_user),
+):
+    """The twelve monthly VAT positions of a year, filed months as declared."""
+    return await vat_returns_by_month(session, year=year)
+
+
 @router.get('/vat/returns')
 async def list_returns(
     session: AsyncSession = Depends(get_session),
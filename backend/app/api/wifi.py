@@ -9,13 +9,12 @@ Security:
 * Wi-Fi password / RADIUS secret are stored AES-encrypted and never returned in
   plaintext (a boolean "*_set" flag is returned instead). Super Admins may
   explicitly reveal a single secret through /settings/reveal.
-* The public /authenticate endpoint is rate-limited per client IP.
+* The public /authenticate endpoint is rate-limited per client IP through a
+  store shared by every worker (see app.services.rate_limit).
 """
 from __future__ import annotations
 
-import time
 import uuid
-from collections import defaultdict, deque
 from datetime import datetime, timezone, date
 from typing import Optional, List
 
@@ -37,7 +36,8 @@ from app.models import (
 )
 from app.api.auth import decode_token, create_access_token
 from app.services.encryption import encrypt_secret, decrypt_secret, has_secret
-from app.services.radius_service import RadiusService
+from app.services.radius_service import RadiusService, auth_log_buffer
+from app.services.rate_limit import build_store
 
 router = APIRouter(prefix="/api/wifi", tags=["network-wifi"])
 
@@ -73,24 +73,36 @@ async def require_super_admin(user: User = Depends(get_current_user)) -> User:
 
 
 # ---------------------------------------------------------------------------
-# Simple in-memory per-IP rate limiter (best effort across a single worker)
+# Per-IP rate limiter, shared across workers (Postgres, or memory when
+# RATE_LIMIT_STORE=memory)
 # ---------------------------------------------------------------------------
 _RATE_WINDOW_SECONDS = 60
 _RATE_MAX_HITS = 10
-_rate_buckets: dict[str, deque] = defaultdict(deque)
+_rate_store = build_store()
 
 
-def _rate_limit(ip: str) -> None:
-    now = time.monotonic()
-    bucket = _rate_buckets[ip]
-    while bucket and now - bucket[0] > _RATE_WINDOW_SECONDS:
-        bucket.popleft()
-    if len(bucket) >= _RATE_MAX_HITS:
+async def _rate_limit(ip: str) -> None:
+    allowed = await _rate_store.hit(
+        f"wifi-auth:{ip}",
+        limit=_RATE_MAX_HITS,
+        window_seconds=_RATE_WINDOW_SECONDS,
+    )
+    if not allowed:
         raise HTTPException(
             status_code=429,
             detail="Too many authentication attempts. Please wait and try again.",
         )
-    bucket.append(now)
+
+
+async def _flush_auth_logs() -> None:
+    """Write buffered auth attempts so admin views see every row."""
+    if auth_log_buffer is not None:
+        await auth_log_buffer.flush()
+
+
+@router.on_event("shutdown")
+async def _flush_auth_logs_on_shutdown():
+    await _flush_auth_logs()
 
 
 def _client_ip(request: Request) -> Optional[str]:
@@ -240,7 +252,7 @@ async def authenticate(
 ):
     """Authenticate a captive-portal client against existing employee accounts."""
     ip = _client_ip(request)
-    _rate_limit(ip or "unknown")
+    await _rate_limit(ip or "unknown")
 
     service = RadiusService(db)
     result = await service.authenticate_user(
@@ -407,6 +419,7 @@ async def list_logs(
     db: AsyncSession = Depends(get_session),
     _: User = Depends(require_super_admin),
 ):
+    await _flush_auth_logs()
     query = select(WifiAuthLog).order_by(WifiAuthLog.timestamp.desc())
     if result_filter:
         query = query.where(WifiAuthLog.authentication_result == result_filter)
@@ -433,6 +446,7 @@ async def dashboard(
     db: AsyncSession = Depends(get_session), _: User = Depends(require_super_admin)
 ):
     """Aggregate widgets for the Network & WiFi Management dashboard."""
+    await _flush_auth_logs()
     service = RadiusService(db)
     await service._expire_stale_sessions()
     today = datetime.now(timezone.utc).date()
@@ -1,7 +1,46 @@
+"""Database engines and the session dependencies every router uses.
+
+Two engines, built the same way:
+
+* `engine` -- the primary. Everything that writes goes through it, via
+  `get_session`.
+* `read_engine` -- an optional read replica, configured with
+  DATABASE_READ_URL. Heavy read-only reports opt into it with
+  `get_read_session` so they stop competing with order and payment traffic
+  for the primary's pool. Its connections are opened with
+  `default_transaction_read_only`, so a report that tries to write fails
+  loudly instead of writing to a stand-in database. Without
+  DATABASE_READ_URL, `get_read_session` hands out primary sessions.
+  A streaming replica can lag the primary slightly, which is fine for
+  reports and is why nothing that writes may use it.
+
+Pool and statement-cache settings come from the environment:
+
+  DB_POOL_SIZE / DB_MAX_OVERFLOW      connections kept / burst above that
+  DB_POOL_TIMEOUT                     seconds to wait for a free connection
+  DB_POOL_RECYCLE                     seconds before a connection is renewed
+                                      (-1, the default: never)
+  DB_POOL_PRE_PING                    test connections on checkout
+  DB_STATEMENT_CACHE_SIZE             prepared statements cached per
+                                      connection (0 behind pgbouncer in
+                                      transaction mode)
+  DB_READ_POOL_SIZE / DB_READ_MAX_OVERFLOW   the replica's pool
+
+Every checkout is timed, and `pool_metrics()` reports pool occupancy and
+acquisition times per engine for /api/admin/perf. A pool that is too small
+shows up there as rising wait times and timeouts long before requests start
+failing.
+"""
 import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 load_dotenv()
 # Allow overriding DATABASE_URL in environment
@@ -15,13 +54,148 @@ if not DATABASE_URL:
         "DATABASE_URL is not set. Set it in the environment (or backend/.env) "
         "before starting the application."
     )
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL') or None
+
+# A checkout slower than this counts as having waited for a connection.
+SLOW_CHECKOUT_MS = 5.0
+_WAIT_WINDOW = 1000
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, "true" if default else "false").strip().lower() in (
+        "1", "true", "yes", "on")
+
+
+class PoolWaitStats:
+    """How long checkouts from one pool took, since start-up."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self._recent = deque(maxlen=_WAIT_WINDOW)
+
+    def record(self, ms: float) -> None:
+        self.checkouts += 1
+        self.total_wait_ms += ms
+        self.max_wait_ms = max(self.max_wait_ms, ms)
+        if ms >= SLOW_CHECKOUT_MS:
+            self.slow_checkouts += 1
+        self._recent.append(ms)
 
-engine = create_async_engine(DATABASE_URL, future=True)
+    def snapshot(self) -> dict:
+        recent = sorted(self._recent)
+        p95 = (recent[min(len(recent) - 1, int(round(0.95 * (len(recent) - 1))))]
+               if recent else 0.0)
+        return {
+            "checkouts": self.checkouts,
+            "slow_checkouts": self.slow_checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 2)
+            if self.checkouts else 0.0,
+            "p95_wait_ms": round(p95, 2),
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default async pool, with each checkout timed.
+
+    The time covers waiting for a free connection and, when the pool grows
+    into its overflow, opening a new one.
+    """
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+        self.wait_stats.record((time.perf_counter() - started) * 1000)
+        return conn
+
+
+def build_engine(url: str, *, read_only: bool = False, pool_prefix: str = "DB_"):
+    """An async engine with the configured pool and statement cache.
+
+    `pool_prefix` selects the pool-size variables (DB_ or DB_READ_); the
+    replica falls back to the primary's sizes when its own are unset.
+    """
+    sa_url = make_url(url)
+    kwargs = {
+        "future": True,
+        "poolclass": TimedQueuePool,
+        "pool_size": _env_int(f"{pool_prefix}POOL_SIZE",
+                              _env_int("DB_POOL_SIZE", 5)),
+        "max_overflow": _env_int(f"{pool_prefix}MAX_OVERFLOW",
+                                 _env_int("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", -1),
+        "pool_pre_ping": _env_flag("DB_POOL_PRE_PING", False),
+    }
+    if sa_url.get_backend_name() == "postgresql" and \
+            sa_url.get_driver_name() == "asyncpg":
+        cache_size = _env_int("DB_STATEMENT_CACHE_SIZE", 500)
+        # SQLAlchemy keeps its own prepared-statement LRU per connection;
+        # asyncpg's cache serves the statements SQLAlchemy does not prepare.
+        sa_url = sa_url.update_query_dict(
+            {"prepared_statement_cache_size": str(cache_size)})
+        connect_args = {"statement_cache_size": cache_size}
+        if read_only:
+            connect_args["server_settings"] = {
+                "default_transaction_read_only": "on"}
+        kwargs["connect_args"] = connect_args
+    return create_async_engine(sa_url, **kwargs)
+
+
+engine = build_engine(DATABASE_URL)
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+read_engine = (build_engine(DATABASE_READ_URL, read_only=True,
+                            pool_prefix="DB_READ_")
+               if DATABASE_READ_URL else engine)
+ReadSessionLocal = (sessionmaker(read_engine, class_=AsyncSession,
+                                 expire_on_commit=False)
+                    if read_engine is not engine else AsyncSessionLocal)
+
 
 async def get_session():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_session():
+    """A session for read-only reports: the replica when one is configured."""
+    async with ReadSessionLocal() as session:
+        yield session
+
+
+def pool_metrics() -> list[dict]:
+    """Occupancy and checkout times of each engine's pool, for this worker."""
+    engines = [("primary", engine)]
+    if read_engine is not engine:
+        engines.append(("replica", read_engine))
+    out = []
+    for name, eng in engines:
+        pool = eng.sync_engine.pool
+        row = {"engine": name, "size": pool.size(),
+               "checked_out": pool.checkedout(), "overflow": pool.overflow(),
+               "checked_in": pool.checkedin()}
+        stats = getattr(pool, "wait_stats", None)
+        if stats is not None:
+            row.update(stats.snapshot())
+        out.append(row)
+    return out
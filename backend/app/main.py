@@ -21,6 +21,25 @@ app = FastAPI(
 _origins_env = os.getenv("ALLOWED_ORIGINS", "").strip()
 _allowed_origins = [o.strip() for o in _origins_env.split(",") if o.strip()] or ["*"]
 
+# Idempotency-Key replay for order, payment and intake writes (see
+# app.services.idempotency). Innermost, so it stores and replays the
+# uncompressed body and compression still follows each client's headers.
+from app.services.idempotency import IdempotencyMiddleware
+app.add_middleware(IdempotencyMiddleware)
+
+# gzip/brotli for textual responses (see app.services.compression). Added
+# early, so it sits just outside idempotency and sees the endpoint's headers.
+from app.services.compression import CompressionMiddleware
+app.add_middleware(CompressionMiddleware)
+
+# Per-request statement count and database time (see app.services.perf).
+# Added before CORS so CORS stays the outermost layer.
+from app.db import engine as _db_engine, read_engine as _db_read_engine
+from app.services.perf import QueryProfilerMiddleware, install as _install_perf
+_install_perf(_db_engine)
+_install_perf(_db_read_engine)
+app.add_middleware(QueryProfilerMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=_allowed_origins,
@@ -55,31 +74,24 @@ def _safe_build_path(root: Path, user_path: str):
 
 if frontend_build_path.exists():
     # Mount static files FIRST with HTMLResponse to prevent auth blocking
-    from fastapi.responses import HTMLResponse, Response
-    
+    from fastapi import Request
+    from fastapi.responses import HTMLResponse, JSONResponse, Response
+    from app.services.static_assets import AssetIndex
+
+    # Indexed once per worker; see app.services.static_assets.
+    static_assets = AssetIndex.build(frontend_build_path)
+
     @app.get("/static/{full_path:path}")
-    async def serve_static(full_path: str):
+    async def serve_static(full_path: str, request: Request):
         """Serve static files without authentication"""
+        response = static_assets.response(request, f"static/{full_path}")
+        if response is not None:
+            return response
         static_file = _safe_build_path(frontend_build_path / "static", full_path)
         if static_file is not None and static_file.is_file():
-            # Determine content type
-            content_type = "application/octet-stream"
-            if full_path.endswith('.js'):
-                content_type = "application/javascript"
-            elif full_path.endswith('.css'):
-                content_type = "text/css"
-            elif full_path.endswith('.map'):
-                content_type = "application/json"
-            elif full_path.endswith('.png'):
-                content_type = "image/png"
-            elif full_path.endswith('.jpg') or full_path.endswith('.jpeg'):
-                content_type = "image/jpeg"
-            elif full_path.endswith('.svg'):
-                content_type = "image/svg+xml"
-            
-            with open(static_file, 'rb') as f:
-                return Response(content=f.read(), media_type=content_type)
-        return {"error": "File not found"}
+            # Added since startup: serve it from disk, uncached.
+            return FileResponse(str(static_file))
+        return JSONResponse({"error": "File not found"}, status_code=404)
     
     print("✅ Static files route configured at /static")
 else:
@@ -92,7 +104,7 @@ async def health():
 
 # Import and include API routers (no COM/Oracle dependencies)
 try:
-    from app.api import staff, attendance, products, raw_materials, stock, warehouses, production, sales, stock_management, bom, settings, auth, permissions, financial, bulk_upload, notifications, production_consumables, machines_equipment, production_completions, marketing, hr_customercare, payment_tracking, procurement, logistics, warehouse_transfers, returns, damaged_transfers, receive_transfers, legacy_debts, communication, sop, public_orders, production_tasks, profits, announcements, radio, geo, regulatory, wifi, accounting, payroll, assets, budgeting, tax, maintenance, dashboard, costs, settlements
+    from app.api import staff, attendance, products, raw_materials, stock, warehouses, production, sales, stock_management, bom, settings, auth, permissions, financial, bulk_upload, notifications, production_consumables, machines_equipment, production_completions, marketing, hr_customercare, payment_tracking, procurement, logistics, warehouse_transfers, returns, damaged_transfers, receive_transfers, legacy_debts, communication, sop, public_orders, production_tasks, profits, announcements, radio, geo, regulatory, wifi, accounting, payroll, assets, budgeting, tax, maintenance, dashboard, costs, settlements, perf, search, exports
     
     from fastapi import Depends
     from app.api.auth import require_authenticated_user, require_admin
@@ -119,6 +131,7 @@ try:
     # --- Admin only -------------------------------------------------------
     app.include_router(permissions.router, dependencies=admin_only)
     app.include_router(financial.router, dependencies=admin_only)
+    app.include_router(perf.router, dependencies=admin_only)
 
     # --- Authenticated ----------------------------------------------------
     for _router in (
@@ -129,7 +142,8 @@ try:
         warehouse_transfers, returns, damaged_transfers, receive_transfers,
         legacy_debts, communication, sop, production_tasks, announcements,
         radio, geo, regulatory, accounting, payroll, assets,
-        budgeting, tax, maintenance, dashboard, costs, settlements,
+        budgeting, tax, maintenance, dashboard, costs, settlements, search,
+        exports,
     ):
         app.include_router(_router.router, dependencies=authed)
     app.include_router(assets.cash_router, dependencies=authed)
@@ -180,30 +194,25 @@ except Exception as e:
     raise RuntimeError(f"API router registration failed, refusing to start: {e}") from e
 
 
-# Bootstrap geo columns (idempotent)
-@app.on_event("startup")
-async def _bootstrap_geo_schema():
-    try:
-        from app.db import AsyncSessionLocal
-        from app.api.geo import bootstrap_geo_schema
-        async with AsyncSessionLocal() as s:
-            await bootstrap_geo_schema(s)
-        print("✅ Geo schema bootstrap complete")
-    except Exception as e:
-        print(f"⚠️ Geo schema bootstrap failed: {e}")
-
-
-# Bootstrap regulatory compliance tables (idempotent)
+# One-time schema bootstrap: applies any module DDL (geo, regulatory,
+# procurement, logistics, profits, ...) not yet recorded in schema_bootstrap.
+# Once everything is recorded this is a single ledger read per worker.
 @app.on_event("startup")
-async def _bootstrap_regulatory_schema():
+async def _run_schema_bootstrap():
     try:
+        import time
         from app.db import AsyncSessionLocal
-        from app.api.regulatory import bootstrap_regulatory_schema
+        from app.services import bootstrap
+        started = time.perf_counter()
         async with AsyncSessionLocal() as s:
-            await bootstrap_regulatory_schema(s)
-        print("✅ Regulatory Compliance schema bootstrap complete")
+            applied = await bootstrap.run(s)
+        elapsed = (time.perf_counter() - started) * 1000
+        if applied:
+            print(f"✅ Schema bootstrap applied {', '.join(applied)} in {elapsed:.0f} ms")
+        else:
+            print(f"✅ Schema bootstrap up to date ({elapsed:.0f} ms)")
     except Exception as e:
-        print(f"⚠️ Regulatory Compliance schema bootstrap failed: {e}")
+        print(f"⚠️ Schema bootstrap failed: {e}")
 
 
 # Background scheduler: auto clock-out at 17:10 Africa/Lagos
@@ -225,6 +234,126 @@ async def _stop_auto_clockout_scheduler():
         task.cancel()
 
 
+# Background scheduler: fires due announcements once across all workers and
+# pushes them to connected clients (see app.services.announcement_scheduler).
+@app.on_event("startup")
+async def _start_announcement_scheduler():
+    try:
+        import asyncio
+        from app.services.announcement_scheduler import run_scheduler
+        app.state._announcement_task = asyncio.create_task(run_scheduler())
+        print("✅ Announcement scheduler started")
+    except Exception as e:
+        print(f"❌ Failed to start announcement scheduler: {e}")
+
+
+@app.on_event("shutdown")
+async def _stop_announcement_scheduler():
+    task = getattr(app.state, "_announcement_task", None)
+    if task:
+        task.cancel()
+
+
+# Background dispatcher: delivers transactional outbox events (pushes,
+# geocoding, MAPD retries, activity entries); see app.services.outbox.
+@app.on_event("startup")
+async def _start_outbox_dispatcher():
+    try:
+        import asyncio
+        from app.services.outbox import run_dispatcher
+        app.state._outbox_task = asyncio.create_task(run_dispatcher())
+        print("✅ Outbox dispatcher started")
+    except Exception as e:
+        print(f"❌ Failed to start outbox dispatcher: {e}")
+
+
+@app.on_event("shutdown")
+async def _stop_outbox_dispatcher():
+    task = getattr(app.state, "_outbox_task", None)
+    if task:
+        task.cancel()
+
+
+# Background maintainer: keeps next months' partitions of the append-only
+# tables created ahead of time; see app.services.partitions.
+@app.on_event("startup")
+async def _start_partition_maintainer():
+    try:
+        import asyncio
+        from app.services.partitions import run_maintainer
+        app.state._partition_task = asyncio.create_task(run_maintainer())
+        print("✅ Partition maintainer started")
+    except Exception as e:
+        print(f"❌ Failed to start partition maintainer: {e}")
+
+
+@app.on_event("shutdown")
+async def _stop_partition_maintainer():
+    task = getattr(app.state, "_partition_task", None)
+    if task:
+        task.cancel()
+
+
+# Background checkpointer: writes the monthly stock checkpoints behind
+# /api/stock/as-of; see app.services.stock_history.
+@app.on_event("startup")
+async def _start_stock_checkpointer():
+    try:
+        import asyncio
+        from app.services.stock_history import run_checkpointer
+        app.state._stock_checkpoint_task = asyncio.create_task(run_checkpointer())
+        print("✅ Stock checkpointer started")
+    except Exception as e:
+        print(f"❌ Failed to start stock checkpointer: {e}")
+
+
+@app.on_event("shutdown")
+async def _stop_stock_checkpointer():
+    task = getattr(app.state, "_stock_checkpoint_task", None)
+    if task:
+        task.cancel()
+
+
+# Background sweeper: fails export jobs whose worker stopped and deletes
+# expired export files; see app.services.exports.
+@app.on_event("startup")
+async def _start_export_sweeper():
+    try:
+        import asyncio
+        from app.services.exports import run_sweeper
+        app.state._export_sweeper_task = asyncio.create_task(run_sweeper())
+        print("✅ Export sweeper started")
+    except Exception as e:
+        print(f"❌ Failed to start export sweeper: {e}")
+
+
+@app.on_event("shutdown")
+async def _stop_export_sweeper():
+    task = getattr(app.state, "_export_sweeper_task", None)
+    if task:
+        task.cancel()
+
+
+# Authorization listener: clears this worker's cached grants when another
+# worker commits a change to them; see app.services.authz.
+@app.on_event("startup")
+async def _start_authz_listener():
+    try:
+        import asyncio
+        from app.services.authz import run_listener
+        app.state._authz_listener_task = asyncio.create_task(run_listener())
+        print("✅ Authz listener started")
+    except Exception as e:
+        print(f"❌ Failed to start authz listener: {e}")
+
+
+@app.on_event("shutdown")
+async def _stop_authz_listener():
+    task = getattr(app.state, "_authz_listener_task", None)
+    if task:
+        task.cancel()
+
+
 # Frontend HTML routes (after API routers but before catch-all)
 if frontend_build_path.exists():
     @app.get("/")
@@ -243,7 +372,10 @@ if frontend_build_path.exists():
         return {"error": "Frontend not found"}
     
     @app.get("/manifest.json")
-    async def manifest():
+    async def manifest(request: Request):
+        response = static_assets.response(request, "manifest.json")
+        if response is not None:
+            return response
         manifest_path = frontend_build_path / "manifest.json"
         if manifest_path.exists():
             return FileResponse(str(manifest_path), media_type="application/json")
@@ -265,32 +397,43 @@ if frontend_build_path.exists():
         return PlainTextResponse("// Service Worker not found", media_type="application/javascript", status_code=404)
     
     @app.get("/{filename}.png")
-    async def serve_images(filename: str):
+    async def serve_images(filename: str, request: Request):
         """Serve PNG images (logos, icons) from build folder"""
         # Deny API paths
         if filename.startswith("api") or "/" in filename:
             return {"error": "Not found"}
         
+        response = static_assets.response(request, f"{filename}.png")
+        if response is not None:
+            return response
         image_path = _safe_build_path(frontend_build_path, f"{filename}.png")
         if image_path is not None:
             return FileResponse(str(image_path), media_type="image/png")
         return {"error": "Image not found"}
     
     @app.get("/{filename}.ico")
-    async def serve_favicon(filename: str):
+    async def serve_favicon(filename: str, request: Request):
         """Serve favicon"""
+        response = static_assets.response(request, f"{filename}.ico")
+        if response is not None:
+            return response
         favicon_path = _safe_build_path(frontend_build_path, f"{filename}.ico")
         if favicon_path is not None:
             return FileResponse(str(favicon_path), media_type="image/x-icon")
         return {"error": "Favicon not found"}
     
     @app.get("/{full_path:path}")
-    async def serve_react_app(full_path: str):
+    async def serve_react_app(full_path: str, request: Request):
         # Don't handle API routes here - let them pass to API routers
         if full_path.startswith("api/") or full_path.startswith("docs") or full_path.startswith("openapi"):
             raise HTTPException(status_code=404, detail="Not Found")
         
-        # Serve static assets from build directory
+        # Serve static assets from build directory. index.html and the
+        # service worker must never be cached, so they bypass the index.
+        if full_path not in ("index.html", "serviceWorker.js"):
+            response = static_assets.response(request, full_path)
+            if response is not None:
+                return response
         static_path = _safe_build_path(frontend_build_path, full_path)
         if static_path is not None and static_path.is_file():
             return FileResponse(str(static_path))
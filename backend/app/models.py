@@ -29,10 +29,12 @@ class User(Base):
     last_login = sa.Column(sa.TIMESTAMP(timezone=True))
     two_factor_enabled = sa.Column(sa.Boolean, default=False)
     two_factor_secret = sa.Column(sa.String(255))
-    phone = sa.Column(sa.String(20))
+    phone = sa.Column(sa.String(20), index=True)
     department = sa.Column(sa.String(100))
     created_at = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = sa.Column(sa.TIMESTAMP(timezone=True), onupdate=func.now())
+    # Login identifiers are matched case-insensitively (see RadiusService._find_user)
+    __table_args__ = (sa.Index('ix_users_email_lower', func.lower(email)),)
     
     # Warehouse access relationship
     accessible_warehouses = relationship("Warehouse", secondary=user_warehouses, back_populates="authorized_users")
@@ -801,6 +803,14 @@ class WifiAuthLog(Base):
     timestamp = sa.Column(sa.TIMESTAMP(timezone=True), server_default=func.now(), index=True)
 
 
+class RateLimitBucket(Base):
+    """Fixed-window hit counter shared by every worker (app.services.rate_limit)."""
+    __tablename__ = 'rate_limit_buckets'
+    bucket_key = sa.Column(sa.String(255), primary_key=True)
+    window_start = sa.Column(sa.TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    hits = sa.Column(sa.Integer, nullable=False, server_default='0')
+
+
 
 # ============ ACCOUNTING: GENERAL LEDGER ============
 # Double-entry bookkeeping. Every financial event in the ERP produces a
@@ -866,6 +876,8 @@ class JournalLine(Base):
     description = sa.Column(sa.Text)
     cost_centre = sa.Column(sa.String(50), index=True)
     line_number = sa.Column(sa.Integer, nullable=False, default=0)
+    # The entry's date, copied onto the line as its partition key.
+    entry_date = sa.Column(sa.Date)
 
     entry = relationship("JournalEntry", back_populates="lines")
 
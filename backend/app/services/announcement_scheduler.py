@@ -0,0 +1,327 @@
+"""Server-side scheduling and delivery of announcements.
+
+Clients used to find due announcements themselves. `/api/announcements/due`
+and the radio feed each loaded every active announcement on every poll and
+tested it in Python against a window of a minute or two. A slow poll could
+miss an announcement. Overlapping windows played it twice, as did two
+workers or two tabs.
+
+Now each announcement carries `next_fire_at`, the UTC instant it is next
+due, computed by `next_fire_at` when it is created or rescheduled. The
+column is indexed for active rows. Every worker runs `run_scheduler`, which
+every ANNOUNCEMENT_TICK_SECONDS (default 5):
+
+1. claims due rows with FOR UPDATE SKIP LOCKED, so workers never contend
+   for the same announcement;
+2. records each firing in `announcement_fires`. The table is unique on
+   (announcement, fire time), so a firing cannot be recorded twice;
+3. moves `next_fire_at` on to the next occurrence, or clears it for a
+   one-shot announcement;
+4. after commit, sends one Web Push per firing;
+5. forwards firings recorded by any worker to the SSE clients connected to
+   this one (`subscribe`). When no client is connected this step is skipped.
+
+An occurrence more than ANNOUNCEMENT_GRACE_SECONDS late (default 15 min),
+for instance after downtime, is skipped rather than played out of context.
+
+Times are Africa/Lagos wall-clock. Repeat rules keep the meaning they have
+always had:
+  none     once, on `scheduled_date`; without a date, every day
+  daily    every day
+  weekly   on the weekdays in `repeat_days` (0=Mon..6=Sun; empty = every day)
+  monthly  on `scheduled_date`'s day of the month (months without it are
+           skipped)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_LOG = logging.getLogger("services.announcement_scheduler")
+
+LAGOS_TZ = timezone(timedelta(hours=1))  # Africa/Lagos, no DST
+TICK_SECONDS = float(os.getenv("ANNOUNCEMENT_TICK_SECONDS", "5"))
+GRACE_SECONDS = int(os.getenv("ANNOUNCEMENT_GRACE_SECONDS", "900"))
+CLAIM_BATCH = 50
+# Firings are read again for this long after they are stamped, so one that
+# another worker commits late, out of id order, still reaches SSE clients.
+FORWARD_OVERLAP = timedelta(seconds=60)
+# Far enough to reach the next 31st from any day.
+_HORIZON_DAYS = 400
+
+_subscribers: set[asyncio.Queue] = set()
+_forwarded_since: Optional[datetime] = None
+# Firing id -> fired_at, for those inside the overlap already forwarded.
+_forwarded: dict[int, datetime] = {}
+
+
+def _weekdays(repeat_days: Optional[str]) -> Optional[set[int]]:
+    """The weekday set, None for "every day", or an empty set if unreadable."""
+    days = (repeat_days or "").strip()
+    if not days:
+        return None
+    try:
+        return {int(d) for d in days.split(",") if d.strip() != ""}
+    except ValueError:
+        return set()
+
+
+def _one_shot(repeat_type: Optional[str], scheduled_date: Optional[date]) -> bool:
+    # Without a date, 'none' has always meant every day at `scheduled_time`.
+    return (repeat_type or "none").lower() == "none" and scheduled_date is not None
+
+
+def next_fire_at(
+    scheduled_date: Optional[date],
+    scheduled_time: Optional[time],
+    repeat_type: Optional[str],
+    repeat_days: Optional[str],
+    after: datetime,
+) -> Optional[datetime]:
+    """The first occurrence strictly after `after`, in UTC; None if none is left."""
+    if scheduled_time is None:
+        return None
+    repeat = (repeat_type or "none").lower()
+    wall = scheduled_time.replace(tzinfo=None)
+
+    def at(day: date) -> datetime:
+        return datetime.combine(day, wall, tzinfo=LAGOS_TZ)
+
+    if _one_shot(repeat, scheduled_date):
+        fire = at(scheduled_date)
+        return fire.astimezone(timezone.utc) if fire > after else None
+
+    weekdays = _weekdays(repeat_days) if repeat == "weekly" else None
+    if weekdays is not None and not weekdays:
+        return None
+    month_day = (scheduled_date.day
+                 if repeat == "monthly" and scheduled_date is not None else None)
+
+    day = after.astimezone(LAGOS_TZ).date()
+    for _ in range(_HORIZON_DAYS):
+        if ((weekdays is None or day.weekday() in weekdays)
+                and (month_day is None or day.day == month_day)
+                and at(day) > after):
+            return at(day).astimezone(timezone.utc)
+        day += timedelta(days=1)
+    return None
+
+
+def _next_for(row, after: datetime) -> Optional[datetime]:
+    return next_fire_at(row.scheduled_date, row.scheduled_time,
+                        row.repeat_type, row.repeat_days, after)
+
+
+async def reschedule(session: AsyncSession, ann_id: str,
+                     now: Optional[datetime] = None) -> Optional[datetime]:
+    """Recompute one announcement's next firing from now. Does not commit."""
+    now = now or datetime.now(timezone.utc)
+    row = (await session.execute(text("""
+        SELECT scheduled_date, scheduled_time, repeat_type, repeat_days,
+               is_active
+          FROM announcements WHERE id = :id
+    """), {"id": ann_id})).first()
+    if row is None:
+        return None
+    nxt = _next_for(row, now) if row.is_active else None
+    await session.execute(
+        text("UPDATE announcements SET next_fire_at = :nxt WHERE id = :id"),
+        {"nxt": nxt, "id": ann_id})
+    return nxt
+
+
+async def schedule_unscheduled(session: AsyncSession) -> None:
+    """Give active announcements without a next firing one (schema backfill)."""
+    rows = (await session.execute(text("""
+        SELECT id FROM announcements
+         WHERE is_active AND next_fire_at IS NULL AND last_played_at IS NULL
+    """))).fetchall()
+    now = datetime.now(timezone.utc)
+    for r in rows:
+        await reschedule(session, str(r.id), now)
+
+
+async def fire_due(session: AsyncSession,
+                   now: Optional[datetime] = None) -> list[dict]:
+    """Record every due firing and advance the schedule; returns the new firings.
+
+    Safe to run from any number of workers at once. Does not commit.
+    """
+    now = now or datetime.now(timezone.utc)
+    rows = (await session.execute(text("""
+        SELECT id, title, message, audio_filename, scheduled_date,
+               scheduled_time, repeat_type, repeat_days, next_fire_at
+          FROM announcements
+         WHERE is_active AND next_fire_at <= :now
+         ORDER BY next_fire_at
+         LIMIT :batch
+           FOR UPDATE SKIP LOCKED
+    """), {"now": now, "batch": CLAIM_BATCH})).fetchall()
+
+    fired = []
+    grace = timedelta(seconds=GRACE_SECONDS)
+    for r in rows:
+        recorded = None
+        if now - r.next_fire_at <= grace:
+            recorded = (await session.execute(text("""
+                INSERT INTO announcement_fires
+                    (announcement_id, fire_at, title, message, audio_filename)
+                VALUES (:id, :fire_at, :title, :message, :audio)
+                ON CONFLICT (announcement_id, fire_at) DO NOTHING
+                RETURNING id, fired_at
+            """), {"id": r.id, "fire_at": r.next_fire_at, "title": r.title,
+                   "message": r.message, "audio": r.audio_filename})).first()
+        else:
+            _LOG.warning("skipped announcement %s due at %s: %ds late",
+                         r.id, r.next_fire_at.isoformat(),
+                         (now - r.next_fire_at).total_seconds())
+        if _one_shot(r.repeat_type, r.scheduled_date):
+            nxt = None
+        else:
+            nxt = _next_for(r, max(r.next_fire_at, now - grace))
+        await session.execute(text("""
+            UPDATE announcements
+               SET next_fire_at = :nxt,
+                   last_played_at = CASE WHEN :fired THEN NOW()
+                                         ELSE last_played_at END
+             WHERE id = :id
+        """), {"nxt": nxt, "fired": recorded is not None, "id": r.id})
+        if recorded is not None:
+            fired.append(_event(recorded.id, r.id, r.title, r.message,
+                                r.audio_filename, r.next_fire_at,
+                                recorded.fired_at))
+    return fired
+
+
+def _event(fire_id, ann_id, title, message, audio_filename, fire_at,
+           fired_at) -> dict:
+    return {
+        "fire_id": int(fire_id),
+        "id": str(ann_id),
+        "title": title,
+        "message": message,
+        "audio_filename": audio_filename,
+        "audio_url": (f"/api/announcements/audio/{audio_filename}"
+                      if audio_filename else None),
+        "fire_at": fire_at.isoformat(),
+        "fired_at": fired_at.isoformat(),
+    }
+
+
+async def recent_fires(
+    session: AsyncSession,
+    *,
+    after_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    limit: int = 50,
+) -> list[dict]:
+    """Recorded firings, oldest first, after a firing id and/or a time."""
+    where, params = ["TRUE"], {"limit": limit}
+    if after_id is not None:
+        where.append("id > :after_id")
+        params["after_id"] = after_id
+    if since is not None:
+        where.append("fired_at > :since")
+        params["since"] = since
+    rows = (await session.execute(text(f"""
+        SELECT id, announcement_id, title, message, audio_filename, fire_at,
+               fired_at
+          FROM announcement_fires
+         WHERE {' AND '.join(where)}
+         ORDER BY id
+         LIMIT :limit
+    """), params)).fetchall()
+    return [_event(r.id, r.announcement_id, r.title, r.message,
+                   r.audio_filename, r.fire_at, r.fired_at) for r in rows]
+
+
+def subscribe() -> asyncio.Queue:
+    """A queue receiving every firing from now on, for one SSE client."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+    _subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue) -> None:
+    _subscribers.discard(queue)
+
+
+def sse_message(event: dict) -> str:
+    return (f"id: {event['fire_id']}\nevent: announcement\n"
+            f"data: {json.dumps(event)}\n\n")
+
+
+def _publish(event: dict) -> None:
+    for queue in list(_subscribers):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that stopped reading; it reconnects with Last-Event-ID.
+            _subscribers.discard(queue)
+
+
+async def _forward(session: AsyncSession) -> None:
+    global _forwarded_since
+    if not _subscribers:
+        _forwarded_since = None
+        _forwarded.clear()
+        return
+    now = (await session.execute(text("SELECT NOW()"))).scalar()
+    if _forwarded_since is not None:
+        # Ids are handed out before commit, so a high-water mark on them
+        # would skip a firing committed late; re-read a window instead.
+        for event in await recent_fires(
+                session, since=_forwarded_since - FORWARD_OVERLAP, limit=500):
+            if event["fire_id"] not in _forwarded:
+                _publish(event)
+                _forwarded[event["fire_id"]] = datetime.fromisoformat(
+                    event["fired_at"])
+    _forwarded_since = now
+    for fire_id, fired_at in list(_forwarded.items()):
+        if fired_at <= now - 2 * FORWARD_OVERLAP:
+            del _forwarded[fire_id]
+
+
+def _push(events: list[dict]) -> None:
+    from app.api.notifications import fire_notification, notify_announcement
+    for event in events:
+        fire_notification(notify_announcement(
+            event["title"], event["message"], event["audio_url"]))
+
+
+async def tick(session: AsyncSession) -> list[dict]:
+    """One scheduler pass: fire, commit, push, forward to SSE clients."""
+    fired = await fire_due(session)
+    await session.commit()
+    if fired:
+        _LOG.info("fired %d announcement(s)", len(fired))
+        _push(fired)
+    await _forward(session)
+    return fired
+
+
+async def run_scheduler() -> None:
+    """Background loop started by app.main on every worker."""
+    from app.db import AsyncSessionLocal
+    from app.services import bootstrap
+
+    _LOG.info("Announcement scheduler started (tick %.0fs)", TICK_SECONDS)
+    while True:
+        try:
+            await asyncio.sleep(TICK_SECONDS)
+            async with AsyncSessionLocal() as session:
+                await bootstrap.ensure(session, "announcements")
+                await tick(session)
+        except asyncio.CancelledError:
+            _LOG.info("Announcement scheduler cancelled")
+            raise
+        except Exception:
+            _LOG.exception("Announcement scheduler iteration failed")
+            await asyncio.sleep(30)
@@ -0,0 +1,213 @@
+"""Each user's effective authorization, cached as one lookup structure.
+
+An authorization check used to cost queries. `/api/auth/check-permission`
+loaded the user and then the matching `role_permissions` row. Order entry
+queried `user_warehouses` again on every order. Login built the module
+map from `user_module_access` once more. All of those answers change only
+when an administrator edits them. This module keeps them in memory:
+
+* `Grants` is one user's role, actions per module, module access map and
+  warehouse set. `can`, `has_module` and `in_warehouse` are dictionary
+  and set lookups.
+* The `role_permissions` table is small and shared by every user of a
+  role. It is loaded whole, in one query.
+* A user's module access and warehouse set are loaded in one statement.
+
+Invalidation is explicit. The admin endpoints that change role
+permissions, a user's role, module access or warehouses call
+`invalidate_roles` or `invalidate_user` once their transaction commits. A
+generation counter keeps a load that raced with one of those
+invalidations from storing what it read.
+
+The cache is per worker process. Other workers hear about an edit through
+Postgres: triggers on the grant tables (migration h3456789012g) NOTIFY
+the `authz_grants` channel on commit, and `run_listener`, started by
+app.main, clears this worker's cache when the notification arrives, and
+again after reconnecting, in case one was missed. Entries still expire
+after AUTHZ_CACHE_TTL_SECONDS (default 60); that only matters while the
+listener is down.
+Account lock and deactivation are not cached:
+`require_authenticated_user` still reads the user row on every request.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Mapping, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_LOG = logging.getLogger("services.authz")
+
+CHANNEL = "authz_grants"
+LISTEN_CHECK_SECONDS = 30
+
+TTL_SECONDS = float(os.getenv("AUTHZ_CACHE_TTL_SECONDS", "60"))
+MAX_ENTRIES = int(os.getenv("AUTHZ_CACHE_MAX_ENTRIES", "4096"))
+
+ACTIONS = ("view", "create", "edit", "delete", "approve")
+
+ALL_MODULES = [
+    'dashboard', 'staff', 'attendance', 'products', 'rawMaterials',
+    'stockManagement', 'production', 'productionCompletions', 'consumables',
+    'machinesEquipment', 'transfers', 'sales', 'paymentTracking', 'procurement',
+    'logistics', 'marketing', 'hrCustomerCare', 'reports', 'financial',
+    'userManagement', 'settings'
+]
+
+
+@dataclass(frozen=True)
+class Grants:
+    """What one user may do. Shared between requests; treat as read-only."""
+    user_id: UUID
+    role: str
+    actions: Mapping[str, frozenset] = field(default_factory=dict)
+    modules: Mapping[str, bool] = field(default_factory=dict)
+    warehouses: frozenset = frozenset()
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+    def can(self, module: str, action: str) -> bool:
+        """Role permission check; admins may do everything."""
+        return self.is_admin or action in self.actions.get(module, ())
+
+    def has_module(self, module: str) -> bool:
+        return self.modules.get(module, False)
+
+    def in_warehouse(self, warehouse_id: UUID) -> bool:
+        """Admins reach every warehouse; others only those granted."""
+        return self.is_admin or warehouse_id in self.warehouses
+
+
+_users: "OrderedDict[UUID, tuple[float, Grants]]" = OrderedDict()
+_roles: Optional[tuple[float, dict[str, dict[str, frozenset]]]] = None
+_generation = 0
+
+
+def module_access(role: str, explicit: Mapping[str, bool]) -> dict[str, bool]:
+    """Every module's visibility: explicit grants first, then the role default.
+
+    Without a row, admins see every module and everyone else the dashboard.
+    """
+    is_admin = role == "admin"
+    return {m: explicit.get(m, is_admin or m == 'dashboard') for m in ALL_MODULES}
+
+
+async def _role_actions(session: AsyncSession) -> dict[str, dict[str, frozenset]]:
+    global _roles
+    entry = _roles
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    generation = _generation
+    rows = (await session.execute(text("""
+        SELECT role, module, can_view, can_create, can_edit, can_delete,
+               can_approve
+          FROM role_permissions
+    """))).fetchall()
+    roles: dict[str, dict[str, frozenset]] = {}
+    for r in rows:
+        flags = (r.can_view, r.can_create, r.can_edit, r.can_delete, r.can_approve)
+        roles.setdefault(r.role, {})[r.module] = frozenset(
+            a for a, on in zip(ACTIONS, flags) if on)
+    if generation == _generation:
+        _roles = (time.monotonic() + TTL_SECONDS, roles)
+    return roles
+
+
+async def grants_for(session: AsyncSession, user_id: UUID) -> Optional[Grants]:
+    """`user_id`'s grants, from cache while fresh; None if the user is gone."""
+    entry = _users.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        _users.move_to_end(user_id)
+        return entry[1]
+
+    generation = _generation
+    row = (await session.execute(text("""
+        SELECT u.role,
+               ARRAY(SELECT module_key FROM user_module_access
+                      WHERE user_id = u.id ORDER BY module_key) AS module_keys,
+               ARRAY(SELECT COALESCE(is_granted, FALSE) FROM user_module_access
+                      WHERE user_id = u.id ORDER BY module_key) AS granted,
+               ARRAY(SELECT warehouse_id FROM user_warehouses
+                      WHERE user_id = u.id) AS warehouses
+          FROM users u
+         WHERE u.id = :uid
+    """), {"uid": user_id})).first()
+    if row is None:
+        return None
+    role = row.role or ""
+    roles = await _role_actions(session)
+    grants = Grants(
+        user_id=user_id,
+        role=role,
+        actions=roles.get(role, {}),
+        modules=module_access(role, dict(zip(row.module_keys, row.granted))),
+        warehouses=frozenset(UUID(str(w)) for w in row.warehouses),
+    )
+    if generation == _generation:
+        _users[user_id] = (time.monotonic() + TTL_SECONDS, grants)
+        _users.move_to_end(user_id)
+        while len(_users) > MAX_ENTRIES:
+            _users.popitem(last=False)
+    return grants
+
+
+def invalidate_user(user_id: UUID) -> None:
+    """Forget one user's grants. Call after the change commits."""
+    global _generation
+    _generation += 1
+    _users.pop(user_id, None)
+
+
+def invalidate_roles() -> None:
+    """Forget role permissions, and every user's grants built from them."""
+    clear()
+
+
+def clear() -> None:
+    global _roles, _generation
+    _generation += 1
+    _roles = None
+    _users.clear()
+
+
+def _on_notify(connection, pid, channel, payload) -> None:
+    clear()
+
+
+async def run_listener() -> None:
+    """Background loop started by app.main on every worker."""
+    import asyncpg
+    from sqlalchemy.engine import make_url
+
+    from app.db import DATABASE_URL
+
+    dsn = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(
+        hide_password=False)
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(CHANNEL, _on_notify)
+            clear()
+            _LOG.info("Listening on %s", CHANNEL)
+            while True:
+                await asyncio.sleep(LISTEN_CHECK_SECONDS)
+                await conn.execute("SELECT 1")
+        except asyncio.CancelledError:
+            _LOG.info("Authz listener cancelled")
+            raise
+        except Exception:
+            _LOG.exception("Authz listener lost its connection")
+            await asyncio.sleep(5)
+        finally:
+            if conn is not None:
+                await conn.close(timeout=5)
@@ -0,0 +1,219 @@
+"""One-time, versioned schema bootstrap for the modules that own runtime DDL.
+
+Several modules create their own tables instead of shipping a migration.
+Profits, production tasks, legacy debts, announcements and damaged transfers
+ran their CREATE TABLE / CREATE INDEX statements at the top of almost every
+request. Procurement and logistics ran theirs on router start-up. Geo and
+regulatory ran theirs on every boot of every worker. The statements were
+idempotent, but each one still took catalog locks and cost a round trip. The
+per-request copies also committed whatever the request had done so far.
+
+Each module now declares its DDL once, at import:
+
+    bootstrap.register("profits", 1, [CREATE_SETTLEMENTS_SQL, ...])
+
+`run` applies every pending step at start-up. A step is pending until
+`schema_bootstrap` records it at its current version. Pending steps run in one
+transaction under an advisory lock, so concurrent workers queue behind the
+first one, and each then re-reads the ledger and finds nothing to do. Every
+step gets its own savepoint: a step that fails is logged and retried on the
+next boot without undoing the others. To change a module's schema, add the
+new idempotent statement to its list and bump its version.
+
+Once the ledger shows everything applied, a worker's start-up costs two small
+reads and no DDL. Request handlers call `ensure`. It answers from a
+per-process set once the step is known to be applied, so hot requests issue
+no SQL at all. It applies the step itself only if start-up could not, for
+example when the database was unreachable at boot.
+
+`scripts/bench_startup.py` compares the cost of re-running every statement on
+each boot with the cost of the ledger check.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_LOG = logging.getLogger("services.bootstrap")
+
+# Arbitrary, but fixed: every worker must contend for the same key.
+LOCK_KEY = 4_217_120_037
+
+CREATE_LEDGER_SQL = """
+CREATE TABLE IF NOT EXISTS schema_bootstrap (
+    name VARCHAR(64) PRIMARY KEY,
+    version INTEGER NOT NULL,
+    duration_ms NUMERIC(12,2),
+    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+)
+"""
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    version: int
+    statements: tuple[str, ...]
+    # Runs after the statements, in the same savepoint (backfills, seeds).
+    after: Optional[Callable[[AsyncSession], Awaitable[None]]] = None
+    # Give each statement its own savepoint and skip the ones that fail,
+    # for best-effort DDL against tables another deployment may not have.
+    tolerant: bool = False
+
+
+_steps: dict[str, Step] = {}
+# name -> version this process knows to be applied.
+_ready: dict[str, int] = {}
+
+
+def register(
+    name: str,
+    version: int,
+    statements: Iterable[str],
+    *,
+    after: Optional[Callable[[AsyncSession], Awaitable[None]]] = None,
+    tolerant: bool = False,
+) -> Step:
+    """Declare a module's DDL. Called once, at module import."""
+    step = Step(name, version, tuple(statements), after, tolerant)
+    existing = _steps.get(name)
+    if existing is not None and existing != step:
+        raise ValueError(f"bootstrap step {name!r} is registered twice")
+    _steps[name] = step
+    return step
+
+
+def track_changes(table: str) -> str:
+    """A statement adding `table` to the change counters behind conditional
+    GETs (migration z5678901234y); a no-op until that migration is applied."""
+    return f"""
+        DO $$ BEGIN
+            IF to_regprocedure('track_changes(regclass)') IS NOT NULL THEN
+                PERFORM track_changes('public.{table}');
+            END IF;
+        END $$
+    """
+
+
+def steps() -> list[Step]:
+    """Registered steps, in registration order."""
+    return list(_steps.values())
+
+
+def _is_ready(step: Step) -> bool:
+    return _ready.get(step.name, 0) >= step.version
+
+
+async def _recorded(session: AsyncSession) -> dict[str, int]:
+    exists = (await session.execute(text(
+        "SELECT to_regclass('public.schema_bootstrap') IS NOT NULL"
+    ))).scalar()
+    if not exists:
+        return {}
+    rows = (await session.execute(text(
+        "SELECT name, version FROM schema_bootstrap"))).fetchall()
+    return {r.name: r.version for r in rows}
+
+
+async def _apply(session: AsyncSession, step: Step) -> None:
+    for sql in step.statements:
+        if not step.tolerant:
+            await session.execute(text(sql))
+            continue
+        try:
+            async with session.begin_nested():
+                await session.execute(text(sql))
+        except Exception as e:
+            _LOG.warning("bootstrap %s: skipped statement: %s", step.name, e)
+    if step.after is not None:
+        await step.after(session)
+
+
+async def run(
+    session: AsyncSession, names: Optional[Sequence[str]] = None,
+) -> list[str]:
+    """Apply every pending step (or the named ones) and commit.
+
+    Returns the names of the steps applied by this call. Steps another
+    worker already applied are skipped, not repeated.
+    """
+    todo = [s for s in _steps.values()
+            if (names is None or s.name in names) and not _is_ready(s)]
+    if not todo:
+        return []
+
+    recorded = await _recorded(session)
+    for s in todo:
+        if recorded.get(s.name, 0) >= s.version:
+            _ready[s.name] = s.version
+    todo = [s for s in todo if not _is_ready(s)]
+    if not todo:
+        # Close the read-only transaction the ledger check opened.
+        await session.commit()
+        return []
+
+    await session.execute(
+        text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+    await session.execute(text(CREATE_LEDGER_SQL))
+    # Another worker may have applied some of them while this one waited.
+    recorded = await _recorded(session)
+
+    applied = []
+    for step in todo:
+        if recorded.get(step.name, 0) >= step.version:
+            continue
+        started = time.perf_counter()
+        try:
+            async with session.begin_nested():
+                await _apply(session, step)
+                await session.execute(
+                    text("""
+                        INSERT INTO schema_bootstrap (name, version, duration_ms)
+                        VALUES (:name, :version, :ms)
+                        ON CONFLICT (name) DO UPDATE
+                           SET version = EXCLUDED.version,
+                               duration_ms = EXCLUDED.duration_ms,
+                               applied_at = NOW()
+                    """),
+                    {"name": step.name, "version": step.version,
+                     "ms": str(round((time.perf_counter() - started) * 1000, 2))},
+                )
+        except Exception as e:
+            _LOG.error("bootstrap %s v%s failed: %s", step.name, step.version, e)
+            continue
+        applied.append(step)
+    await session.commit()
+
+    for step in todo:
+        if step in applied or recorded.get(step.name, 0) >= step.version:
+            _ready[step.name] = step.version
+    for step in applied:
+        _LOG.info("bootstrap %s applied at v%s", step.name, step.version)
+    return [s.name for s in applied]
+
+
+async def ensure(session: AsyncSession, name: str) -> None:
+    """Make sure step `name` is applied; free once it is known to be.
+
+    Applying it commits the session, so call this before doing any work.
+    """
+    step = _steps[name]
+    if _is_ready(step):
+        return
+    await run(session, [name])
+    if not _is_ready(step):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Schema bootstrap '{name}' has not been applied; see the server log",
+        )
+
+
+def reset() -> None:
+    """Forget what this process knows to be applied (tests)."""
+    _ready.clear()
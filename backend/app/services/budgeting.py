@@ -338,3 +338,148 @@ async def budget_variance(
             f"{len(unbudgeted)} account(s) had activity with no budget line."
             if unbudgeted else None),
     }
+
+
+# ---------------------------------------------------------------------------
+# Full-year variance grid
+# ---------------------------------------------------------------------------
+
+# fiscal_year -> (stamp, grid). The stamp identifies the approved budget and
+# the state of the year's journal; a grid is served from here only while its
+# stamp still matches, so a posting from any worker invalidates it here too.
+_GRID_CACHE: dict[int, tuple[tuple, dict]] = {}
+
+
+def _month_starts(start: date, end: date) -> list[date]:
+    months, m = [], date(start.year, start.month, 1)
+    while m <= end:
+        months.append(m)
+        m = date(m.year + (m.month == 12), m.month % 12 + 1, 1)
+    return months
+
+
+async def variance_grid(session: AsyncSession, *, fiscal_year: int) -> dict:
+    """Budget against actual for every (account, cost centre, month) of a year.
+
+    `budget_variance` answers one period at a time; an executive grid needs
+    every cell of the year. Actuals for the whole year come from ONE grouped
+    journal query, the budget lines from one more, and the two are joined
+    here. The result is cached per fiscal year and reused until a new entry
+    posts into the year or a different budget is approved for it.
+    """
+    head = (await session.execute(
+        text("""
+            SELECT b.id, b.name, b.period_start, b.period_end,
+                   (SELECT COUNT(*) FROM gl_journal_entries e
+                     WHERE e.status <> 'DRAFT'
+                       AND e.entry_date BETWEEN b.period_start
+                                            AND b.period_end) AS entries,
+                   (SELECT MAX(e.created_at) FROM gl_journal_entries e
+                     WHERE e.status <> 'DRAFT'
+                       AND e.entry_date BETWEEN b.period_start
+                                            AND b.period_end) AS last_posted
+              FROM budgets b
+             WHERE b.fiscal_year = :y AND b.status = 'APPROVED'
+             LIMIT 1
+        """),
+        {"y": fiscal_year},
+    )).first()
+    if head is None:
+        raise HTTPException(
+            status_code=400,
+            detail=(f"No approved budget for {fiscal_year}. A draft budget is "
+                    f"not reported against -- approve it first."))
+
+    # Posted entries are never edited (corrections are new reversing
+    # entries), so the count and latest posting time change whenever the
+    # year's actuals can have changed.
+    stamp = (str(head.id), int(head.entries), head.last_posted)
+    cached = _GRID_CACHE.get(fiscal_year)
+    if cached is not None and cached[0] == stamp:
+        return {**cached[1], "cached": True}
+
+    start, end = head.period_start, head.period_end
+    types, names = {}, {}
+
+    actuals = {}
+    for r in (await session.execute(
+        text("""
+            SELECT a.code, a.name, a.account_type,
+                   COALESCE(l.cost_centre, '') AS cc,
+                   CAST(DATE_TRUNC('month', e.entry_date) AS date) AS month,
+                   SUM(CASE WHEN a.account_type = 'EXPENSE'
+                            THEN l.debit - l.credit
+                            ELSE l.credit - l.debit END) AS amount
+              FROM gl_journal_lines l
+              JOIN gl_journal_entries e ON e.id = l.entry_id
+              JOIN gl_accounts a ON a.id = l.account_id
+             WHERE e.status <> 'DRAFT'
+               AND e.entry_date BETWEEN :start AND :end
+               AND a.account_type IN ('INCOME','EXPENSE')
+             GROUP BY a.code, a.name, a.account_type, cc, month
+        """), {"start": start, "end": end})).fetchall():
+        actuals[(r.code, r.cc, r.month)] = money(r.amount)
+        types[r.code], names[r.code] = r.account_type, r.name
+
+    budgeted = {}
+    for r in (await session.execute(
+        text("""
+            SELECT bl.account_code, COALESCE(bl.cost_centre, '') AS cc,
+                   bl.period_month, a.name, a.account_type,
+                   SUM(bl.amount) AS total
+              FROM budget_lines bl
+              LEFT JOIN gl_accounts a ON a.code = bl.account_code
+             WHERE bl.budget_id = :b
+             GROUP BY bl.account_code, cc, bl.period_month,
+                      a.name, a.account_type
+        """), {"b": str(head.id)})).fetchall():
+        budgeted[(r.account_code, r.cc, r.period_month)] = money(r.total)
+        if r.account_type:
+            types.setdefault(r.account_code, r.account_type)
+            names.setdefault(r.account_code, r.name)
+
+    zero = Decimal("0.00")
+    cells = []
+    by_centre, by_month = {}, {}
+    for key in sorted(set(budgeted) | set(actuals)):
+        code, cc, month = key
+        b, a = budgeted.get(key, zero), actuals.get(key, zero)
+        atype = types.get(code, "EXPENSE")
+        variance, verdict = classify_variance(atype, b, a)
+        cells.append({
+            "account_code": code, "account_name": names.get(code, code),
+            "account_type": atype,
+            "cost_centre": cc or "UNALLOCATED",
+            "month": str(month),
+            "budget": float(b), "actual": float(a),
+            "variance": float(variance),
+            "variance_percent": (float(variance / b * 100) if b else None),
+            "verdict": verdict,
+            "unbudgeted": b == 0 and a != 0,
+        })
+        # Roll-ups keep spend and earnings apart: netting an adverse expense
+        # against a favourable income line would hide both.
+        side = "income" if atype in EARN_TYPES else "expense"
+        for bucket in (by_centre.setdefault(cc or "UNALLOCATED", {}),
+                       by_month.setdefault(str(month), {})):
+            bucket[f"{side}_budget"] = bucket.get(f"{side}_budget", zero) + b
+            bucket[f"{side}_actual"] = bucket.get(f"{side}_actual", zero) + a
+
+    def _rollup(label, groups):
+        fields = ("expense_budget", "expense_actual",
+                  "income_budget", "income_actual")
+        return [{label: k, **{f: float(v.get(f, zero)) for f in fields}}
+                for k, v in sorted(groups.items())]
+
+    grid = {
+        "budget_name": head.name, "fiscal_year": fiscal_year,
+        "period": {"start": str(start), "end": str(end)},
+        "months": [str(m) for m in _month_starts(start, end)],
+        "cells": cells,
+        "by_cost_centre": _rollup("cost_centre", by_centre),
+        "by_month": _rollup("month", by_month),
+        "adverse_count": sum(1 for c in cells if c["verdict"] == "ADVERSE"),
+        "unbudgeted_count": sum(1 for c in cells if c["unbudgeted"]),
+    }
+    _GRID_CACHE[fiscal_year] = (stamp, grid)
+    return {**grid, "cached": False}
@@ -0,0 +1,236 @@
+"""The admin "company status" overview, as a cached read model.
+
+`/api/financial/company-status` used to assemble its figures from about
+twenty independent aggregates. Those included one revenue query per month,
+one attendance query per staff member, and four separate counts each for
+orders and production. `/company-status/export` then rebuilt all of it again
+to render the PDF. Both were the slowest pages in the app.
+
+`compute_company_status` now gathers the same figures with a handful of
+grouped queries:
+
+* revenue, total and by month, in one GROUP BY over `payments`;
+* order, production and entity counts, each in one statement using FILTER;
+* inventory valuation from one pass over the stock levels. The per-product
+  breakdown and the product totals come from the same rows;
+* the month's attendance-based payroll in one join, instead of a query per
+  staff member.
+
+`company_status` serves the result from a per-process cache for
+COMPANY_STATUS_TTL_SECONDS (default five minutes). The overview and its
+export share the cache, so a PDF taken after viewing the overview reuses the
+figures on screen. Concurrent requests for a stale entry wait for a single
+recomputation instead of each running their own. `refresh=True` forces a
+recomputation; the payload's `generated_at` and `fresh_until` say how old
+the figures are.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.ledger import money
+from app.services.receivables import outstanding_receivables
+
+TTL_SECONDS = float(os.getenv("COMPANY_STATUS_TTL_SECONDS", "300"))
+
+_cache: Optional[tuple[float, dict]] = None
+_lock = asyncio.Lock()
+
+
+def _last_twelve_months(now: datetime) -> list[datetime]:
+    """UTC calendar month starts, newest first, ending with `now`'s month."""
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(12):
+        starts.append(datetime(year, month, 1, tzinfo=timezone.utc))
+        month -= 1
+        if month == 0:
+            month, year = 12, year - 1
+    return starts
+
+
+async def compute_company_status(session: AsyncSession) -> dict:
+    """Every figure on the company-status overview, computed now."""
+    now = datetime.now(timezone.utc)
+    months = _last_twelve_months(now)
+
+    # ---- Revenue: cash collected (receivables.revenue_between's definition),
+    # all time and per calendar month, from one scan of payments.
+    by_month = {}
+    total_revenue = money(0)
+    for r in (await session.execute(text("""
+        SELECT date_trunc('month', p.payment_date AT TIME ZONE 'UTC') AS month,
+               COALESCE(SUM(p.amount), 0) AS total
+          FROM payments p
+         GROUP BY 1
+    """))).fetchall():
+        total_revenue += money(r.total)
+        if r.month is not None:
+            by_month[(r.month.year, r.month.month)] = money(r.total)
+    revenue_by_month = [
+        {'month': m.strftime('%b %Y'),
+         'revenue': float(by_month.get((m.year, m.month), money(0)))}
+        for m in months
+    ]
+
+    outstanding = float(await outstanding_receivables(session))
+
+    orders = (await session.execute(text("""
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE payment_status = 'paid') AS paid,
+               COUNT(*) FILTER (WHERE payment_status IN ('unpaid', 'partial'))
+                   AS unpaid
+          FROM sales_orders
+    """))).first()
+
+    # ---- Inventory valuation. The breakdown rows carry everything the
+    # product totals need, so the products are read once.
+    product_rows = (await session.execute(text("""
+        SELECT p.id, p.name, p.unit, sl.current_stock,
+               COALESCE(pp_match.cost_price, p.cost_price, 0) AS unit_cost,
+               sl.current_stock * COALESCE(pp_match.cost_price, p.cost_price, 0)
+                   AS line_value
+          FROM stock_levels sl
+          JOIN products p ON sl.product_id = p.id
+          LEFT JOIN product_pricing pp_match
+                 ON pp_match.product_id = p.id AND pp_match.unit = p.unit
+         WHERE sl.product_id IS NOT NULL AND sl.current_stock > 0
+         ORDER BY line_value DESC
+    """))).fetchall()
+    product_inventory_value = float(sum(r.line_value for r in product_rows))
+    total_product_units = float(sum(r.current_stock for r in product_rows))
+    total_products_in_stock = len({r.id for r in product_rows})
+    product_breakdown = [
+        {'name': r.name, 'unit': r.unit, 'stock': float(r.current_stock),
+         'unit_cost': float(r.unit_cost), 'value': float(r.line_value)}
+        for r in product_rows
+    ]
+
+    raw = (await session.execute(text("""
+        SELECT COALESCE(SUM(sl.current_stock * COALESCE(rm.unit_cost, 0)), 0)
+                   AS total_value,
+               COALESCE(SUM(sl.current_stock), 0) AS total_units,
+               COUNT(DISTINCT sl.raw_material_id) AS material_count
+          FROM stock_levels sl
+          JOIN raw_materials rm ON sl.raw_material_id = rm.id
+         WHERE sl.raw_material_id IS NOT NULL AND sl.current_stock > 0
+    """))).first()
+    raw_materials_value = float(raw.total_value)
+    total_inventory_value = product_inventory_value + raw_materials_value
+
+    # ---- This month's attendance-based payroll: clocked hours at each staff
+    # member's hourly rate, in one join.
+    total_payroll = float((await session.execute(text("""
+        SELECT COALESCE(SUM(EXTRACT(EPOCH FROM (a.clock_out - a.clock_in))
+                            / 3600 * COALESCE(s.hourly_rate, 0)), 0)
+          FROM attendance a
+          JOIN staff s ON s.id = a.staff_id
+         WHERE a.clock_in >= :month_start AND a.clock_out IS NOT NULL
+    """), {"month_start": months[0]})).scalar() or 0)
+
+    production = (await session.execute(text("""
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+               COUNT(*) FILTER (WHERE status = 'in_progress') AS in_progress,
+               COUNT(*) FILTER (WHERE status = 'pending') AS pending
+          FROM production_orders
+    """))).first()
+
+    counts = (await session.execute(text("""
+        SELECT (SELECT COUNT(*) FROM customers) AS customers,
+               (SELECT COUNT(*) FROM products) AS products,
+               (SELECT COUNT(*) FROM raw_materials) AS raw_materials,
+               (SELECT COUNT(*) FROM staff) AS staff
+    """))).first()
+
+    revenue = float(total_revenue)
+    total_orders = int(orders.total or 0)
+    paid_orders = int(orders.paid or 0)
+    net_profit = revenue - total_payroll
+    return {
+        # Revenue Metrics
+        'total_revenue': revenue,
+        'outstanding_payments': outstanding,
+        'paid_orders_count': paid_orders,
+        'unpaid_orders_count': int(orders.unpaid or 0),
+        'revenue_by_month': revenue_by_month,
+
+        # Inventory Metrics
+        'product_inventory_value': product_inventory_value,
+        'raw_materials_value': raw_materials_value,
+        'total_inventory_value': total_inventory_value,
+        'total_products_in_stock': total_products_in_stock,
+        'total_raw_materials_in_stock': int(raw.material_count),
+        'total_product_units': total_product_units,
+        'total_raw_material_units': float(raw.total_units),
+        'product_breakdown': product_breakdown,
+
+        # Expense Metrics
+        'monthly_payroll': total_payroll,
+        'total_expenses': total_payroll,
+
+        # Financial Position
+        'total_assets': total_inventory_value + outstanding,
+        'total_liabilities': total_payroll,
+        'net_worth': revenue + total_inventory_value - total_payroll,
+
+        # Profitability
+        'net_profit': net_profit,
+        'profit_margin': (net_profit / revenue * 100) if revenue > 0 else 0,
+
+        # Sales
+        'total_sales': total_orders,
+        'paid_sales': paid_orders,
+        'total_customers': int(counts.customers),
+        'payment_collection_rate': round(
+            (paid_orders / total_orders * 100) if total_orders else 0, 1),
+
+        # Production
+        'total_production_orders': int(production.total or 0),
+        'completed_production': int(production.completed or 0),
+        'in_progress_production': int(production.in_progress or 0),
+        'pending_production': int(production.pending or 0),
+
+        # Workforce
+        'total_products': int(counts.products),
+        'total_raw_materials': int(counts.raw_materials),
+        'total_staff': int(counts.staff),
+
+        # Timestamp
+        'generated_at': now.isoformat(),
+    }
+
+
+async def company_status(session: AsyncSession, *, refresh: bool = False) -> dict:
+    """The overview, from cache while it is fresh.
+
+    The returned dict is shared with later callers; treat it as read-only.
+    """
+    global _cache
+    entry = _cache
+    if not refresh and entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+
+    async with _lock:
+        # Another request may have recomputed while this one waited.
+        entry = _cache
+        if not refresh and entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        metrics = await compute_company_status(session)
+        generated = datetime.fromisoformat(metrics['generated_at'])
+        metrics['fresh_until'] = (
+            generated + timedelta(seconds=TTL_SECONDS)).isoformat()
+        _cache = (time.monotonic() + TTL_SECONDS, metrics)
+        return metrics
+
+
+def clear_cache() -> None:
+    global _cache
+    _cache = None
@@ -0,0 +1,190 @@
+"""Response compression: brotli when the client accepts it, gzip otherwise.
+
+The JSON the PWA polls (stock levels, product lists, debtors, dashboards)
+was sent uncompressed, often hundreds of kilobytes per poll on a mobile link.
+`CompressionMiddleware` compresses any textual response of at least
+COMPRESS_MIN_BYTES (default 1 KiB). Smaller bodies cost more to compress than
+they save.
+
+* brotli needs the optional `brotli` package. Without it, clients get gzip.
+* Complete bodies are compressed in one go and sent with their new length.
+  Streamed bodies (CSV/PDF exports, file downloads) are compressed chunk by
+  chunk, flushing after each one, so a slow export still streams.
+* Server-sent events, binary types and bodies that are already encoded pass
+  through untouched.
+* A strong ETag on a compressed body is weakened: the bytes differ from the
+  identity encoding the tag was computed for.
+
+Levels favour speed over ratio, since every response is compressed on the
+fly: gzip 6, brotli quality 4.
+"""
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Optional
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript",
+                 "application/xml", "image/svg+xml")
+_NEVER = ("text/event-stream",)
+
+
+def offered_encodings(accept_encoding: str) -> dict[str, float]:
+    """The codings of an Accept-Encoding header with their q-values."""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    return offered
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """`br`, `gzip` or None for an Accept-Encoding header."""
+    offered = offered_encodings(accept_encoding)
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._gz = None
+        else:
+            self._br = None
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self._br is not None:
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._br is not None:
+            return self._br.finish()
+        return self._gz.flush(zlib.Z_FINISH)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    c = _Compressor(encoding)
+    return c.chunk(data) + c.finish()
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return (content_type.startswith(_COMPRESSIBLE)
+            and not content_type.startswith(_NEVER))
+
+
+def _compressible(headers: list) -> bool:
+    content_type = ""
+    for name, value in headers:
+        name = name.lower()
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value.decode("latin-1")
+    return is_compressible(content_type)
+
+
+def _rewrite(headers: list, encoding: Optional[str],
+             length: Optional[int]) -> list:
+    out = []
+    for name, value in headers:
+        lname = name.lower()
+        if lname == b"content-length" or lname == b"vary":
+            continue
+        if encoding and lname == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        out.append((name, value))
+    vary = [v for n, v in headers if n.lower() == b"vary"]
+    if not any(b"accept-encoding" in v.lower() for v in vary):
+        vary.append(b"Accept-Encoding")
+    out.append((b"vary", b", ".join(vary)))
+    if encoding:
+        out.append((b"content-encoding", encoding.encode()))
+    if length is not None:
+        out.append((b"content-length", str(length).encode()))
+    return out
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware; see the module docstring."""
+
+    def __init__(self, app, *, minimum_size: int = MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope.get("headers") or ()).get(b"accept-encoding", b"")
+        encoding = choose_encoding(accept.decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if (message["status"] < 200 or message["status"] in (204, 304)
+                        or not _compressible(headers)):
+                    state["passthrough"] = True
+                    await send(message)
+                else:
+                    state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            start = state["start"]
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if state["compressor"] is None:
+                if not more:
+                    # The whole body at once: compress it if it is worth it.
+                    if len(body) < self.minimum_size:
+                        state["passthrough"] = True
+                        await send({**start, "headers": _rewrite(
+                            start["headers"], None, len(body))})
+                        await send(message)
+                        return
+                    out = compress(body, encoding)
+                    await send({**start, "headers": _rewrite(
+                        start["headers"], encoding, len(out))})
+                    await send({"type": "http.response.body", "body": out})
+                    return
+                state["compressor"] = _Compressor(encoding)
+                await send({**start, "headers": _rewrite(
+                    start["headers"], encoding, None)})
+            c = state["compressor"]
+            out = c.chunk(body) if body else b""
+            if not more:
+                out += c.finish()
+            if out or not more:
+                await send({"type": "http.response.body", "body": out,
+                            "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
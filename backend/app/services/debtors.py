@@ -0,0 +1,306 @@
+"""The debtors list and the overdue-reminders list, for collections staff.
+
+Both screens used to work out every invoice's paid total with a correlated
+`SELECT SUM(amount) FROM payments` subquery, repeated in the select list, the
+HAVING clause and the ORDER BY. That meant several payment scans per invoice
+on every page load, and the legacy-debt half did the same against
+`legacy_debt_payments`.
+
+Both halves now read cached paid totals instead:
+
+* `invoices.paid_amount` is written only by `receivables.recompute_invoice_paid`
+  from the payment rows, inside the same transaction as the payment.
+* `legacy_debts.paid_amount` is written the same way by the legacy-debt
+  module's `_recalculate_debt_status` on every payment insert or delete.
+
+Debtors are found through partial indexes on documents that are still open,
+so the work grows with the number of customers who owe money, not with the
+invoice history. Filtering, sorting and paging happen in the database. Money
+is returned as floats, matching the screens these figures feed.
+
+(`customer_debt.outstanding_for_customer` remains the per-customer statement.
+It works from sales orders, because invoices are created lazily, and this
+list follows the invoice and legacy-debt records the dashboard has always
+shown.)
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.customer_debt import CENT, _legacy_table_exists
+
+# Open documents: what the partial indexes cover. Keep in step with
+# migration v1234567890u and legacy_debts.CREATE_INDEX_SQLS.
+_OPEN_INVOICE = "status NOT IN ('cancelled', 'paid')"
+_OPEN_LEGACY = "status NOT IN ('cancelled', 'paid')"
+
+_SORTS = {
+    "balance": "balance DESC, customer_name",
+    "days_overdue": "earliest_due_date ASC NULLS LAST, balance DESC",
+    "name": "customer_name, balance DESC",
+}
+
+_LEGACY_CTE = f"""
+    leg AS (
+        SELECT customer_id,
+               COUNT(*) AS legacy_count,
+               SUM(original_amount) AS legacy_total,
+               SUM(paid_amount) AS legacy_paid,
+               MIN(due_date) AS legacy_earliest_due
+          FROM legacy_debts
+         WHERE {_OPEN_LEGACY}
+         GROUP BY customer_id
+        HAVING SUM(original_amount) - SUM(paid_amount) > :cent
+    )"""
+
+_NO_LEGACY_CTE = """
+    leg AS (
+        SELECT CAST(NULL AS uuid) AS customer_id,
+               0 AS legacy_count,
+               CAST(0 AS numeric) AS legacy_total,
+               CAST(0 AS numeric) AS legacy_paid,
+               CAST(NULL AS date) AS legacy_earliest_due
+         WHERE FALSE
+    )"""
+
+
+def _due_as_of(as_of: date) -> datetime:
+    return datetime.combine(as_of, time.min, tzinfo=timezone.utc)
+
+
+def _days_since(value, as_of: date) -> int:
+    if value is None:
+        return 0
+    d = value.date() if isinstance(value, datetime) else value
+    return max(0, (as_of - d).days)
+
+
+def _debtors_sql(has_legacy: bool, *, search, overdue_only, min_balance,
+                 as_of: date) -> tuple[str, dict]:
+    """The CTEs up to `m`, every debtor matching the filters."""
+    where, params = ["TRUE"], {
+        "cent": str(CENT), "as_of": as_of, "due_ts": _due_as_of(as_of),
+    }
+    if search and search.strip():
+        where.append("(c.name ILIKE :q OR c.phone ILIKE :q OR c.email ILIKE :q)")
+        params["q"] = f"%{search.strip()}%"
+    if overdue_only:
+        where.append("""(d.inv_earliest_due < :due_ts
+                         OR d.legacy_earliest_due < :as_of)""")
+    if min_balance is not None:
+        where.append("d.balance >= :min_balance")
+        params["min_balance"] = str(min_balance)
+
+    return f"""
+        WITH owing AS (
+            -- Partial index ix_invoices_open_customer: only unsettled
+            -- invoices are visited to find who owes anything.
+            SELECT DISTINCT customer_id
+              FROM invoices
+             WHERE {_OPEN_INVOICE}
+               AND total_amount - COALESCE(paid_amount, 0) > :cent
+        ),
+        inv AS (
+            -- Totals over ALL live invoices of those customers, so
+            -- "invoiced" and "paid" read the same as they always have.
+            SELECT i.customer_id,
+                   COUNT(*) AS invoice_count,
+                   SUM(i.total_amount) AS invoiced,
+                   SUM(COALESCE(i.paid_amount, 0)) AS paid,
+                   MIN(i.due_date) FILTER (WHERE i.{_OPEN_INVOICE})
+                       AS inv_earliest_due,
+                   MAX(i.invoice_date) AS last_invoice_date
+              FROM invoices i
+             WHERE i.status <> 'cancelled'
+               AND i.customer_id IN (SELECT customer_id FROM owing)
+             GROUP BY i.customer_id
+            HAVING SUM(i.total_amount) - SUM(COALESCE(i.paid_amount, 0))
+                   > :cent
+        ),
+        {_LEGACY_CTE if has_legacy else _NO_LEGACY_CTE},
+        d AS (
+            SELECT COALESCE(inv.customer_id, leg.customer_id) AS customer_id,
+                   COALESCE(inv.invoice_count, 0) AS invoice_count,
+                   COALESCE(inv.invoiced, 0) AS invoiced,
+                   COALESCE(inv.paid, 0) AS paid,
+                   COALESCE(leg.legacy_count, 0) AS legacy_count,
+                   COALESCE(leg.legacy_total, 0) AS legacy_total,
+                   COALESCE(leg.legacy_paid, 0) AS legacy_paid,
+                   inv.inv_earliest_due, inv.last_invoice_date,
+                   leg.legacy_earliest_due,
+                   COALESCE(inv.invoiced, 0) - COALESCE(inv.paid, 0)
+                     + COALESCE(leg.legacy_total, 0)
+                     - COALESCE(leg.legacy_paid, 0) AS balance,
+                   LEAST(CAST(inv.inv_earliest_due AS date),
+                         leg.legacy_earliest_due) AS earliest_due_date
+              FROM inv FULL OUTER JOIN leg
+                   ON leg.customer_id = inv.customer_id
+        ),
+        m AS (
+            SELECT d.*, c.name AS customer_name,
+                   c.phone, c.email, c.address
+              FROM d JOIN customers c ON c.id = d.customer_id
+             WHERE {' AND '.join(where)}
+        )
+    """, params
+
+
+def _debtor_row(r, as_of: date, due_ts: datetime) -> dict:
+    inv_days = (_days_since(r.inv_earliest_due, as_of)
+                if r.inv_earliest_due and r.inv_earliest_due < due_ts else 0)
+    leg_days = (_days_since(r.legacy_earliest_due, as_of)
+                if r.legacy_earliest_due and r.legacy_earliest_due
+                < as_of else 0)
+    legacy_balance = float(r.legacy_total) - float(r.legacy_paid)
+    return {
+        "customer_id": str(r.customer_id),
+        "customer_name": r.customer_name,
+        "phone": r.phone,
+        "email": r.email,
+        "address": r.address,
+        "invoice_count": int(r.invoice_count),
+        "total_invoiced": float(r.invoiced) + float(r.legacy_total),
+        "total_paid": float(r.paid) + float(r.legacy_paid),
+        "balance": float(r.balance),
+        "legacy_debt_count": int(r.legacy_count),
+        "legacy_debt_total": float(r.legacy_total),
+        "legacy_debt_paid": float(r.legacy_paid),
+        "legacy_debt_balance": legacy_balance,
+        "is_overdue": bool(inv_days or leg_days),
+        "days_overdue": max(inv_days, leg_days),
+        "earliest_due_date": (r.earliest_due_date.isoformat()
+                              if r.earliest_due_date else None),
+        "last_invoice_date": (r.last_invoice_date.isoformat()
+                              if r.last_invoice_date else None),
+    }
+
+
+async def debtors_page(
+    session: AsyncSession,
+    *,
+    search: Optional[str] = None,
+    overdue_only: bool = False,
+    min_balance: Optional[float] = None,
+    sort: str = "balance",
+    limit: Optional[int] = None,
+    offset: int = 0,
+    as_of: Optional[date] = None,
+) -> dict:
+    """Customers with an outstanding balance on invoices or legacy debts.
+
+    Returns one page of debtors plus the count and outstanding total of every
+    debtor that matches the filters, so the screen can show "page 2 of 40"
+    without a second request. `limit=None` returns every match.
+    """
+    as_of = as_of or datetime.now(timezone.utc).date()
+    ctes, params = _debtors_sql(
+        await _legacy_table_exists(session), search=search,
+        overdue_only=overdue_only, min_balance=min_balance, as_of=as_of)
+    params.update(offset=offset, limit=limit)
+
+    rows = (await session.execute(
+        text(f"""{ctes}
+            -- Totals over every match, plus one page of rows. The totals row
+            -- is always returned, even for a page past the end.
+            SELECT t.matched, t.matched_balance, p.*
+              FROM (SELECT COUNT(*) AS matched,
+                           COALESCE(SUM(balance), 0) AS matched_balance
+                      FROM m) t
+              LEFT JOIN LATERAL (
+                    SELECT * FROM m
+                     ORDER BY {_SORTS.get(sort, _SORTS['balance'])}
+                     LIMIT :limit OFFSET :offset
+              ) p ON TRUE
+        """),
+        params,
+    )).fetchall()
+
+    return {
+        "debtors": [_debtor_row(r, as_of, params["due_ts"])
+                    for r in rows if r.customer_id is not None],
+        "total_debtors": int(rows[0].matched),
+        "total_outstanding": float(rows[0].matched_balance),
+        "offset": offset,
+        "limit": limit,
+    }
+
+
+async def iter_debtors(
+    session: AsyncSession,
+    *,
+    search: Optional[str] = None,
+    overdue_only: bool = False,
+    min_balance: Optional[float] = None,
+    sort: str = "balance",
+    as_of: Optional[date] = None,
+):
+    """Every debtor `debtors_page` would list, from a server-side cursor."""
+    as_of = as_of or datetime.now(timezone.utc).date()
+    ctes, params = _debtors_sql(
+        await _legacy_table_exists(session), search=search,
+        overdue_only=overdue_only, min_balance=min_balance, as_of=as_of)
+    result = await session.stream(
+        text(f"""{ctes}
+            SELECT * FROM m ORDER BY {_SORTS.get(sort, _SORTS['balance'])}
+        """).execution_options(yield_per=1000),
+        params)
+    async for r in result:
+        yield _debtor_row(r, as_of, params["due_ts"])
+
+
+async def overdue_reminders(
+    session: AsyncSession,
+    *,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    as_of: Optional[date] = None,
+) -> dict:
+    """Customers with invoices past their due date and still unpaid."""
+    as_of = as_of or datetime.now(timezone.utc).date()
+    rows = (await session.execute(
+        text(f"""
+            WITH o AS (
+                -- Partial index ix_invoices_open_due.
+                SELECT customer_id,
+                       COUNT(*) AS overdue_invoices,
+                       SUM(total_amount) AS invoiced,
+                       SUM(COALESCE(paid_amount, 0)) AS paid,
+                       MIN(due_date) AS earliest_due_date
+                  FROM invoices
+                 WHERE {_OPEN_INVOICE}
+                   AND due_date < NOW()
+                   AND total_amount - COALESCE(paid_amount, 0) > :cent
+                 GROUP BY customer_id
+            )
+            SELECT c.id AS customer_id, c.name AS customer_name,
+                   c.phone, c.email, o.*,
+                   o.invoiced - o.paid AS balance,
+                   COUNT(*) OVER () AS matched
+              FROM o JOIN customers c ON c.id = o.customer_id
+             ORDER BY balance DESC, c.name
+             LIMIT :limit OFFSET :offset
+        """),
+        {"cent": str(CENT), "limit": limit, "offset": offset},
+    )).fetchall()
+
+    return {
+        "reminders": [
+            {"customer_id": str(r.customer_id),
+             "customer_name": r.customer_name,
+             "phone": r.phone,
+             "email": r.email,
+             "overdue_invoices": int(r.overdue_invoices),
+             "total_invoiced": float(r.invoiced),
+             "total_paid": float(r.paid),
+             "balance": float(r.balance),
+             "days_overdue": _days_since(r.earliest_due_date, as_of)}
+            for r in rows
+        ],
+        "total": int(rows[0].matched) if rows else 0,
+        "offset": offset,
+        "limit": limit,
+    }
@@ -0,0 +1,455 @@
+"""CSV and XLSX downloads written row by row.
+
+Reports used to build their whole result as one list, then one workbook or
+string in memory, and send it in one piece. Here rows arrive from an async
+iterator, typically a server-side cursor (`AsyncSession.stream`), and are
+written as they come:
+
+* **CSV** is sent in chunks of about CSV_CHUNK_BYTES as they fill, so the
+  download starts with the first rows.
+* **XLSX** uses openpyxl's write-only workbook, which spools rows to a
+  temporary file rather than keeping cells in memory. Rows are written in
+  batches on a worker thread. A zip cannot be sent before it is complete, so
+  the file is streamed once the last row is in.
+
+Either way, memory stays flat however many rows there are. Values should be
+plain str, int, float, Decimal, date or None.
+
+Reports register here as a `Report`: a name, its columns, the typed query
+parameters it accepts, and a function streaming its rows as dicts from a
+server-side cursor. `/api/exports/{report}` sends one as a download.
+
+An export too long to wait for runs as a job instead. The file is written
+under EXPORT_DIR while the client polls the job, then downloaded from its
+link until it expires after EXPORT_JOB_TTL_HOURS. Each worker runs at most
+EXPORT_JOB_CONCURRENCY jobs at once, so large exports queue rather than
+compete with the pages people are using. Jobs live in `export_jobs`
+(migration g2345678901f), so any worker can answer for any job; with
+workers on several hosts, EXPORT_DIR must be a directory they share.
+`run_sweeper` removes expired files and fails jobs whose worker stopped
+reporting progress, e.g. across a restart.
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import (Any, AsyncIterator, Callable, Iterable, Mapping, Optional,
+                    Sequence)
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_LOG = logging.getLogger("services.exports")
+
+CSV_CHUNK_BYTES = 64 * 1024
+# Rows handed to a worker thread at a time: formatting cells costs far more
+# than reading them, and would otherwise hold up the event loop.
+XLSX_BATCH_ROWS = 1000
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+EXPORT_DIR = Path(os.getenv(
+    "EXPORT_DIR", os.path.join(tempfile.gettempdir(), "astroaxis-exports")))
+JOB_TTL_HOURS = float(os.getenv("EXPORT_JOB_TTL_HOURS", "24"))
+JOB_CONCURRENCY = int(os.getenv("EXPORT_JOB_CONCURRENCY", "2"))
+# Written to the job row every this many rows; a running job silent for
+# JOB_STALE_MINUTES, or a job still queued that long after it was created,
+# is taken to have lost its worker.
+JOB_PROGRESS_ROWS = 10_000
+JOB_STALE_MINUTES = 30
+SWEEP_SECONDS = 900
+
+
+async def csv_chunks(header: Sequence[str],
+                     rows: AsyncIterator[Iterable]) -> AsyncIterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    async for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= CSV_CHUNK_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _append_rows(ws, rows) -> None:
+    for row in rows:
+        ws.append(list(row))
+
+
+async def xlsx_chunks(header: Sequence[str], rows: AsyncIterator[Iterable],
+                      *, sheet: str = "Sheet1") -> AsyncIterator[bytes]:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet[:31])
+    ws.append(list(header))
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= XLSX_BATCH_ROWS:
+            await asyncio.to_thread(_append_rows, ws, batch)
+            batch = []
+    _append_rows(ws, batch)
+    with tempfile.TemporaryFile() as f:
+        await asyncio.to_thread(wb.save, f)
+        f.seek(0)
+        while chunk := f.read(CSV_CHUNK_BYTES):
+            yield chunk
+
+
+def file_response(fmt: str, filename: str, header: Sequence[str],
+                  rows: AsyncIterator[Iterable], *,
+                  sheet: str = "Sheet1") -> StreamingResponse:
+    """A download of `rows` as `filename`.csv or .xlsx."""
+    body = (csv_chunks(header, rows) if fmt == "csv"
+            else xlsx_chunks(header, rows, sheet=sheet))
+    return StreamingResponse(
+        body, media_type=FORMATS[fmt],
+        headers={"Content-Disposition":
+                 f'attachment; filename="{filename}.{fmt}"'})
+
+
+def check_format(fmt: str) -> str:
+    if fmt not in FORMATS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"format must be one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+# ---------------------------------------------------------------------------
+# Reports
+# ---------------------------------------------------------------------------
+
+def flag(value: str) -> bool:
+    """A query-string boolean, spelled the way FastAPI accepts them."""
+    v = value.strip().lower()
+    if v in ("1", "true", "yes", "on"):
+        return True
+    if v in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(value)
+
+
+def choice(*allowed: str) -> Callable[[str], str]:
+    def parse(value: str) -> str:
+        if value not in allowed:
+            raise ValueError(value)
+        return value
+    return parse
+
+
+@dataclass(frozen=True)
+class Report:
+    name: str
+    title: str
+    columns: tuple[str, ...]
+    # rows(session, **params) -> async iterator of dicts keyed by column.
+    rows: Callable[..., AsyncIterator[Mapping[str, Any]]]
+    params: Mapping[str, Callable[[str], Any]] = field(default_factory=dict)
+    required: tuple[str, ...] = ()
+
+    def filename(self, params: Mapping[str, Any]) -> str:
+        parts = [self.name.replace("_", "-")]
+        parts += [str(v) for k, v in sorted(params.items())
+                  if isinstance(v, (str, date)) and v != ""]
+        # Filters are user input; keep the header and file system happy.
+        return re.sub(r"[^A-Za-z0-9._-]+", "_", "-".join(parts))[:120]
+
+
+REPORTS: dict[str, Report] = {}
+
+
+def register(report: Report) -> Report:
+    REPORTS[report.name] = report
+    return report
+
+
+def get_report(name: str) -> Report:
+    report = REPORTS.get(name)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report '{name}'")
+    return report
+
+
+def parse_params(report: Report, query: Mapping[str, str]) -> dict:
+    """The report's parameters from a query string, converted; 422 if not.
+
+    Parameters the report does not take are ignored, as FastAPI does.
+    """
+    params = {}
+    for name, convert in report.params.items():
+        raw = query.get(name)
+        if raw is None or raw == "":
+            continue
+        try:
+            params[name] = convert(raw)
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=422, detail=f"Invalid value for '{name}': {raw!r}")
+    missing = [n for n in report.required if n not in params]
+    if missing:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Missing required parameter(s): {', '.join(missing)}")
+    return params
+
+
+async def report_rows(report: Report, params: Mapping[str, Any], *,
+                      sessions=None) -> AsyncIterator[list]:
+    """The report's rows as lists in column order, read through a session
+    of their own: a request's session is closed before its body streams."""
+    if sessions is None:
+        from app.db import ReadSessionLocal as sessions
+    async with sessions() as session:
+        async for row in report.rows(session, **params):
+            yield [row[c] for c in report.columns]
+
+
+async def _primed(rows: AsyncIterator[list]) -> AsyncIterator[list]:
+    """Start `rows` now, so a report refusing its parameters (an unknown
+    account, a missing schema) fails with its own status code rather than
+    a download cut off after a 200."""
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def chained():
+        if first is None:
+            return
+        yield first
+        async for row in rows:
+            yield row
+    return chained()
+
+
+async def download(report: Report, fmt: str, params: Mapping[str, Any], *,
+                   sessions=None) -> StreamingResponse:
+    rows = await _primed(report_rows(report, params, sessions=sessions))
+    return file_response(fmt, report.filename(params), report.columns, rows,
+                         sheet=report.title)
+
+
+# ---------------------------------------------------------------------------
+# Background jobs
+# ---------------------------------------------------------------------------
+
+_semaphore: Optional[asyncio.Semaphore] = None
+# Running job tasks, held so they are not garbage-collected mid-run.
+_tasks: set[asyncio.Task] = set()
+
+
+def job_path(job_id, fmt: str) -> Path:
+    return EXPORT_DIR / f"{job_id}.{fmt}"
+
+
+def _job_dict(r) -> dict:
+    return {
+        "id": str(r.id), "report": r.report, "format": r.format,
+        "params": r.params if isinstance(r.params, dict)
+        else json.loads(r.params or "{}"),
+        "status": r.status, "rows": int(r.rows or 0),
+        "bytes": int(r.bytes) if r.bytes is not None else None,
+        "error": r.error,
+        "created_at": r.created_at.isoformat() if r.created_at else None,
+        "finished_at": r.finished_at.isoformat() if r.finished_at else None,
+    }
+
+
+_JOB_COLUMNS = """id, report, format, params, status, rows, bytes, error,
+                  created_at, finished_at, created_by"""
+
+
+async def get_job(session: AsyncSession, job_id, user_id) -> dict:
+    """The job, if `user_id` started it; 404 otherwise."""
+    r = (await session.execute(
+        text(f"SELECT {_JOB_COLUMNS} FROM export_jobs "
+             "WHERE id = :id AND created_by = :u"),
+        {"id": str(job_id), "u": str(user_id)},
+    )).first()
+    if r is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _job_dict(r)
+
+
+async def list_jobs(session: AsyncSession, user_id, *,
+                    limit: int = 50) -> list[dict]:
+    rows = (await session.execute(
+        text(f"SELECT {_JOB_COLUMNS} FROM export_jobs WHERE created_by = :u "
+             "ORDER BY created_at DESC LIMIT :lim"),
+        {"u": str(user_id), "lim": limit},
+    )).fetchall()
+    return [_job_dict(r) for r in rows]
+
+
+def job_query(report: Report, query: Mapping[str, str]) -> dict:
+    """The report's parameters as given in the query string, validated.
+
+    Jobs keep these strings and parse them again when they run.
+    """
+    kept = {k: v for k, v in query.items() if k in report.params}
+    parse_params(report, kept)
+    return kept
+
+
+async def create_job(session: AsyncSession, report: Report, fmt: str,
+                     query: Mapping[str, str], user_id) -> uuid.UUID:
+    """Record a queued job. The caller commits, then calls `start_job`."""
+    job_id = uuid.uuid4()
+    await session.execute(
+        text("""INSERT INTO export_jobs (id, report, format, params, created_by)
+                VALUES (:id, :r, :f, CAST(:p AS jsonb), :u)"""),
+        {"id": str(job_id), "r": report.name, "f": fmt,
+         "p": json.dumps(dict(query)), "u": str(user_id)})
+    return job_id
+
+
+def start_job(job_id, report: Report, fmt: str,
+              query: Mapping[str, str]) -> asyncio.Task:
+    task = asyncio.create_task(_run_job(job_id, report, fmt, dict(query)))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def write_file(fmt: str, header: Sequence[str],
+                     rows: AsyncIterator[Iterable], path: Path, *,
+                     sheet: str = "Sheet1") -> int:
+    """Write the export to `path` via a `.partial` file renamed into place
+    once complete, so a download never sees half a file. Returns bytes."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    body = (csv_chunks(header, rows) if fmt == "csv"
+            else xlsx_chunks(header, rows, sheet=sheet))
+    size = 0
+    try:
+        with open(partial, "wb") as f:
+            async for chunk in body:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(partial, path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return size
+
+
+async def _set_job(sessions, job_id, **values) -> None:
+    sets = ", ".join(f"{k} = :{k}" for k in values)
+    async with sessions() as session:
+        await session.execute(
+            text(f"UPDATE export_jobs SET {sets}, updated_at = NOW() "
+                 "WHERE id = :id"),
+            {"id": str(job_id), **values})
+        await session.commit()
+
+
+async def _run_job(job_id, report: Report, fmt: str, query: dict, *,
+                   sessions=None, read_sessions=None) -> None:
+    global _semaphore
+    if sessions is None:
+        from app.db import AsyncSessionLocal as sessions
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(JOB_CONCURRENCY)
+    count = 0
+
+    async def counted(rows):
+        nonlocal count
+        async for row in rows:
+            yield row
+            count += 1
+            if count % JOB_PROGRESS_ROWS == 0:
+                await _set_job(sessions, job_id, rows=count)
+
+    async with _semaphore:
+        started = time.monotonic()
+        try:
+            await _set_job(sessions, job_id, status="running")
+            params = parse_params(report, query)
+            size = await write_file(
+                fmt, report.columns,
+                counted(report_rows(report, params, sessions=read_sessions)),
+                job_path(job_id, fmt), sheet=report.title)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            _LOG.exception("export job %s (%s) failed", job_id, report.name)
+            detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+            await _set_job(sessions, job_id, status="failed", rows=count,
+                           error=str(detail)[:1000],
+                           finished_at=datetime.now(timezone.utc))
+            return
+        await _set_job(sessions, job_id, status="done", rows=count,
+                       bytes=size, finished_at=datetime.now(timezone.utc))
+        elapsed = time.monotonic() - started
+        _LOG.info("export job %s: %s rows of %s in %.1fs (%.0f rows/s)",
+                  job_id, count, report.name, elapsed,
+                  count / elapsed if elapsed else 0)
+
+
+async def sweep(session: AsyncSession) -> int:
+    """Fail jobs that stopped reporting, delete expired ones and their files.
+
+    Returns the number of jobs deleted.
+    """
+    await session.execute(
+        text("""UPDATE export_jobs
+                   SET status = 'failed', finished_at = NOW(),
+                       error = 'Interrupted: the worker running it stopped'
+                 WHERE (status = 'running'
+                        AND updated_at < NOW() - make_interval(mins => :m))
+                    OR (status = 'queued'
+                        AND created_at < NOW() - make_interval(mins => :m))"""),
+        {"m": JOB_STALE_MINUTES})
+    expired = (await session.execute(
+        text("""DELETE FROM export_jobs
+                 WHERE created_at < NOW() - make_interval(secs => :s)
+                RETURNING id, format"""),
+        {"s": JOB_TTL_HOURS * 3600},
+    )).fetchall()
+    for r in expired:
+        path = job_path(r.id, r.format)
+        path.unlink(missing_ok=True)
+        path.with_name(path.name + ".partial").unlink(missing_ok=True)
+    return len(expired)
+
+
+async def run_sweeper() -> None:
+    """Background loop started by app.main on every worker."""
+    from app.db import AsyncSessionLocal
+
+    _LOG.info("Export sweeper started (every %ss)", SWEEP_SECONDS)
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                removed = await sweep(session)
+                await session.commit()
+            if removed:
+                _LOG.info("removed %d expired export(s)", removed)
+            await asyncio.sleep(SWEEP_SECONDS)
+        except asyncio.CancelledError:
+            _LOG.info("Export sweeper cancelled")
+            raise
+        except Exception:
+            _LOG.exception("Export sweeper iteration failed")
+            await asyncio.sleep(30)
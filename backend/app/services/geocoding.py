@@ -4,6 +4,10 @@ Free, no API key required. Respects Nominatim usage policy:
 - Sets a descriptive User-Agent
 - Caches results in-memory (rounded to 4 decimals ≈ 11m) to avoid duplicate hits
 - Hard timeout of 4 s; failures return None (best-effort)
+
+Request handlers do not call it directly. `geotag` stores the coordinates in
+the request's own transaction and queues the lookup in the outbox, whose
+dispatcher calls `fill_address` (and retries it) off the request path.
 """
 from __future__ import annotations
 
@@ -12,6 +16,8 @@ import logging
 from typing import Optional, Tuple
 
 import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
 _LOG = logging.getLogger("services.geocoding")
 
@@ -23,6 +29,17 @@ _CACHE: dict[Tuple[float, float], str] = {}
 _CACHE_MAX = 4096
 _LOCK = asyncio.Lock()
 
+# Where each kind of geotag lives: table, then lat, lng, accuracy and
+# address columns (added by the geo bootstrap in app.api.geo).
+LOCATION_COLUMNS = {
+    "attendance.clock_in": ("attendance", "clock_in_lat", "clock_in_lng",
+                            "clock_in_accuracy", "clock_in_address"),
+    "attendance.clock_out": ("attendance", "clock_out_lat", "clock_out_lng",
+                             "clock_out_accuracy", "clock_out_address"),
+    "audit_logs": ("audit_logs", "latitude", "longitude", "accuracy",
+                   "location_address"),
+}
+
 
 def _round_key(lat: float, lng: float) -> Tuple[float, float]:
     return (round(float(lat), 4), round(float(lng), 4))
@@ -76,3 +93,54 @@ async def reverse_geocode(lat: Optional[float], lng: Optional[float]) -> Optiona
     except (httpx.HTTPError, ValueError, asyncio.TimeoutError) as exc:
         _LOG.debug("reverse_geocode failed for %s,%s: %s", lat_f, lng_f, exc)
         return None
+
+
+async def geotag(
+    session: AsyncSession,
+    target: str,
+    row_id,
+    lat: Optional[float],
+    lng: Optional[float],
+    accuracy: Optional[float] = None,
+) -> None:
+    """Store a row's coordinates and queue its address lookup. Does not commit.
+
+    Best-effort, as before: the UPDATE runs in a savepoint, so a database
+    without the geo columns still records the clock-in or login itself.
+    """
+    if lat is None or lng is None:
+        return
+    table, lat_col, lng_col, acc_col, _ = LOCATION_COLUMNS[target]
+    savepoint = await session.begin_nested()
+    try:
+        await session.execute(
+            text(f"UPDATE {table} SET {lat_col} = :lat, {lng_col} = :lng, "
+                 f"{acc_col} = :acc WHERE id = :id"),
+            {"lat": lat, "lng": lng, "acc": accuracy, "id": row_id},
+        )
+        await savepoint.commit()
+    except Exception as exc:                              # noqa: BLE001
+        await savepoint.rollback()
+        _LOG.debug("geotag of %s %s skipped: %s", target, row_id, exc)
+        return
+    from app.services import outbox
+    await outbox.enqueue(session, "geocode", {
+        "target": target, "id": str(row_id),
+        "lat": float(lat), "lng": float(lng)})
+
+
+async def fill_address(session: AsyncSession, target: str, row_id,
+                       lat: float, lng: float) -> bool:
+    """Look up and store the address of a geotagged row. Does not commit.
+
+    False when no address could be found, so the caller can try again.
+    """
+    address = await reverse_geocode(lat, lng)
+    if address is None:
+        return False
+    table, *_, address_col = LOCATION_COLUMNS[target]
+    await session.execute(
+        text(f"UPDATE {table} SET {address_col} = :addr WHERE id = :id"),
+        {"addr": address, "id": str(row_id)},
+    )
+    return True
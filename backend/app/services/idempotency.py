@@ -0,0 +1,409 @@
+"""Idempotency-Key replay for the order, payment and stock-intake writes.
+
+A phone on a flaky connection resends a POST whose response it never saw.
+Each resend used to run the whole write again before anything noticed:
+  * stock locks and cost snapshots;
+  * invoice and payment rows;
+  * journal posting, until `already_posted` or a unique constraint
+    rejected it.
+A network blip became a burst of duplicate work, all contending for the same
+balance rows.
+
+A client that sends an `Idempotency-Key` header to one of `ROUTES` now gets
+at most one execution per key. `IdempotencyMiddleware`:
+
+1. claims the key, scoped to the method, path and caller (Authorization), and
+   fingerprints the request body;
+2. on a fresh claim runs the endpoint and stores its response if it is a 2xx.
+   Any other outcome releases the claim, so the client may try again;
+3. replays a stored response for a retry with the same body, marked
+   `Idempotent-Replayed: true`, without touching stock or the ledger;
+4. answers 409 (with Retry-After) while the first attempt is still running,
+   and 422 when the key is reused for a different body.
+
+Keys live IDEMPOTENCY_TTL_HOURS (default 24). A claim left behind by a
+worker that died mid-request is taken over after IDEMPOTENCY_LOCK_SECONDS
+(default 60). A request still running refreshes its claim every third of
+that, so a slow bulk upload is never run twice at once. Once a 2xx has been
+sent the key is completed even if the request is then cancelled, since the
+write has committed. Requests without the header, or to other routes, pass
+straight through.
+
+`PostgresIdempotencyStore` (table `idempotency_keys`, migration
+c8901234567b) is shared by every worker, and uses its own short
+transactions so that a claim is visible before the endpoint's work begins.
+Until the migration is applied, requests pass through unchanged.
+`MemoryIdempotencyStore` is the stand-in for development and tests. Select
+with IDEMPOTENCY_STORE=memory|postgres.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+_LOG = logging.getLogger("services.idempotency")
+
+HEADER = b"idempotency-key"
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")) * 3600
+LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+MAX_KEY_LENGTH = 255
+# Larger responses are not kept; a retry then gets 409 rather than a replay.
+MAX_STORED_BODY = 1024 * 1024
+_PRUNE_EVERY = 200
+
+# (method, path) pairs that honour the header.
+ROUTES = [
+    ("POST", re.compile(r"^/api/sales/orders/?$")),
+    ("PATCH", re.compile(r"^/api/sales/orders/[^/]+/mark-paid/?$")),
+    ("POST", re.compile(r"^/api/public/orders/?$")),
+    ("POST", re.compile(r"^/api/payment-tracking/invoices/from-order/[^/]+/?$")),
+    ("POST", re.compile(r"^/api/payment-tracking/invoices/[^/]+/payments/?$")),
+    ("POST", re.compile(r"^/api/stock/intake(/raw-material)?/?$")),
+    ("POST", re.compile(
+        r"^/api/stock-management/(product|raw-material)-intake/?$")),
+    ("POST", re.compile(
+        r"^/api/bulk-upload/(product|raw-material)-stock-intake/?$")),
+]
+
+
+def covers(method: str, path: str) -> bool:
+    return any(m == method and p.match(path) for m, p in ROUTES)
+
+
+@dataclass(frozen=True)
+class Claim:
+    """Outcome of claiming a key: new, replay, busy or mismatch."""
+    state: str
+    status_code: Optional[int] = None
+    content_type: Optional[str] = None
+    body: Optional[bytes] = None
+
+
+class MemoryIdempotencyStore:
+    """Per-process store, for development and tests."""
+
+    def __init__(self):
+        self._keys: dict[str, dict] = {}
+
+    async def claim(self, key: str, request_hash: str, method: str,
+                    path: str) -> Claim:
+        now = time.monotonic()
+        row = self._keys.get(key)
+        if (row is None or row["expires"] < now
+                or (row["status_code"] is None
+                    and row["claimed"] < now - LOCK_SECONDS
+                    and row["hash"] == request_hash)):
+            self._keys[key] = {"hash": request_hash, "claimed": now,
+                               "expires": now + TTL_SECONDS,
+                               "status_code": None, "content_type": None,
+                               "body": None}
+            return Claim("new")
+        return _decide(row["hash"], request_hash, row["status_code"],
+                       row["content_type"], row["body"])
+
+    async def complete(self, key: str, request_hash: str, status_code: int,
+                       content_type: Optional[str],
+                       body: Optional[bytes]) -> None:
+        row = self._keys.get(key)
+        if row is not None and row["hash"] == request_hash:
+            row.update(status_code=status_code, content_type=content_type,
+                       body=body)
+
+    async def refresh(self, key: str, request_hash: str) -> None:
+        row = self._keys.get(key)
+        if (row is not None and row["hash"] == request_hash
+                and row["status_code"] is None):
+            row["claimed"] = time.monotonic()
+
+    async def release(self, key: str) -> None:
+        row = self._keys.get(key)
+        if row is not None and row["status_code"] is None:
+            del self._keys[key]
+
+
+class PostgresIdempotencyStore:
+    """Keys shared by every worker through Postgres."""
+
+    def __init__(self, session_factory: Optional[Callable] = None):
+        self._session_factory = session_factory
+        self._ready = False
+        self._calls = 0
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from app.db import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory()
+
+    async def _is_ready(self, s) -> bool:
+        if not self._ready:
+            self._ready = bool((await s.execute(text(
+                "SELECT to_regclass('public.idempotency_keys') IS NOT NULL"
+            ))).scalar())
+        return self._ready
+
+    async def claim(self, key: str, request_hash: str, method: str,
+                    path: str) -> Claim:
+        async with self._sessions() as s:
+            if not await self._is_ready(s):
+                return Claim("unavailable")
+            # Inserts a new claim, or takes over an expired one or one whose
+            # worker died mid-request; otherwise returns nothing.
+            taken = (await s.execute(
+                text("""
+                    INSERT INTO idempotency_keys
+                        (scope_key, request_hash, method, path, created_at,
+                         expires_at)
+                    VALUES (:k, :h, :m, :p, NOW(),
+                            NOW() + make_interval(secs => :ttl))
+                    ON CONFLICT (scope_key) DO UPDATE SET
+                        request_hash = EXCLUDED.request_hash,
+                        created_at = NOW(),
+                        expires_at = EXCLUDED.expires_at,
+                        status_code = NULL, content_type = NULL,
+                        response_body = NULL, completed_at = NULL
+                     WHERE idempotency_keys.expires_at < NOW()
+                        OR (idempotency_keys.status_code IS NULL
+                            AND idempotency_keys.request_hash
+                                = EXCLUDED.request_hash
+                            AND idempotency_keys.created_at
+                                < NOW() - make_interval(secs => :stale))
+                    RETURNING scope_key
+                """),
+                {"k": key, "h": request_hash, "m": method, "p": path[:255],
+                 "ttl": TTL_SECONDS, "stale": LOCK_SECONDS},
+            )).first()
+            if taken is not None:
+                self._calls += 1
+                if self._calls % _PRUNE_EVERY == 0:
+                    await s.execute(text(
+                        "DELETE FROM idempotency_keys WHERE expires_at < NOW()"))
+                await s.commit()
+                return Claim("new")
+            row = (await s.execute(
+                text("""
+                    SELECT request_hash, status_code, content_type,
+                           response_body
+                      FROM idempotency_keys WHERE scope_key = :k
+                """),
+                {"k": key},
+            )).first()
+            await s.commit()
+        if row is None:
+            # Released between the two statements: let the client retry.
+            return Claim("busy")
+        return _decide(row.request_hash, request_hash, row.status_code,
+                       row.content_type, row.response_body)
+
+    async def complete(self, key: str, request_hash: str, status_code: int,
+                       content_type: Optional[str],
+                       body: Optional[bytes]) -> None:
+        async with self._sessions() as s:
+            await s.execute(
+                text("""
+                    UPDATE idempotency_keys
+                       SET status_code = :st, content_type = :ct,
+                           response_body = :body, completed_at = NOW()
+                     WHERE scope_key = :k AND request_hash = :h
+                """),
+                {"k": key, "h": request_hash, "st": status_code,
+                 "ct": content_type, "body": body},
+            )
+            await s.commit()
+
+    async def refresh(self, key: str, request_hash: str) -> None:
+        async with self._sessions() as s:
+            await s.execute(
+                text("""
+                    UPDATE idempotency_keys SET created_at = NOW()
+                     WHERE scope_key = :k AND request_hash = :h
+                       AND status_code IS NULL
+                """),
+                {"k": key, "h": request_hash},
+            )
+            await s.commit()
+
+    async def release(self, key: str) -> None:
+        async with self._sessions() as s:
+            await s.execute(
+                text("DELETE FROM idempotency_keys "
+                     "WHERE scope_key = :k AND status_code IS NULL"),
+                {"k": key},
+            )
+            await s.commit()
+
+
+def _decide(stored_hash: str, request_hash: str, status_code: Optional[int],
+            content_type: Optional[str], body: Optional[bytes]) -> Claim:
+    if stored_hash != request_hash:
+        return Claim("mismatch")
+    if status_code is None or body is None:
+        return Claim("busy")
+    return Claim("replay", status_code, content_type, bytes(body))
+
+
+def build_store():
+    """The store selected by IDEMPOTENCY_STORE (default: postgres)."""
+    kind = os.getenv("IDEMPOTENCY_STORE", "postgres").strip().lower()
+    if kind == "memory":
+        return MemoryIdempotencyStore()
+    return PostgresIdempotencyStore()
+
+
+def _scope_key(method: str, path: str, authorization: bytes,
+               key: bytes) -> str:
+    h = hashlib.sha256()
+    for part in (method.encode(), path.encode(), authorization, key):
+        h.update(len(part).to_bytes(4, "big") + part)
+    return h.hexdigest()
+
+
+async def _json(send, status: int, detail: str,
+                extra: Optional[list] = None) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            *(extra or [])]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware; see the module docstring."""
+
+    def __init__(self, app, *, store=None):
+        self.app = app
+        self.store = store if store is not None else build_store()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not covers(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or ())
+        raw_key = headers.get(HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key.strip() or len(raw_key) > MAX_KEY_LENGTH:
+            await _json(send, 400, "Idempotency-Key must be 1-255 characters.")
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        request_hash = hashlib.sha256(body).hexdigest()
+        key = _scope_key(scope["method"], scope["path"],
+                         headers.get(b"authorization", b""), raw_key.strip())
+
+        try:
+            claim = await self.store.claim(key, request_hash, scope["method"],
+                                           scope["path"])
+        except Exception as e:                            # noqa: BLE001
+            # Losing the store must not stop orders being taken; without it
+            # requests simply run as they did before keys existed.
+            _LOG.warning("idempotency store unavailable: %s", e)
+            claim = Claim("unavailable")
+
+        if claim.state == "replay":
+            await send({"type": "http.response.start",
+                        "status": claim.status_code,
+                        "headers": [
+                            (b"content-type", (claim.content_type
+                                               or "application/json").encode()),
+                            (b"content-length", str(len(claim.body)).encode()),
+                            (b"idempotent-replayed", b"true")]})
+            await send({"type": "http.response.body", "body": claim.body})
+            return
+        if claim.state == "busy":
+            await _json(send, 409, "A request with this Idempotency-Key is "
+                        "still being processed.", [(b"retry-after", b"1")])
+            return
+        if claim.state == "mismatch":
+            await _json(send, 422, "This Idempotency-Key was already used "
+                        "for a different request.")
+            return
+
+        sent_body = False
+
+        async def replay_receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body,
+                        "more_body": False}
+            return await receive()
+
+        if claim.state != "new":
+            await self.app(scope, replay_receive, send)
+            return
+
+        response = {"status": None, "content_type": None, "body": [],
+                    "size": 0, "done": False}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response["size"] += len(chunk)
+                if response["size"] <= MAX_STORED_BODY:
+                    response["body"].append(chunk)
+                response["done"] = not message.get("more_body", False)
+            await send(message)
+
+        keep = asyncio.create_task(self._keep_claim(key, request_hash))
+        try:
+            await self.app(scope, replay_receive, capture)
+        except BaseException:
+            # A 2xx already started means the write committed: complete the
+            # key so a retry is not run again, with the body if it is whole.
+            stored = (b"".join(response["body"])
+                      if response["done"] and response["size"] <= MAX_STORED_BODY
+                      else None)
+            await self._settle(key, request_hash, response["status"],
+                               response["content_type"], stored)
+            raise
+        finally:
+            keep.cancel()
+        status = response["status"]
+        stored = (b"".join(response["body"])
+                  if response["size"] <= MAX_STORED_BODY else None)
+        await self._settle(key, request_hash, status,
+                           response["content_type"], stored)
+
+    async def _keep_claim(self, key, request_hash) -> None:
+        while True:
+            await asyncio.sleep(LOCK_SECONDS / 3)
+            try:
+                await self.store.refresh(key, request_hash)
+            except Exception as e:                        # noqa: BLE001
+                _LOG.warning("could not refresh idempotency key: %s", e)
+
+    async def _settle(self, key, request_hash, status, content_type,
+                      body) -> None:
+        try:
+            if status is not None and 200 <= status < 300:
+                await self.store.complete(key, request_hash, status,
+                                          content_type, body)
+            else:
+                await self.store.release(key)
+        except Exception as e:                            # noqa: BLE001
+            _LOG.warning("could not settle idempotency key: %s", e)
@@ -22,14 +22,18 @@ completely or not at all.
 """
 from __future__ import annotations
 
+import uuid
+from dataclasses import dataclass
 from decimal import Decimal
-from typing import Optional
+from typing import Any, Optional, Sequence
 from uuid import UUID
 
 from fastapi import HTTPException
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.services import low_stock
+
 # Direction of each movement type. A type absent from this map is rejected
 # rather than silently ignored -- the old code had an if/elif chain where an
 # unrecognised type changed nothing and returned success.
@@ -60,6 +64,51 @@ def _as_decimal(value) -> Decimal:
     return Decimal(str(value))
 
 
+def _checked(movement_type: str, quantity, product_id,
+             raw_material_id) -> tuple[int, Decimal]:
+    """Validate one movement; returns its direction and magnitude."""
+    if (product_id is None) == (raw_material_id is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Exactly one of product_id or raw_material_id must be given.",
+        )
+
+    direction = MOVEMENT_DIRECTION.get(movement_type)
+    if direction is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown movement_type {movement_type!r}. "
+                   f"Expected one of: {', '.join(sorted(MOVEMENT_DIRECTION))}",
+        )
+
+    qty = _as_decimal(quantity)
+    if qty <= 0:
+        # Direction is carried by movement_type, never by the sign of the
+        # quantity -- mixing the two conventions corrupts every aggregate.
+        raise HTTPException(
+            status_code=400,
+            detail="Quantity must be a positive magnitude; "
+                   "use movement_type to indicate direction.",
+        )
+    return direction, qty
+
+
+def _insufficient(current: Decimal, qty: Decimal):
+    raise HTTPException(
+        status_code=400,
+        detail=(f"Insufficient stock. Available: {current}, "
+                f"requested: {qty}."),
+    )
+
+
+# Per item column: the partial unique index ON CONFLICT targets.
+_CONFLICT = {
+    "product_id": "(warehouse_id, product_id) WHERE product_id IS NOT NULL",
+    "raw_material_id":
+        "(warehouse_id, raw_material_id) WHERE raw_material_id IS NOT NULL",
+}
+
+
 async def _lock_or_create_level(
     session: AsyncSession,
     warehouse_id: UUID,
@@ -73,11 +122,10 @@ async def _lock_or_create_level(
     two concurrent first-time writers would each insert a row.
     """
     if product_id is not None:
-        item_col, item_id, conflict = "product_id", product_id, (
-            "(warehouse_id, product_id) WHERE product_id IS NOT NULL")
+        item_col, item_id = "product_id", product_id
     else:
-        item_col, item_id, conflict = "raw_material_id", raw_material_id, (
-            "(warehouse_id, raw_material_id) WHERE raw_material_id IS NOT NULL")
+        item_col, item_id = "raw_material_id", raw_material_id
+    conflict = _CONFLICT[item_col]
 
     await session.execute(
         text(f"""
@@ -130,29 +178,8 @@ async def apply_stock_movement(
 
     Returns the new `stock_movements` row id. Does not commit.
     """
-    if (product_id is None) == (raw_material_id is None):
-        raise HTTPException(
-            status_code=400,
-            detail="Exactly one of product_id or raw_material_id must be given.",
-        )
-
-    direction = MOVEMENT_DIRECTION.get(movement_type)
-    if direction is None:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unknown movement_type {movement_type!r}. "
-                   f"Expected one of: {', '.join(sorted(MOVEMENT_DIRECTION))}",
-        )
-
-    qty = _as_decimal(quantity)
-    if qty <= 0:
-        # Direction is carried by movement_type, never by the sign of the
-        # quantity -- mixing the two conventions corrupts every aggregate.
-        raise HTTPException(
-            status_code=400,
-            detail="Quantity must be a positive magnitude; "
-                   "use movement_type to indicate direction.",
-        )
+    direction, qty = _checked(movement_type, quantity, product_id,
+                              raw_material_id)
 
     level = await _lock_or_create_level(
         session, warehouse_id, product_id, raw_material_id)
@@ -161,20 +188,25 @@ async def apply_stock_movement(
     new_balance = current + (qty * direction)
 
     if new_balance < 0 and not allow_negative:
-        raise HTTPException(
-            status_code=400,
-            detail=(f"Insufficient stock. Available: {current}, "
-                    f"requested: {qty}."),
-        )
-
-    await session.execute(
-        text("""
-            UPDATE stock_levels
+        _insufficient(current, qty)
+
+    # With the low-stock list in place, the UPDATE also hands back the row's
+    # reorder level, so spotting a crossing costs no extra round trip.
+    watch = await low_stock.ready(session)
+    returning = (f"RETURNING {low_stock.threshold_sql(product_id)}"
+                 if watch else "")
+    updated = await session.execute(
+        text(f"""
+            UPDATE stock_levels sl
                SET current_stock = :bal, updated_at = NOW()
-             WHERE id = :lid
+             WHERE sl.id = :lid
+            {returning}
         """),
         {"bal": str(new_balance), "lid": str(level.id)},
     )
+    if watch:
+        await low_stock.evaluate(
+            session, level.id, current, new_balance, updated.scalar())
 
     movement_id = (await session.execute(
         text("""
@@ -201,6 +233,155 @@ async def apply_stock_movement(
     return movement_id
 
 
+@dataclass(frozen=True)
+class Movement:
+    """One movement for `apply_stock_movements`; fields as `apply_stock_movement`."""
+    warehouse_id: UUID
+    movement_type: str
+    quantity: Any
+    product_id: Optional[UUID] = None
+    raw_material_id: Optional[UUID] = None
+    reference: Optional[str] = None
+    notes: Optional[str] = None
+    created_by: Optional[UUID] = None
+    unit_cost: Any = None
+    allow_negative: bool = False
+
+    @property
+    def level_key(self) -> tuple[str, str, str]:
+        """(item column, warehouse id, item id): one balance row."""
+        if self.product_id is not None:
+            return "product_id", str(self.warehouse_id), str(self.product_id)
+        return ("raw_material_id", str(self.warehouse_id),
+                str(self.raw_material_id))
+
+
+async def apply_stock_movements(
+    session: AsyncSession,
+    movements: Sequence[Movement],
+) -> list[UUID]:
+    """Apply many movements at once, with every guarantee of the single path.
+
+    For a batch such as a production completion consuming dozens of
+    materials, this costs a fixed handful of statements instead of four per
+    movement, so the balance locks are held for far less time:
+
+      * one upsert per item type creates any missing balance rows;
+      * one SELECT ... FOR UPDATE per item type locks every balance, in id
+        order so that two batches cannot deadlock each other;
+      * one UPDATE writes every new balance;
+      * one batched INSERT writes the ledger.
+
+    Movements apply in the order given, so several on the same balance
+    compose (booking damaged output in, then writing it off). If any of them
+    would take a balance negative, the whole batch is rejected before any
+    balance is written. Returns the `stock_movements` ids in input order.
+    Does not commit.
+    """
+    if not movements:
+        return []
+    checked = [(m, *_checked(m.movement_type, m.quantity, m.product_id,
+                             m.raw_material_id)) for m in movements]
+
+    keys_by_col: dict[str, set] = {}
+    for m, _, _ in checked:
+        col, wid, iid = m.level_key
+        keys_by_col.setdefault(col, set()).add((wid, iid))
+
+    levels: dict[tuple, Any] = {}
+    for col in sorted(keys_by_col):
+        keys = sorted(keys_by_col[col])
+        await session.execute(
+            text(f"""
+                INSERT INTO stock_levels
+                    (id, warehouse_id, {col}, current_stock,
+                     reserved_stock, min_stock, max_stock, updated_at)
+                VALUES (gen_random_uuid(), :wid, :iid, 0, 0, 0, 0, NOW())
+                ON CONFLICT {_CONFLICT[col]} DO NOTHING
+            """),
+            [{"wid": wid, "iid": iid} for wid, iid in keys],
+        )
+        rows = (await session.execute(
+            text(f"""
+                SELECT sl.id, sl.warehouse_id, sl.{col} AS item_id,
+                       sl.current_stock
+                  FROM stock_levels sl
+                  JOIN unnest(CAST(:wids AS uuid[]), CAST(:iids AS uuid[]))
+                       AS k(wid, iid)
+                    ON sl.warehouse_id = k.wid AND sl.{col} = k.iid
+                 ORDER BY sl.id
+                   FOR UPDATE OF sl
+            """),
+            {"wids": [k[0] for k in keys], "iids": [k[1] for k in keys]},
+        )).fetchall()
+        if len(rows) != len(keys):
+            raise HTTPException(
+                status_code=409,
+                detail="Stock level row disappeared during update; please retry.",
+            )
+        for r in rows:
+            levels[(col, str(r.warehouse_id), str(r.item_id))] = r
+
+    opening: dict[tuple, Decimal] = {}
+    balances: dict[tuple, Decimal] = {}
+    for m, direction, qty in checked:
+        key = m.level_key
+        if key not in balances:
+            opening[key] = balances[key] = _as_decimal(
+                levels[key].current_stock or 0)
+        current = balances[key]
+        new_balance = current + (qty * direction)
+        if new_balance < 0 and not m.allow_negative:
+            _insufficient(current, qty)
+        balances[key] = new_balance
+
+    watch = await low_stock.ready(session)
+    returning = f"RETURNING sl.id, {low_stock.THRESHOLD_SQL}" if watch else ""
+    updated = await session.execute(
+        text(f"""
+            UPDATE stock_levels sl
+               SET current_stock = v.bal, updated_at = NOW()
+              FROM unnest(CAST(:ids AS uuid[]), CAST(:bals AS numeric[]))
+                   AS v(id, bal)
+             WHERE sl.id = v.id
+            {returning}
+        """),
+        {"ids": [str(levels[k].id) for k in balances],
+         "bals": list(balances.values())},
+    )
+    if watch:
+        reorder_levels = {str(r[0]): r[1] for r in updated.fetchall()}
+        for key, new_balance in balances.items():
+            level_id = levels[key].id
+            await low_stock.evaluate(session, level_id, opening[key],
+                                     new_balance, reorder_levels.get(str(level_id)))
+
+    ids = [uuid.uuid4() for _ in checked]
+    await session.execute(
+        text("""
+            INSERT INTO stock_movements
+                (id, warehouse_id, product_id, raw_material_id, movement_type,
+                 quantity, unit_cost, reference, notes, created_by, created_at)
+            VALUES (:id, :wid, :pid, :rmid, :mtype,
+                    :qty, :cost, :ref, :notes, :by, NOW())
+        """),
+        [{
+            "id": str(mid),
+            "wid": str(m.warehouse_id),
+            "pid": str(m.product_id) if m.product_id else None,
+            "rmid": str(m.raw_material_id) if m.raw_material_id else None,
+            "mtype": m.movement_type,
+            "qty": str(qty),
+            "cost": (str(_as_decimal(m.unit_cost))
+                     if m.unit_cost is not None else None),
+            "ref": m.reference,
+            "notes": m.notes,
+            "by": str(m.created_by) if m.created_by else None,
+        } for mid, (m, _, qty) in zip(ids, checked)],
+    )
+    return ids
+
+
 async def transfer_stock(
     session: AsyncSession,
     *,
@@ -22,6 +22,7 @@ place a balance is 'fixed up' -- fix the source, then post a correction.
 """
 from __future__ import annotations
 
+import base64
 from dataclasses import dataclass
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
@@ -109,6 +110,26 @@ async def assert_period_open(session: AsyncSession, on: date) -> None:
 # Posting
 # ---------------------------------------------------------------------------
 
+_lines_dated: Optional[bool] = None
+
+
+async def _lines_carry_date(session: AsyncSession) -> bool:
+    """Has migration d9012345678c given journal lines their entry date?
+
+    It is the lines' partition key from then on. A True result is cached.
+    """
+    global _lines_dated
+    if _lines_dated:
+        return True
+    found = (await session.execute(text("""
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'gl_journal_lines'
+                          AND column_name = 'entry_date')
+    """))).scalar()
+    _lines_dated = bool(found)
+    return _lines_dated
+
+
 async def _next_entry_number(session: AsyncSession, on: date) -> str:
     # Sequence per month, collision-safe: the unique index on entry_number is
     # the real guard, and the random suffix makes a retry succeed rather than
@@ -196,20 +217,24 @@ async def post_entry(
         },
     )
 
+    dated = await _lines_carry_date(session)
     for n, (account_id, debit, credit, ln) in enumerate(prepared, start=1):
+        params = {
+            "eid": str(entry_id), "aid": str(account_id),
+            "dr": str(debit), "cr": str(credit),
+            "desc": ln.description, "cc": ln.cost_centre, "n": n,
+        }
+        if dated:
+            params["dt"] = entry_date
         await session.execute(
-            text("""
+            text(f"""
                 INSERT INTO gl_journal_lines
                     (id, entry_id, account_id, debit, credit, description,
-                     cost_centre, line_number)
+                     cost_centre, line_number{", entry_date" if dated else ""})
                 VALUES (gen_random_uuid(), :eid, :aid, :dr, :cr, :desc,
-                        :cc, :n)
+                        :cc, :n{", :dt" if dated else ""})
             """),
-            {
-                "eid": str(entry_id), "aid": str(account_id),
-                "dr": str(debit), "cr": str(credit),
-                "desc": ln.description, "cc": ln.cost_centre, "n": n,
-            },
+            params,
         )
 
     return entry_id
@@ -289,13 +314,7 @@ async def reverse_entry(
 # Reporting
 # ---------------------------------------------------------------------------
 
-async def trial_balance(
-    session: AsyncSession,
-    *,
-    start: Optional[date] = None,
-    end: Optional[date] = None,
-) -> dict:
-    """Debits and credits per account. Must always balance in total."""
+def _trial_balance_sql(start: Optional[date], end: Optional[date]):
     clauses, params = ["e.status <> 'DRAFT'"], {}
     if start:
         clauses.append("e.entry_date >= :start")
@@ -303,36 +322,46 @@ async def trial_balance(
     if end:
         clauses.append("e.entry_date <= :end")
         params["end"] = end
+    return text(f"""
+        SELECT a.code, a.name, a.account_type, a.normal_balance,
+               COALESCE(SUM(l.debit), 0)  AS debit,
+               COALESCE(SUM(l.credit), 0) AS credit
+          FROM gl_journal_lines l
+          JOIN gl_journal_entries e ON e.id = l.entry_id
+          JOIN gl_accounts a        ON a.id = l.account_id
+         WHERE {' AND '.join(clauses)}
+         GROUP BY a.code, a.name, a.account_type, a.normal_balance
+         HAVING COALESCE(SUM(l.debit), 0) <> 0
+             OR COALESCE(SUM(l.credit), 0) <> 0
+         ORDER BY a.code
+    """), params
+
+
+def _trial_balance_row(r) -> dict:
+    dr, cr = money(r.debit), money(r.credit)
+    # Net balance expressed on the account's normal side, so an asset
+    # reads positive when it holds value rather than when it is debited.
+    net = (dr - cr) if r.normal_balance == 'DEBIT' else (cr - dr)
+    return {
+        "code": r.code, "name": r.name, "account_type": r.account_type,
+        "debit": float(dr), "credit": float(cr), "balance": float(net),
+    }
 
-    rows = (await session.execute(
-        text(f"""
-            SELECT a.code, a.name, a.account_type, a.normal_balance,
-                   COALESCE(SUM(l.debit), 0)  AS debit,
-                   COALESCE(SUM(l.credit), 0) AS credit
-              FROM gl_journal_lines l
-              JOIN gl_journal_entries e ON e.id = l.entry_id
-              JOIN gl_accounts a        ON a.id = l.account_id
-             WHERE {' AND '.join(clauses)}
-             GROUP BY a.code, a.name, a.account_type, a.normal_balance
-             HAVING COALESCE(SUM(l.debit), 0) <> 0
-                 OR COALESCE(SUM(l.credit), 0) <> 0
-             ORDER BY a.code
-        """),
-        params,
-    )).fetchall()
+
+async def trial_balance(
+    session: AsyncSession,
+    *,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> dict:
+    """Debits and credits per account. Must always balance in total."""
+    rows = (await session.execute(*_trial_balance_sql(start, end))).fetchall()
 
     accounts, td, tc = [], Decimal("0.00"), Decimal("0.00")
     for r in rows:
-        dr, cr = money(r.debit), money(r.credit)
-        td += dr
-        tc += cr
-        # Net balance expressed on the account's normal side, so an asset
-        # reads positive when it holds value rather than when it is debited.
-        net = (dr - cr) if r.normal_balance == 'DEBIT' else (cr - dr)
-        accounts.append({
-            "code": r.code, "name": r.name, "account_type": r.account_type,
-            "debit": float(dr), "credit": float(cr), "balance": float(net),
-        })
+        td += money(r.debit)
+        tc += money(r.credit)
+        accounts.append(_trial_balance_row(r))
 
     return {
         "accounts": accounts,
@@ -345,6 +374,20 @@ async def trial_balance(
     }
 
 
+async def iter_trial_balance(
+    session: AsyncSession,
+    *,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """`trial_balance` accounts, streamed from a server-side cursor."""
+    sql, params = _trial_balance_sql(start, end)
+    result = await session.stream(
+        sql.execution_options(yield_per=1000), params)
+    async for r in result:
+        yield _trial_balance_row(r)
+
+
 async def _type_totals(session, account_type, start, end) -> Decimal:
     clauses, params = ["e.status <> 'DRAFT'", "a.account_type = :t"], {
         "t": account_type}
@@ -435,63 +478,227 @@ async def balance_sheet(
     }
 
 
-async def account_ledger(
-    session: AsyncSession, *, account_code: str,
-    start: Optional[date] = None, end: Optional[date] = None,
-) -> dict:
-    """Every movement on one account, with a running balance."""
-    rows = (await session.execute(
-        text("""
-            SELECT e.entry_number, e.entry_date, e.description,
-                   e.source_module, e.source_reference,
-                   l.debit, l.credit, l.description AS line_description
-              FROM gl_journal_lines l
-              JOIN gl_journal_entries e ON e.id = l.entry_id
-              JOIN gl_accounts a        ON a.id = l.account_id
-             WHERE a.code = :code
-               AND e.status <> 'DRAFT'
-               AND (CAST(:start AS date) IS NULL OR e.entry_date >= :start)
-               AND (CAST(:end AS date)   IS NULL OR e.entry_date <= :end)
-             -- e.seq, not entry_number or posted_at: the number carries a
-             -- random collision-safety suffix, and NOW() is transaction time
-             -- so entries in one transaction share it. Only the sequence
-             -- gives a stable insertion order for the running balance.
-             ORDER BY e.entry_date, e.seq, l.line_number
-        """),
-        {"code": account_code, "start": start, "end": end},
-    )).fetchall()
+LEDGER_PAGE = 200
+
+
+def _encode_cursor(on: date, seq: int, line_number: int) -> str:
+    raw = f"{on.isoformat()}.{seq}.{line_number}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
 
+def _decode_cursor(cursor: str) -> tuple[date, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        on, seq, line_number = raw.decode().split(".")
+        return date.fromisoformat(on), int(seq), int(line_number)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid ledger cursor.")
+
+
+async def _ledger_account(session: AsyncSession, account_code: str):
     acct = (await session.execute(
-        text("SELECT code, name, account_type, normal_balance "
+        text("SELECT id, code, name, account_type, normal_balance "
              "FROM gl_accounts WHERE code = :c"),
         {"c": account_code},
     )).first()
     if acct is None:
         raise HTTPException(status_code=404, detail="Account not found.")
+    return acct
+
+
+def _ledger_lines_sql(dated: bool, *, after: bool, limit: bool) -> str:
+    """The account's posted lines in ledger order, within the window.
+
+    With lines carrying their entry date (migration d9012345678c), the date
+    bounds prune the lines' monthly partitions, and the index from migration
+    f1234567890e returns them in date order for the keyset.
+    """
+    d = "l.entry_date" if dated else "e.entry_date"
+    return f"""
+        SELECT e.entry_number, {d} AS entry_date, e.seq, l.line_number,
+               e.description, e.source_module, e.source_reference,
+               l.debit, l.credit, l.description AS line_description
+          FROM gl_journal_lines l
+          JOIN gl_journal_entries e ON e.id = l.entry_id
+         WHERE l.account_id = :aid
+           AND e.status <> 'DRAFT'
+           AND (CAST(:start AS date) IS NULL OR {d} >= :start)
+           AND (CAST(:end AS date)   IS NULL OR {d} <= :end)
+           {f"AND {d} >= :cd AND ({d}, e.seq, l.line_number) > (:cd, :cs, :cn)"
+            if after else ""}
+         -- e.seq, not entry_number or posted_at: the number carries a
+         -- random collision-safety suffix, and NOW() is transaction time
+         -- so entries in one transaction share it. Only the sequence
+         -- gives a stable insertion order for the running balance.
+         ORDER BY {d}, e.seq, l.line_number
+         {"LIMIT :limit" if limit else ""}
+    """
+
+
+def _ledger_row(r, balance: Decimal) -> dict:
+    return {
+        "entry_number": r.entry_number,
+        "date": str(r.entry_date),
+        "description": r.line_description or r.description,
+        "source": r.source_module,
+        "reference": r.source_reference,
+        "debit": float(money(r.debit)), "credit": float(money(r.credit)),
+        "balance": float(balance),
+    }
+
+
+async def _ledger_balances(session: AsyncSession, acct, *,
+                           start: Optional[date], end: Optional[date],
+                           cursor: Optional[tuple[date, int, int]] = None,
+                           ) -> tuple[Decimal, Decimal, Decimal]:
+    """(opening, closing, brought forward) for a ledger window.
+
+    Opening is the balance before `start`, closing the balance at the end of
+    `end`, and brought forward the balance just after the `cursor` line.
+    They are read from `gl_account_daily_balances` in one aggregate, plus
+    the cursor day's own lines.
+    """
+    sign = Decimal(1) if acct.normal_balance == 'DEBIT' else Decimal(-1)
+    row = (await session.execute(text("""
+        SELECT COALESCE(SUM(b.debit - b.credit)
+                        FILTER (WHERE b.entry_date < :start), 0) AS opening,
+               COALESCE(SUM(b.debit - b.credit)
+                        FILTER (WHERE CAST(:end AS date) IS NULL
+                                   OR b.entry_date <= :end), 0) AS closing,
+               COALESCE(SUM(b.debit - b.credit)
+                        FILTER (WHERE b.entry_date < :cd), 0) AS forward
+          FROM gl_account_daily_balances b
+         WHERE b.account_id = :aid
+    """), {"aid": acct.id, "start": start, "end": end,
+           "cd": cursor[0] if cursor else None})).first()
+    opening, closing = money(row.opening) * sign, money(row.closing) * sign
+    if cursor is None:
+        return opening, closing, opening
+
+    d = "l.entry_date" if await _lines_carry_date(session) else "e.entry_date"
+    same_day = (await session.execute(text(f"""
+        SELECT COALESCE(SUM(l.debit - l.credit), 0)
+          FROM gl_journal_lines l
+          JOIN gl_journal_entries e ON e.id = l.entry_id
+         WHERE l.account_id = :aid AND e.status <> 'DRAFT'
+           AND {d} = :cd AND (e.seq, l.line_number) <= (:cs, :cn)
+    """), {"aid": acct.id, "cd": cursor[0], "cs": cursor[1],
+           "cn": cursor[2]})).scalar()
+    return opening, closing, (money(row.forward) + money(same_day)) * sign
+
+
+async def account_ledger(
+    session: AsyncSession, *, account_code: str,
+    start: Optional[date] = None, end: Optional[date] = None,
+    cursor: Optional[str] = None, limit: int = LEDGER_PAGE,
+) -> dict:
+    """One page of movements on an account, with a running balance.
+
+    Pages follow a keyset on (entry date, entry sequence, line number): pass
+    a page's `next_cursor` to get the next one, which costs the same however
+    deep it is. Balances include everything posted before `start`;
+    `opening_balance` and `closing_balance` are those of the whole window.
+    """
+    acct = await _ledger_account(session, account_code)
+    after = _decode_cursor(cursor) if cursor else None
+    opening, closing, running = await _ledger_balances(
+        session, acct, start=start, end=end, cursor=after)
+
+    params = {"aid": acct.id, "start": start, "end": end, "limit": limit + 1}
+    if after:
+        params.update(cd=after[0], cs=after[1], cn=after[2])
+    dated = await _lines_carry_date(session)
+    rows = (await session.execute(
+        text(_ledger_lines_sql(dated, after=after is not None, limit=True)),
+        params)).fetchall()
 
-    running = Decimal("0.00")
+    debit_normal = acct.normal_balance == 'DEBIT'
     entries = []
-    for r in rows:
+    for r in rows[:limit]:
         dr, cr = money(r.debit), money(r.credit)
-        running += (dr - cr) if acct.normal_balance == 'DEBIT' else (cr - dr)
-        entries.append({
-            "entry_number": r.entry_number,
-            "date": str(r.entry_date),
-            "description": r.line_description or r.description,
-            "source": r.source_module,
-            "reference": r.source_reference,
-            "debit": float(dr), "credit": float(cr),
-            "balance": float(running),
-        })
+        running += (dr - cr) if debit_normal else (cr - dr)
+        entries.append(_ledger_row(r, running))
 
+    last = rows[limit - 1] if len(rows) > limit else None
     return {
         "account": {"code": acct.code, "name": acct.name,
                     "type": acct.account_type},
+        "opening_balance": float(opening),
         "entries": entries,
-        "closing_balance": float(running),
+        "closing_balance": float(closing),
+        "next_cursor": (_encode_cursor(last.entry_date, last.seq,
+                                       last.line_number) if last else None),
     }
 
 
+async def iter_account_ledger(
+    session: AsyncSession, *, account_code: str,
+    start: Optional[date] = None, end: Optional[date] = None,
+):
+    """Every movement in the window, streamed from a server-side cursor.
+
+    Yields the same dicts as `account_ledger` entries, with the running
+    balance carried from the window's opening balance, without holding the
+    rows in memory. Used by the CSV/XLSX export.
+    """
+    acct = await _ledger_account(session, account_code)
+    running, _, _ = await _ledger_balances(session, acct, start=start, end=end)
+    dated = await _lines_carry_date(session)
+    result = await session.stream(
+        text(_ledger_lines_sql(dated, after=False, limit=False))
+        .execution_options(yield_per=1000),
+        {"aid": acct.id, "start": start, "end": end})
+    debit_normal = acct.normal_balance == 'DEBIT'
+    async for r in result:
+        dr, cr = money(r.debit), money(r.credit)
+        running += (dr - cr) if debit_normal else (cr - dr)
+        yield _ledger_row(r, running)
+
+
+# ---------------------------------------------------------------------------
+# Period balances
+# ---------------------------------------------------------------------------
+
+async def account_period_movements(
+    session: AsyncSession,
+    *,
+    codes: Sequence[str],
+    start: date,
+    end: date,
+    by_month: bool = False,
+) -> dict:
+    """Total debits and credits per account over [start, end].
+
+    Read from `gl_account_daily_balances` (migration u0123456789t), which a
+    trigger keeps in step with every journal line, so the cost is one row per
+    account per active day rather than one per journal line.
+
+    Returns {code: {"debit": Decimal, "credit": Decimal}}, or with by_month
+    {(code, first_of_month): {...}} -- a year of monthly figures in one query.
+    Accounts with no movement are absent; callers default them to zero.
+    """
+    month = "CAST(date_trunc('month', b.entry_date) AS date)" if by_month \
+        else "NULL::date"
+    rows = (await session.execute(
+        text(f"""
+            SELECT a.code, {month} AS month,
+                   COALESCE(SUM(b.debit), 0)  AS debit,
+                   COALESCE(SUM(b.credit), 0) AS credit
+              FROM gl_account_daily_balances b
+              JOIN gl_accounts a ON a.id = b.account_id
+             WHERE a.code = ANY(:codes)
+               AND b.entry_date BETWEEN :start AND :end
+             GROUP BY 1, 2
+        """),
+        {"codes": list(codes), "start": start, "end": end},
+    )).fetchall()
+    out = {}
+    for r in rows:
+        key = (r.code, r.month) if by_month else r.code
+        out[key] = {"debit": money(r.debit), "credit": money(r.credit)}
+    return out
+
+
 # ---------------------------------------------------------------------------
 # Cash flow statement
 # ---------------------------------------------------------------------------
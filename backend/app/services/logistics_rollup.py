@@ -0,0 +1,310 @@
+"""Daily logistics rollup: the read model behind the logistics analytics.
+
+`/api/logistics/analytics` and `/dashboard` used to run several GROUP BY scans
+over `delivery_manifests` and `manifest_customers` on every call, so their cost
+grew with the whole manifest history. They now read two small per-day tables
+instead:
+
+  logistics_daily_costs      one row per (day, transport mode, status, officer)
+  logistics_daily_customers  one row per (day, customer)
+
+Weekday and month breakdowns are derived from the day, so a longer date range
+costs a few hundred rollup rows rather than every manifest ever written.
+
+Consistency model: a day's rollup rows are never incremented in place. Each
+write path that touches a manifest calls `refresh_days` for the delivery
+date(s) involved, which recomputes those days from the source tables inside
+the caller's transaction. A day holds a handful of manifests, so the refresh
+is bounded, and a recomputation cannot drift the way a running delta can -- a
+cost update applied twice still leaves the day correct.
+
+None of these functions commit; the caller owns the transaction boundary.
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+ROLLUP_STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS logistics_daily_costs (
+    delivery_date DATE NOT NULL,
+    transport_mode VARCHAR(50) NOT NULL,
+    status VARCHAR(30) NOT NULL,
+    logistics_officer VARCHAR(255) NOT NULL,
+    manifests INTEGER NOT NULL DEFAULT 0,
+    total_cost NUMERIC(18,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (delivery_date, transport_mode, status, logistics_officer)
+)""",
+    """CREATE TABLE IF NOT EXISTS logistics_daily_customers (
+    delivery_date DATE NOT NULL,
+    customer_name VARCHAR(255) NOT NULL,
+    manifests INTEGER NOT NULL DEFAULT 0,
+    drops INTEGER NOT NULL DEFAULT 0,
+    delivered_drops INTEGER NOT NULL DEFAULT 0,
+    items_delivered NUMERIC(18,6) NOT NULL DEFAULT 0,
+    PRIMARY KEY (delivery_date, customer_name)
+)""",
+]
+
+# The day filter is the only thing that differs between a one-day refresh and
+# a full rebuild, so both share these statements.
+_COSTS_INSERT = """
+    INSERT INTO logistics_daily_costs
+        (delivery_date, transport_mode, status, logistics_officer,
+         manifests, total_cost)
+    SELECT delivery_date,
+           COALESCE(NULLIF(transport_mode, ''), 'vehicle'),
+           status,
+           COALESCE(logistics_officer, ''),
+           COUNT(*),
+           COALESCE(SUM(total_cost), 0)
+      FROM delivery_manifests
+     WHERE {where}
+     GROUP BY 1, 2, 3, 4
+"""
+
+_CUSTOMERS_INSERT = """
+    INSERT INTO logistics_daily_customers
+        (delivery_date, customer_name, manifests, drops,
+         delivered_drops, items_delivered)
+    SELECT dm.delivery_date,
+           mc.customer_name,
+           COUNT(DISTINCT mc.manifest_id),
+           COUNT(*),
+           COUNT(*) FILTER (WHERE mc.status = 'delivered'),
+           COALESCE(SUM(items.qty) FILTER (WHERE mc.status = 'delivered'), 0)
+      FROM manifest_customers mc
+      JOIN delivery_manifests dm ON dm.id = mc.manifest_id
+      LEFT JOIN (
+            SELECT manifest_customer_id, SUM(quantity) AS qty
+              FROM manifest_items
+             GROUP BY manifest_customer_id
+      ) items ON items.manifest_customer_id = mc.id
+     WHERE {where}
+     GROUP BY 1, 2
+"""
+
+
+async def refresh_days(session: AsyncSession, days: Iterable[date]) -> None:
+    """Recompute the rollup rows for the given delivery dates.
+
+    Call after any change to a manifest, its customers or its items, passing
+    every date the change touched (both the old and new date if a manifest
+    moved). The day is locked with a transaction-scoped advisory lock so two
+    writers refreshing the same day serialise instead of colliding on the
+    primary key.
+    """
+    days = sorted({d for d in days if d is not None})
+    if not days:
+        return
+
+    for d in days:
+        await session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext('logistics_rollup'), "
+                 "(CAST(:d AS date) - DATE '2000-01-01'))"),
+            {"d": d},
+        )
+
+    params = {"days": days}
+    await session.execute(
+        text("DELETE FROM logistics_daily_costs WHERE delivery_date = ANY(:days)"),
+        params)
+    await session.execute(
+        text("DELETE FROM logistics_daily_customers "
+             "WHERE delivery_date = ANY(:days)"),
+        params)
+    await session.execute(
+        text(_COSTS_INSERT.format(where="delivery_date = ANY(:days)")), params)
+    await session.execute(
+        text(_CUSTOMERS_INSERT.format(where="dm.delivery_date = ANY(:days)")),
+        params)
+
+
+async def rebuild(session: AsyncSession) -> None:
+    """Recompute the whole rollup from the source tables.
+
+    Used to backfill a database whose manifests predate the rollup. Takes a
+    table lock so no day refresh interleaves with the rebuild.
+    """
+    await session.execute(text(
+        "LOCK TABLE logistics_daily_costs, logistics_daily_customers "
+        "IN EXCLUSIVE MODE"))
+    await session.execute(text("DELETE FROM logistics_daily_costs"))
+    await session.execute(text("DELETE FROM logistics_daily_customers"))
+    await session.execute(text(_COSTS_INSERT.format(where="TRUE")))
+    await session.execute(text(_CUSTOMERS_INSERT.format(where="TRUE")))
+
+
+async def needs_backfill(session: AsyncSession) -> bool:
+    """True if manifests exist but the rollup has never been populated."""
+    row = (await session.execute(text("""
+        SELECT EXISTS (SELECT 1 FROM delivery_manifests) AS has_manifests,
+               EXISTS (SELECT 1 FROM logistics_daily_costs) AS has_rollup
+    """))).first()
+    return bool(row.has_manifests) and not bool(row.has_rollup)
+
+
+def _range_clause(
+    date_from: Optional[date], date_to: Optional[date],
+) -> tuple[str, dict]:
+    where, params = [], {}
+    if date_from:
+        where.append("delivery_date >= :df")
+        params["df"] = date_from
+    if date_to:
+        where.append("delivery_date <= :dt")
+        params["dt"] = date_to
+    return (" AND ".join(where) if where else "TRUE"), params
+
+
+async def cost_analytics(
+    session: AsyncSession,
+    *,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    top_customers: int = 10,
+) -> dict:
+    """Cost breakdowns for a date range, read entirely from the rollup."""
+    wc, params = _range_clause(date_from, date_to)
+
+    by_mode = [
+        {"mode": r.transport_mode, "count": int(r.n),
+         "total": float(r.total),
+         "avg_cost": round(float(r.total) / r.n, 2) if r.n else 0.0}
+        for r in (await session.execute(text(f"""
+            SELECT transport_mode,
+                   SUM(manifests) AS n,
+                   SUM(total_cost) AS total
+              FROM logistics_daily_costs
+             WHERE {wc}
+             GROUP BY transport_mode
+             ORDER BY total DESC
+        """), params)).fetchall()
+    ]
+
+    top = [
+        {"customer": r.customer_name, "manifests": int(r.manifests),
+         "drops": int(r.drops)}
+        for r in (await session.execute(text(f"""
+            SELECT customer_name,
+                   SUM(manifests) AS manifests,
+                   SUM(drops) AS drops
+              FROM logistics_daily_customers
+             WHERE {wc}
+             GROUP BY customer_name
+             ORDER BY drops DESC
+             LIMIT :lim
+        """), {**params, "lim": top_customers})).fetchall()
+    ]
+
+    by_day = [
+        {"day": r.day_name.strip(), "count": int(r.n), "total": float(r.total)}
+        for r in (await session.execute(text(f"""
+            SELECT TO_CHAR(delivery_date, 'Day') AS day_name,
+                   EXTRACT(DOW FROM delivery_date) AS dow,
+                   SUM(manifests) AS n,
+                   SUM(total_cost) AS total
+              FROM logistics_daily_costs
+             WHERE {wc}
+             GROUP BY 1, 2
+             ORDER BY dow
+        """), params)).fetchall()
+    ]
+
+    by_date = [
+        {"date": str(r.delivery_date), "count": int(r.n),
+         "total": float(r.total)}
+        for r in (await session.execute(text(f"""
+            SELECT delivery_date,
+                   SUM(manifests) AS n,
+                   SUM(total_cost) AS total
+              FROM logistics_daily_costs
+             WHERE {wc}
+             GROUP BY delivery_date
+             ORDER BY delivery_date
+        """), params)).fetchall()
+    ]
+
+    return {
+        "by_transport_mode": by_mode,
+        "top_customers": top,
+        "by_day_of_week": by_day,
+        "by_date": by_date,
+    }
+
+
+async def dashboard_totals(session: AsyncSession, *, months: int = 6) -> dict:
+    """Headline counts, officer league table and monthly trend from the rollup."""
+    s = (await session.execute(text("""
+        SELECT COALESCE(SUM(manifests), 0) AS total_manifests,
+               COALESCE(SUM(manifests) FILTER (WHERE status = 'completed'), 0)
+                   AS completed,
+               COALESCE(SUM(manifests) FILTER (WHERE status = 'preparing'), 0)
+                   AS preparing,
+               COALESCE(SUM(manifests) FILTER
+                   (WHERE status IN ('dispatched', 'in_transit')), 0)
+                   AS in_transit,
+               COALESCE(SUM(manifests) FILTER (WHERE status = 'cancelled'), 0)
+                   AS cancelled,
+               COALESCE(SUM(total_cost), 0) AS total_cost
+          FROM logistics_daily_costs
+    """))).first()
+    total_manifests = int(s.total_manifests)
+    summary = {
+        "total_manifests": total_manifests,
+        "completed": int(s.completed), "preparing": int(s.preparing),
+        "in_transit": int(s.in_transit), "cancelled": int(s.cancelled),
+        "total_logistics_cost": float(s.total_cost),
+        "avg_manifest_cost": (round(float(s.total_cost) / total_manifests, 2)
+                              if total_manifests else 0.0),
+    }
+
+    d = (await session.execute(text("""
+        SELECT COALESCE(SUM(drops), 0) AS total_drops,
+               COALESCE(SUM(delivered_drops), 0) AS delivered_drops,
+               COALESCE(SUM(items_delivered), 0) AS items_delivered
+          FROM logistics_daily_customers
+    """))).first()
+    delivery_stats = {
+        "total_customer_drops": int(d.total_drops),
+        "delivered_drops": int(d.delivered_drops),
+        "items_delivered": float(d.items_delivered),
+    }
+
+    by_officer = [
+        {"officer": r.logistics_officer, "manifests": int(r.manifests),
+         "total_cost": float(r.total_cost)}
+        for r in (await session.execute(text("""
+            SELECT logistics_officer,
+                   SUM(manifests) AS manifests,
+                   SUM(total_cost) AS total_cost
+              FROM logistics_daily_costs
+             GROUP BY logistics_officer
+             ORDER BY manifests DESC
+             LIMIT 10
+        """))).fetchall()
+    ]
+
+    monthly_trend = [
+        {"month": r.month, "manifests": int(r.manifests),
+         "total_cost": float(r.total_cost)}
+        for r in (await session.execute(text("""
+            SELECT TO_CHAR(delivery_date, 'YYYY-MM') AS month,
+                   SUM(manifests) AS manifests,
+                   SUM(total_cost) AS total_cost
+              FROM logistics_daily_costs
+             WHERE delivery_date >= CURRENT_DATE - make_interval(months => :m)
+             GROUP BY 1
+             ORDER BY month DESC
+        """), {"m": months})).fetchall()
+    ]
+
+    return {
+        "summary": summary,
+        "delivery_stats": delivery_stats,
+        "by_officer": by_officer,
+        "monthly_trend": monthly_trend,
+    }
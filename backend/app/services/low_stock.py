@@ -0,0 +1,277 @@
+"""Low-stock alerts, raised the moment a balance crosses its reorder level.
+
+`notify_low_stock` existed, but nothing called it: low stock was only ever
+discovered by a screen scanning every balance. The engine here runs inside
+`apply_stock_movement`. It does no extra work for most movements: the balance
+UPDATE already returns the row's reorder level (`threshold_sql`), so a
+movement that stays above it costs nothing more.
+
+* A balance at or below the level with no open row in `low_stock_items`
+  (migration a6789012345z) opens one and queues an alert. That is a
+  crossing downward, and also a balance that was never above the level: a
+  new balance row starts at 0, so its first intake of 5 against a level of
+  10 is low from the start. A movement that stays below the level costs one
+  statement, which finds the open row and changes nothing.
+* Crossing back above the level marks the row cleared.
+* Alerts are debounced per balance row, that is per (warehouse, item): one
+  is sent at most every LOW_STOCK_ALERT_INTERVAL seconds (default 6 hours),
+  however often the balance bounces across the level. The row keeps its
+  `last_alerted_at` while cleared for exactly that reason.
+* Queued alerts are sent only after the caller's transaction commits, and
+  off the request path through `fire_notification`. A rolled-back movement
+  alerts nobody.
+
+`low_stock_items` rows with no `cleared_at` are the live low-stock list. It
+is read by `live_items`, joined to the current balances. Reorder levels use
+the definitions of `app.services.stock_levels`. Editing a level does not move
+stock, so it is not seen until the next movement; `rebuild` resynchronises
+the whole list in one statement.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.services.stock_levels import (
+    PRODUCT_REORDER_LEVEL, RAW_MATERIAL_REORDER_LEVEL)
+
+_LOG = logging.getLogger("services.low_stock")
+
+ALERT_INTERVAL_SECONDS = int(os.getenv("LOW_STOCK_ALERT_INTERVAL", "21600"))
+
+# Reorder level of the balance row `sl`, for use in its UPDATE ... RETURNING.
+PRODUCT_THRESHOLD = PRODUCT_REORDER_LEVEL
+RAW_MATERIAL_THRESHOLD = f"""(SELECT {RAW_MATERIAL_REORDER_LEVEL}
+                               FROM raw_materials rm
+                              WHERE rm.id = sl.raw_material_id)"""
+# Either kind of balance row.
+THRESHOLD_SQL = (f"CASE WHEN sl.product_id IS NOT NULL THEN {PRODUCT_THRESHOLD} "
+                 f"ELSE {RAW_MATERIAL_THRESHOLD} END")
+
+_PENDING = "low_stock_alerts"
+
+_ready: Optional[bool] = None
+
+
+async def ready(session: AsyncSession) -> bool:
+    """Has migration a6789012345z been applied? A True result is cached."""
+    global _ready
+    if _ready:
+        return True
+    found = (await session.execute(text(
+        "SELECT to_regclass('public.low_stock_items') IS NOT NULL"
+    ))).scalar()
+    _ready = bool(found)
+    return _ready
+
+
+def threshold_sql(product_id) -> str:
+    return PRODUCT_THRESHOLD if product_id is not None else RAW_MATERIAL_THRESHOLD
+
+
+async def evaluate(
+    session: AsyncSession,
+    level_id: UUID,
+    old_balance,
+    new_balance,
+    reorder_level,
+) -> None:
+    """Record balance row `level_id` going low, or recovering.
+
+    Called by `apply_stock_movement` with the row still locked. Does nothing
+    unless the balance crossed the level, or is at or below it without an
+    open low-stock row.
+    """
+    if reorder_level is None:
+        return
+    if new_balance <= reorder_level:
+        row = (await session.execute(
+            text("""
+                INSERT INTO low_stock_items AS li
+                    (stock_level_id, warehouse_id, product_id,
+                     raw_material_id, reorder_level, became_low_at,
+                     last_alerted_at)
+                SELECT sl.id, sl.warehouse_id, sl.product_id,
+                       sl.raw_material_id, :level, NOW(), NOW()
+                  FROM stock_levels sl
+                 WHERE sl.id = :lid
+                ON CONFLICT (stock_level_id) DO UPDATE
+                   SET reorder_level = EXCLUDED.reorder_level,
+                       became_low_at = NOW(),
+                       cleared_at = NULL,
+                       last_alerted_at = CASE
+                           WHEN li.last_alerted_at IS NULL
+                             OR li.last_alerted_at
+                                < NOW() - make_interval(secs => :interval)
+                           THEN NOW() ELSE li.last_alerted_at END
+                 WHERE :crossed OR li.cleared_at IS NOT NULL
+                RETURNING li.last_alerted_at = NOW() AS alert,
+                          COALESCE(
+                              (SELECT p.name FROM products p
+                                WHERE p.id = li.product_id),
+                              (SELECT rm.name FROM raw_materials rm
+                                WHERE rm.id = li.raw_material_id),
+                              'Unknown item') AS item_name
+            """),
+            {"lid": str(level_id), "level": str(reorder_level),
+             "interval": ALERT_INTERVAL_SECONDS,
+             "crossed": old_balance > reorder_level},
+        )).first()
+        if row is not None and row.alert:
+            _queue(session, level_id, (row.item_name, float(new_balance),
+                                       float(reorder_level)))
+    elif old_balance <= reorder_level < new_balance:
+        await session.execute(
+            text("""
+                UPDATE low_stock_items SET cleared_at = NOW()
+                 WHERE stock_level_id = :lid AND cleared_at IS NULL
+            """),
+            {"lid": str(level_id)},
+        )
+        _pending(session).pop(str(level_id), None)
+
+
+def _pending(session: AsyncSession) -> dict:
+    return session.sync_session.info.setdefault(_PENDING, {})
+
+
+def _queue(session: AsyncSession, level_id: UUID, alert: tuple) -> None:
+    # Keyed by balance row: a row that dips twice in one transaction is
+    # announced once.
+    _pending(session)[str(level_id)] = alert
+
+
+@event.listens_for(Session, "after_commit")
+def _send_after_commit(sync_session) -> None:
+    alerts = sync_session.info.pop(_PENDING, None)
+    if not alerts:
+        return
+    from app.api.notifications import fire_notification, notify_low_stock
+    for name, balance, level in alerts.values():
+        fire_notification(notify_low_stock(name, balance, level))
+    _LOG.info("queued %d low-stock alert(s)", len(alerts))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_rollback(sync_session) -> None:
+    sync_session.info.pop(_PENDING, None)
+
+
+async def live_items(
+    session: AsyncSession,
+    *,
+    warehouse_id: Optional[UUID] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> tuple[list[dict], int]:
+    """One page of the balances currently at or below their reorder level."""
+    where = ["li.cleared_at IS NULL"]
+    params: dict = {"limit": limit, "offset": offset}
+    if warehouse_id:
+        where.append("li.warehouse_id = :wh")
+        params["wh"] = str(warehouse_id)
+    where_sql = " AND ".join(where)
+
+    rows = (await session.execute(
+        text(f"""
+            SELECT li.stock_level_id, li.warehouse_id, li.product_id,
+                   li.raw_material_id, li.reorder_level, li.became_low_at,
+                   li.last_alerted_at, sl.current_stock,
+                   COALESCE(p.name, rm.name) AS item_name,
+                   COALESCE(p.sku, rm.sku) AS item_sku,
+                   w.name AS warehouse_name,
+                   COUNT(*) OVER () AS matched
+              FROM low_stock_items li
+              JOIN stock_levels sl ON sl.id = li.stock_level_id
+              LEFT JOIN products p ON p.id = li.product_id
+              LEFT JOIN raw_materials rm ON rm.id = li.raw_material_id
+              LEFT JOIN warehouses w ON w.id = li.warehouse_id
+             WHERE {where_sql}
+             ORDER BY li.became_low_at DESC, li.stock_level_id
+             LIMIT :limit OFFSET :offset
+        """),
+        params,
+    )).fetchall()
+    if rows:
+        total = int(rows[0].matched)
+    elif offset:
+        total = int((await session.execute(
+            text(f"SELECT COUNT(*) FROM low_stock_items li WHERE {where_sql}"),
+            params)).scalar() or 0)
+    else:
+        total = 0
+
+    return [{
+        'stock_level_id': str(r.stock_level_id),
+        'warehouse_id': str(r.warehouse_id),
+        'warehouse_name': r.warehouse_name or 'Default',
+        'item_type': 'product' if r.product_id else 'raw_material',
+        'item_id': str(r.product_id or r.raw_material_id),
+        'item_name': r.item_name or 'Unknown',
+        'item_sku': r.item_sku or '',
+        'current_stock': float(r.current_stock or 0),
+        'reorder_level': float(r.reorder_level),
+        'became_low_at': r.became_low_at.isoformat(),
+        'last_alerted_at': (r.last_alerted_at.isoformat()
+                            if r.last_alerted_at else None),
+    } for r in rows], total
+
+
+async def counts(session: AsyncSession) -> dict:
+    """Live low-stock rows, by item type."""
+    r = (await session.execute(text("""
+        SELECT COUNT(*) FILTER (WHERE product_id IS NOT NULL) AS products,
+               COUNT(*) FILTER (WHERE raw_material_id IS NOT NULL)
+                   AS raw_materials
+          FROM low_stock_items
+         WHERE cleared_at IS NULL
+    """))).first()
+    return {"products": int(r.products), "raw_materials": int(r.raw_materials)}
+
+
+async def rebuild(session: AsyncSession) -> int:
+    """Resynchronise the live list with every balance; returns its size.
+
+    Sends no alerts: nothing crossed anything. Does not commit.
+    """
+    await session.execute(text(REBUILD_SQL))
+    return int((await session.execute(text(
+        "SELECT COUNT(*) FROM low_stock_items WHERE cleared_at IS NULL"
+    ))).scalar() or 0)
+
+
+# Migration a6789012345z backfills with the same statement.
+REBUILD_SQL = f"""
+    WITH levels AS (
+        SELECT sl.id, sl.warehouse_id, sl.product_id, sl.raw_material_id,
+               sl.current_stock,
+               CASE WHEN sl.product_id IS NOT NULL
+                    THEN {PRODUCT_REORDER_LEVEL}
+                    ELSE {RAW_MATERIAL_REORDER_LEVEL} END AS reorder_level
+          FROM stock_levels sl
+          LEFT JOIN raw_materials rm ON rm.id = sl.raw_material_id
+    ), low AS (
+        INSERT INTO low_stock_items AS li
+            (stock_level_id, warehouse_id, product_id, raw_material_id,
+             reorder_level, became_low_at)
+        SELECT id, warehouse_id, product_id, raw_material_id, reorder_level,
+               NOW()
+          FROM levels
+         WHERE current_stock <= reorder_level
+        ON CONFLICT (stock_level_id) DO UPDATE
+           SET reorder_level = EXCLUDED.reorder_level,
+               became_low_at = CASE WHEN li.cleared_at IS NULL
+                                    THEN li.became_low_at ELSE NOW() END,
+               cleared_at = NULL
+        RETURNING stock_level_id
+    )
+    UPDATE low_stock_items SET cleared_at = NOW()
+     WHERE cleared_at IS NULL
+       AND stock_level_id NOT IN (SELECT stock_level_id FROM low)
+"""
@@ -0,0 +1,371 @@
+"""Transactional outbox: side effects that commit with the change behind them.
+
+Side effects used to be fired ad hoc once a request had committed:
+  * `fire_notification` pushes from sales and public orders ran as
+    fire-and-forget tasks;
+  * reverse geocoding on clock-in/out and login ran on the request path,
+    with up to four seconds of Nominatim time before the response;
+  * failed MAPD distributions waited for someone to press "retry".
+A process that died in between lost the effect for good. A push that failed
+was never repeated.
+
+Write paths now call `enqueue`. It inserts a row into `outbox_events`
+(migration b7890123456a) in the caller's transaction, so the event exists
+if and only if the change committed. Every worker runs `run_dispatcher`,
+which:
+
+1. claims pending events with FOR UPDATE SKIP LOCKED, OUTBOX_BATCH (default
+   20) at a time, so workers never deliver the same event concurrently;
+2. runs each event's handler in its own savepoint, and marks it dispatched;
+3. on failure rolls the handler's writes back and schedules another attempt
+   with exponential backoff (OUTBOX_RETRY_SECONDS, doubling, capped at an
+   hour). After OUTBOX_MAX_ATTEMPTS (default 8) the event is marked failed
+   and kept for inspection;
+4. commits the batch.
+
+A handler can instead raise `RetryLater`. Its writes are kept and it is
+tried again later, which is how a MAPD retry records each failed attempt.
+
+Delivery is at least once: an event whose worker dies before committing is
+delivered again, so handlers must tolerate repeats. A commit that enqueued
+something wakes this worker's dispatcher at once. Otherwise it polls every
+OUTBOX_POLL_SECONDS (default 2). Dispatched events are purged after
+OUTBOX_RETENTION_DAYS (default 7).
+
+Before the migration is applied, `enqueue` falls back to the old behaviour:
+the event is delivered once, after commit, by a detached task.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+_LOG = logging.getLogger("services.outbox")
+
+BATCH = int(os.getenv("OUTBOX_BATCH", "20"))
+POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+RETRY_SECONDS = int(os.getenv("OUTBOX_RETRY_SECONDS", "30"))
+MAX_RETRY_SECONDS = 3600
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+PURGE_EVERY_SECONDS = 3600
+
+# The notify_* functions of app.api.notifications a push event may name.
+PUSH_NOTIFIERS = {
+    "sale_created", "payment_received", "order_update", "low_stock",
+    "production_complete", "announcement",
+}
+
+_PENDING = "outbox_events"
+_ENQUEUED = "outbox_enqueued"
+
+_ready: Optional[bool] = None
+_wake: Optional[asyncio.Event] = None
+
+
+class RetryLater(Exception):
+    """Raised by a handler whose writes stand but whose work is not done."""
+
+
+@dataclass(frozen=True)
+class Event:
+    id: Optional[int]
+    kind: str
+    payload: dict
+    created_at: Optional[datetime] = None
+    attempts: int = 0
+
+
+Handler = Callable[[AsyncSession, Event], Awaitable[None]]
+HANDLERS: dict[str, Handler] = {}
+
+
+def handler(kind: str):
+    """Register the coroutine that delivers events of `kind`."""
+    def register(fn: Handler) -> Handler:
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+async def ready(session: AsyncSession) -> bool:
+    """Has migration b7890123456a been applied? A True result is cached."""
+    global _ready
+    if _ready:
+        return True
+    found = (await session.execute(text(
+        "SELECT to_regclass('public.outbox_events') IS NOT NULL"
+    ))).scalar()
+    _ready = bool(found)
+    return _ready
+
+
+def backoff_seconds(attempts: int) -> int:
+    """Delay before the next try of an event that has failed `attempts` times."""
+    return min(RETRY_SECONDS * 2 ** max(attempts - 1, 0), MAX_RETRY_SECONDS)
+
+
+async def enqueue(session: AsyncSession, kind: str, payload: dict,
+                  *, delay_seconds: int = 0) -> None:
+    """Record a side effect in the caller's transaction. Does not commit."""
+    if kind not in HANDLERS:
+        raise ValueError(f"No outbox handler for {kind!r}")
+    body = json.dumps(payload, default=str)
+    info = session.sync_session.info
+    if await ready(session):
+        await session.execute(
+            text("""
+                INSERT INTO outbox_events (kind, payload, available_at)
+                VALUES (:kind, CAST(:payload AS jsonb),
+                        NOW() + make_interval(secs => :delay))
+            """),
+            {"kind": kind, "payload": body, "delay": delay_seconds},
+        )
+        info[_ENQUEUED] = True
+    elif delay_seconds:
+        # Nothing can hold a delayed event without the table; the caller's
+        # own record of the failure (a FAILED settlement) still stands.
+        _LOG.info("outbox not migrated; dropped delayed %s event", kind)
+    else:
+        info.setdefault(_PENDING, []).append(Event(None, kind,
+                                                   json.loads(body)))
+
+
+async def enqueue_push(session: AsyncSession, notifier: str, **kwargs) -> None:
+    """Queue `notify_<notifier>(**kwargs)` from app.api.notifications."""
+    if notifier not in PUSH_NOTIFIERS:
+        raise ValueError(f"Unknown notifier {notifier!r}")
+    await enqueue(session, "push", {"notifier": notifier, "kwargs": kwargs})
+
+
+async def enqueue_activity(session: AsyncSession, *, action: str, module: str,
+                           record_id=None, details: Optional[str] = None,
+                           user_id=None) -> None:
+    """Queue an entry for the activity log (`audit_logs`)."""
+    await enqueue(session, "activity", {
+        "action": action, "module": module,
+        "record_id": str(record_id) if record_id is not None else None,
+        "details": details,
+        "user_id": str(user_id) if user_id is not None else None,
+    })
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(sync_session) -> None:
+    if sync_session.info.pop(_ENQUEUED, False) and _wake is not None:
+        _wake.set()
+    pending = sync_session.info.pop(_PENDING, None)
+    if pending:
+        from app.api.notifications import fire_notification
+        for ev in pending:
+            fire_notification(_deliver_detached(ev))
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(sync_session) -> None:
+    sync_session.info.pop(_ENQUEUED, None)
+    sync_session.info.pop(_PENDING, None)
+
+
+async def _deliver_detached(ev: Event) -> None:
+    from app.db import AsyncSessionLocal
+    async with AsyncSessionLocal() as session:
+        try:
+            await HANDLERS[ev.kind](session, ev)
+            await session.commit()
+        except RetryLater:
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            _LOG.exception("detached %s delivery failed", ev.kind)
+
+
+async def dispatch_batch(session: AsyncSession,
+                         limit: Optional[int] = None) -> int:
+    """Deliver up to `limit` due events; returns how many were claimed.
+
+    Safe to run from any number of workers at once. Commits.
+    """
+    rows = (await session.execute(
+        text("""
+            SELECT id, kind, payload, created_at, attempts
+              FROM outbox_events
+             WHERE dispatched_at IS NULL AND failed_at IS NULL
+               AND available_at <= NOW()
+             ORDER BY available_at, id
+             LIMIT :limit
+               FOR UPDATE SKIP LOCKED
+        """),
+        {"limit": limit or BATCH},
+    )).fetchall()
+
+    for r in rows:
+        payload = r.payload if isinstance(r.payload, dict) else json.loads(r.payload)
+        ev = Event(r.id, r.kind, payload, r.created_at, r.attempts)
+        fn = HANDLERS.get(ev.kind)
+        error: Optional[str] = None
+        done = False
+        savepoint = await session.begin_nested()
+        try:
+            if fn is None:
+                raise LookupError(f"No outbox handler for {ev.kind!r}")
+            await fn(session, ev)
+            await savepoint.commit()
+            done = True
+        except RetryLater as exc:
+            await savepoint.commit()
+            error = str(exc) or "retry later"
+        except Exception as exc:                          # noqa: BLE001
+            await savepoint.rollback()
+            error = f"{type(exc).__name__}: {exc}"
+
+        if done:
+            await session.execute(
+                text("UPDATE outbox_events SET dispatched_at = NOW(), "
+                     "attempts = attempts + 1 WHERE id = :id"),
+                {"id": ev.id})
+            continue
+        attempts = ev.attempts + 1
+        dead = fn is None or attempts >= MAX_ATTEMPTS
+        if dead:
+            _LOG.error("outbox event %s (%s) failed for good after %d "
+                       "attempt(s): %s", ev.id, ev.kind, attempts, error)
+        else:
+            _LOG.warning("outbox event %s (%s) attempt %d failed: %s",
+                         ev.id, ev.kind, attempts, error)
+        await session.execute(
+            text("""
+                UPDATE outbox_events
+                   SET attempts = :attempts,
+                       last_error = :error,
+                       failed_at = CASE WHEN :dead THEN NOW() END,
+                       available_at = NOW() + make_interval(secs => :delay)
+                 WHERE id = :id
+            """),
+            {"id": ev.id, "attempts": attempts, "error": error[:2000],
+             "dead": dead, "delay": backoff_seconds(attempts)})
+
+    await session.commit()
+    return len(rows)
+
+
+async def purge(session: AsyncSession) -> int:
+    """Delete events dispatched more than RETENTION_DAYS ago. Does not commit."""
+    result = await session.execute(
+        text("""
+            DELETE FROM outbox_events
+             WHERE dispatched_at < NOW() - make_interval(days => :days)
+        """),
+        {"days": RETENTION_DAYS},
+    )
+    return result.rowcount or 0
+
+
+async def run_dispatcher() -> None:
+    """Background loop started by app.main on every worker."""
+    global _wake
+    from app.db import AsyncSessionLocal
+
+    _wake = asyncio.Event()
+    last_purge = 0.0
+    loop = asyncio.get_running_loop()
+    _LOG.info("Outbox dispatcher started (poll %.0fs)", POLL_SECONDS)
+    while True:
+        try:
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _wake.clear()
+            async with AsyncSessionLocal() as session:
+                if not await ready(session):
+                    continue
+                # Keep going while batches come back full.
+                while await dispatch_batch(session) >= BATCH:
+                    pass
+                if loop.time() - last_purge >= PURGE_EVERY_SECONDS:
+                    purged = await purge(session)
+                    await session.commit()
+                    last_purge = loop.time()
+                    if purged:
+                        _LOG.info("purged %d dispatched outbox event(s)", purged)
+        except asyncio.CancelledError:
+            _LOG.info("Outbox dispatcher cancelled")
+            raise
+        except Exception:
+            _LOG.exception("Outbox dispatcher iteration failed")
+            await asyncio.sleep(30)
+
+
+# ---------------------------------------------------------------------------
+# Handlers
+# ---------------------------------------------------------------------------
+
+@handler("push")
+async def _push(session: AsyncSession, ev: Event) -> None:
+    from app.api import notifications
+    notifier = ev.payload["notifier"]
+    if notifier not in PUSH_NOTIFIERS:
+        raise LookupError(f"Unknown notifier {notifier!r}")
+    coro = getattr(notifications, f"notify_{notifier}")(**ev.payload["kwargs"])
+    # pywebpush sends synchronously; a thread keeps a large fan-out from
+    # stalling every request on this worker's event loop.
+    missed = await asyncio.to_thread(asyncio.run, notifications.deliver_push(
+        coro, ev.payload.get("endpoints")))
+    if missed:
+        # Try again later for those alone: the others already have it.
+        if ev.id is not None:
+            await session.execute(
+                text("UPDATE outbox_events SET payload = CAST(:p AS jsonb) "
+                     "WHERE id = :id"),
+                {"p": json.dumps({**ev.payload, "endpoints": missed}),
+                 "id": ev.id})
+        raise RetryLater(f"{len(missed)} subscription(s) not reached")
+
+
+@handler("geocode")
+async def _geocode(session: AsyncSession, ev: Event) -> None:
+    from app.services.geocoding import fill_address
+    p = ev.payload
+    if not await fill_address(session, p["target"], p["id"], p["lat"], p["lng"]):
+        raise LookupError("reverse geocoding returned no address")
+
+
+@handler("mapd_retry")
+async def _mapd_retry(session: AsyncSession, ev: Event) -> None:
+    from app.services.settlement import retry_distribution
+    outcome = await retry_distribution(session, ev.payload["payment_id"])
+    if outcome in ("FAILED", "ERROR"):
+        raise RetryLater(f"distribution still {outcome}")
+
+
+@handler("activity")
+async def _activity(session: AsyncSession, ev: Event) -> None:
+    p = ev.payload
+    # The row id and time derive from the event, so a redelivery logs nothing
+    # twice (audit_logs' key is (id, created_at) once it is partitioned).
+    entry_id = (uuid.uuid5(uuid.NAMESPACE_URL, f"outbox:{ev.id}")
+                if ev.id is not None else uuid.uuid4())
+    await session.execute(
+        text("""
+            INSERT INTO audit_logs (id, user_id, action, module, record_id,
+                                    details, created_at)
+            VALUES (:id, :uid, :action, :module, :rid, :details,
+                    COALESCE(CAST(:at AS timestamptz), NOW()))
+            ON CONFLICT DO NOTHING
+        """),
+        {"id": str(entry_id), "uid": p.get("user_id"),
+         "action": p["action"], "module": p.get("module"),
+         "rid": p.get("record_id"), "details": p.get("details"),
+         "at": ev.created_at},
+    )
@@ -0,0 +1,365 @@
+"""Monthly partitions for the append-only tables, and their archive.
+
+Migration d9012345678c turned the tables in `TABLES` into monthly range
+partitions, named `<table>_YYYYMM`, plus a `<table>_default` partition for
+rows that fall outside every month. This module keeps those partitions
+going:
+
+* **Future months.** `run_maintainer` runs on every worker and calls
+  `ensure_partitions` every PARTITION_CHECK_SECONDS. That creates the
+  partitions for this month and the next PARTITION_MONTHS_AHEAD months, so
+  current inserts land in a monthly partition. Rows outside them (dated
+  further ahead, or back-dated before the oldest partition) wait in the
+  default, and the same pass creates their months and moves them in. Rows
+  of an archived month stay in the default until that month is restored.
+  An advisory lock keeps two workers from issuing the same DDL.
+* **Archive.** `archive_partition` detaches one cold month, writes it to
+  `<PARTITION_ARCHIVE_DIR>/<table>/<partition>.csv.gz` and drops it. It
+  refuses to archive a month that is still within the table's `HOT_MONTHS`,
+  and a month of stock movements that `stock_history` checkpoints do not
+  cover yet. `partition_archives` records the file's row count and SHA-256.
+* **Restore.** `restore_partition` loads an archived file back into a fresh
+  partition and attaches it, so the month can be queried again.
+
+Queries bounded by the partition key read only the months they name.
+Queries ordered by the key with a LIMIT stop once they have read the newest
+months. `scripts/partitions.py` is the command-line front end for status,
+archive and restore. Nothing here commits except `run_maintainer`.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timezone
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_LOG = logging.getLogger("services.partitions")
+
+# table -> partition key. Keep in step with migration d9012345678c.
+TABLES = {
+    "stock_movements": "created_at",
+    "gl_journal_lines": "entry_date",
+    "attendance": "clock_in",
+    "wifi_auth_logs": "timestamp",
+    "wifi_sessions": "login_time",
+    "audit_logs": "created_at",
+    "chat_messages": "created_at",
+    "reg_audit_trail": "created_at",
+}
+
+# Months a table's data stays attached before it may be archived. The
+# books and stock history are kept for seven years; logs for less.
+HOT_MONTHS = {
+    "stock_movements": 84,
+    "gl_journal_lines": 84,
+    "attendance": 36,
+    "wifi_auth_logs": 6,
+    "wifi_sessions": 6,
+    "audit_logs": 24,
+    "chat_messages": 12,
+    "reg_audit_trail": 84,
+}
+
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+CHECK_SECONDS = float(os.getenv("PARTITION_CHECK_SECONDS", "21600"))
+ARCHIVE_DIR = Path(os.getenv("PARTITION_ARCHIVE_DIR", "archive/partitions"))
+
+# Arbitrary, but fixed: every worker must contend for the same key.
+LOCK_KEY = 4_217_120_047
+
+_ready: Optional[bool] = None
+
+
+@dataclass(frozen=True)
+class Partition:
+    table: str
+    name: str
+    month: Optional[date]  # None for the default partition
+    rows: int              # planner estimate
+    bytes: int
+
+
+@dataclass(frozen=True)
+class Archive:
+    table: str
+    name: str
+    month: date
+    path: str
+    rows: int
+    bytes: int
+    sha256: str
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    months = d.year * 12 + d.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month.year:04d}{month.month:02d}"
+
+
+def archivable_before(table: str, today: Optional[date] = None) -> date:
+    """The first month of `table` that must stay attached."""
+    return add_months(month_start(today or date.today()), -HOT_MONTHS[table])
+
+
+def _check_table(table: str) -> None:
+    if table not in TABLES:
+        raise HTTPException(status_code=400,
+                            detail=f"{table} is not a partitioned table.")
+
+
+async def ready(session: AsyncSession) -> bool:
+    """Has migration d9012345678c been applied? A True result is cached."""
+    global _ready
+    if _ready:
+        return True
+    found = (await session.execute(text(
+        "SELECT to_regprocedure('create_month_partition(text, date)') IS NOT NULL"
+    ))).scalar()
+    _ready = bool(found)
+    return _ready
+
+
+async def partitioned_tables(session: AsyncSession) -> list[str]:
+    """The tables in `TABLES` that are partitioned in this database."""
+    rows = (await session.execute(text("""
+        SELECT c.relname FROM pg_class c
+         WHERE c.relkind = 'p' AND c.relname = ANY(:names)
+           AND c.relnamespace = 'public'::regnamespace
+    """), {"names": list(TABLES)})).scalars().all()
+    return [t for t in TABLES if t in set(rows)]
+
+
+async def ensure_partitions(
+    session: AsyncSession,
+    *,
+    today: Optional[date] = None,
+    ahead: int = MONTHS_AHEAD,
+) -> list[str]:
+    """Create this month's and the next `ahead` months' partitions, and
+    those of any months waiting in the default partition.
+
+    Returns the partitions created. Another worker holding the lock means
+    the work is being done; this call then returns nothing. Does not commit.
+    """
+    if not await ready(session):
+        return []
+    locked = (await session.execute(
+        text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY})).scalar()
+    if not locked:
+        return []
+    first = month_start(today or date.today())
+    upcoming = [add_months(first, n) for n in range(ahead + 1)]
+    created = []
+    for table in await partitioned_tables(session):
+        # Months with an archive not restored yet are left to the restore,
+        # which would otherwise find their partition already there.
+        waiting = (await session.execute(text("""
+            SELECT m FROM default_partition_months(:t) AS m
+             WHERE NOT EXISTS (
+                   SELECT 1 FROM partition_archives a
+                    WHERE a.parent_table = :t AND a.range_start = m
+                      AND a.restored_at IS NULL)
+        """), {"t": table})).scalars().all()
+        for month in sorted(set(upcoming) | set(waiting)):
+            made = (await session.execute(
+                text("SELECT create_month_partition(:t, :m)"),
+                {"t": table, "m": month})).scalar()
+            if made:
+                created.append(partition_name(table, month))
+    return created
+
+
+async def list_partitions(session: AsyncSession, table: str) -> list[Partition]:
+    """`table`'s attached partitions, oldest month first, default last."""
+    _check_table(table)
+    rows = (await session.execute(text("""
+        SELECT c.relname,
+               GREATEST(c.reltuples, 0)::bigint AS rows,
+               pg_total_relation_size(c.oid) AS bytes
+          FROM pg_inherits i
+          JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = to_regclass(:t)
+         ORDER BY c.relname
+    """), {"t": table})).fetchall()
+    parts = []
+    for r in rows:
+        suffix = r.relname[len(table) + 1:]
+        month = (date(int(suffix[:4]), int(suffix[4:]), 1)
+                 if suffix.isdigit() and len(suffix) == 6 else None)
+        parts.append(Partition(table, r.relname, month, int(r.rows), int(r.bytes)))
+    return sorted(parts, key=lambda p: (p.month is None, p.month or date.min))
+
+
+async def _driver_connection(session: AsyncSession):
+    """The asyncpg connection under the session, for COPY."""
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    return raw.driver_connection
+
+
+async def _check_stock_checkpoints(session: AsyncSession, end: date) -> None:
+    """Past positions must survive the archive: checkpoints cover `end`."""
+    from app.services import stock_history
+
+    covered = await stock_history.covered_until(session)
+    if covered is None or covered < datetime.combine(end, time.min, timezone.utc):
+        raise HTTPException(
+            status_code=409,
+            detail="Stock checkpoints do not cover this month yet; "
+                   "archiving it would lose past stock positions.")
+
+
+async def archive_partition(
+    session: AsyncSession,
+    table: str,
+    month: date,
+    *,
+    directory: Path = ARCHIVE_DIR,
+    today: Optional[date] = None,
+) -> Archive:
+    """Detach `month` of `table`, write it to a gzipped CSV and drop it.
+
+    The file is complete and verified before the partition is dropped. If
+    the caller then rolls back, the partition is still attached and the
+    file is simply written again next time. Does not commit.
+    """
+    _check_table(table)
+    month = month_start(month)
+    if month >= archivable_before(table, today):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{table} keeps {HOT_MONTHS[table]} months attached; "
+                   f"{month:%Y-%m} is not cold yet.")
+    name = partition_name(table, month)
+    attached = any(p.name == name for p in await list_partitions(session, table))
+    if not attached:
+        raise HTTPException(status_code=404,
+                            detail=f"No attached partition {name}.")
+    if table == "stock_movements":
+        await _check_stock_checkpoints(session, add_months(month, 1))
+
+    await session.execute(text(f'ALTER TABLE {table} DETACH PARTITION "{name}"'))
+    expected = (await session.execute(
+        text(f'SELECT COUNT(*) FROM "{name}"'))).scalar()
+
+    path = Path(directory) / table / f"{name}.csv.gz"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    digest = hashlib.sha256()
+    driver = await _driver_connection(session)
+    with open(partial, "wb") as raw_file:
+        with gzip.GzipFile(fileobj=raw_file, mode="wb") as gz:
+            async def sink(chunk: bytes) -> None:
+                gz.write(chunk)
+            status = await driver.copy_from_table(
+                name, output=sink, format="csv", header=True)
+        raw_file.flush()
+        os.fsync(raw_file.fileno())
+    copied = int(status.split()[-1])
+    if copied != expected:
+        partial.unlink(missing_ok=True)
+        raise RuntimeError(f"{name}: copied {copied} of {expected} rows")
+    with open(partial, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    os.replace(partial, path)
+
+    archive = Archive(table, name, month, str(path), copied,
+                      path.stat().st_size, digest.hexdigest())
+    await session.execute(text("""
+        INSERT INTO partition_archives
+            (parent_table, partition_name, range_start, range_end,
+             file_path, row_count, file_bytes, sha256)
+        VALUES (:t, :n, :lo, :hi, :path, :rows, :bytes, :sha)
+    """), {"t": table, "n": name, "lo": month, "hi": add_months(month, 1),
+           "path": archive.path, "rows": archive.rows,
+           "bytes": archive.bytes, "sha": archive.sha256})
+    await session.execute(text(f'DROP TABLE "{name}"'))
+    _LOG.info("archived %s: %d rows to %s", name, copied, path)
+    return archive
+
+
+async def _file_chunks(path: Path, size: int = 1 << 16):
+    with gzip.open(path, "rb") as gz:
+        for chunk in iter(lambda: gz.read(size), b""):
+            yield chunk
+
+
+async def restore_partition(session: AsyncSession, table: str, month: date) -> int:
+    """Load `month` of `table` back from its archive and attach it.
+
+    Returns the rows loaded. The file is checked against the digest recorded
+    when it was written. Does not commit.
+    """
+    _check_table(table)
+    month = month_start(month)
+    name = partition_name(table, month)
+    row = (await session.execute(text("""
+        SELECT id, file_path, row_count, sha256 FROM partition_archives
+         WHERE parent_table = :t AND range_start = :m AND restored_at IS NULL
+         ORDER BY archived_at DESC LIMIT 1
+    """), {"t": table, "m": month})).first()
+    if row is None:
+        raise HTTPException(status_code=404,
+                            detail=f"No archive of {table} for {month:%Y-%m}.")
+    path = Path(row.file_path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    if digest.hexdigest() != row.sha256.strip():
+        raise RuntimeError(f"{path} does not match its recorded digest")
+
+    await session.execute(text(
+        f'CREATE TABLE "{name}" (LIKE {table} '
+        f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    driver = await _driver_connection(session)
+    status = await driver.copy_to_table(
+        name, source=_file_chunks(path), format="csv", header=True)
+    loaded = int(status.split()[-1])
+    if loaded != row.row_count:
+        raise RuntimeError(f"{name}: loaded {loaded} of {row.row_count} rows")
+    await session.execute(text("SELECT attach_month_partition(:t, :n, :m)"),
+                          {"t": table, "n": name, "m": month})
+    await session.execute(text(
+        "UPDATE partition_archives SET restored_at = NOW() WHERE id = :id"),
+        {"id": row.id})
+    _LOG.info("restored %s: %d rows from %s", name, loaded, path)
+    return loaded
+
+
+async def run_maintainer() -> None:
+    """Background loop started by app.main on every worker."""
+    from app.db import AsyncSessionLocal
+
+    _LOG.info("Partition maintainer started (every %.0fs)", CHECK_SECONDS)
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                created = await ensure_partitions(session)
+                await session.commit()
+            if created:
+                _LOG.info("created partition(s) %s", ", ".join(created))
+            await asyncio.sleep(CHECK_SECONDS)
+        except asyncio.CancelledError:
+            _LOG.info("Partition maintainer cancelled")
+            raise
+        except Exception:
+            _LOG.exception("Partition maintainer iteration failed")
+            await asyncio.sleep(30)
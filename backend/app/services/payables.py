@@ -243,6 +243,53 @@ async def outstanding_payables(session: AsyncSession) -> Decimal:
     )).scalar())
 
 
+_AGING_SQL = text("""
+    WITH po_balance AS (
+        SELECT po.id, po.po_number, po.supplier_id,
+               COALESCE(s.name, po.vendor_name) AS supplier_name,
+               COALESCE(s.payment_terms_days, 30) AS terms,
+               po.order_date::date AS order_date,
+               po.total_amount,
+               po.total_amount - COALESCE((
+                   SELECT SUM(sp.amount) FROM supplier_payments sp
+                    WHERE sp.po_id = po.id), 0) AS balance
+          FROM purchase_orders po
+          LEFT JOIN suppliers s ON s.id = po.supplier_id
+         WHERE po.status NOT IN ('cancelled', 'draft')
+    )
+    SELECT supplier_id, supplier_name, po_number, total_amount,
+           balance,
+           (COALESCE(:as_at, CURRENT_DATE)
+            - (order_date + terms * INTERVAL '1 day')::date) AS days_overdue
+      FROM po_balance
+     WHERE balance > 0.01
+     ORDER BY days_overdue DESC
+""")
+
+
+def _aging_item(r) -> dict:
+    overdue = int(r.days_overdue or 0)
+    if overdue <= 0:
+        bucket = "current"
+    elif overdue <= 30:
+        bucket = "1_30"
+    elif overdue <= 60:
+        bucket = "31_60"
+    elif overdue <= 90:
+        bucket = "61_90"
+    else:
+        bucket = "over_90"
+    return {
+        "supplier_id": str(r.supplier_id) if r.supplier_id else None,
+        "supplier_name": r.supplier_name,
+        "po_number": r.po_number,
+        "total_amount": float(money(r.total_amount)),
+        "balance": float(money(r.balance)),
+        "days_overdue": max(overdue, 0),
+        "bucket": bucket,
+    }
+
+
 async def supplier_aging(
     session: AsyncSession, *, as_at: Optional[date] = None) -> dict:
     """Outstanding payables bucketed by how overdue they are.
@@ -251,59 +298,16 @@ async def supplier_aging(
     not the order date -- an invoice on 60-day terms is not overdue at 45
     days, and treating it as such would misstate the position.
     """
-    rows = (await session.execute(
-        text("""
-            WITH po_balance AS (
-                SELECT po.id, po.po_number, po.supplier_id,
-                       COALESCE(s.name, po.vendor_name) AS supplier_name,
-                       COALESCE(s.payment_terms_days, 30) AS terms,
-                       po.order_date::date AS order_date,
-                       po.total_amount,
-                       po.total_amount - COALESCE((
-                           SELECT SUM(sp.amount) FROM supplier_payments sp
-                            WHERE sp.po_id = po.id), 0) AS balance
-                  FROM purchase_orders po
-                  LEFT JOIN suppliers s ON s.id = po.supplier_id
-                 WHERE po.status NOT IN ('cancelled', 'draft')
-            )
-            SELECT supplier_id, supplier_name, po_number, total_amount,
-                   balance,
-                   (COALESCE(:as_at, CURRENT_DATE)
-                    - (order_date + terms * INTERVAL '1 day')::date) AS days_overdue
-              FROM po_balance
-             WHERE balance > 0.01
-             ORDER BY days_overdue DESC
-        """),
-        {"as_at": as_at},
-    )).fetchall()
+    rows = (await session.execute(_AGING_SQL, {"as_at": as_at})).fetchall()
 
     buckets = {"current": Decimal("0"), "1_30": Decimal("0"),
                "31_60": Decimal("0"), "61_90": Decimal("0"),
                "over_90": Decimal("0")}
     detail = []
     for r in rows:
-        bal = money(r.balance)
-        overdue = int(r.days_overdue or 0)
-        if overdue <= 0:
-            bucket = "current"
-        elif overdue <= 30:
-            bucket = "1_30"
-        elif overdue <= 60:
-            bucket = "31_60"
-        elif overdue <= 90:
-            bucket = "61_90"
-        else:
-            bucket = "over_90"
-        buckets[bucket] += bal
-        detail.append({
-            "supplier_id": str(r.supplier_id) if r.supplier_id else None,
-            "supplier_name": r.supplier_name,
-            "po_number": r.po_number,
-            "total_amount": float(money(r.total_amount)),
-            "balance": float(bal),
-            "days_overdue": max(overdue, 0),
-            "bucket": bucket,
-        })
+        item = _aging_item(r)
+        buckets[item["bucket"]] += money(r.balance)
+        detail.append(item)
 
     return {
         "as_at": str(as_at) if as_at else None,
@@ -313,6 +317,15 @@ async def supplier_aging(
     }
 
 
+async def iter_supplier_aging(
+    session: AsyncSession, *, as_at: Optional[date] = None):
+    """`supplier_aging` items, streamed from a server-side cursor."""
+    result = await session.stream(
+        _AGING_SQL.execution_options(yield_per=1000), {"as_at": as_at})
+    async for r in result:
+        yield _aging_item(r)
+
+
 async def supplier_statement(
     session: AsyncSession, *, supplier_id: UUID,
     start: Optional[date] = None, end: Optional[date] = None,
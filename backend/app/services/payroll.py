@@ -36,7 +36,7 @@ gives a different (and wrong) answer for anyone whose pay varies.
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from datetime import date
+from datetime import date, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Optional
 from uuid import UUID, uuid4
@@ -195,6 +195,48 @@ def compute_paye(annual_taxable: Decimal, bands: list) -> Decimal:
     return money(tax)
 
 
+# ---------------------------------------------------------------------------
+# Attendance
+# ---------------------------------------------------------------------------
+
+async def attendance_totals(
+    session: AsyncSession,
+    *,
+    period_start: date,
+    period_end: date,
+    staff_ids: Optional[list] = None,
+) -> dict:
+    """Completed hours and days worked per staff member, in one query.
+
+    Returns {staff_id (str): (hours Decimal, days int)}; staff with no
+    completed attendance in the period are absent. The period is inclusive
+    and is applied as half-open bounds on the bare `clock_in` column, so the
+    partial index from migration y4567890123x serves it -- `DATE(clock_in)`
+    could not use any index.
+    """
+    where = ""
+    params = {"ps": period_start, "pe_excl": period_end + timedelta(days=1)}
+    if staff_ids is not None:
+        where = "AND staff_id = ANY(CAST(:ids AS uuid[]))"
+        params["ids"] = [str(s) for s in staff_ids]
+    rows = (await session.execute(
+        text(f"""
+            SELECT staff_id,
+                   COALESCE(SUM(hours_worked), 0) AS hours,
+                   COUNT(*) AS days
+              FROM attendance
+             WHERE status = 'completed'
+               AND clock_in >= CAST(:ps AS date)
+               AND clock_in < CAST(:pe_excl AS date)
+               {where}
+             GROUP BY staff_id
+        """),
+        params,
+    )).fetchall()
+    return {str(r.staff_id): (Decimal(str(r.hours)), int(r.days))
+            for r in rows}
+
+
 # ---------------------------------------------------------------------------
 # Payslip calculation
 # ---------------------------------------------------------------------------
@@ -19,7 +19,7 @@ from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.services.payroll import (
-    calculate_payslip, load_rate_config, money)
+    attendance_totals, calculate_payslip, load_rate_config, money)
 
 
 async def create_payroll_run(
@@ -97,18 +97,16 @@ async def create_payroll_run(
     employer_total = Decimal("0.00")
     skipped = []
 
+    hourly = [st.id for st in staff
+              if (st.payment_mode or "").lower() == "hourly"]
+    attendance = (await attendance_totals(
+        session, period_start=period_start, period_end=period_end,
+        staff_ids=hourly) if hourly else {})
+
     for st in staff:
         hours = None
         if (st.payment_mode or "").lower() == "hourly":
-            hours = (await session.execute(
-                text("""
-                    SELECT COALESCE(SUM(hours_worked), 0) FROM attendance
-                     WHERE staff_id = :s
-                       AND DATE(clock_in) BETWEEN :ps AND :pe
-                       AND status = 'completed'
-                """),
-                {"s": str(st.id), "ps": period_start, "pe": period_end},
-            )).scalar()
+            hours = attendance.get(str(st.id), (Decimal("0"), 0))[0]
 
         slip = await calculate_payslip(
             session, staff_row=st, config=config,
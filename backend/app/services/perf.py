@@ -0,0 +1,247 @@
+"""Per-request database instrumentation.
+
+Several routers issue one statement per row of a loop (attendance status, BOM
+requirements, bulk upload, payroll, depreciation), and nothing showed how many
+statements a request made or how long it spent in the database. This module
+counts them.
+
+* `install(engine)` hooks the engine's cursor events. Every statement executed
+  while a request is in flight is timed and attributed to that request through
+  a context variable, so concurrent requests never mix their counts.
+* `QueryProfilerMiddleware` opens the per-request tally, adds
+  `X-DB-Queries`, `X-DB-Time-Ms` and a `Server-Timing` entry to the response,
+  logs one structured line per slow or chatty request, and feeds the rolling
+  per-endpoint window behind `/api/admin/perf`.
+
+Figures are per worker process: each worker profiles the requests it served.
+The SQL text of the slowest statements goes to the log only, never to a
+response header. Disable with PERF_PROFILING=false.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+_LOG = logging.getLogger("services.perf")
+
+# A request is logged at INFO when it crosses either threshold; every other
+# request is logged at DEBUG.
+SLOW_REQUEST_MS = float(os.getenv("PERF_SLOW_REQUEST_MS", "500"))
+CHATTY_REQUEST_QUERIES = int(os.getenv("PERF_CHATTY_REQUEST_QUERIES", "50"))
+# Requests kept per endpoint for the percentile window.
+WINDOW = int(os.getenv("PERF_WINDOW", "500"))
+_SLOWEST_KEPT = 3
+_SQL_PREVIEW = 300
+
+
+def enabled() -> bool:
+    return os.getenv("PERF_PROFILING", "true").strip().lower() not in (
+        "0", "false", "no", "off")
+
+
+class RequestStats:
+    """Statement count, database time and slowest statements of one request."""
+
+    __slots__ = ("queries", "db_ms", "slowest")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.slowest: list[tuple[float, str]] = []
+
+    def record(self, statement: str, ms: float) -> None:
+        self.queries += 1
+        self.db_ms += ms
+        if (len(self.slowest) < _SLOWEST_KEPT
+                or ms > self.slowest[-1][0]):
+            self.slowest.append((ms, statement))
+            self.slowest.sort(key=lambda s: s[0], reverse=True)
+            del self.slowest[_SLOWEST_KEPT:]
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar(
+    "perf_request_stats", default=None)
+
+
+def current() -> Optional[RequestStats]:
+    """The tally of the request being served, or None outside a request."""
+    return _current.get()
+
+
+# ---------------------------------------------------------------------------
+# Engine hooks
+# ---------------------------------------------------------------------------
+
+_installed: set[int] = set()
+
+
+def install(engine) -> None:
+    """Time every statement `engine` executes. Safe to call more than once."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if id(sync_engine) in _installed:
+        return
+    _installed.add(id(sync_engine))
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("perf_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        started = conn.info.get("perf_started")
+        if stats is None or not started:
+            return
+        stats.record(statement, (time.perf_counter() - started.pop()) * 1000)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        started = conn.info.get("perf_started") if conn is not None else None
+        if started:
+            started.pop()
+
+
+# ---------------------------------------------------------------------------
+# Rolling per-endpoint window
+# ---------------------------------------------------------------------------
+
+def _p95(values: list[float]) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+class EndpointStats:
+    """The last WINDOW requests of every endpoint served by this process."""
+
+    def __init__(self, window: int = WINDOW):
+        self._window = window
+        self._samples: dict[str, deque] = defaultdict(
+            lambda: deque(maxlen=self._window))
+        self._served: dict[str, int] = defaultdict(int)
+
+    def add(self, endpoint: str, *, total_ms: float, db_ms: float,
+            queries: int) -> None:
+        self._samples[endpoint].append((total_ms, db_ms, queries))
+        self._served[endpoint] += 1
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._served.clear()
+
+    def summary(self, *, limit: int = 20, sort: str = "p95_ms") -> list[dict]:
+        rows = []
+        for endpoint, samples in self._samples.items():
+            total = [s[0] for s in samples]
+            db = [s[1] for s in samples]
+            queries = [s[2] for s in samples]
+            rows.append({
+                "endpoint": endpoint,
+                "requests": self._served[endpoint],
+                "window": len(samples),
+                "p95_ms": round(_p95(total), 1),
+                "max_ms": round(max(total), 1),
+                "p95_db_ms": round(_p95(db), 1),
+                "p95_queries": int(_p95(queries)),
+                "max_queries": max(queries),
+                "avg_queries": round(sum(queries) / len(queries), 1),
+            })
+        rows.sort(key=lambda r: r.get(sort, 0), reverse=True)
+        return rows[:limit]
+
+
+endpoint_stats = EndpointStats()
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+_route_paths: dict[int, str] = {}
+
+
+def _endpoint_label(scope) -> str:
+    """METHOD plus the route template, so /items/1 and /items/2 share a row.
+
+    Unmatched paths share one label; keying on the raw path would let random
+    404 probes grow the window without bound.
+    """
+    method = scope.get("method", "")
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return f"{method} <unmatched>"
+    path = _route_paths.get(id(endpoint))
+    if path is None:
+        app = scope.get("app")
+        for r in getattr(getattr(app, "router", None), "routes", ()):
+            if getattr(r, "endpoint", None) is endpoint:
+                path = r.path
+                break
+        path = _route_paths.setdefault(id(endpoint), path or scope.get("path", "?"))
+    return f"{method} {path}"
+
+
+class QueryProfilerMiddleware:
+    """Pure ASGI middleware; streaming responses pass through untouched."""
+
+    def __init__(self, app, *, stats: EndpointStats = endpoint_stats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = {"code": 0}
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers += [
+                    (b"x-db-queries", str(stats.queries).encode()),
+                    (b"x-db-time-ms", f"{stats.db_ms:.1f}".encode()),
+                    (b"server-timing",
+                     f'db;dur={stats.db_ms:.1f};desc="{stats.queries} queries"'
+                     .encode()),
+                ]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            endpoint = _endpoint_label(scope)
+            self.stats.add(endpoint, total_ms=total_ms, db_ms=stats.db_ms,
+                           queries=stats.queries)
+            flagged = (total_ms >= SLOW_REQUEST_MS
+                       or stats.queries >= CHATTY_REQUEST_QUERIES)
+            _LOG.log(
+                logging.INFO if flagged else logging.DEBUG,
+                json.dumps({
+                    "event": "request_db_profile",
+                    "endpoint": endpoint,
+                    "status": status["code"],
+                    "total_ms": round(total_ms, 1),
+                    "db_ms": round(stats.db_ms, 1),
+                    "queries": stats.queries,
+                    "slowest": [
+                        {"ms": round(ms, 1), "sql": " ".join(sql.split())
+                         [:_SQL_PREVIEW]}
+                        for ms, sql in stats.slowest] if flagged else [],
+                }),
+            )
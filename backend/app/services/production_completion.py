@@ -0,0 +1,207 @@
+"""Stock and cost side of a production completion, in batched statements.
+
+`create_production_completion` used to make a round trip per line:
+  * it looked up each material's and each consumable's unit cost;
+  * it looked up each consumable's cost a second time while writing the
+    line items;
+  * it wrote each line item separately;
+  * it deducted each consumable separately;
+  * it booked each stock movement separately, and each one is an upsert,
+    a lock, an update and an insert.
+A batch record with forty materials took a few hundred statements. The
+balance rows of every material stayed locked from the first of them until
+the commit, blocking everyone else who touched the same stock.
+
+The completion now takes a fixed number of statements, whatever its size:
+  1. `price_lines` reads every material cost in one `= ANY(:ids)` query,
+     and every consumable cost in another;
+  2. `book` writes all the line items with one batched INSERT per table;
+  3. `book` deducts all the consumables with one guarded UPDATE;
+  4. `book` posts every stock movement through one
+     `inventory.apply_stock_movements` call.
+
+Nothing here commits. The endpoint records the completion, books it and
+posts it to the ledger in a single transaction.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.inventory import Movement, apply_stock_movements
+
+
+@dataclass(frozen=True)
+class Line:
+    """One material or consumable line, priced at today's unit cost."""
+    item_id: str
+    quantity: float
+    unit_cost: float = 0.0
+
+    @property
+    def cost(self) -> float:
+        return self.unit_cost * self.quantity
+
+    @property
+    def total_cost(self) -> float:
+        return round(self.cost, 2)
+
+
+async def _unit_costs(session: AsyncSession, table: str,
+                      ids: Iterable[str]) -> dict[str, float]:
+    ids = sorted({str(i) for i in ids})
+    if not ids:
+        return {}
+    rows = (await session.execute(
+        text(f"SELECT id, unit_cost FROM {table} "
+             f"WHERE id = ANY(CAST(:ids AS uuid[]))"),
+        {"ids": ids},
+    )).fetchall()
+    return {str(r.id): float(r.unit_cost or 0) for r in rows}
+
+
+async def price_lines(
+    session: AsyncSession,
+    materials: list[tuple[str, float]],
+    consumables: list[tuple[str, float]],
+) -> tuple[list[Line], list[Line]]:
+    """Price (item id, quantity) pairs; an unknown item costs nothing."""
+    rm_costs = await _unit_costs(session, "raw_materials",
+                                 (i for i, _ in materials))
+    con_costs = await _unit_costs(session, "production_consumables",
+                                  (i for i, _ in consumables))
+    return (
+        [Line(str(i), q, rm_costs.get(str(i), 0.0)) for i, q in materials],
+        [Line(str(i), q, con_costs.get(str(i), 0.0)) for i, q in consumables],
+    )
+
+
+async def _insert_lines(session: AsyncSession, table: str, item_col: str,
+                        completion_id: str, lines: list[Line]) -> None:
+    if not lines:
+        return
+    await session.execute(
+        text(f"""
+            INSERT INTO {table}
+                (id, completion_id, {item_col}, quantity, unit_cost, total_cost)
+            VALUES (gen_random_uuid(), :cid, :item, :qty, :uc, :tc)
+        """),
+        [{"cid": completion_id, "item": line.item_id, "qty": line.quantity,
+          "uc": line.unit_cost, "tc": line.total_cost} for line in lines],
+    )
+
+
+async def _deduct_consumables(session: AsyncSession,
+                              lines: list[Line]) -> None:
+    """Take every consumable out of stock, or reject the whole completion.
+
+    Over-consumption is refused, not clamped at zero: the shortfall is the
+    signal of a mis-key or shrinkage. Rows are locked in id order, so two
+    completions using the same consumables cannot deadlock.
+    """
+    needed: dict[str, Decimal] = {}
+    for line in lines:
+        if line.quantity > 0:
+            needed[line.item_id] = (needed.get(line.item_id, Decimal(0))
+                                    + Decimal(str(line.quantity)))
+    if not needed:
+        return
+    ids = sorted(needed)
+    deducted = {str(r.id) for r in (await session.execute(
+        text("""
+            WITH locked AS (
+                SELECT id FROM production_consumables
+                 WHERE id = ANY(CAST(:ids AS uuid[]))
+                 ORDER BY id
+                   FOR UPDATE
+            )
+            UPDATE production_consumables pc
+               SET current_stock = pc.current_stock - v.qty
+              FROM unnest(CAST(:ids AS uuid[]), CAST(:qtys AS numeric[]))
+                   AS v(id, qty)
+              JOIN locked l ON l.id = v.id
+             WHERE pc.id = v.id AND pc.current_stock >= v.qty
+         RETURNING pc.id
+        """),
+        {"ids": ids, "qtys": [needed[i] for i in ids]},
+    )).fetchall()}
+
+    short = next((i for i in needed if i not in deducted), None)
+    if short is not None:
+        avail = (await session.execute(
+            text("SELECT name, current_stock FROM production_consumables "
+                 "WHERE id = :id"),
+            {"id": short},
+        )).fetchone()
+        raise HTTPException(
+            status_code=400,
+            detail=(f"Insufficient consumable stock for "
+                    f"{avail.name if avail else short}: "
+                    f"available {avail.current_stock if avail else 0}, "
+                    f"required {needed[short]}."),
+        )
+
+
+async def book(
+    session: AsyncSession,
+    *,
+    completion_id: str,
+    product_id: str,
+    warehouse_id: str,
+    materials: list[Line],
+    consumables: list[Line],
+    qty_produced: int,
+    qty_damaged: int,
+    cost_per_unit: float,
+    damage_notes: Optional[str] = None,
+    created_by=None,
+) -> None:
+    """Write a completion's line items and move its stock. Does not commit."""
+    await _insert_lines(session, "production_completion_consumables",
+                        "consumable_id", completion_id, consumables)
+    await _deduct_consumables(session, consumables)
+    await _insert_lines(session, "production_completion_materials",
+                        "raw_material_id", completion_id, materials)
+
+    reference = f"PRODCOMP-{completion_id}"
+    unit_cost = round(cost_per_unit, 2)
+    # Raw materials physically leave the warehouse when consumed.
+    movements = [
+        Movement(warehouse_id=warehouse_id, raw_material_id=line.item_id,
+                 movement_type="PRODUCTION_OUT", quantity=line.quantity,
+                 unit_cost=line.unit_cost, reference=reference,
+                 notes="Consumed by production completion",
+                 created_by=created_by)
+        for line in materials if line.quantity > 0
+    ]
+    # Finished goods come in at the cost this batch actually incurred,
+    # snapshotted so a later price change cannot restate it.
+    if qty_produced > 0:
+        movements.append(Movement(
+            warehouse_id=warehouse_id, product_id=product_id,
+            movement_type="PRODUCTION_IN", quantity=qty_produced,
+            unit_cost=unit_cost, reference=reference,
+            notes="Finished goods from production completion",
+            created_by=created_by))
+    # Damaged output is booked in, then written off, so the loss is
+    # traceable rather than silently never existing.
+    if qty_damaged > 0:
+        movements.append(Movement(
+            warehouse_id=warehouse_id, product_id=product_id,
+            movement_type="PRODUCTION_IN", quantity=qty_damaged,
+            unit_cost=unit_cost, reference=reference,
+            notes="Damaged output booked in prior to write-off",
+            created_by=created_by))
+        movements.append(Movement(
+            warehouse_id=warehouse_id, product_id=product_id,
+            movement_type="DAMAGE", quantity=qty_damaged,
+            unit_cost=unit_cost, reference=reference,
+            notes=(f"Damaged during production: {damage_notes}"
+                   if damage_notes else "Damaged during production"),
+            created_by=created_by))
+    await apply_stock_movements(session, movements)
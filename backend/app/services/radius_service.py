@@ -12,15 +12,20 @@ Key behaviours
 * Refuses access when an employee account is inactive or locked (i.e. Wi-Fi is
   automatically disabled when the employee account is deactivated).
 * Enforces "maximum devices per employee" and device block-lists.
-* Records every attempt to `wifi_auth_logs` for auditing.
+* Records every attempt to `wifi_auth_logs` for auditing, through a buffered
+  writer so a login storm does not add one INSERT per attempt to the auth
+  transaction.
 """
 from __future__ import annotations
 
+import asyncio
+import logging
+import os
 import uuid
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, Optional
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import (
@@ -34,6 +39,106 @@ from app.models import (
 # Reuse the EXISTING authentication primitives — do not create a new system.
 from app.api.auth import verify_password
 
+_LOG = logging.getLogger("services.radius")
+
+
+class AuthLogBuffer:
+    """Collects `wifi_auth_logs` rows and writes them in batches.
+
+    Each attempt is appended in memory and flushed with one multi-row INSERT
+    when `batch_size` rows are waiting or `flush_seconds` after the first
+    unflushed row, whichever comes first. The write uses its own session, so
+    audit rows no longer ride in (or roll back with) the auth transaction.
+
+    Rows still buffered when a worker is killed are lost; the window is
+    bounded by `flush_seconds`. Readers that must see every row (the logs
+    page, the dashboard) call `flush()` first.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 50,
+        flush_seconds: float = 2.0,
+        max_pending: int = 5000,
+        session_factory: Optional[Callable] = None,
+    ):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._session_factory = session_factory
+        self._pending: list[dict] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        # The loop keeps only weak references to tasks; these are held here
+        # until they finish.
+        self._flushes: set[asyncio.Task] = set()
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from app.db import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, row: dict) -> None:
+        row.setdefault("id", uuid.uuid4())
+        row.setdefault("timestamp", datetime.now(timezone.utc))
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_size:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flush_done)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.get_running_loop().create_task(
+                self._flush_later())
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        self._flushes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _LOG.error("wifi auth log flush task failed: %r", task.exception())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_seconds)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Write every buffered row now. Returns the number written."""
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                async with self._sessions() as s:
+                    await s.execute(insert(WifiAuthLog), batch)
+                    await s.commit()
+                return len(batch)
+            except Exception as e:
+                # Put the rows back for the next flush, but never let a dead
+                # database turn the buffer into an unbounded memory leak.
+                self._pending = (batch + self._pending)[-self.max_pending:]
+                _LOG.error("wifi auth log flush failed (%d rows kept): %s",
+                           len(self._pending), e)
+                return 0
+
+
+def _buffer_from_env() -> Optional[AuthLogBuffer]:
+    if os.getenv("WIFI_AUTH_LOG_BUFFERED", "true").lower() in (
+            "0", "false", "no", "off"):
+        return None
+    return AuthLogBuffer(
+        batch_size=int(os.getenv("WIFI_AUTH_LOG_BATCH", "50")),
+        flush_seconds=float(os.getenv("WIFI_AUTH_LOG_FLUSH_SECONDS", "2")),
+    )
+
+
+# Process-wide writer shared by every RadiusService. None means unbuffered:
+# each attempt is added to the caller's session as before.
+auth_log_buffer: Optional[AuthLogBuffer] = _buffer_from_env()
+
 
 class AuthResult:
     """Lightweight result object returned by authenticate_user()."""
@@ -54,8 +159,9 @@ class AuthResult:
 class RadiusService:
     """Service layer wrapping Wi-Fi authentication & session management."""
 
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, log_buffer: Optional[AuthLogBuffer] = None):
         self.db = db
+        self.log_buffer = log_buffer if log_buffer is not None else auth_log_buffer
 
     # ------------------------------------------------------------------ utils
     async def _get_settings(self) -> Optional[WifiSettings]:
@@ -63,17 +169,22 @@ class RadiusService:
         return result.scalar_one_or_none()
 
     async def _find_user(self, username: str) -> Optional[User]:
-        """Resolve an employee by email or phone (existing login identifiers)."""
-        ident = (username or "").strip().lower()
+        """Resolve an employee by email or phone (existing login identifiers).
+
+        One query over both identifiers, served by the lower(email) and phone
+        indexes. An email match wins over a phone match, as it did when these
+        were two sequential lookups.
+        """
+        raw = (username or "").strip()
+        ident = raw.lower()
+        email_match = func.lower(User.email) == ident
         result = await self.db.execute(
-            select(User).where(func.lower(User.email) == ident)
+            select(User)
+            .where(or_(email_match, User.phone == raw))
+            .order_by(email_match.desc())
+            .limit(1)
         )
-        user = result.scalar_one_or_none()
-        if user:
-            return user
-        # Fall back to phone-based lookup (existing system supports phone login).
-        result = await self.db.execute(select(User).where(User.phone == username))
-        return result.scalar_one_or_none()
+        return result.scalars().first()
 
     async def _log(
         self,
@@ -85,17 +196,18 @@ class RadiusService:
         result: str,
         failure_reason: Optional[str] = None,
     ) -> None:
-        self.db.add(
-            WifiAuthLog(
-                id=uuid.uuid4(),
-                employee_id=employee_id,
-                username=username,
-                ip_address=ip_address,
-                device_mac=device_mac,
-                authentication_result=result,
-                failure_reason=failure_reason,
-            )
+        row = dict(
+            employee_id=employee_id,
+            username=username,
+            ip_address=ip_address,
+            device_mac=device_mac,
+            authentication_result=result,
+            failure_reason=failure_reason,
         )
+        if self.log_buffer is not None:
+            self.log_buffer.add(row)
+            return
+        self.db.add(WifiAuthLog(id=uuid.uuid4(), **row))
 
     # ----------------------------------------------------------- authenticate
     async def authenticate_user(
@@ -0,0 +1,122 @@
+"""Shared fixed-window rate limiting.
+
+The captive portal used to keep per-IP deques in a module-level dict. Under
+uvicorn/gunicorn with N workers that is N independent limiters -- a client got
+N times the advertised budget -- and every restart wiped the counters.
+
+`PostgresRateLimitStore` keeps one row per bucket in `rate_limit_buckets` and
+counts a hit with a single upsert, so every worker sees the same counter and
+the hit is atomic without an explicit lock. The window is fixed rather than
+sliding: a client can land up to twice the limit across a window boundary,
+which is an acceptable price for one round trip per attempt.
+
+`MemoryRateLimitStore` is the local stand-in for development, single-worker
+deployments and tests. Select with RATE_LIMIT_STORE=memory|postgres.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+_LOG = logging.getLogger("services.rate_limit")
+
+# How often (in hits per process) the Postgres store clears buckets whose
+# window closed long ago. The table holds one row per client key, so this only
+# stops it accumulating one-off visitors.
+_PRUNE_EVERY = 500
+_PRUNE_AFTER_SECONDS = 86400
+
+
+class MemoryRateLimitStore:
+    """Sliding-window counter held in this process only."""
+
+    def __init__(self):
+        self._buckets: dict[str, deque] = defaultdict(deque)
+
+    async def hit(self, key: str, *, limit: int, window_seconds: int) -> bool:
+        """Record one hit; return False if the key is over its limit."""
+        now = time.monotonic()
+        bucket = self._buckets[key]
+        while bucket and now - bucket[0] > window_seconds:
+            bucket.popleft()
+        if len(bucket) >= limit:
+            return False
+        bucket.append(now)
+        return True
+
+    def reset(self) -> None:
+        self._buckets.clear()
+
+
+class PostgresRateLimitStore:
+    """Fixed-window counter shared by every worker through Postgres.
+
+    Uses its own short transaction, so a hit is counted even when the request
+    that made it later fails and rolls back -- a failed login must still spend
+    budget, or the limiter would only ever throttle successful attempts.
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None):
+        self._session_factory = session_factory
+        self._fallback = MemoryRateLimitStore()
+        self._calls = 0
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from app.db import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory()
+
+    async def hit(self, key: str, *, limit: int, window_seconds: int) -> bool:
+        """Record one hit; return False if the key is over its limit."""
+        try:
+            async with self._sessions() as s:
+                hits = (await s.execute(
+                    text("""
+                        INSERT INTO rate_limit_buckets
+                            (bucket_key, window_start, hits)
+                        VALUES (:k, NOW(), 1)
+                        ON CONFLICT (bucket_key) DO UPDATE SET
+                            hits = CASE
+                                WHEN rate_limit_buckets.window_start
+                                     <= NOW() - make_interval(secs => :w)
+                                THEN 1
+                                ELSE rate_limit_buckets.hits + 1 END,
+                            window_start = CASE
+                                WHEN rate_limit_buckets.window_start
+                                     <= NOW() - make_interval(secs => :w)
+                                THEN NOW()
+                                ELSE rate_limit_buckets.window_start END
+                        RETURNING hits
+                    """),
+                    {"k": key, "w": window_seconds},
+                )).scalar_one()
+                self._calls += 1
+                if self._calls % _PRUNE_EVERY == 0:
+                    await s.execute(
+                        text("""DELETE FROM rate_limit_buckets
+                                 WHERE window_start
+                                       < NOW() - make_interval(secs => :a)"""),
+                        {"a": _PRUNE_AFTER_SECONDS},
+                    )
+                await s.commit()
+            return hits <= limit
+        except Exception as e:
+            # Losing the shared store must not lock every employee out of the
+            # network; degrade to this worker's own counter instead.
+            _LOG.warning("rate-limit store unavailable, using local: %s", e)
+            return await self._fallback.hit(
+                key, limit=limit, window_seconds=window_seconds)
+
+
+def build_store():
+    """The store selected by RATE_LIMIT_STORE (default: postgres)."""
+    kind = os.getenv("RATE_LIMIT_STORE", "postgres").strip().lower()
+    if kind == "memory":
+        return MemoryRateLimitStore()
+    return PostgresRateLimitStore()
@@ -0,0 +1,211 @@
+"""Type-ahead search across products, raw materials, customers and staff.
+
+The sales and POS screens search on every keystroke. The list endpoints they
+used filter with `ILIKE '%term%'` and repeat the filter in a COUNT(*), which
+was two sequential scans per keystroke. This module answers a type-ahead
+query in one statement:
+
+* **Matching** is a substring match (`ILIKE '%term%'`) on each entity's
+  searchable columns, served by the pg_trgm GIN indexes from migration
+  w2345678901v.
+* **Ranking** puts an exact match first, then a prefix match, then a
+  word-prefix match. Ties are broken by trigram `similarity()`, so "amox"
+  ranks "Amoxicillin 500mg" above "Co-amoxiclav".
+* **Short-circuits.** A term that cannot match anything (empty, or
+  punctuation only) never reaches the database. When the user extends a term
+  whose cached result was *complete* (fewer hits than the limit), the new
+  result is a subset of the old one, because every string containing "amox"
+  also contains "amo". It is filtered from the cache instead of queried.
+* **Cache.** Results are cached per (term, kinds, limit) for a few seconds,
+  in a small LRU. Type-ahead results only need to be fresh to within a few
+  seconds; a product created a moment ago shows up once the entry expires.
+
+The cache is per worker process.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "10"))
+CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+MAX_LIMIT = 50
+
+# kind -> how to search it. `fields` are the searchable SQL expressions (each
+# covered by a trigram index); `label` and `detail` are what the picker shows.
+ENTITIES = {
+    "products": {
+        "table": "products",
+        "fields": ("name", "sku"),
+        "label": "name",
+        "detail": "sku",
+        "where": "TRUE",
+    },
+    "raw_materials": {
+        "table": "raw_materials",
+        "fields": ("name", "sku"),
+        "label": "name",
+        "detail": "sku",
+        "where": "TRUE",
+    },
+    "customers": {
+        "table": "customers",
+        "fields": ("name", "phone", "email"),
+        "label": "name",
+        "detail": "COALESCE(phone, email, customer_code)",
+        "where": "COALESCE(is_active, TRUE)",
+    },
+    "staff": {
+        "table": "employees",
+        "fields": ("(first_name || ' ' || last_name)", "employee_number"),
+        "label": "(first_name || ' ' || last_name)",
+        "detail": "employee_number",
+        "where": "COALESCE(is_active, TRUE)",
+    },
+}
+
+_MATCH = {3: "exact", 2: "prefix", 1: "word", 0: "contains"}
+
+_cache: "OrderedDict[tuple, tuple[float, bool, list[dict]]]" = OrderedDict()
+
+
+def normalise(term: Optional[str]) -> str:
+    """Lower-case, trim and collapse internal whitespace."""
+    return " ".join((term or "").lower().split())
+
+
+def _like_escape(term: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", term)
+
+
+def _tier(term: str, values: Iterable[Optional[str]]) -> int:
+    """3 exact, 2 prefix, 1 word-prefix, 0 substring -- the best field wins."""
+    best = 0
+    for v in values:
+        v = (v or "").lower()
+        if v == term:
+            return 3
+        if v.startswith(term):
+            best = max(best, 2)
+        elif f" {term}" in v:
+            best = max(best, 1)
+    return best
+
+
+def _build_sql(kinds: list[str]) -> str:
+    parts = []
+    for kind in kinds:
+        e = ENTITIES[kind]
+        fields = e["fields"]
+        match = " OR ".join(f"{f} ILIKE :contains ESCAPE '\\'" for f in fields)
+        tier = "GREATEST(" + ", ".join(
+            f"""CASE WHEN lower({f}) = :term THEN 3
+                     WHEN lower({f}) LIKE :prefix ESCAPE '\\' THEN 2
+                     WHEN lower({f}) LIKE :word ESCAPE '\\' THEN 1
+                     ELSE 0 END""" for f in fields) + ")"
+        sim = "GREATEST(" + ", ".join(
+            f"similarity(COALESCE({f}, ''), :term)" for f in fields) + ")"
+        values = ", ".join(f"CAST({f} AS text)" for f in fields)
+        parts.append(f"""
+            (SELECT '{kind}' AS kind, CAST(id AS text) AS id,
+                    {e['label']} AS label, {e['detail']} AS detail,
+                    ARRAY[{values}] AS search_values,
+                    {tier} AS tier, {sim} AS sim
+               FROM {e['table']}
+              WHERE {e['where']} AND ({match})
+              ORDER BY tier DESC, sim DESC, label
+              LIMIT :limit)""")
+    return " UNION ALL ".join(parts)
+
+
+def _from_parent(term: str, kinds: tuple, limit: int):
+    """Answer from a cached, complete result for a shorter prefix of `term`.
+
+    Returns (expires_at, hits) -- the parent's expiry, so a derived entry
+    never outlives the data it was derived from -- or None.
+    """
+    now = time.monotonic()
+    for cut in range(len(term) - 1, 0, -1):
+        entry = _cache.get((term[:cut], kinds, limit))
+        if entry is None or entry[0] < now or not entry[1]:
+            continue
+        hits = [dict(h, tier=_tier(term, h["_values"]))
+                for h in entry[2]
+                if any(term in (v or "").lower() for v in h["_values"])]
+        # Stable sort: the parent's similarity order breaks ties.
+        hits.sort(key=lambda h: h["tier"], reverse=True)
+        return entry[0], hits
+    return None
+
+
+def _remember(key: tuple, complete: bool, hits: list[dict],
+              expires_at: Optional[float] = None) -> None:
+    _cache[key] = (expires_at or time.monotonic() + CACHE_TTL_SECONDS,
+                   complete, hits)
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+async def search(
+    session: AsyncSession,
+    *,
+    term: Optional[str],
+    kinds: Optional[Iterable[str]] = None,
+    limit: int = 10,
+) -> dict:
+    """Ranked matches for `term`, grouped by kind, at most `limit` per kind."""
+    term = normalise(term)
+    kinds = tuple(sorted(set(kinds or ENTITIES) & set(ENTITIES)))
+    limit = max(1, min(limit, MAX_LIMIT))
+    empty = {"term": term, "results": {k: [] for k in kinds}, "source": "none"}
+    if not kinds or not re.search(r"\w", term):
+        return empty
+
+    key = (term, kinds, limit)
+    entry = _cache.get(key)
+    source = "cache"
+    if entry is not None and entry[0] >= time.monotonic():
+        _cache.move_to_end(key)
+        hits = entry[2]
+    else:
+        derived = _from_parent(term, kinds, limit)
+        if derived is not None:
+            source = "prefix"
+            expires_at, hits = derived
+            _remember(key, True, hits, expires_at)
+        else:
+            source = "database"
+            escaped = _like_escape(term)
+            rows = (await session.execute(
+                text(_build_sql(list(kinds))),
+                {"term": term, "contains": f"%{escaped}%",
+                 "prefix": f"{escaped}%", "word": f"% {escaped}%",
+                 "limit": limit},
+            )).fetchall()
+            hits = [{"kind": r.kind, "id": r.id, "label": r.label,
+                     "detail": r.detail, "tier": int(r.tier),
+                     "_values": list(r.search_values)} for r in rows]
+            counts = {k: 0 for k in kinds}
+            for h in hits:
+                counts[h["kind"]] += 1
+            # Complete only if no kind hit its limit: otherwise a longer term
+            # could match rows this result never fetched.
+            _remember(key, all(n < limit for n in counts.values()), hits)
+
+    results = {k: [] for k in kinds}
+    for h in hits:
+        results[h["kind"]].append(
+            {"id": h["id"], "label": h["label"], "detail": h["detail"],
+             "match": _MATCH[h["tier"]]})
+    return {"term": term, "results": results, "source": source}
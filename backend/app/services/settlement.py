@@ -58,6 +58,7 @@ from fastapi import HTTPException
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.services import settlement_rollup
 from app.services.ledger import Line, money, post_entry, reverse_entry
 from app.services.posting import (
     ACC_BANK, ACC_CASH, already_posted, business_date, posting_enabled)
@@ -818,6 +819,8 @@ async def distribute_payment(
                 {"sid": str(settlement_id),
                  "eid": str(entry_id) if entry_id else None},
             )
+            await settlement_rollup.apply_settlement(
+                session, settlement_id=settlement_id)
 
             await mapd_audit(
                 session, event_type="SETTLEMENT_COMPLETED",
@@ -951,7 +954,6 @@ async def distribute_payment_safely(
             session, payment_id=payment_id, created_by=created_by,
             actor_label="auto (payment received)")
         await outer.commit()
-        return result
     except Exception as e:                                # noqa: BLE001
         # distribute_payment handles its own failures; reaching here means
         # something outside that guard broke. Log loudly and let the payment
@@ -959,7 +961,29 @@ async def distribute_payment_safely(
         # /api/payments/undistributed and settlement_health flags it.
         await outer.rollback()
         print(f"[MAPD] distribution hook failed for payment {payment_id}: {e}")
-        return {"status": "ERROR", "reason": str(e)}
+        result = {"status": "ERROR", "reason": str(e)}
+
+    if result["status"] in ("FAILED", "ERROR"):
+        # Queued with the payment itself, so the retry cannot be lost; the
+        # outbox backs off between attempts until the cause is fixed.
+        from app.services import outbox
+        await outbox.enqueue(
+            session, "mapd_retry", {"payment_id": str(payment_id)},
+            delay_seconds=outbox.RETRY_SECONDS)
+    return result
+
+
+async def retry_distribution(session: AsyncSession, payment_id) -> str:
+    """One automatic re-attempt for a payment; returns the resulting status.
+
+    Used by the outbox. A payment that has since been settled (by hand, or
+    by an earlier delivery of the same event) is left alone.
+    """
+    if not mapd_enabled():
+        return "DISABLED"
+    result = await distribute_payment(
+        session, payment_id=payment_id, actor_label="auto (retry)")
+    return result["status"]
 
 
 async def retry_failed_settlements(
@@ -1152,6 +1176,8 @@ async def refund_settlement(
             text("UPDATE settlements SET status = 'REVERSED' WHERE id = :sid"),
             {"sid": str(settlement_id)},
         )
+        await settlement_rollup.apply_settlement(
+            session, settlement_id=settlement_id, reverse=True)
 
     await mapd_audit(
         session, event_type="SETTLEMENT_REFUNDED",
@@ -0,0 +1,262 @@
+"""Daily settlement rollup: the read model behind the distribution reports.
+
+The revenue report and the finance dashboard used to join every settlement
+detail to its settlement, product, account and business unit on each call,
+filtering on `CAST(s.distributed_at AS date)`. Their cost grew with the whole
+settlement history. They now read `settlement_daily_rollup` (migration
+x3456789012w), which has one row per distribution day and per product,
+destination account, business unit and day total. A year of history is a few
+thousand rollup rows.
+
+Consistency model: settlement details are append-only, and a settlement
+changes status in only two ways that matter here. It becomes COMPLETED once,
+when it is distributed, and it becomes REVERSED once, on a full refund. So the
+rollup is kept by delta. `apply_settlement` adds a settlement's figures to its
+distribution day when it completes, and subtracts them again when it is
+reversed, inside the caller's transaction. The upsert's row locks serialise
+concurrent writers on the same day. `rebuild` recomputes any range from the
+source tables if the two ever need reconciling.
+
+Partial refunds leave the settlement COMPLETED and the rollup unchanged,
+matching the detail-based report this replaces.
+
+Business units are taken from the destination account when the settlement
+completes. Moving an account to another unit does not re-attribute past
+distributions until the range is rebuilt.
+
+None of these functions commit; the caller owns the transaction boundary.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NIL = "00000000-0000-0000-0000-000000000000"
+
+# Shared by the per-settlement delta and the range rebuild, which differ only
+# in which settlements they read and in the sign of the figures.
+_ROLLUP_SELECT = f"""
+    SELECT x.day,
+           CASE WHEN GROUPING(x.product_id) = 0 THEN 'product'
+                WHEN GROUPING(x.financial_account_id) = 0 THEN 'account'
+                WHEN GROUPING(x.business_unit_id) = 0 THEN 'business_unit'
+                ELSE 'total' END AS dimension,
+           COALESCE(x.product_id, x.financial_account_id, x.business_unit_id,
+                    CAST('{NIL}' AS uuid)) AS key_id,
+           {{sign}} * COALESCE(SUM(x.amount) FILTER
+               (WHERE x.allocation_type = 'CASH'), 0) AS cash,
+           {{sign}} * COALESCE(SUM(x.amount) FILTER
+               (WHERE x.allocation_type = 'OBLIGATION'), 0) AS obligations,
+           {{sign}} * COUNT(DISTINCT x.settlement_id) AS settlements
+      FROM (SELECT CAST(s.distributed_at AS date) AS day,
+                   d.settlement_id, d.product_id, d.financial_account_id,
+                   fa.business_unit_id, d.allocation_type, d.amount
+              FROM settlements s
+              JOIN settlement_details d ON d.settlement_id = s.id
+              LEFT JOIN financial_accounts fa
+                     ON fa.id = d.financial_account_id
+             WHERE s.distributed_at IS NOT NULL AND {{where}}) x
+     GROUP BY GROUPING SETS ((x.day, x.product_id),
+                             (x.day, x.financial_account_id),
+                             (x.day, x.business_unit_id),
+                             (x.day))
+"""
+
+_rollup_ready: Optional[bool] = None
+
+
+async def rollup_ready(session: AsyncSession) -> bool:
+    """Has migration x3456789012w been applied? A True result is cached."""
+    global _rollup_ready
+    if _rollup_ready:
+        return True
+    found = (await session.execute(text(
+        "SELECT to_regclass('public.settlement_daily_rollup') IS NOT NULL"
+    ))).scalar()
+    _rollup_ready = bool(found)
+    return _rollup_ready
+
+
+async def apply_settlement(
+    session: AsyncSession, *, settlement_id: UUID, reverse: bool = False,
+) -> None:
+    """Add a newly COMPLETED settlement to its day, or take a reversed one out.
+
+    Call exactly once per transition, after `distributed_at` is set and in
+    the same transaction as the status change.
+    """
+    if not await rollup_ready(session):
+        return
+    sign = -1 if reverse else 1
+    await session.execute(
+        text(f"""
+            INSERT INTO settlement_daily_rollup AS r
+                (day, dimension, key_id, cash, obligations, settlements)
+            {_ROLLUP_SELECT.format(sign=sign, where="s.id = :sid")}
+            ON CONFLICT (day, dimension, key_id) DO UPDATE
+               SET cash = r.cash + EXCLUDED.cash,
+                   obligations = r.obligations + EXCLUDED.obligations,
+                   settlements = r.settlements + EXCLUDED.settlements
+        """),
+        {"sid": str(settlement_id)},
+    )
+    if reverse:
+        # A fully reversed day/key has nothing left to report.
+        await session.execute(
+            text("""DELETE FROM settlement_daily_rollup
+                     WHERE settlements <= 0
+                       AND day = (SELECT CAST(distributed_at AS date)
+                                    FROM settlements WHERE id = :sid)"""),
+            {"sid": str(settlement_id)},
+        )
+
+
+def _bounds(start: Optional[date], end: Optional[date],
+            column: str) -> tuple[str, dict]:
+    """Half-open bounds on a bare column, so an index on it can serve them."""
+    where, params = [], {}
+    if start:
+        where.append(f"{column} >= CAST(:start AS date)")
+        params["start"] = start
+    if end:
+        where.append(f"{column} < CAST(:end_excl AS date)")
+        params["end_excl"] = end + timedelta(days=1)
+    return (" AND ".join(where) if where else "TRUE"), params
+
+
+async def rebuild(
+    session: AsyncSession,
+    *,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> None:
+    """Recompute the rollup for a range of days (all days by default).
+
+    Takes a table lock so no settlement completes into a half-rebuilt day.
+    """
+    await session.execute(text(
+        "LOCK TABLE settlement_daily_rollup IN EXCLUSIVE MODE"))
+    day_where, params = _bounds(start, end, "day")
+    await session.execute(
+        text(f"DELETE FROM settlement_daily_rollup WHERE {day_where}"), params)
+    ts_where, _ = _bounds(start, end, "s.distributed_at")
+    await session.execute(
+        text(f"""
+            INSERT INTO settlement_daily_rollup
+                (day, dimension, key_id, cash, obligations, settlements)
+            {_ROLLUP_SELECT.format(
+                sign=1, where=f"s.status = 'COMPLETED' AND {ts_where}")}
+        """),
+        params,
+    )
+
+
+async def revenue(
+    session: AsyncSession,
+    *,
+    group_by: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> list[dict]:
+    """Distributed cash and obligations per product, account, unit or day."""
+    where, params = _bounds(start, end, "r.day")
+    if group_by == "day":
+        sql = f"""
+            SELECT CAST(r.day AS text) AS label, NULL AS key,
+                   r.cash, r.obligations, r.settlements
+              FROM settlement_daily_rollup r
+             WHERE r.dimension = 'total' AND {where}
+        """
+    else:
+        label, key, join = {
+            "product": ("COALESCE(pr.name, 'Unknown product')", "pr.sku",
+                        "LEFT JOIN products pr ON pr.id = r.key_id"),
+            "account": ("fa.name", "fa.code",
+                        "LEFT JOIN financial_accounts fa ON fa.id = r.key_id"),
+            "business_unit": ("COALESCE(bu.name, 'Unassigned')", "bu.code",
+                              "LEFT JOIN business_units bu ON bu.id = r.key_id"),
+        }[group_by]
+        sql = f"""
+            SELECT {label} AS label, {key} AS key,
+                   SUM(r.cash) AS cash, SUM(r.obligations) AS obligations,
+                   SUM(r.settlements) AS settlements
+              FROM settlement_daily_rollup r
+              {join}
+             WHERE r.dimension = '{group_by}' AND {where}
+             GROUP BY 1, 2
+        """
+    rows = (await session.execute(
+        text(f"{sql} ORDER BY cash DESC"), params)).fetchall()
+    return [
+        {"label": r.label, "key": r.key, "cash": r.cash,
+         "obligations": r.obligations, "settlements": int(r.settlements)}
+        for r in rows
+    ]
+
+
+async def dashboard_breakdowns(
+    session: AsyncSession,
+    *,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> dict:
+    """Per-account, per-product, per-unit and daily figures for the dashboard."""
+    where, params = _bounds(start, end, "r.day")
+
+    by_account = (await session.execute(
+        text(f"""
+            SELECT fa.code, fa.name, fa.status,
+                   bu.name AS business_unit,
+                   COALESCE(t.total, 0) AS total,
+                   COALESCE(t.settlements, 0) AS settlements
+              FROM financial_accounts fa
+              LEFT JOIN (
+                    SELECT r.key_id,
+                           SUM(r.cash + r.obligations) AS total,
+                           SUM(r.settlements) AS settlements
+                      FROM settlement_daily_rollup r
+                     WHERE r.dimension = 'account' AND {where}
+                     GROUP BY r.key_id
+              ) t ON t.key_id = fa.id
+              LEFT JOIN business_units bu ON bu.id = fa.business_unit_id
+             ORDER BY total DESC, fa.code
+        """), params)).fetchall()
+
+    by_product = (await session.execute(
+        text(f"""
+            SELECT pr.name AS product, pr.sku, SUM(r.cash) AS total
+              FROM settlement_daily_rollup r
+              LEFT JOIN products pr ON pr.id = r.key_id
+             WHERE r.dimension = 'product' AND {where}
+             GROUP BY pr.name, pr.sku
+             ORDER BY total DESC LIMIT 20
+        """), params)).fetchall()
+
+    by_unit = (await session.execute(
+        text(f"""
+            SELECT COALESCE(bu.name, 'Unassigned') AS business_unit,
+                   SUM(r.cash) AS total
+              FROM settlement_daily_rollup r
+              LEFT JOIN business_units bu ON bu.id = r.key_id
+             WHERE r.dimension = 'business_unit' AND {where}
+             GROUP BY 1 ORDER BY total DESC
+        """), params)).fetchall()
+
+    daily = (await session.execute(
+        text(f"""
+            SELECT r.day, r.cash AS total
+              FROM settlement_daily_rollup r
+             WHERE r.dimension = 'total' AND {where}
+             ORDER BY r.day DESC LIMIT 30
+        """), params)).fetchall()
+
+    return {
+        "by_account": by_account,
+        "by_product": by_product,
+        "by_unit": by_unit,
+        "daily": daily,
+    }
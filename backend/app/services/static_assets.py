@@ -0,0 +1,217 @@
+"""The PWA bundle, indexed once and served from memory.
+
+`/static/...` used to open and read its file on every request, with no
+caching headers and no compression. Every client that reopened the app
+fetched the whole JS/CSS bundle again, through a worker that should have
+been answering API calls.
+
+`AssetIndex.build` walks `frontend/build` once, at startup:
+
+* Each file is read and hashed. Files up to STATIC_MAX_MEMORY_FILE bytes
+  (default 4 MiB) stay in memory; larger ones are streamed from disk.
+* Compressed variants come from `.br`/`.gz` files next to the original, as
+  written by `scripts/precompress_assets.py`, when they are at least as new.
+  Otherwise a textual file is gzip-compressed here, and brotli-compressed
+  when the optional `brotli` package is installed. A variant is kept only
+  if it is smaller.
+* File names carrying a build hash (`main.51fd89a1.js`) never change
+  content, so they are sent `public, max-age=31536000, immutable`. Everything
+  else is `no-cache`: stored, but revalidated on each use.
+
+`AssetIndex.response` picks the variant the client accepts and answers
+`If-None-Match` / `If-Modified-Since` with 304. Only indexed files can be
+served, so no path from the URL ever reaches the filesystem. Responses
+carry their own Content-Encoding, which `CompressionMiddleware` leaves alone.
+Files added after startup are not indexed; callers fall back to reading
+them from disk.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from app.services import compression
+from app.services.http_cache import etag_matches
+
+_LOG = logging.getLogger("services.static_assets")
+
+MAX_MEMORY_FILE = int(os.getenv("STATIC_MAX_MEMORY_FILE", str(4 * 1024 * 1024)))
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Build hashes as emitted by react-scripts: main.51fd89a1.js, 453.1c2e8f0a.chunk.css
+_HASHED = re.compile(r"\.[0-9a-f]{8,}\.")
+_SIDECARS = {".br": "br", ".gz": "gzip"}
+# Preferred first.
+_ENCODINGS = ("br", "gzip")
+_MEDIA_TYPES = {
+    ".js": "application/javascript",
+    ".map": "application/json",
+    ".ico": "image/x-icon",
+    ".json": "application/json",
+    ".txt": "text/plain",
+}
+
+
+@dataclass(frozen=True)
+class Variant:
+    encoding: Optional[str]
+    etag: str
+    size: int
+    path: Path
+    body: Optional[bytes]
+
+
+@dataclass
+class Asset:
+    media_type: str
+    cache_control: str
+    mtime: float
+    variants: dict = field(default_factory=dict)
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.mtime, usegmt=True)
+
+
+def media_type_for(path: Path) -> str:
+    return (_MEDIA_TYPES.get(path.suffix.lower())
+            or mimetypes.guess_type(path.name)[0]
+            or "application/octet-stream")
+
+
+def _sidecar(path: Path, suffix: str) -> Optional[Path]:
+    candidate = path.with_name(path.name + suffix)
+    try:
+        if candidate.stat().st_mtime >= path.stat().st_mtime:
+            return candidate
+    except OSError:
+        pass
+    return None
+
+
+def _compress(data: bytes, encoding: str) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if compression.brotli is not None:
+        return compression.brotli.compress(data, quality=5)
+    return None
+
+
+class AssetIndex:
+    """Every file of a build directory, ready to serve."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._assets: dict[str, Asset] = {}
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    @classmethod
+    def build(cls, root: Path) -> "AssetIndex":
+        index = cls(root)
+        in_memory = 0
+        for path in sorted(root.rglob("*")):
+            if not path.is_file() or path.suffix in _SIDECARS:
+                continue
+            asset = index._add(path)
+            in_memory += sum(len(v.body) for v in asset.variants.values()
+                             if v.body is not None)
+        _LOG.info("indexed %d static files under %s (%d KiB in memory)",
+                  len(index), root, in_memory // 1024)
+        return index
+
+    def _add(self, path: Path) -> Asset:
+        rel = path.relative_to(self.root).as_posix()
+        stat = path.stat()
+        keep = stat.st_size <= MAX_MEMORY_FILE
+        data = path.read_bytes()
+        digest = hashlib.sha1(data).hexdigest()[:20]
+        media_type = media_type_for(path)
+        asset = Asset(
+            media_type=media_type,
+            cache_control=IMMUTABLE if _HASHED.search(path.name) else REVALIDATE,
+            mtime=stat.st_mtime,
+        )
+        asset.variants[None] = Variant(None, f'"{digest}"', stat.st_size,
+                                       path, data if keep else None)
+
+        for suffix, encoding in _SIDECARS.items():
+            sidecar = _sidecar(path, suffix)
+            if sidecar is not None:
+                size = sidecar.stat().st_size
+                body = sidecar.read_bytes() if size <= MAX_MEMORY_FILE else None
+            elif (keep and stat.st_size >= compression.MIN_BYTES
+                  and compression.is_compressible(media_type)):
+                body = _compress(data, encoding)
+                size = len(body) if body is not None else 0
+            else:
+                continue
+            if (body is None and sidecar is None) or size >= stat.st_size:
+                continue
+            asset.variants[encoding] = Variant(
+                encoding, f'"{digest}-{encoding}"', size, sidecar or path, body)
+
+        self._assets[rel] = asset
+        return asset
+
+    def get(self, rel_path: str) -> Optional[Asset]:
+        return self._assets.get(rel_path.lstrip("/"))
+
+    def response(self, request: Request, rel_path: str) -> Optional[Response]:
+        """The file at `rel_path` for this request, or None if not indexed."""
+        asset = self.get(rel_path)
+        if asset is None:
+            return None
+        offered = compression.offered_encodings(
+            request.headers.get("accept-encoding", ""))
+        variant = asset.variants[None]
+        for encoding in _ENCODINGS:
+            if encoding in asset.variants and offered.get(encoding, 0) > 0:
+                variant = asset.variants[encoding]
+                break
+
+        headers = {
+            "ETag": variant.etag,
+            "Last-Modified": asset.last_modified,
+            "Cache-Control": asset.cache_control,
+        }
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if self._not_modified(request, asset):
+            return Response(status_code=304, headers=headers)
+
+        if variant.encoding:
+            headers["Content-Encoding"] = variant.encoding
+        if variant.body is not None:
+            return Response(content=variant.body, media_type=asset.media_type,
+                            headers=headers)
+        return FileResponse(variant.path, media_type=asset.media_type,
+                            headers=headers)
+
+    @staticmethod
+    def _not_modified(request: Request, asset: Asset) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Any representation's tag will do: they share the content.
+            return any(etag_matches(if_none_match, v.etag)
+                       for v in asset.variants.values())
+        since = request.headers.get("if-modified-since")
+        if since:
+            try:
+                return int(asset.mtime) <= parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
@@ -0,0 +1,374 @@
+"""Stock on hand as of a past date, from monthly checkpoints.
+
+`stock_levels` holds only today's balance. Until now the only way to answer
+"what was in warehouse X at the end of day D" was to replay `stock_movements`
+from the first row. Here:
+
+* **Checkpoints.** `build_checkpoints` writes one `stock_checkpoints` row per
+  (warehouse, item) at the start of every month. Months start at UTC
+  midnight, the same instant as the `stock_movements` partitions, so a
+  checkpoint never splits an archived partition. A row holds the quantity
+  on hand just before that moment, plus the running costed-inbound quantity
+  and value. Each month is
+  built from the previous month's rows plus that month's movements, so a
+  build reads one month of the ledger. A month is built only GRACE after it
+  starts, once every transaction stamped before it has committed.
+  `run_checkpointer` calls it every STOCK_CHECKPOINT_CHECK_SECONDS.
+* **Positions.** `stock_as_of` reads the newest checkpoint before the end
+  of business day D (posting.BUSINESS_TZ) and adds the movements from that
+  checkpoint to the end of D. That is one checkpoint read plus at most a
+  month of movements.
+* **Corrections.** A movement written, edited or deleted with a timestamp
+  before a built month makes that month and later ones wrong. The trigger
+  from migration e0123456789d records it, and the next build rewrites the
+  checkpoints from there. Checkpoints up to the end of an archived month
+  are never rewritten, since the month's movements are gone: a correction
+  inside it waits, marked, until the month is restored.
+
+Quantities count movement types by `inventory.MOVEMENT_DIRECTION`. Unit
+costs are weighted averages of the costed inbound movements up to the date,
+the rule `costing.weighted_average_cost` applies to today.
+
+Once a month of movements is archived, every day from the next month on
+still answers, because the next month's checkpoint covers the archived one.
+`partitions.archive_partition` therefore refuses to archive stock movements
+that no checkpoint covers yet. Days inside an archived month need the month
+restored first. That includes its last business day when BUSINESS_TZ is
+ahead of UTC, because that day ends before the UTC month does. None of this
+commits except `run_checkpointer`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import partitions
+from app.services.costing import CENT, COSTED_INBOUND, PRECISION
+from app.services.inventory import INBOUND, OUTBOUND
+from app.services.posting import BUSINESS_TZ
+
+_LOG = logging.getLogger("services.stock_history")
+
+CHECK_SECONDS = float(os.getenv("STOCK_CHECKPOINT_CHECK_SECONDS", "3600"))
+
+# How long after a month starts before it is built. Rows are stamped with
+# their transaction's start time, so one that began just before midnight can
+# commit after it.
+GRACE = timedelta(hours=1)
+
+# Arbitrary, but fixed: every worker must contend for the same key.
+LOCK_KEY = 4_217_120_048
+
+_ready: Optional[bool] = None
+
+_SIGNED = """CASE WHEN sm.movement_type = ANY(:inbound) THEN sm.quantity
+                  WHEN sm.movement_type = ANY(:outbound) THEN -sm.quantity
+                  ELSE 0 END"""
+_COSTED = """sm.movement_type = ANY(:costed) AND sm.unit_cost > 0
+             AND sm.quantity > 0"""
+
+
+@dataclass(frozen=True)
+class Position:
+    warehouse_id: UUID
+    warehouse_name: Optional[str]
+    product_id: Optional[UUID]
+    raw_material_id: Optional[UUID]
+    sku: Optional[str]
+    name: Optional[str]
+    quantity: Decimal
+    unit_cost: Optional[Decimal]  # None when no inbound movement carried one
+    value: Optional[Decimal]
+
+
+@dataclass(frozen=True)
+class StockAsOf:
+    on: date
+    checkpoint: Optional[date]  # the month start the positions were built from
+    positions: list[Position]
+
+
+def starts_at(day: date) -> datetime:
+    """Midnight at the start of `day`, in business time."""
+    return datetime.combine(day, time.min, ZoneInfo(BUSINESS_TZ))
+
+
+def month_starts_at(month: date) -> datetime:
+    """When the checkpoint for `month` is taken: its first UTC midnight,
+    as the stock_movements partitions (migration d9012345678c) divide."""
+    return datetime.combine(month, time.min, timezone.utc)
+
+
+async def ready(session: AsyncSession) -> bool:
+    """Has migration e0123456789d been applied? A True result is cached."""
+    global _ready
+    if _ready:
+        return True
+    found = (await session.execute(text(
+        "SELECT to_regclass('stock_checkpoint_months') IS NOT NULL"
+    ))).scalar()
+    _ready = bool(found)
+    return _ready
+
+
+def _positions_sql(*, base: bool, lower: bool, filters: list[str]) -> str:
+    """Positions grouped per (warehouse, item).
+
+    Sums the checkpoint rows of :base (when `base`) and the movements from
+    :lo (when `lower`) up to :hi. `filters` apply to both.
+    """
+    where = " AND ".join(filters)
+    parts = []
+    if base:
+        parts.append(f"""
+            SELECT sm.warehouse_id, sm.product_id, sm.raw_material_id,
+                   sm.quantity, sm.in_qty, sm.in_value
+              FROM stock_checkpoints sm
+             WHERE sm.as_of = :base {'AND ' + where if where else ''}""")
+    moved = ["sm.created_at < :hi"] + (["sm.created_at >= :lo"] if lower else [])
+    parts.append(f"""
+            SELECT sm.warehouse_id, sm.product_id, sm.raw_material_id,
+                   {_SIGNED},
+                   CASE WHEN {_COSTED} THEN sm.quantity ELSE 0 END,
+                   CASE WHEN {_COSTED} THEN sm.quantity * sm.unit_cost ELSE 0 END
+              FROM stock_movements sm
+             WHERE {' AND '.join(moved + filters)}""")
+    return f"""
+        SELECT u.warehouse_id, u.product_id, u.raw_material_id,
+               SUM(u.quantity) AS quantity, SUM(u.in_qty) AS in_qty,
+               SUM(u.in_value) AS in_value
+          FROM ({' UNION ALL '.join(parts)}
+               ) AS u (warehouse_id, product_id, raw_material_id,
+                       quantity, in_qty, in_value)
+         GROUP BY u.warehouse_id, u.product_id, u.raw_material_id"""
+
+
+def _directions() -> dict:
+    return {"inbound": sorted(INBOUND), "outbound": sorted(OUTBOUND),
+            "costed": list(COSTED_INBOUND)}
+
+
+async def _build_month(session: AsyncSession, month: date,
+                       previous: Optional[date]) -> int:
+    params = {"m": month, "ts": month_starts_at(month),
+              "hi": month_starts_at(month), **_directions()}
+    if previous is not None:
+        params.update(base=previous, lo=month_starts_at(previous))
+    await session.execute(text("""
+        INSERT INTO stock_checkpoint_months (as_of, starts_at)
+        VALUES (:m, :ts)
+    """), params)
+    sql = _positions_sql(base=previous is not None,
+                         lower=previous is not None, filters=[])
+    result = await session.execute(text(f"""
+        INSERT INTO stock_checkpoints
+            (as_of, warehouse_id, product_id, raw_material_id,
+             quantity, in_qty, in_value)
+        SELECT :m, p.* FROM ({sql}) AS p
+    """), params)
+    await session.execute(text(
+        "UPDATE stock_checkpoint_months SET items = :n WHERE as_of = :m"),
+        {"n": result.rowcount, "m": month})
+    return result.rowcount
+
+
+async def build_checkpoints(
+    session: AsyncSession, *, now: Optional[datetime] = None,
+) -> list[date]:
+    """Rewrite stale checkpoints and build every month now due.
+
+    Returns the months built. Another worker holding the lock means the work
+    is being done; this call then returns nothing. Nor does a first build
+    while stock movements are archived, which would start without them.
+    Does not commit.
+    """
+    if not await ready(session):
+        return []
+    locked = (await session.execute(
+        text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": LOCK_KEY})).scalar()
+    if not locked:
+        return []
+
+    # Checkpoints up to the end of the newest archived month are all that
+    # is left of its movements, so they are never rewritten. Marks before
+    # that wait for the months to be restored.
+    floor = await _archived_until(session)
+    dropped = (await session.execute(text("""
+        WITH marks AS (
+            DELETE FROM stock_checkpoint_stale
+             WHERE CAST(:floor AS timestamptz) IS NULL OR since >= :floor
+            RETURNING since
+        )
+        DELETE FROM stock_checkpoint_months
+         WHERE starts_at > (SELECT MIN(since) FROM marks)
+        RETURNING as_of
+    """), {"floor": floor})).scalars().all()
+    if dropped:
+        _LOG.info("rewriting stock checkpoints from %s", min(dropped))
+
+    last = (await session.execute(text(
+        "SELECT MAX(as_of) FROM stock_checkpoint_months"))).scalar()
+    if last is None and floor is not None:
+        _LOG.warning("no stock checkpoints to build on, and stock movements "
+                     "before %s are archived; restore them first", floor)
+        return []
+    if last is None:
+        first = (await session.execute(text(
+            "SELECT MIN(created_at) FROM stock_movements"))).scalar()
+        if first is None:
+            return []
+        month = partitions.add_months(
+            partitions.month_start(first.astimezone(timezone.utc).date()), 1)
+    else:
+        month = partitions.add_months(last, 1)
+
+    now = now or datetime.now(timezone.utc)
+    built = []
+    while month_starts_at(month) + GRACE <= now:
+        await _build_month(session, month, last)
+        built.append(month)
+        last, month = month, partitions.add_months(month, 1)
+    return built
+
+
+async def _archived_until(session: AsyncSession) -> Optional[datetime]:
+    """The end of the newest stock_movements month archived and not restored."""
+    if not await partitions.ready(session):
+        return None
+    end = (await session.execute(text("""
+        SELECT MAX(range_end) FROM partition_archives
+         WHERE parent_table = 'stock_movements' AND restored_at IS NULL
+    """))).scalar()
+    return month_starts_at(end) if end is not None else None
+
+
+async def covered_until(session: AsyncSession) -> Optional[datetime]:
+    """The start of the newest built month: checkpoints cover all before it."""
+    if not await ready(session):
+        return None
+    return (await session.execute(text(
+        "SELECT MAX(starts_at) FROM stock_checkpoint_months"))).scalar()
+
+
+async def _refuse_archived(session: AsyncSession, lo: Optional[datetime],
+                           hi: datetime) -> None:
+    if not await partitions.ready(session):
+        return
+    month = (await session.execute(text("""
+        SELECT range_start FROM partition_archives
+         WHERE parent_table = 'stock_movements' AND restored_at IS NULL
+           AND CAST(range_end AS timestamp) AT TIME ZONE 'UTC'
+               > COALESCE(CAST(:lo AS timestamptz), '-infinity')
+           AND CAST(range_start AS timestamp) AT TIME ZONE 'UTC' < :hi
+         ORDER BY range_start LIMIT 1
+    """), {"lo": lo, "hi": hi})).scalar()
+    if month is not None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Stock movements for {month:%Y-%m} are archived. Restore "
+                   f"them (scripts/partitions.py restore stock_movements "
+                   f"{month:%Y-%m}) or ask for a day after that month.")
+
+
+async def stock_as_of(
+    session: AsyncSession,
+    on: date,
+    *,
+    warehouse_id: Optional[UUID] = None,
+    product_id: Optional[UUID] = None,
+    raw_material_id: Optional[UUID] = None,
+) -> StockAsOf:
+    """Every non-zero position at the end of business day `on`."""
+    hi = starts_at(on + timedelta(days=1))
+    base = base_at = None
+    if await ready(session):
+        newest = (await session.execute(text("""
+            SELECT as_of, starts_at FROM stock_checkpoint_months
+             WHERE starts_at <= :hi ORDER BY as_of DESC LIMIT 1
+        """), {"hi": hi})).first()
+        if newest is not None:
+            base, base_at = newest
+
+    params = {"hi": hi, **_directions()}
+    filters = []
+    for col, value in (("warehouse_id", warehouse_id),
+                       ("product_id", product_id),
+                       ("raw_material_id", raw_material_id)):
+        if value is not None:
+            filters.append(f"sm.{col} = :{col}")
+            params[col] = str(value)
+    if base is not None:
+        params.update(base=base, lo=base_at)
+    exact = base_at == hi
+    if not exact:
+        await _refuse_archived(session, params.get("lo"), params["hi"])
+
+    if exact:
+        # The checkpoint is the answer; no movements to add.
+        sql = f"""
+            SELECT sm.warehouse_id, sm.product_id, sm.raw_material_id,
+                   sm.quantity, sm.in_qty, sm.in_value
+              FROM stock_checkpoints sm
+             WHERE {' AND '.join(['sm.as_of = :base'] + filters)}"""
+    else:
+        sql = _positions_sql(base=base is not None, lower=base is not None,
+                             filters=filters)
+    rows = (await session.execute(text(f"""
+        WITH pos AS ({sql})
+        SELECT pos.*, w.name AS warehouse_name,
+               COALESCE(p.sku, rm.sku) AS sku,
+               COALESCE(p.name, rm.name) AS name
+          FROM pos
+          LEFT JOIN warehouses w ON w.id = pos.warehouse_id
+          LEFT JOIN products p ON p.id = pos.product_id
+          LEFT JOIN raw_materials rm ON rm.id = pos.raw_material_id
+         WHERE pos.quantity <> 0
+         ORDER BY w.name, COALESCE(p.name, rm.name), pos.warehouse_id,
+                  COALESCE(pos.product_id, pos.raw_material_id)
+    """), params)).fetchall()
+
+    positions = []
+    for r in rows:
+        qty = Decimal(str(r.quantity))
+        unit_cost = value = None
+        if r.in_qty and Decimal(str(r.in_qty)) > 0:
+            unit_cost = (Decimal(str(r.in_value)) / Decimal(str(r.in_qty))
+                         ).quantize(PRECISION)
+            value = (qty * unit_cost).quantize(CENT)
+        positions.append(Position(
+            r.warehouse_id, r.warehouse_name, r.product_id, r.raw_material_id,
+            r.sku, r.name, qty, unit_cost, value))
+    return StockAsOf(on, base, positions)
+
+
+async def run_checkpointer() -> None:
+    """Background loop started by app.main on every worker."""
+    from app.db import AsyncSessionLocal
+
+    _LOG.info("Stock checkpointer started (every %.0fs)", CHECK_SECONDS)
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                built = await build_checkpoints(session)
+                await session.commit()
+            if built:
+                _LOG.info("built stock checkpoint(s) for %s",
+                          ", ".join(f"{m:%Y-%m}" for m in built))
+            await asyncio.sleep(CHECK_SECONDS)
+        except asyncio.CancelledError:
+            _LOG.info("Stock checkpointer cancelled")
+            raise
+        except Exception:
+            _LOG.exception("Stock checkpointer iteration failed")
+            await asyncio.sleep(30)
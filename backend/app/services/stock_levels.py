@@ -0,0 +1,220 @@
+"""The stock-level lists behind the warehouse screens.
+
+`/product-levels` and `/raw-material-levels` used to join `stock_levels` to
+products and warehouses on `::text` casts of both keys. A cast like that
+defeats the primary-key indexes, so every call hash-joined entire tables.
+The product list also ran a correlated `string_agg` over `product_pricing`
+for every stock row. Both lists fetched every row and then dropped the ones
+that were not low on stock in Python.
+
+Here the joins are on the uuid keys. The warehouse and low-stock filters are
+applied in SQL, and the lists page with `limit`/`offset` in a stable order:
+item name, then warehouse. The product units are aggregated once per page,
+with a single grouped pass over the pricing rows of the products on that
+page. Each function returns the page together with the number of rows
+matching the filters.
+
+Reorder levels keep the definitions the screens have always shown:
+a product's is its `min_stock` in that warehouse, and a raw material's is its
+`reorder_level`, each 10 when unset or zero.
+"""
+from __future__ import annotations
+
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+PRODUCT_REORDER_LEVEL = "COALESCE(NULLIF(sl.min_stock, 0), 10)"
+RAW_MATERIAL_REORDER_LEVEL = "COALESCE(NULLIF(rm.reorder_level::integer, 0), 10)"
+
+
+def _iso(ts) -> Optional[str]:
+    return ts.isoformat() if ts else None
+
+
+async def _total(session: AsyncSession, rows, count_sql: str,
+                 params: dict) -> int:
+    if rows:
+        return int(rows[0].matched)
+    if not params.get("offset"):
+        return 0
+    # Paged past the end: the window count is not there to read.
+    return int((await session.execute(text(count_sql), params)).scalar() or 0)
+
+
+def _product_levels_sql(warehouse_id: Optional[UUID],
+                        low_stock_only: bool) -> tuple[str, str, dict]:
+    where = ["sl.product_id IS NOT NULL"]
+    params: dict = {}
+    if warehouse_id:
+        where.append("sl.warehouse_id = :wh")
+        params["wh"] = str(warehouse_id)
+    if low_stock_only:
+        where.append(f"sl.current_stock <= {PRODUCT_REORDER_LEVEL}")
+    where_sql = " AND ".join(where)
+    return f"""
+        WITH page AS (
+            SELECT sl.id, sl.warehouse_id, sl.product_id, sl.current_stock,
+                   sl.updated_at, {PRODUCT_REORDER_LEVEL} AS reorder_level,
+                   p.name AS product_name, p.sku AS product_sku,
+                   p.unit AS product_unit, w.name AS warehouse_name,
+                   COUNT(*) OVER () AS matched
+              FROM stock_levels sl
+              LEFT JOIN products p ON p.id = sl.product_id
+              LEFT JOIN warehouses w ON w.id = sl.warehouse_id
+             WHERE {where_sql}
+             ORDER BY p.name, w.name, sl.id
+             LIMIT :limit OFFSET :offset
+        )
+        SELECT page.*, u.units AS available_units
+          FROM page
+          LEFT JOIN (
+                SELECT pp.product_id,
+                       string_agg(pp.unit, ', ' ORDER BY pp.unit) AS units
+                  FROM product_pricing pp
+                 WHERE pp.product_id IN (SELECT product_id FROM page)
+                 GROUP BY pp.product_id
+          ) u ON u.product_id = page.product_id
+         ORDER BY page.product_name, page.warehouse_name, page.id
+    """, f"SELECT COUNT(*) FROM stock_levels sl WHERE {where_sql}", params
+
+
+def _product_level(r) -> dict:
+    current_stock = float(r.current_stock or 0)
+    reorder_level = float(r.reorder_level)
+    return {
+        'stock_level_id': str(r.id),
+        'warehouse_id': str(r.warehouse_id or ''),
+        'warehouse_name': r.warehouse_name or 'Default',
+        'product_id': str(r.product_id),
+        'product_name': r.product_name or 'Unknown',
+        'product_sku': r.product_sku or '',
+        'current_stock': current_stock,
+        'reserved_stock': 0,
+        'available_stock': current_stock,
+        'reorder_level': reorder_level,
+        'product_unit': r.product_unit or '',
+        'available_units': r.available_units or r.product_unit or 'each',
+        'is_low_stock': current_stock <= reorder_level,
+        'updated_at': _iso(r.updated_at),
+    }
+
+
+async def product_levels(
+    session: AsyncSession,
+    *,
+    warehouse_id: Optional[UUID] = None,
+    low_stock_only: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> tuple[list[dict], int]:
+    """One page of product balances, and how many match the filters."""
+    sql, count_sql, params = _product_levels_sql(warehouse_id, low_stock_only)
+    params.update(limit=limit, offset=offset)
+    rows = (await session.execute(text(sql), params)).fetchall()
+    total = await _total(session, rows, count_sql, params)
+    return [_product_level(r) for r in rows], total
+
+
+def _raw_material_levels_sql(warehouse_id: Optional[UUID],
+                             low_stock_only: bool) -> tuple[str, str, dict]:
+    where = ["TRUE"]
+    params: dict = {}
+    if warehouse_id:
+        where.append("sl.warehouse_id = :wh")
+        params["wh"] = str(warehouse_id)
+    if low_stock_only:
+        where.append(
+            f"COALESCE(sl.current_stock, 0) <= {RAW_MATERIAL_REORDER_LEVEL}")
+    where_sql = " AND ".join(where)
+    from_sql = """
+          FROM raw_materials rm
+          LEFT JOIN stock_levels sl ON sl.raw_material_id = rm.id
+          LEFT JOIN warehouses w ON w.id = sl.warehouse_id
+    """
+    return f"""
+        SELECT rm.id AS raw_material_id, rm.name AS rm_name,
+               COALESCE(rm.sku, rm.name) AS rm_sku,
+               {RAW_MATERIAL_REORDER_LEVEL} AS reorder_level,
+               COALESCE(rm.unit, 'kg') AS unit,
+               COALESCE(sl.id, gen_random_uuid()) AS stock_level_id,
+               COALESCE(sl.current_stock, 0) AS current_stock,
+               sl.warehouse_id,
+               COALESCE(w.name, 'Default') AS warehouse_name,
+               sl.updated_at,
+               COUNT(*) OVER () AS matched
+          {from_sql}
+         WHERE {where_sql}
+         ORDER BY rm.name, w.name, sl.id
+         LIMIT :limit OFFSET :offset
+    """, f"SELECT COUNT(*) {from_sql} WHERE {where_sql}", params
+
+
+def _raw_material_level(r) -> dict:
+    current_stock = float(r.current_stock or 0)
+    reorder_level = float(r.reorder_level)
+    return {
+        'stock_level_id': str(r.stock_level_id),
+        'warehouse_id': str(r.warehouse_id or ''),
+        'warehouse_name': r.warehouse_name or 'Default',
+        'raw_material_id': str(r.raw_material_id),
+        'raw_material_name': r.rm_name or 'Unknown',
+        'raw_material_sku': r.rm_sku or '',
+        'current_stock': current_stock,
+        'reserved_stock': 0,
+        'available_stock': current_stock,
+        'reorder_level': reorder_level,
+        'is_low_stock': current_stock <= reorder_level,
+        'unit': r.unit or 'kg',
+        'updated_at': _iso(r.updated_at),
+    }
+
+
+async def raw_material_levels(
+    session: AsyncSession,
+    *,
+    warehouse_id: Optional[UUID] = None,
+    low_stock_only: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> tuple[list[dict], int]:
+    """One page of raw-material balances, and how many match the filters.
+
+    Materials with no stock row yet are listed at zero unless a warehouse is
+    asked for.
+    """
+    sql, count_sql, params = _raw_material_levels_sql(
+        warehouse_id, low_stock_only)
+    params.update(limit=limit, offset=offset)
+    rows = (await session.execute(text(sql), params)).fetchall()
+    total = await _total(session, rows, count_sql, params)
+    return [_raw_material_level(r) for r in rows], total
+
+
+async def iter_product_levels(
+    session: AsyncSession, *, warehouse_id: Optional[UUID] = None,
+    low_stock_only: bool = False,
+):
+    """Every product balance matching the filters, from a server-side
+    cursor, in the order the pages list them."""
+    sql, _, params = _product_levels_sql(warehouse_id, low_stock_only)
+    params.update(limit=None, offset=0)
+    result = await session.stream(
+        text(sql).execution_options(yield_per=1000), params)
+    async for r in result:
+        yield _product_level(r)
+
+
+async def iter_raw_material_levels(
+    session: AsyncSession, *, warehouse_id: Optional[UUID] = None,
+    low_stock_only: bool = False,
+):
+    """Every raw-material balance matching the filters, streamed likewise."""
+    sql, _, params = _raw_material_levels_sql(warehouse_id, low_stock_only)
+    params.update(limit=None, offset=0)
+    result = await session.stream(
+        text(sql).execution_options(yield_per=1000), params)
+    async for r in result:
+        yield _raw_material_level(r)
@@ -12,6 +12,9 @@ WHERE THE FIGURES COME FROM, and why
   is the authoritative record of VAT collected. (If sales are not yet charging
   VAT, this is legitimately zero -- the return then reflects reality rather
   than inventing a liability.)
+* Both ledger figures are read from `gl_account_daily_balances`, a per-account,
+  per-day store kept exact by a trigger on the journal, rather than by
+  scanning journal lines for every computation.
 * **Input VAT** is read from the purchase day book: `purchase_invoices.tax_amount`
   for invoices dated in the period, plus any VAT posted directly to Input VAT
   Recoverable (1360). Purchases are where recoverable VAT is documented, so
@@ -25,7 +28,7 @@ computation is only how it was arrived at.
 """
 from __future__ import annotations
 
-from datetime import date
+from datetime import date, timedelta
 from decimal import Decimal
 from typing import Optional
 from uuid import UUID, uuid4
@@ -34,7 +37,8 @@ from fastapi import HTTPException
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.ledger import Line, money, post_entry
+from app.services.ledger import (
+    Line, account_period_movements, money, post_entry)
 from app.services.posting import posting_enabled
 
 ACC_VAT_PAYABLE = "2300"
@@ -43,60 +47,11 @@ ACC_BANK = "1200"
 ACC_CASH = "1100"
 
 
-async def compute_vat_return(
-    session: AsyncSession, *, start: date, end: date,
+def _vat_figures(
+    start: date, end: date, *,
+    output_vat: Decimal, ledger_input: Decimal, doc_input: Decimal,
 ) -> dict:
-    """Compute (not persist) the VAT position for a period.
-
-    Every figure is traceable to its source, and the reader is told when a
-    source is empty rather than being shown a bare zero they cannot interpret.
-    """
-    if end < start:
-        raise HTTPException(status_code=400, detail="end cannot precede start.")
-
-    # Output VAT: credits to VAT Payable in the period. Debits to 2300 are
-    # remittances, not output VAT, so they are excluded -- output VAT is what
-    # was charged, not what is left owing after a payment.
-    output_vat = money((await session.execute(
-        text("""
-            SELECT COALESCE(SUM(l.credit), 0)
-              FROM gl_journal_lines l
-              JOIN gl_journal_entries e ON e.id = l.entry_id
-              JOIN gl_accounts a ON a.id = l.account_id
-             WHERE a.code = :vat
-               AND e.status <> 'DRAFT'
-               AND e.source_module <> 'tax.remittance'
-               AND e.entry_date BETWEEN :start AND :end
-        """),
-        {"vat": ACC_VAT_PAYABLE, "start": start, "end": end},
-    )).scalar())
-
-    # Input VAT already carried in the ledger (debits to Input VAT Recoverable).
-    ledger_input = money((await session.execute(
-        text("""
-            SELECT COALESCE(SUM(l.debit - l.credit), 0)
-              FROM gl_journal_lines l
-              JOIN gl_journal_entries e ON e.id = l.entry_id
-              JOIN gl_accounts a ON a.id = l.account_id
-             WHERE a.code = :ivat
-               AND e.status <> 'DRAFT'
-               AND e.entry_date BETWEEN :start AND :end
-        """),
-        {"ivat": ACC_INPUT_VAT, "start": start, "end": end},
-    )).scalar())
-
-    # Input VAT documented on purchase invoices in the period. This is the
-    # purchase day book -- recoverable VAT is documented here whether or not a
-    # journal has split it out yet, so it is the honest basis for the claim.
-    doc_input = money((await session.execute(
-        text("""
-            SELECT COALESCE(SUM(tax_amount), 0)
-              FROM purchase_invoices
-             WHERE invoice_date BETWEEN :start AND :end
-        """),
-        {"start": start, "end": end},
-    )).scalar())
-
+    """Shape one period's VAT position from its three source figures."""
     input_vat = money(ledger_input + doc_input)
     net = money(output_vat - input_vat)
 
@@ -125,6 +80,155 @@ async def compute_vat_return(
         "position": ("PAYABLE" if net > 0 else
                      "CREDIT" if net < 0 else "NIL"),
         "notes": notes,
+        "frozen": False,
+    }
+
+
+def _filed_figures(row) -> dict:
+    """A filed return as declared -- the frozen snapshot, not a recomputation."""
+    net = money(row.net_payable)
+    return {
+        "period": {"start": str(row.period_start), "end": str(row.period_end)},
+        "output_vat": float(row.output_vat),
+        "input_vat": float(row.input_vat),
+        # The split is not part of what was declared, so it is not kept.
+        "input_vat_breakdown": None,
+        "net_payable": float(net),
+        "position": ("PAYABLE" if net > 0 else
+                     "CREDIT" if net < 0 else "NIL"),
+        "notes": ["These are the figures declared on filing; they do not "
+                  "move with later ledger corrections."],
+        "frozen": True,
+        "vat_return_id": str(row.id),
+        "status": row.status,
+        "filed_at": row.filed_at.isoformat() if row.filed_at else None,
+    }
+
+
+async def compute_vat_return(
+    session: AsyncSession, *, start: date, end: date,
+    use_filed: bool = True,
+) -> dict:
+    """Compute (not persist) the VAT position for a period.
+
+    Every figure is traceable to its source, and the reader is told when a
+    source is empty rather than being shown a bare zero they cannot interpret.
+
+    A period that has already been filed returns its frozen snapshot unless
+    `use_filed` is False: once declared, the return is what FIRS holds, and
+    recomputing it only invites confusion with the filed figures.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end cannot precede start.")
+
+    if use_filed:
+        filed = (await session.execute(
+            text("""SELECT id, period_start, period_end, output_vat,
+                           input_vat, net_payable, status, filed_at
+                      FROM vat_returns
+                     WHERE period_start = :s AND period_end = :e
+                       AND status <> 'DRAFT'"""),
+            {"s": start, "e": end},
+        )).first()
+        if filed is not None:
+            return _filed_figures(filed)
+
+    # Both ledger figures come from the per-day balance store in one query.
+    # Output VAT is the CREDITS to VAT Payable: debits to 2300 are
+    # remittances, not output VAT, so they are excluded -- output VAT is what
+    # was charged, not what is left owing after a payment. (A remittance only
+    # ever debits 2300, so summing credits needs no source_module filter.)
+    moves = await account_period_movements(
+        session, codes=[ACC_VAT_PAYABLE, ACC_INPUT_VAT], start=start, end=end)
+    zero = {"debit": Decimal("0.00"), "credit": Decimal("0.00")}
+    output_vat = moves.get(ACC_VAT_PAYABLE, zero)["credit"]
+    ivat = moves.get(ACC_INPUT_VAT, zero)
+    ledger_input = money(ivat["debit"] - ivat["credit"])
+
+    # Input VAT documented on purchase invoices in the period. This is the
+    # purchase day book -- recoverable VAT is documented here whether or not a
+    # journal has split it out yet, so it is the honest basis for the claim.
+    doc_input = money((await session.execute(
+        text("""
+            SELECT COALESCE(SUM(tax_amount), 0)
+              FROM purchase_invoices
+             WHERE invoice_date BETWEEN :start AND :end
+        """),
+        {"start": start, "end": end},
+    )).scalar())
+
+    return _vat_figures(start, end, output_vat=output_vat,
+                        ledger_input=ledger_input, doc_input=doc_input)
+
+
+async def vat_returns_by_month(session: AsyncSession, *, year: int) -> dict:
+    """Twelve monthly VAT positions for a year, for side-by-side comparison.
+
+    One grouped query over the balance store, one over purchase invoices and
+    one for filed returns -- instead of twelve separate computations. Months
+    already filed show their frozen snapshot, like `compute_vat_return`.
+    """
+    year_start, year_end = date(year, 1, 1), date(year, 12, 31)
+
+    moves = await account_period_movements(
+        session, codes=[ACC_VAT_PAYABLE, ACC_INPUT_VAT],
+        start=year_start, end=year_end, by_month=True)
+
+    doc_by_month = {
+        r.month: money(r.tax)
+        for r in (await session.execute(
+            text("""
+                SELECT CAST(date_trunc('month', invoice_date) AS date) AS month,
+                       COALESCE(SUM(tax_amount), 0) AS tax
+                  FROM purchase_invoices
+                 WHERE invoice_date BETWEEN :start AND :end
+                 GROUP BY 1
+            """),
+            {"start": year_start, "end": year_end},
+        )).fetchall()
+    }
+
+    filed_by_month = {
+        r.period_start: r
+        for r in (await session.execute(
+            text("""SELECT id, period_start, period_end, output_vat,
+                           input_vat, net_payable, status, filed_at
+                      FROM vat_returns
+                     WHERE status <> 'DRAFT'
+                       AND period_start BETWEEN :start AND :end
+                       AND period_start = date_trunc('month', period_start)
+                       AND period_end = CAST(date_trunc('month', period_start)
+                                             + INTERVAL '1 month'
+                                             - INTERVAL '1 day' AS date)"""),
+            {"start": year_start, "end": year_end},
+        )).fetchall()
+    }
+
+    zero = {"debit": Decimal("0.00"), "credit": Decimal("0.00")}
+    months = []
+    totals = {"output_vat": Decimal("0.00"), "input_vat": Decimal("0.00"),
+              "net_payable": Decimal("0.00")}
+    for m in range(1, 13):
+        m_start = date(year, m, 1)
+        m_end = (date(year + 1, 1, 1) if m == 12
+                 else date(year, m + 1, 1)) - timedelta(days=1)
+        if m_start in filed_by_month:
+            figures = _filed_figures(filed_by_month[m_start])
+        else:
+            ivat = moves.get((ACC_INPUT_VAT, m_start), zero)
+            figures = _vat_figures(
+                m_start, m_end,
+                output_vat=moves.get((ACC_VAT_PAYABLE, m_start), zero)["credit"],
+                ledger_input=money(ivat["debit"] - ivat["credit"]),
+                doc_input=doc_by_month.get(m_start, Decimal("0.00")))
+        for k in totals:
+            totals[k] += Decimal(str(figures[k]))
+        months.append(figures)
+
+    return {
+        "year": year,
+        "months": months,
+        "totals": {k: float(money(v)) for k, v in totals.items()},
     }
 
 
@@ -154,7 +258,8 @@ async def file_vat_return(
             detail=f"A return for {start}..{end} has already been filed "
                    f"(status {existing.status}).")
 
-    computed = await compute_vat_return(session, start=start, end=end)
+    computed = await compute_vat_return(
+        session, start=start, end=end, use_filed=False)
     ret_id = uuid4()
     await session.execute(
         text("""
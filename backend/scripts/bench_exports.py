@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Rows per second, and memory, of the CSV and XLSX report exports.
+
+Two modes:
+
+  synthetic  ledger-shaped rows generated in memory, so only the writers
+             (app.services.exports) are measured; needs no database
+  report     a registered report read from DATABASE_URL through the same
+             server-side cursor as /api/exports/{report}; needs the app's
+             environment (DATABASE_URL, SECRET_KEY)
+
+Each run writes the export to a throwaway sink and prints rows/s, MB/s and
+how far the process's peak RSS grew. The growth should stay roughly flat as
+--rows goes up: nothing holds the whole result.
+
+Usage
+-----
+    python scripts/bench_exports.py synthetic [--rows 200000]
+    python scripts/bench_exports.py report trial_balance
+    python scripts/bench_exports.py report account_ledger -p account_code=1100
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import exports  # noqa: E402
+
+HEADER = ("entry_number", "date", "description", "source", "reference",
+          "debit", "credit", "balance")
+
+
+def _peak_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _synthetic(n: int):
+    day, balance = date(2026, 1, 1), Decimal("0.00")
+    for i in range(n):
+        amount = Decimal(i % 997) + Decimal("0.25")
+        balance += amount
+        yield [f"JE-{i:08d}", day + timedelta(days=i // 500),
+               f"Sale to customer {i % 1000}", "sales_order",
+               f"SO-{i:08d}", amount, Decimal("0.00"), balance]
+
+
+async def _measure(label: str, fmt: str, header, rows) -> None:
+    count = 0
+
+    async def counted():
+        nonlocal count
+        async for row in rows:
+            count += 1
+            yield row
+
+    body = (exports.csv_chunks(header, counted()) if fmt == "csv"
+            else exports.xlsx_chunks(header, counted()))
+    before, size = _peak_mb(), 0
+    started = time.perf_counter()
+    async for chunk in body:
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {fmt:<4} {count:>10,} rows  {elapsed:7.2f} s  "
+          f"{count / elapsed:>10,.0f} rows/s  "
+          f"{size / 1_048_576 / elapsed:6.1f} MB/s  "
+          f"peak RSS +{_peak_mb() - before:.1f} MB")
+
+
+async def synthetic(args) -> None:
+    for fmt in args.formats:
+        await _measure("synthetic", fmt, HEADER, _synthetic(args.rows))
+
+
+async def report(args) -> None:
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL not set.")
+    from app.api import exports as registered  # noqa: F401  (registers them)
+
+    spec = exports.get_report(args.name)
+    query = dict(p.split("=", 1) for p in args.param)
+    params = exports.parse_params(spec, query)
+    for fmt in args.formats:
+        await _measure(spec.name, fmt, spec.columns,
+                       exports.report_rows(spec, params))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-f", "--format", dest="formats", action="append",
+                    choices=list(exports.FORMATS),
+                    help="csv or xlsx; repeatable, default both")
+    sub = ap.add_subparsers(dest="mode", required=True)
+    s = sub.add_parser("synthetic")
+    s.add_argument("--rows", type=int, default=200_000)
+    r = sub.add_parser("report")
+    r.add_argument("name")
+    r.add_argument("-p", "--param", action="append", default=[],
+                   help="report parameter as name=value; repeatable")
+    args = ap.parse_args()
+    args.formats = args.formats or list(exports.FORMATS)
+    asyncio.run(synthetic(args) if args.mode == "synthetic" else report(args))
+
+
+if __name__ == "__main__":
+    main()
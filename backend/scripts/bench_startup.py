@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Start-up cost of the schema bootstrap, before and after the ledger.
+
+Measures, against DATABASE_URL:
+
+  import     time to import app.main (route and bootstrap registration)
+  replay     re-running every registered DDL statement, the way each worker
+             used to on boot and the per-request `_ensure_tables` helpers did
+             on every call (rolled back, so nothing is changed)
+  ledger     `bootstrap.run` once everything is recorded, i.e. what a worker
+             now pays on boot
+
+The first `bootstrap.run` applies any pending steps, exactly as starting the
+server would, so point this at a database you would start the app against.
+
+Usage
+-----
+    python scripts/bench_startup.py [--rounds 20]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _summary(label: str, samples: list[float]) -> str:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    return (f"{label:<8} median {statistics.median(samples):8.2f} ms   "
+            f"p95 {p95:8.2f} ms   ({len(samples)} rounds)")
+
+
+async def _replay(session, steps) -> int:
+    from sqlalchemy import text
+    count = 0
+    for step in steps:
+        for sql in step.statements:
+            try:
+                async with session.begin_nested():
+                    await session.execute(text(sql))
+            except Exception:
+                pass
+            count += 1
+    await session.rollback()
+    return count
+
+
+async def main(rounds: int) -> None:
+    started = time.perf_counter()
+    import app.main  # noqa: F401  -- registers every module's steps
+    import_ms = (time.perf_counter() - started) * 1000
+
+    from app.db import AsyncSessionLocal, engine
+    from app.services import bootstrap
+
+    steps = bootstrap.steps()
+    async with AsyncSessionLocal() as session:
+        applied = await bootstrap.run(session)
+    if applied:
+        print(f"applied pending steps first: {', '.join(applied)}")
+
+    replay, ledger = [], []
+    statements = 0
+    for _ in range(rounds):
+        async with AsyncSessionLocal() as session:
+            t = time.perf_counter()
+            statements = await _replay(session, steps)
+            replay.append((time.perf_counter() - t) * 1000)
+        bootstrap.reset()
+        async with AsyncSessionLocal() as session:
+            t = time.perf_counter()
+            await bootstrap.run(session)
+            ledger.append((time.perf_counter() - t) * 1000)
+    await engine.dispose()
+
+    print(f"{len(steps)} steps, {statements} statements")
+    print(f"import   {import_ms:8.2f} ms")
+    print(_summary("replay", replay))
+    print(_summary("ledger", ledger))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args().rounds))
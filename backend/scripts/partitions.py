@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Inspect, archive and restore the monthly partitions.
+
+The append-only tables (stock movements, journal lines, attendance, Wi-Fi
+logs and sessions, activity log, chat, regulatory audit trail) are
+partitioned by month (migration d9012345678c). This script is the operator's
+front end to app.services.partitions:
+
+    python scripts/partitions.py status [TABLE]
+    python scripts/partitions.py ensure                  # create future months
+    python scripts/partitions.py archive --before 2024-01 [--table T]
+    python scripts/partitions.py archive --before 2024-01 --commit
+    python scripts/partitions.py restore audit_logs 2023-06
+
+`archive` is a dry run unless --commit is given. It lists the cold months it
+would archive; a table's most recent HOT_MONTHS are never eligible. Each
+archived month becomes PARTITION_ARCHIVE_DIR/<table>/<partition>.csv.gz, in
+its own transaction. `restore` loads the file back and attaches it, so the
+month can be queried again.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker                               # noqa: E402
+
+from app.services import partitions                                   # noqa: E402
+
+
+def _month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def _mb(n: int) -> str:
+    return f"{n / 1_048_576:,.1f} MB"
+
+
+async def status(s, tables) -> None:
+    attached = set(await partitions.partitioned_tables(s))
+    for table in tables:
+        if table not in attached:
+            print(f"{table}: not partitioned")
+            continue
+        parts = await partitions.list_partitions(s, table)
+        cold = partitions.archivable_before(table)
+        print(f"{table}: {len(parts)} partitions, "
+              f"archivable before {cold:%Y-%m}")
+        for p in parts:
+            label = f"{p.month:%Y-%m}" if p.month else "default"
+            print(f"  {label:8} {p.rows:>12,} rows  {_mb(p.bytes):>12}")
+
+
+async def archive(maker, tables, before: date, commit: bool) -> None:
+    async with maker() as s:
+        attached = set(await partitions.partitioned_tables(s))
+        todo = []
+        for table in tables:
+            if table not in attached:
+                continue
+            limit = min(before, partitions.archivable_before(table))
+            todo += [p for p in await partitions.list_partitions(s, table)
+                     if p.month and p.month < limit]
+    if not todo:
+        print("Nothing to archive.")
+        return
+    for p in todo:
+        if not commit:
+            print(f"would archive {p.name} (~{p.rows:,} rows, {_mb(p.bytes)})")
+            continue
+        async with maker() as s:
+            a = await partitions.archive_partition(s, p.table, p.month)
+            await s.commit()
+        print(f"archived {a.name}: {a.rows:,} rows -> {a.path} ({_mb(a.bytes)})")
+    if not commit:
+        print("Dry run. Re-run with --commit to archive.")
+
+
+async def main(args) -> None:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        sys.exit("DATABASE_URL not set.")
+    engine = create_async_engine(url, future=True)
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        async with maker() as s:
+            if not await partitions.ready(s):
+                sys.exit("Migration d9012345678c has not been applied.")
+        tables = [args.table] if getattr(args, "table", None) else list(partitions.TABLES)
+        if args.command == "status":
+            async with maker() as s:
+                await status(s, tables)
+        elif args.command == "ensure":
+            async with maker() as s:
+                created = await partitions.ensure_partitions(s)
+                await s.commit()
+            print("Created: " + (", ".join(created) or "nothing"))
+        elif args.command == "archive":
+            await archive(maker, tables, args.before, args.commit)
+        elif args.command == "restore":
+            async with maker() as s:
+                rows = await partitions.restore_partition(s, args.table, args.month)
+                await s.commit()
+            print(f"restored {partitions.partition_name(args.table, args.month)}: "
+                  f"{rows:,} rows")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    st = sub.add_parser("status")
+    st.add_argument("table", nargs="?", choices=list(partitions.TABLES))
+    sub.add_parser("ensure")
+    ar = sub.add_parser("archive")
+    ar.add_argument("--before", type=_month, required=True,
+                    help="archive months before this one (YYYY-MM)")
+    ar.add_argument("--table", choices=list(partitions.TABLES))
+    ar.add_argument("--commit", action="store_true")
+    rs = sub.add_parser("restore")
+    rs.add_argument("table", choices=list(partitions.TABLES))
+    rs.add_argument("month", type=_month, help="YYYY-MM")
+    asyncio.run(main(ap.parse_args()))
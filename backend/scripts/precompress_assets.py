@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Write `.gz` and `.br` copies of the frontend build, for the asset server.
+
+`app.services.static_assets` serves these in place of compressing at startup.
+Ahead of time, the slowest settings are affordable: gzip level 9 and brotli
+quality 11. brotli copies need the optional `brotli` package and are skipped
+without it. A copy is only written when it is smaller than the original.
+
+Run after every frontend build (the Dockerfile does):
+
+    python scripts/precompress_assets.py [--root frontend/build]
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import compression  # noqa: E402
+from app.services.static_assets import media_type_for  # noqa: E402
+
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent / "frontend" / "build"
+
+
+def _encoders():
+    yield ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if compression.brotli is not None:
+        yield ".br", lambda data: compression.brotli.compress(data, quality=11)
+
+
+def precompress(root: Path) -> tuple[int, int, int]:
+    """Returns (files written, bytes before, bytes after)."""
+    written = before = after = 0
+    encoders = list(_encoders())
+    for path in sorted(root.rglob("*")):
+        if (not path.is_file() or path.suffix in (".gz", ".br")
+                or not compression.is_compressible(media_type_for(path))):
+            continue
+        data = path.read_bytes()
+        if len(data) < compression.MIN_BYTES:
+            continue
+        for suffix, encode in encoders:
+            out = encode(data)
+            if len(out) >= len(data):
+                continue
+            path.with_name(path.name + suffix).write_bytes(out)
+            written += 1
+            before += len(data)
+            after += len(out)
+    return written, before, after
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", type=Path, default=DEFAULT_ROOT)
+    root = parser.parse_args().root
+    if not root.is_dir():
+        print(f"no build at {root}; nothing to do")
+        return
+    written, before, after = precompress(root)
+    print(f"wrote {written} files: {before // 1024} KiB -> {after // 1024} KiB"
+          + ("" if compression.brotli is not None
+             else " (gzip only; install brotli for .br)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Server-side announcement scheduling.
+
+Properties guarded:
+  * the next firing follows the repeat rule in Lagos wall-clock time,
+    including weekdays and months without the scheduled day;
+  * a due announcement fires exactly once, however many workers claim at
+    the same moment, and its schedule moves on (one-shots are cleared);
+  * an occurrence missed by more than the grace period is skipped, not
+    played late;
+  * a 'none' announcement without a date repeats daily, as it always has;
+  * firings are readable by id, for SSE catch-up and the radio feed, and
+    one committed out of id order still reaches SSE clients.
+
+The scheduling tests need no database; the firing tests require real
+PostgreSQL (TEST_DATABASE_URL).
+"""
+import asyncio
+import json
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.api.announcements import CREATE_ANNOUNCEMENTS_SQL, SCHEDULER_STATEMENTS
+from app.services import announcement_scheduler as sched
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+LAGOS = sched.LAGOS_TZ
+
+
+def _lagos(*args) -> datetime:
+    return datetime(*args, tzinfo=LAGOS)
+
+
+def test_one_shot_fires_on_its_date_only():
+    at = sched.next_fire_at(date(2026, 3, 2), time(9, 30), "none", None,
+                            _lagos(2026, 3, 1, 12, 0))
+    assert at == _lagos(2026, 3, 2, 9, 30)
+    assert at.tzinfo == timezone.utc
+    assert sched.next_fire_at(date(2026, 3, 2), time(9, 30), "none", None,
+                              _lagos(2026, 3, 2, 9, 30)) is None
+
+
+def test_none_without_a_date_fires_every_day():
+    assert sched.next_fire_at(None, time(9, 30), "none", None,
+                              _lagos(2026, 3, 2, 12, 0)) == \
+        _lagos(2026, 3, 3, 9, 30)
+
+
+def test_weekly_and_daily_rules():
+    monday_noon = _lagos(2026, 3, 2, 12, 0)
+    # Mon and Wed at 08:00: today's slot has passed, so Wednesday.
+    assert sched.next_fire_at(None, time(8, 0), "weekly", "0,2",
+                              monday_noon) == _lagos(2026, 3, 4, 8, 0)
+    assert sched.next_fire_at(None, time(8, 0), "daily", None,
+                              monday_noon) == _lagos(2026, 3, 3, 8, 0)
+    assert sched.next_fire_at(None, time(13, 0), "daily", None,
+                              monday_noon) == _lagos(2026, 3, 2, 13, 0)
+    assert sched.next_fire_at(None, time(8, 0), "weekly", "x,1",
+                              monday_noon) is None
+
+
+def test_monthly_skips_months_without_the_day():
+    at = sched.next_fire_at(date(2026, 1, 31), time(10, 0), "monthly", None,
+                            _lagos(2026, 1, 31, 11, 0))
+    assert at == _lagos(2026, 3, 31, 10, 0)
+
+
+def test_sse_message_carries_the_firing_id():
+    msg = sched.sse_message({"fire_id": 7, "title": "Fire drill"})
+    assert msg.startswith("id: 7\nevent: announcement\n")
+    assert json.loads(msg.split("data: ")[1])["title"] == "Fire drill"
+
+
+@pytest_asyncio.fixture
+async def maker():
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    async with eng.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
+        await conn.execute(text("DROP TABLE IF EXISTS announcement_fires"))
+        await conn.execute(text("DROP TABLE IF EXISTS announcements CASCADE"))
+        await conn.execute(text(CREATE_ANNOUNCEMENTS_SQL))
+        for stmt in SCHEDULER_STATEMENTS:
+            await conn.execute(text(stmt))
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    await eng.dispose()
+
+
+async def _add(s, title, repeat, next_fire, sched_date=None, days=None):
+    return (await s.execute(text("""
+        INSERT INTO announcements (title, message, scheduled_date,
+                                   scheduled_time, repeat_type, repeat_days,
+                                   next_fire_at)
+        VALUES (:t, :t, :d, :tm, :r, :days, :nf) RETURNING id
+    """), {"t": title, "d": sched_date, "tm": next_fire.astimezone(LAGOS).time(),
+           "r": repeat, "days": days, "nf": next_fire})).scalar()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_due_announcements_fire_once_across_workers(maker):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    due = now - timedelta(seconds=30)
+    async with maker() as s:
+        once = await _add(s, "Stock count", "none", due,
+                          sched_date=due.astimezone(LAGOS).date())
+        daily = await _add(s, "Morning brief", "daily", due)
+        stale = await _add(s, "Yesterday", "daily", now - timedelta(hours=3))
+        await s.commit()
+
+    async def worker():
+        async with maker() as s:
+            fired = await sched.fire_due(s, now)
+            await s.commit()
+            return fired
+
+    results = await asyncio.gather(*(worker() for _ in range(4)))
+    titles = sorted(e["title"] for fired in results for e in fired)
+    assert titles == ["Morning brief", "Stock count"]
+
+    async with maker() as s:
+        rows = {r.id: r for r in (await s.execute(text(
+            "SELECT id, next_fire_at, last_played_at FROM announcements"
+        ))).fetchall()}
+        assert rows[once].next_fire_at is None
+        assert rows[daily].next_fire_at == due + timedelta(days=1)
+        assert rows[stale].last_played_at is None
+        assert rows[stale].next_fire_at > now
+
+        fires = await sched.recent_fires(s)
+        assert sorted(f["title"] for f in fires) == titles
+        later = await sched.recent_fires(s, after_id=fires[0]["fire_id"])
+        assert len(later) == 1
+
+        # Nothing left to fire.
+        assert await sched.fire_due(s, now) == []
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_a_firing_committed_out_of_order_is_forwarded(maker, monkeypatch):
+    monkeypatch.setattr(sched, "_forwarded_since", None)
+    monkeypatch.setattr(sched, "_forwarded", {})
+    queue = sched.subscribe()
+    now = datetime.now(timezone.utc)
+
+    async def fire(s, title):
+        ann = await _add(s, title, "daily", now)
+        await s.execute(text("""
+            INSERT INTO announcement_fires (announcement_id, fire_at, title)
+            VALUES (:a, :at, :t)"""), {"a": ann, "at": now, "t": title})
+
+    try:
+        async with maker() as reader, maker() as slow, maker() as quick:
+            await sched._forward(reader)
+            await fire(slow, "Slow")        # takes the lower id
+            await fire(quick, "Quick")
+            await quick.commit()
+            await sched._forward(reader)
+            await slow.commit()
+            await sched._forward(reader)
+            await sched._forward(reader)
+    finally:
+        sched.unsubscribe(queue)
+    titles = [queue.get_nowait()["title"] for _ in range(queue.qsize())]
+    assert titles == ["Quick", "Slow"]
@@ -0,0 +1,131 @@
+"""The authorization cache.
+
+Properties guarded:
+  * role permissions, module access and warehouse grants resolve to the same
+    answers the per-request queries gave, admins included;
+  * a cached user costs no query, and the role table is shared by all users;
+  * invalidating a user or the role table forces a reload, and a load that
+    raced with an invalidation is not stored;
+  * a change notified by another worker clears this worker's cache.
+"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import authz
+
+ADMIN, CLERK = uuid.uuid4(), uuid.uuid4()
+WH_A, WH_B = uuid.uuid4(), uuid.uuid4()
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class _Session:
+    """Answers the two statements `authz` issues from in-memory tables."""
+
+    def __init__(self):
+        self.queries = 0
+        self.users = {
+            ADMIN: SimpleNamespace(role="admin", module_keys=["sales"],
+                                   granted=[False], warehouses=[]),
+            CLERK: SimpleNamespace(role="sales_staff",
+                                   module_keys=["reports", "sales"],
+                                   granted=[False, True], warehouses=[WH_A]),
+        }
+        self.roles = [SimpleNamespace(
+            role="sales_staff", module="sales", can_view=True,
+            can_create=True, can_edit=False, can_delete=None,
+            can_approve=False)]
+        self.during_query = None
+
+    async def execute(self, stmt, params=None):
+        self.queries += 1
+        if self.during_query:
+            self.during_query()
+        if "FROM role_permissions" in str(stmt):
+            return _Result(self.roles)
+        row = self.users.get(params["uid"])
+        return _Result([row] if row else [])
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    authz.clear()
+    yield
+    authz.clear()
+
+
+@pytest.mark.asyncio
+async def test_grants_match_role_module_and_warehouse_rules():
+    s = _Session()
+    clerk = await authz.grants_for(s, CLERK)
+    assert clerk.can("sales", "create") and clerk.can("sales", "view")
+    assert not clerk.can("sales", "delete")
+    assert not clerk.can("production", "view")
+    assert clerk.in_warehouse(WH_A) and not clerk.in_warehouse(WH_B)
+    assert clerk.has_module("sales") and clerk.has_module("dashboard")
+    assert not clerk.has_module("reports") and not clerk.has_module("staff")
+
+    admin = await authz.grants_for(s, ADMIN)
+    assert admin.can("anything", "approve") and admin.in_warehouse(WH_B)
+    assert admin.has_module("staff")
+    assert not admin.has_module("sales"), "an explicit revoke applies to admins"
+
+    assert await authz.grants_for(s, uuid.uuid4()) is None
+
+
+@pytest.mark.asyncio
+async def test_cached_checks_cost_no_queries():
+    s = _Session()
+    await authz.grants_for(s, CLERK)
+    await authz.grants_for(s, ADMIN)
+    assert s.queries == 3, "two user loads and one shared role-table load"
+    for _ in range(100):
+        assert (await authz.grants_for(s, CLERK)).in_warehouse(WH_A)
+    assert s.queries == 3
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reloads_and_beats_an_in_flight_load():
+    s = _Session()
+    await authz.grants_for(s, CLERK)
+
+    s.users[CLERK].warehouses = [WH_B]
+    assert (await authz.grants_for(s, CLERK)).in_warehouse(WH_A), "still cached"
+    authz.invalidate_user(CLERK)
+    assert (await authz.grants_for(s, CLERK)).in_warehouse(WH_B)
+
+    s.roles[0].can_delete = True
+    authz.invalidate_roles()
+    assert (await authz.grants_for(s, CLERK)).can("sales", "delete")
+
+    # An admin edit commits while this load is reading: what it read may be
+    # stale, so it is returned but not kept.
+    authz.invalidate_user(CLERK)
+    s.during_query = lambda: authz.invalidate_user(CLERK)
+    await authz.grants_for(s, CLERK)
+    s.during_query = None
+    before = s.queries
+    await authz.grants_for(s, CLERK)
+    assert s.queries > before
+
+
+@pytest.mark.asyncio
+async def test_a_change_notified_by_another_worker_reloads():
+    s = _Session()
+    await authz.grants_for(s, CLERK)
+    s.users[CLERK].role = "viewer"
+    assert (await authz.grants_for(s, CLERK)).role == "sales_staff", "cached"
+
+    authz._on_notify(None, 1234, authz.CHANNEL, "")
+    assert (await authz.grants_for(s, CLERK)).role == "viewer"
@@ -0,0 +1,130 @@
+"""Schema bootstrap registry.
+
+Properties guarded:
+  * a step runs once: later runs, in this worker or another, find it in the
+    ledger and issue no DDL; bumping its version runs it again;
+  * concurrent workers serialise on the advisory lock, so a step is applied
+    by exactly one of them;
+  * a failing step is not recorded and does not undo the others;
+  * once a step is known to be applied, `ensure` needs no database at all.
+
+The registry tests need no database; the ledger tests require real PostgreSQL
+(TEST_DATABASE_URL). They swap in probe steps so the app's own DDL never runs.
+"""
+import asyncio
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import bootstrap
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture
+def probe_registry(monkeypatch):
+    monkeypatch.setattr(bootstrap, "_steps", {})
+    monkeypatch.setattr(bootstrap, "_ready", {})
+
+
+def test_registering_a_step_twice_must_agree(probe_registry):
+    bootstrap.register("probe", 1, ["SELECT 1"])
+    bootstrap.register("probe", 1, ["SELECT 1"])
+    with pytest.raises(ValueError):
+        bootstrap.register("probe", 2, ["SELECT 1"])
+    assert [s.name for s in bootstrap.steps()] == ["probe"]
+
+
+@pytest.mark.asyncio
+async def test_ensure_is_free_once_the_step_is_known_applied(probe_registry):
+    bootstrap.register("probe", 3, ["SELECT 1"])
+    bootstrap._ready["probe"] = 3
+    # No session needed: nothing may touch the database.
+    await bootstrap.ensure(None, "probe")
+    assert await bootstrap.run(None) == []
+
+
+def test_the_app_modules_register_their_ddl():
+    from app.api import geo, logistics, procurement, profits, regulatory  # noqa: F401
+    names = {s.name for s in bootstrap.steps()}
+    assert {"geo", "logistics", "procurement", "profits", "regulatory"} <= names
+    assert all(s.statements for s in bootstrap.steps())
+
+
+@pytest_asyncio.fixture
+async def maker(probe_registry):
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    async with eng.begin() as conn:
+        for table in ("schema_bootstrap", "bootstrap_probe", "bootstrap_other"):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    await eng.dispose()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_a_step_runs_once_per_version(maker):
+    # No IF NOT EXISTS: running it twice would fail.
+    create = "CREATE TABLE bootstrap_probe (id int)"
+    bootstrap.register("probe", 1, [create])
+    async with maker() as s:
+        assert await bootstrap.run(s) == ["probe"]
+
+    bootstrap.reset()   # a fresh worker
+    async with maker() as s:
+        assert await bootstrap.run(s) == []
+        await bootstrap.ensure(s, "probe")
+
+    seen = []
+
+    async def after(session):
+        seen.append(1)
+
+    bootstrap._steps.clear()
+    bootstrap.register("probe", 2, [
+        create.replace("TABLE", "TABLE IF NOT EXISTS"),
+        "ALTER TABLE bootstrap_probe ADD COLUMN IF NOT EXISTS note text",
+    ], after=after)
+    async with maker() as s:
+        assert await bootstrap.run(s) == ["probe"]
+        version = (await s.execute(text(
+            "SELECT version FROM schema_bootstrap WHERE name = 'probe'"
+        ))).scalar()
+        await s.execute(text("SELECT note FROM bootstrap_probe"))
+    assert version == 2 and seen == [1]
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_concurrent_workers_apply_a_step_once(maker):
+    async def slow(session):
+        await asyncio.sleep(0.2)
+
+    bootstrap.register("probe", 1, ["CREATE TABLE bootstrap_probe (id int)"],
+                       after=slow)
+
+    async def worker():
+        async with maker() as s:
+            return await bootstrap.run(s)
+
+    results = await asyncio.gather(worker(), worker())
+    assert sorted(results) == [[], ["probe"]]
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_a_failing_step_is_retried_and_spares_the_others(maker):
+    bootstrap.register("broken", 1, ["ALTER TABLE no_such_table ADD COLUMN x int"])
+    bootstrap.register("other", 1, ["CREATE TABLE bootstrap_other (id int)"])
+    async with maker() as s:
+        assert await bootstrap.run(s) == ["other"]
+        recorded = (await s.execute(text(
+            "SELECT name FROM schema_bootstrap"))).scalars().all()
+    assert recorded == ["other"]
+    assert not bootstrap._is_ready(bootstrap._steps["broken"])
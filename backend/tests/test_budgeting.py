@@ -5,7 +5,9 @@ The properties being guarded:
   * variance is interpreted, not just signed -- under-spending is good,
     under-earning is bad, and both are "negative";
   * only an APPROVED budget is reported against, and only one per year;
-  * unbudgeted spend and unallocated postings are surfaced, not dropped.
+  * unbudgeted spend and unallocated postings are surfaced, not dropped;
+  * the full-year grid agrees with per-period variance and is recomputed as
+    soon as a new entry posts into the year.
 """
 import os
 import uuid
@@ -21,7 +23,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.services.budgeting import (
     classify_variance, resolve_cost_centre, cost_centre_report,
-    approve_budget, budget_variance, money)
+    approve_budget, budget_variance, money, variance_grid)
 from app.services.ledger import Line, post_entry
 
 TEST_DB = os.getenv("TEST_DATABASE_URL")
@@ -386,3 +388,80 @@ async def test_variance_only_covers_the_requested_months(session):
         session, fiscal_year=2026,
         start=date(2026, 7, 1), end=date(2026, 8, 31))
     assert both["total_budget"] == 200000.00
+
+
+@pytest.mark.asyncio
+async def test_grid_cells_match_monthly_variance(session):
+    await make_budget(session, year=2026, status='APPROVED', lines=[
+        ("5410", "PROD", date(2026, 7, 1), "100000"),
+        ("5410", "PROD", date(2026, 8, 1), "100000"),
+        ("6300", "MKT", date(2026, 7, 1), "80000"),
+    ])
+    await post_entry(
+        session, entry_date=date(2026, 7, 10), description="Power",
+        source_module="test",
+        lines=[Line("5410", debit="130000", cost_centre="PROD"),
+               Line("1200", credit="130000")])
+    await post_entry(
+        session, entry_date=date(2026, 8, 3), description="Legal",
+        source_module="test",
+        lines=[Line("6700", debit="5000", cost_centre="ADMIN"),
+               Line("1200", credit="5000")])
+    await session.commit()
+
+    grid = await variance_grid(session, fiscal_year=2026)
+    assert len(grid["months"]) == 12
+    cells = {(c["account_code"], c["cost_centre"], c["month"]): c
+             for c in grid["cells"]}
+    for month_start, month_end in ((date(2026, 7, 1), date(2026, 7, 31)),
+                                   (date(2026, 8, 1), date(2026, 8, 31))):
+        var = await budget_variance(
+            session, fiscal_year=2026, start=month_start, end=month_end)
+        for ln in var["lines"]:
+            cell = cells[(ln["account_code"], ln["cost_centre"],
+                          str(month_start))]
+            assert (cell["budget"], cell["actual"], cell["verdict"]) == (
+                ln["budget"], ln["actual"], ln["verdict"])
+
+    assert cells[("6700", "ADMIN", "2026-08-01")]["unbudgeted"] is True
+    prod = next(c for c in grid["by_cost_centre"]
+                if c["cost_centre"] == "PROD")
+    assert prod["expense_budget"] == 200000.00
+    assert prod["expense_actual"] == 130000.00
+
+
+@pytest.mark.asyncio
+async def test_grid_is_cached_until_the_year_moves(session):
+    await make_budget(session, year=2026, status='APPROVED', lines=[
+        ("5410", "PROD", date(2026, 7, 1), "100000")])
+    first = await variance_grid(session, fiscal_year=2026)
+    assert first["cached"] is False
+    assert (await variance_grid(session, fiscal_year=2026))["cached"] is True
+
+    # A posting in another year leaves this year's grid valid...
+    await post_entry(
+        session, entry_date=date(2025, 7, 10), description="Old power",
+        source_module="test",
+        lines=[Line("5410", debit="1000", cost_centre="PROD"),
+               Line("1200", credit="1000")])
+    await session.commit()
+    assert (await variance_grid(session, fiscal_year=2026))["cached"] is True
+
+    # ...a posting into the year does not.
+    await post_entry(
+        session, entry_date=date(2026, 7, 10), description="Power",
+        source_module="test",
+        lines=[Line("5410", debit="40000", cost_centre="PROD"),
+               Line("1200", credit="40000")])
+    await session.commit()
+    again = await variance_grid(session, fiscal_year=2026)
+    assert again["cached"] is False
+    cell = next(c for c in again["cells"] if c["month"] == "2026-07-01")
+    assert cell["actual"] == 40000.00
+
+
+@pytest.mark.asyncio
+async def test_grid_requires_an_approved_budget(session):
+    await make_budget(session, year=2026, status='DRAFT')
+    with pytest.raises(HTTPException):
+        await variance_grid(session, fiscal_year=2026)
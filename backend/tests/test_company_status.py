@@ -0,0 +1,159 @@
+"""Company-status overview.
+
+Properties guarded:
+  * revenue by month covers twelve real calendar months, newest first, and
+    sums from the same payments as the headline total;
+  * the month's payroll is clocked hours at each member's own rate;
+  * the overview is served from cache inside its freshness window, and
+    concurrent requests for a stale entry share one recomputation.
+
+The cache tests need no database; the figures test requires real PostgreSQL
+(TEST_DATABASE_URL).
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import company_status as cs
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+SCHEMA = """
+DROP TABLE IF EXISTS attendance CASCADE;
+DROP TABLE IF EXISTS staff CASCADE;
+DROP TABLE IF EXISTS payments CASCADE;
+DROP TABLE IF EXISTS invoices CASCADE;
+DROP TABLE IF EXISTS sales_orders CASCADE;
+DROP TABLE IF EXISTS production_orders CASCADE;
+DROP TABLE IF EXISTS stock_levels CASCADE;
+DROP TABLE IF EXISTS product_pricing CASCADE;
+DROP TABLE IF EXISTS products CASCADE;
+DROP TABLE IF EXISTS raw_materials CASCADE;
+DROP TABLE IF EXISTS customers CASCADE;
+
+CREATE TABLE customers (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        name VARCHAR(255));
+CREATE TABLE products (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                       name VARCHAR(255), unit VARCHAR(32),
+                       cost_price NUMERIC(18,2));
+CREATE TABLE product_pricing (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                              product_id UUID, unit VARCHAR(32),
+                              cost_price NUMERIC(18,2));
+CREATE TABLE raw_materials (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                            name VARCHAR(255), unit_cost NUMERIC(18,2));
+CREATE TABLE stock_levels (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                           product_id UUID, raw_material_id UUID,
+                           current_stock NUMERIC(18,6));
+CREATE TABLE sales_orders (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                           payment_status VARCHAR(32));
+CREATE TABLE invoices (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                       total_amount NUMERIC(18,2), status VARCHAR(32));
+CREATE TABLE payments (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                       invoice_id UUID, amount NUMERIC(18,2),
+                       payment_date TIMESTAMPTZ);
+CREATE TABLE production_orders (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                                status VARCHAR(32));
+CREATE TABLE staff (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    hourly_rate NUMERIC(10,2));
+CREATE TABLE attendance (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                         staff_id UUID, clock_in TIMESTAMPTZ,
+                         clock_out TIMESTAMPTZ)
+"""
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    cs.clear_cache()
+    yield
+    cs.clear_cache()
+
+
+def test_last_twelve_months_are_calendar_months_newest_first():
+    months = cs._last_twelve_months(datetime(2026, 3, 1, tzinfo=timezone.utc))
+    assert [m.strftime('%Y-%m') for m in months[:3]] == [
+        '2026-03', '2026-02', '2026-01']
+    assert months[-1].strftime('%Y-%m') == '2025-04'
+    assert len({(m.year, m.month) for m in months}) == 12
+
+
+@pytest.mark.asyncio
+async def test_overview_is_cached_and_recomputed_once(monkeypatch):
+    calls = []
+
+    async def compute(session):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'total_revenue': float(len(calls)),
+                'generated_at': datetime.now(timezone.utc).isoformat()}
+
+    monkeypatch.setattr(cs, "compute_company_status", compute)
+
+    first, second = await asyncio.gather(
+        cs.company_status(None), cs.company_status(None))
+    assert len(calls) == 1 and first is second
+    assert 'fresh_until' in first
+
+    assert (await cs.company_status(None))['total_revenue'] == 1.0
+    assert (await cs.company_status(None, refresh=True))['total_revenue'] == 2.0
+
+    monkeypatch.setattr(cs, "TTL_SECONDS", 0)
+    cs.clear_cache()
+    await cs.company_status(None)
+    await cs.company_status(None)
+    assert len(calls) == 4
+
+
+@pytest_asyncio.fixture
+async def session():
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    async with eng.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
+        for stmt in SCHEMA.strip().split(";"):
+            if stmt.strip():
+                await conn.execute(text(stmt))
+    maker = sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as s:
+        yield s
+    await eng.dispose()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_revenue_months_and_payroll_come_from_grouped_queries(session):
+    now = datetime.now(timezone.utc)
+    this_month = now.replace(day=1, hour=12, minute=0, second=0, microsecond=0)
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+    long_ago = this_month.replace(year=this_month.year - 3)
+    for amount, paid_on in ((100, this_month), (50, this_month),
+                            (70, last_month), (30, long_ago)):
+        await session.execute(text(
+            "INSERT INTO payments (amount, payment_date) VALUES (:a, :d)"),
+            {"a": amount, "d": paid_on})
+
+    staff = (await session.execute(text(
+        "INSERT INTO staff (hourly_rate) VALUES (1000) RETURNING id"))).scalar()
+    await session.execute(text("""
+        INSERT INTO attendance (staff_id, clock_in, clock_out)
+        VALUES (:s, :i, :i + INTERVAL '8 hours'),
+               (:s, :i + INTERVAL '1 day', NULL)
+    """), {"s": staff, "i": this_month})
+    await session.execute(text(
+        "INSERT INTO production_orders (status) "
+        "VALUES ('completed'), ('pending'), ('pending')"))
+    await session.commit()
+
+    m = await cs.compute_company_status(session)
+    assert m['total_revenue'] == 250.0
+    assert m['revenue_by_month'][0]['revenue'] == 150.0
+    assert m['revenue_by_month'][1]['revenue'] == 70.0
+    assert sum(r['revenue'] for r in m['revenue_by_month']) == 220.0
+    assert m['monthly_payroll'] == 8000.0
+    assert (m['total_production_orders'], m['pending_production']) == (3, 2)
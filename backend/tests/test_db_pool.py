@@ -0,0 +1,69 @@
+"""Engine configuration: pool sizing, statement cache, checkout timing and the
+read-only replica engine.
+
+The replica tests point the read engine at TEST_DATABASE_URL itself. A second
+database stands in for a streaming replica perfectly well here: what matters
+is that the read engine refuses writes and that its checkouts are timed.
+Those tests require real PostgreSQL; the configuration tests do not.
+"""
+import os
+
+import pytest
+from sqlalchemy import exc, text
+
+from app import db
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+
+def test_pool_and_statement_cache_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "7")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "3")
+    monkeypatch.setenv("DB_STATEMENT_CACHE_SIZE", "0")
+    eng = db.build_engine("postgresql+asyncpg://u:p@localhost/x_test")
+    pool = eng.sync_engine.pool
+    assert isinstance(pool, db.TimedQueuePool)
+    assert pool.size() == 7 and pool._max_overflow == 3
+    assert eng.url.query["prepared_statement_cache_size"] == "0"
+
+
+def test_replica_pool_falls_back_to_the_primary_sizes(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "9")
+    monkeypatch.delenv("DB_READ_POOL_SIZE", raising=False)
+    eng = db.build_engine("postgresql+asyncpg://u:p@localhost/x_test",
+                          read_only=True, pool_prefix="DB_READ_")
+    assert eng.sync_engine.pool.size() == 9
+    monkeypatch.setenv("DB_READ_POOL_SIZE", "2")
+    eng = db.build_engine("postgresql+asyncpg://u:p@localhost/x_test",
+                          read_only=True, pool_prefix="DB_READ_")
+    assert eng.sync_engine.pool.size() == 2
+
+
+def test_wait_stats_summarise_checkouts():
+    stats = db.PoolWaitStats()
+    for ms in (0.1, 0.2, 12.0, 0.3):
+        stats.record(ms)
+    snap = stats.snapshot()
+    assert snap["checkouts"] == 4
+    assert snap["slow_checkouts"] == 1
+    assert snap["max_wait_ms"] == 12.0
+    assert snap["avg_wait_ms"] == 3.15
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_read_engine_refuses_writes_and_times_checkouts():
+    eng = db.build_engine(TEST_DB, read_only=True, pool_prefix="DB_READ_")
+    try:
+        async with eng.connect() as conn:
+            assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+            with pytest.raises(exc.DBAPIError) as err:
+                await conn.execute(text(
+                    "CREATE TABLE read_only_probe (id int)"))
+            assert "read-only" in str(err.value)
+        async with eng.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        assert eng.sync_engine.pool.wait_stats.checkouts == 2
+    finally:
+        await eng.dispose()
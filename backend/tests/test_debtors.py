@@ -0,0 +1,180 @@
+"""Debtors and overdue-reminder lists.
+
+Properties guarded:
+  * balances come from the cached paid totals on invoices and legacy debts,
+    merged per customer;
+  * settled and cancelled documents do not make anyone a debtor;
+  * filtering and paging happen server-side, and the totals cover every match
+    rather than the page returned;
+  * reminders list only invoices past their due date.
+
+Requires real PostgreSQL (TEST_DATABASE_URL).
+"""
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services.debtors import debtors_page, overdue_reminders
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(
+    not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+SCHEMA = """
+DROP TABLE IF EXISTS legacy_debt_payments CASCADE;
+DROP TABLE IF EXISTS legacy_debts CASCADE;
+DROP TABLE IF EXISTS payments CASCADE;
+DROP TABLE IF EXISTS invoices CASCADE;
+DROP TABLE IF EXISTS customers CASCADE;
+
+CREATE TABLE customers (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255),
+    phone VARCHAR(50),
+    address TEXT
+);
+CREATE TABLE invoices (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    invoice_number VARCHAR(64) UNIQUE NOT NULL,
+    customer_id UUID REFERENCES customers(id),
+    invoice_date TIMESTAMPTZ DEFAULT NOW(),
+    due_date TIMESTAMPTZ,
+    total_amount NUMERIC(18,2) DEFAULT 0,
+    paid_amount NUMERIC(18,2) DEFAULT 0,
+    status VARCHAR(32) DEFAULT 'pending'
+);
+CREATE TABLE legacy_debts (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    debt_number VARCHAR(64) UNIQUE NOT NULL,
+    customer_id UUID NOT NULL REFERENCES customers(id),
+    description TEXT NOT NULL,
+    original_amount NUMERIC(18,2) NOT NULL,
+    paid_amount NUMERIC(18,2) NOT NULL DEFAULT 0,
+    status VARCHAR(32) NOT NULL DEFAULT 'pending',
+    debt_date DATE NOT NULL,
+    due_date DATE
+);
+"""
+
+
+@pytest_asyncio.fixture
+async def engine():
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    async with eng.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
+        for stmt in SCHEMA.strip().split(";"):
+            if stmt.strip():
+                await conn.execute(text(stmt))
+    yield eng
+    await eng.dispose()
+
+
+@pytest_asyncio.fixture
+async def session(engine):
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as s:
+        yield s
+        await s.rollback()
+
+
+async def make_customer(session, name):
+    return (await session.execute(text(
+        "INSERT INTO customers (name, phone) VALUES (:n, :p) RETURNING id"),
+        {"n": name, "p": f"080{uuid.uuid4().int % 10**8:08d}"})).scalar_one()
+
+
+async def make_invoice(session, cid, total, *, paid=0, status=None,
+                       due_in_days=30):
+    status = status or ('paid' if paid >= total else
+                        'partial' if paid else 'pending')
+    await session.execute(text("""
+        INSERT INTO invoices (invoice_number, customer_id, due_date,
+                              total_amount, paid_amount, status)
+        VALUES (:n, :c, :due, :t, :p, :s)
+    """), {"n": f"INV-{uuid.uuid4().hex[:8]}", "c": cid,
+           "due": datetime.now(timezone.utc) + timedelta(days=due_in_days),
+           "t": total, "p": paid, "s": status})
+
+
+async def make_legacy(session, cid, amount, *, paid=0):
+    await session.execute(text("""
+        INSERT INTO legacy_debts (debt_number, customer_id, description,
+                                  original_amount, paid_amount, status,
+                                  debt_date, due_date)
+        VALUES (:n, :c, 'Carried over', :a, :p, :s, CURRENT_DATE - 60,
+                CURRENT_DATE - 30)
+    """), {"n": f"LD-{uuid.uuid4().hex[:8]}", "c": cid, "a": amount,
+           "p": paid, "s": 'partial' if paid else 'pending'})
+
+
+@pytest.mark.asyncio
+async def test_balances_merge_invoices_and_legacy_debts(session):
+    a = await make_customer(session, "Alpha Clinic")
+    await make_invoice(session, a, 1000, paid=400)
+    await make_invoice(session, a, 500, paid=500)          # settled
+    await make_legacy(session, a, 300, paid=100)
+    b = await make_customer(session, "Beta Pharmacy")
+    await make_legacy(session, b, 250)
+    c = await make_customer(session, "Gamma Stores")
+    await make_invoice(session, c, 800, status='cancelled')
+    await session.commit()
+
+    out = await debtors_page(session)
+    by_name = {d["customer_name"]: d for d in out["debtors"]}
+    assert set(by_name) == {"Alpha Clinic", "Beta Pharmacy"}
+
+    alpha = by_name["Alpha Clinic"]
+    assert alpha["invoice_count"] == 2
+    assert alpha["balance"] == 800.0                       # 600 + 200
+    assert alpha["total_invoiced"] == 1800.0
+    assert alpha["legacy_debt_balance"] == 200.0
+    assert alpha["is_overdue"] is True                     # legacy is past due
+    assert by_name["Beta Pharmacy"]["invoice_count"] == 0
+    assert out["total_outstanding"] == 1050.0
+
+
+@pytest.mark.asyncio
+async def test_paging_and_filters_keep_totals_for_all_matches(session):
+    for i in range(5):
+        cid = await make_customer(session, f"Customer {i}")
+        await make_invoice(session, cid, 100 * (i + 1))
+    await session.commit()
+
+    page = await debtors_page(session, limit=2, offset=2)
+    assert [d["balance"] for d in page["debtors"]] == [300.0, 200.0]
+    assert page["total_debtors"] == 5
+    assert page["total_outstanding"] == 1500.0
+
+    past_end = await debtors_page(session, limit=2, offset=10)
+    assert past_end["debtors"] == [] and past_end["total_debtors"] == 5
+
+    filtered = await debtors_page(session, search="customer 4", min_balance=1)
+    assert [d["customer_name"] for d in filtered["debtors"]] == ["Customer 4"]
+
+    assert (await debtors_page(session, overdue_only=True))["total_debtors"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reminders_list_only_overdue_invoices(session):
+    late = await make_customer(session, "Late Payer")
+    await make_invoice(session, late, 700, paid=200, due_in_days=-10)
+    await make_invoice(session, late, 900, due_in_days=20)  # not yet due
+    ontime = await make_customer(session, "On Time")
+    await make_invoice(session, ontime, 400, due_in_days=5)
+    await session.commit()
+
+    out = await overdue_reminders(session)
+    assert out["total"] == 1
+    r = out["reminders"][0]
+    assert r["customer_name"] == "Late Payer"
+    assert r["overdue_invoices"] == 1
+    assert r["balance"] == 500.0
+    assert r["days_overdue"] >= 9
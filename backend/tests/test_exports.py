@@ -0,0 +1,152 @@
+"""Row-by-row CSV and XLSX downloads, and report exports run as jobs.
+
+Properties guarded:
+  * CSV goes out in several chunks as rows arrive, not one body at the end;
+  * both formats hold exactly the header and rows given, in order;
+  * report parameters are converted and checked before any row is read,
+    and a report refusing them fails with its own status, not a cut-off 200;
+  * a job reports progress as it goes and leaves either the complete file
+    or nothing.
+"""
+import csv
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import load_workbook
+
+from app.services import exports
+
+HEADER = ("entry_number", "date", "debit", "balance")
+
+
+async def _rows(n):
+    for i in range(n):
+        yield [f"JE-{i:05d}", date(2026, 7, 1), Decimal("12.50"), float(i)]
+
+
+@pytest.mark.asyncio
+async def test_csv_streams_in_chunks(monkeypatch):
+    monkeypatch.setattr(exports, "CSV_CHUNK_BYTES", 1024)
+    chunks = [c async for c in exports.csv_chunks(HEADER, _rows(500))]
+    assert len(chunks) > 10
+    assert all(len(c) < 1200 for c in chunks)
+    parsed = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert parsed[0] == list(HEADER)
+    assert parsed[1] == ["JE-00000", "2026-07-01", "12.50", "0.0"]
+    assert len(parsed) == 501
+
+
+@pytest.mark.asyncio
+async def test_xlsx_holds_every_row():
+    body = b"".join([c async for c in exports.xlsx_chunks(
+        HEADER, _rows(300), sheet="Ledger 1100")])
+    ws = load_workbook(io.BytesIO(body), read_only=True)["Ledger 1100"]
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0] == HEADER
+    assert len(rows) == 301 and rows[-1][0] == "JE-00299"
+    assert rows[1][2] == 12.5
+
+
+# ---------------------------------------------------------------------------
+# Registered reports and background jobs
+# ---------------------------------------------------------------------------
+
+class _Session:
+    """Stands in for a session maker and its sessions; records writes."""
+
+    def __init__(self, log=None):
+        self.log = [] if log is None else log
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, params=None):
+        self.log.append(params)
+
+    async def commit(self):
+        pass
+
+
+async def _ledger(session, *, account_code, start=None, end=None):
+    if account_code == "9999":
+        raise HTTPException(status_code=404, detail="Account not found.")
+    async for row in _rows(2500):
+        yield dict(zip(HEADER, row))
+
+
+LEDGER = exports.Report(
+    "test_ledger", "Ledger", HEADER, _ledger,
+    {"account_code": str, "start": date.fromisoformat,
+     "overdue_only": exports.flag},
+    required=("account_code",))
+
+
+def test_params_are_converted_and_checked():
+    assert exports.parse_params(LEDGER, {
+        "account_code": "1100", "start": "2026-07-01", "format": "csv",
+        "overdue_only": "true", "end": ""}) == {
+        "account_code": "1100", "start": date(2026, 7, 1),
+        "overdue_only": True}
+    with pytest.raises(HTTPException) as bad:
+        exports.parse_params(LEDGER, {"account_code": "1", "start": "July"})
+    assert bad.value.status_code == 422 and "start" in bad.value.detail
+    with pytest.raises(HTTPException) as missing:
+        exports.parse_params(LEDGER, {"start": "2026-07-01"})
+    assert missing.value.status_code == 422
+    with pytest.raises(HTTPException):
+        exports.check_format("pdf")
+
+
+@pytest.mark.asyncio
+async def test_a_refused_report_fails_before_the_download_starts():
+    with pytest.raises(HTTPException) as refused:
+        await exports.download(LEDGER, "csv", {"account_code": "9999"},
+                               sessions=_Session())
+    assert refused.value.status_code == 404
+
+    response = await exports.download(LEDGER, "csv", {"account_code": "1100"},
+                                      sessions=_Session())
+    body = b"".join([c async for c in response.body_iterator])
+    assert len(body.splitlines()) == 2501
+    assert "test-ledger-1100.csv" in response.headers["content-disposition"]
+
+
+@pytest.mark.asyncio
+async def test_a_job_writes_its_file_and_reports_progress(
+        monkeypatch, tmp_path):
+    monkeypatch.setattr(exports, "EXPORT_DIR", tmp_path)
+    monkeypatch.setattr(exports, "JOB_PROGRESS_ROWS", 1000)
+    monkeypatch.setattr(exports, "_semaphore", None)
+    log = []
+    await exports._run_job("job-1", LEDGER, "xlsx", {"account_code": "1100"},
+                           sessions=_Session(log), read_sessions=_Session())
+
+    assert [p.get("status") for p in log] == [
+        "running", None, None, "done"]
+    assert [p.get("rows") for p in log[1:]] == [1000, 2000, 2500]
+    assert log[-1]["bytes"] == (tmp_path / "job-1.xlsx").stat().st_size
+    ws = load_workbook(tmp_path / "job-1.xlsx", read_only=True)["Ledger"]
+    assert sum(1 for _ in ws.iter_rows()) == 2501
+    assert [p.name for p in tmp_path.iterdir()] == ["job-1.xlsx"]
+
+
+@pytest.mark.asyncio
+async def test_a_failed_job_leaves_no_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(exports, "EXPORT_DIR", tmp_path)
+    monkeypatch.setattr(exports, "_semaphore", None)
+    log = []
+    await exports._run_job("job-2", LEDGER, "csv", {"account_code": "9999"},
+                           sessions=_Session(log), read_sessions=_Session())
+
+    assert log[-1]["status"] == "failed"
+    assert log[-1]["error"] == "Account not found."
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,206 @@
+"""Response compression and conditional GETs.
+
+Properties guarded:
+  * textual bodies above the threshold are gzip-compressed for clients that
+    accept it; small bodies, event streams and clients without gzip get the
+    identity encoding; streamed bodies stay streamed;
+  * an If-None-Match carrying the current tag is answered with 304 without
+    running the endpoint's query, and any change counter moving yields a new
+    tag;
+  * the change counters move once per committed transaction, and never for
+    a rolled-back one.
+
+The HTTP tests need no database; the counter test requires real PostgreSQL
+(TEST_DATABASE_URL).
+"""
+import gzip
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import compression, http_cache
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+BIG = [{"sku": f"SKU-{i}", "name": "Wound dressing"} for i in range(200)]
+
+
+def _app(versions: dict):
+    app = FastAPI()
+    app.add_middleware(compression.CompressionMiddleware)
+    queries = []
+
+    @app.get("/big")
+    async def big(request: Request, response: Response):
+        cached = await http_cache.not_modified(
+            request, response, None, ("products",))
+        if cached is not None:
+            return cached
+        queries.append(1)
+        return BIG
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(50):
+                yield f"{i},{'x' * 100}\n".encode()
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    @app.get("/events")
+    async def events():
+        async def ev():
+            yield b"data: " + b"x" * 4000 + b"\n\n"
+        return StreamingResponse(ev(), media_type="text/event-stream")
+
+    async def token(session, tables):
+        return ",".join(f"{t}:{versions[t]}" for t in tables)
+
+    return app, queries, token
+
+
+@pytest.fixture
+def client_for(monkeypatch):
+    def make(versions):
+        app, queries, token = _app(versions)
+        monkeypatch.setattr(http_cache, "version_token", token)
+        return AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://test"), queries
+    return make
+
+
+def test_encoding_negotiation(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.choose_encoding("gzip, deflate, br") == "gzip"
+    assert compression.choose_encoding("gzip;q=0, identity") is None
+    assert compression.choose_encoding("") is None
+
+
+def test_weak_etag_comparison():
+    assert http_cache.etag_matches('"abc"', 'W/"abc"')
+    assert http_cache.etag_matches('W/"x", W/"abc"', 'W/"abc"')
+    assert http_cache.etag_matches("*", 'W/"abc"')
+    assert not http_cache.etag_matches('W/"abd"', 'W/"abc"')
+    assert not http_cache.etag_matches(None, 'W/"abc"')
+
+
+@pytest.mark.asyncio
+async def test_large_json_is_compressed_and_small_is_not(client_for):
+    client, _ = client_for({"products": 1})
+    async with client as ac:
+        r = await ac.get("/big", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in r.headers["vary"].lower()
+        assert r.json() == BIG
+        assert int(r.headers["content-length"]) < len(r.content) // 3
+
+        r = await ac.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers
+
+        r = await ac.get("/big", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in r.headers
+
+
+@pytest.mark.asyncio
+async def test_streams_stay_streams_and_events_pass_through(client_for):
+    client, _ = client_for({"products": 1})
+    async with client as ac:
+        r = await ac.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["content-encoding"] == "gzip"
+        assert "content-length" not in r.headers
+        assert r.text.count("\n") == 50
+
+        r = await ac.get("/events", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers
+
+
+@pytest.mark.asyncio
+async def test_if_none_match_short_circuits_until_a_table_changes(client_for):
+    versions = {"products": 7}
+    client, queries = client_for(versions)
+    async with client as ac:
+        first = await ac.get("/big")
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+        assert first.headers["cache-control"] == http_cache.CACHE_CONTROL
+
+        again = await ac.get("/big", headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.content == b""
+        assert len(queries) == 1
+
+        other_query = await ac.get("/big?page=2", headers={"If-None-Match": etag})
+        assert other_query.status_code == 200
+
+        versions["products"] = 8
+        changed = await ac.get("/big", headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["etag"] != etag
+        assert len(queries) == 3
+
+
+def test_gzip_round_trip_of_a_stream():
+    c = compression._Compressor("gzip")
+    out = b"".join(c.chunk(p) for p in (b"a" * 10, b"b" * 10)) + c.finish()
+    assert gzip.decompress(out) == b"a" * 10 + b"b" * 10
+
+
+def _apply_migration(conn, filename: str):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    spec = importlib.util.spec_from_file_location(
+        f"mig_{filename[:12]}", VERSIONS / filename)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    with Operations.context(MigrationContext.configure(conn)):
+        mod.upgrade()
+
+
+@pytest_asyncio.fixture
+async def maker():
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        c.execute(text("DROP TABLE IF EXISTS products CASCADE"))
+        c.execute(text("DROP TABLE IF EXISTS change_versions"))
+        c.execute(text("CREATE TABLE products (id serial PRIMARY KEY, name text)"))
+        c.commit()
+        _apply_migration(c, "z5678901234y_change_versions.py")
+        c.commit()
+    seng.dispose()
+    http_cache._tracking_ready = None
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    await eng.dispose()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_counters_move_once_per_commit(maker):
+    async with maker() as s:
+        before = await http_cache.version_token(s, ["products"])
+        assert before == "products:0"
+
+        await s.execute(text("INSERT INTO products (name) VALUES ('a'), ('b')"))
+        await s.execute(text("UPDATE products SET name = name || '!'"))
+        await s.commit()
+        assert await http_cache.version_token(s, ["products"]) == "products:1"
+
+        await s.execute(text("DELETE FROM products"))
+        await s.rollback()
+        assert await http_cache.version_token(s, ["products"]) == "products:1"
+
+        assert await http_cache.version_token(
+            s, ["products", "untracked"]) is None
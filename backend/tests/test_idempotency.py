@@ -0,0 +1,234 @@
+"""Idempotency-Key replay.
+
+Properties guarded:
+  * a retried write with the same key runs once; the retry gets the stored
+    response, marked as replayed;
+  * a key reused with a different body is refused, and a second attempt
+    while the first is running gets 409;
+  * a failed attempt releases its key, so the client can try again;
+  * a slow attempt keeps its claim past IDEMPOTENCY_LOCK_SECONDS, and one
+    cancelled after its 2xx went out is not run again;
+  * requests without a key, and routes outside the list, are untouched;
+  * the Postgres store shares claims between workers.
+
+The middleware tests need no database; the store test requires real
+PostgreSQL (TEST_DATABASE_URL).
+"""
+import asyncio
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, HTTPException
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import idempotency
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+
+def _apply_migration(conn, filename: str):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    spec = importlib.util.spec_from_file_location(
+        f"mig_{filename[:12]}", VERSIONS / filename)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    with Operations.context(MigrationContext.configure(conn)):
+        mod.upgrade()
+
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.gate = None
+    app.add_middleware(idempotency.IdempotencyMiddleware,
+                       store=idempotency.MemoryIdempotencyStore())
+
+    @app.post("/api/sales/orders")
+    async def create_order(body: dict):
+        app.state.calls += 1
+        if app.state.gate is not None:
+            await app.state.gate.wait()
+        if body.get("fail"):
+            raise HTTPException(status_code=400, detail="Out of stock")
+        return {"order": f"SO-{app.state.calls}"}
+
+    @app.post("/api/sales/customers")
+    async def create_customer(body: dict):
+        app.state.calls += 1
+        return {"customer": app.state.calls}
+
+    return app
+
+
+def _client(app):
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_retry_replays_the_first_response(app):
+    key = {"Idempotency-Key": "a1", "Authorization": "Bearer t"}
+    async with _client(app) as ac:
+        first = await ac.post("/api/sales/orders", json={"q": 1}, headers=key)
+        again = await ac.post("/api/sales/orders", json={"q": 1}, headers=key)
+        other_user = await ac.post(
+            "/api/sales/orders", json={"q": 1},
+            headers={"Idempotency-Key": "a1", "Authorization": "Bearer u"})
+    assert first.json() == again.json() == {"order": "SO-1"}
+    assert again.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert other_user.json() == {"order": "SO-2"}, "keys are per caller"
+    assert app.state.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_reuse_with_another_body_and_concurrent_retry(app):
+    app.state.gate = asyncio.Event()
+    async with _client(app) as ac:
+        first = asyncio.create_task(ac.post(
+            "/api/sales/orders", json={"q": 1}, headers={"Idempotency-Key": "b"}))
+        while app.state.calls == 0:
+            await asyncio.sleep(0.01)
+        busy = await ac.post("/api/sales/orders", json={"q": 1},
+                             headers={"Idempotency-Key": "b"})
+        assert busy.status_code == 409 and busy.headers["retry-after"] == "1"
+        app.state.gate.set()
+        assert (await first).status_code == 200
+
+        changed = await ac.post("/api/sales/orders", json={"q": 2},
+                                headers={"Idempotency-Key": "b"})
+        assert changed.status_code == 422
+    assert app.state.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_attempt_releases_the_key(app):
+    async with _client(app) as ac:
+        failed = await ac.post("/api/sales/orders", json={"fail": True},
+                               headers={"Idempotency-Key": "c"})
+        retried = await ac.post("/api/sales/orders", json={"fail": True},
+                                headers={"Idempotency-Key": "c"})
+    assert failed.status_code == retried.status_code == 400
+    assert app.state.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_a_slow_attempt_is_not_taken_over(app, monkeypatch):
+    monkeypatch.setattr(idempotency, "LOCK_SECONDS", 0.3)
+    app.state.gate = asyncio.Event()
+    async with _client(app) as ac:
+        first = asyncio.create_task(ac.post(
+            "/api/sales/orders", json={"q": 1}, headers={"Idempotency-Key": "s"}))
+        await asyncio.sleep(0.7)
+        # Taken over, the retry would run and wait on the gate too.
+        busy = await asyncio.wait_for(ac.post(
+            "/api/sales/orders", json={"q": 1},
+            headers={"Idempotency-Key": "s"}), timeout=5)
+        assert busy.status_code == 409
+        app.state.gate.set()
+        assert (await first).status_code == 200
+    assert app.state.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_after_a_2xx_is_not_run_again():
+    calls = []
+
+    async def endpoint(scope, receive, send):
+        calls.append(await receive())
+        await send({"type": "http.response.start", "status": 201,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"id": 1}'})
+        raise asyncio.CancelledError  # the client went away
+
+    middleware = idempotency.IdempotencyMiddleware(
+        endpoint, store=idempotency.MemoryIdempotencyStore())
+    scope = {"type": "http", "method": "POST", "path": "/api/sales/orders",
+             "headers": [(b"idempotency-key", b"e")]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    with pytest.raises(asyncio.CancelledError):
+        await middleware(scope, receive, send)
+    sent.clear()
+    await middleware(scope, receive, send)
+    assert len(calls) == 1
+    assert sent[0]["status"] == 201 and sent[1]["body"] == b'{"id": 1}'
+
+
+@pytest.mark.asyncio
+async def test_unkeyed_and_unlisted_requests_pass_through(app):
+    async with _client(app) as ac:
+        for _ in range(2):
+            await ac.post("/api/sales/orders", json={"q": 1})
+            await ac.post("/api/sales/customers", json={"n": 1},
+                          headers={"Idempotency-Key": "d"})
+        too_long = await ac.post("/api/sales/orders", json={"q": 1},
+                                 headers={"Idempotency-Key": "x" * 300})
+    assert app.state.calls == 4
+    assert too_long.status_code == 400
+
+
+def test_route_list_covers_the_money_and_stock_writes():
+    assert idempotency.covers("POST", "/api/public/orders")
+    assert idempotency.covers("PATCH", "/api/sales/orders/42/mark-paid")
+    assert idempotency.covers("POST", "/api/payment-tracking/invoices/9/payments")
+    assert idempotency.covers("POST", "/api/stock/intake/raw-material/")
+    assert idempotency.covers("POST", "/api/stock-management/product-intake")
+    assert idempotency.covers("POST", "/api/stock-management/raw-material-intake/")
+    assert not idempotency.covers("GET", "/api/sales/orders")
+    assert not idempotency.covers("POST", "/api/sales/orders/42/cancel")
+
+
+@pytest_asyncio.fixture
+async def pg_store():
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        c.execute(text("DROP TABLE IF EXISTS idempotency_keys"))
+        c.commit()
+        _apply_migration(c, "c8901234567b_idempotency_keys.py")
+        c.commit()
+    seng.dispose()
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    maker = sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    yield (idempotency.PostgresIdempotencyStore(maker),
+           idempotency.PostgresIdempotencyStore(maker))
+    async with eng.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS idempotency_keys"))
+    await eng.dispose()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_postgres_store_is_shared_between_workers(pg_store):
+    a, b = pg_store
+    key = "k" * 64
+    claims = await asyncio.gather(a.claim(key, "h1", "POST", "/x"),
+                                  b.claim(key, "h1", "POST", "/x"))
+    assert sorted(c.state for c in claims) == ["busy", "new"]
+
+    await a.complete(key, "h1", 201, "application/json", b'{"ok":1}')
+    replay = await b.claim(key, "h1", "POST", "/x")
+    assert (replay.state, replay.status_code, replay.body) == (
+        "replay", 201, b'{"ok":1}')
+    assert (await b.claim(key, "h2", "POST", "/x")).state == "mismatch"
+
+    other = "o" * 64
+    assert (await a.claim(other, "h", "POST", "/x")).state == "new"
+    await a.release(other)
+    assert (await b.claim(other, "h", "POST", "/x")).state == "new"
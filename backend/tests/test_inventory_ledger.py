@@ -25,7 +25,8 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.services.inventory import (
-    apply_stock_movement, transfer_stock, get_available_stock)
+    Movement, apply_stock_movement, apply_stock_movements, transfer_stock,
+    get_available_stock)
 
 TEST_DB = os.getenv("TEST_DATABASE_URL")
 pytestmark = pytest.mark.skipif(
@@ -416,3 +417,106 @@ async def test_ledger_replay_reconciles_to_balance(session, wh, prod):
         session, warehouse_id=wh, product_id=prod)
 
     assert Decimal(str(replayed)) == balance == Decimal("400")
+
+
+# ---------------------------------------------------------------------------
+# The batched path must keep every guarantee of the single one.
+# ---------------------------------------------------------------------------
+
+@pytest.mark.asyncio
+async def test_batch_composes_movements_in_order(session, wh, prod):
+    rm_a, rm_b = uuid.uuid4(), uuid.uuid4()
+    await apply_stock_movements(session, [
+        Movement(warehouse_id=wh, raw_material_id=rm_a,
+                 movement_type="IN", quantity=50),
+        Movement(warehouse_id=wh, raw_material_id=rm_b,
+                 movement_type="IN", quantity=8),
+    ])
+    await session.commit()
+
+    ids = await apply_stock_movements(session, [
+        Movement(warehouse_id=wh, raw_material_id=rm_a,
+                 movement_type="PRODUCTION_OUT", quantity=30, unit_cost=2),
+        Movement(warehouse_id=wh, raw_material_id=rm_b,
+                 movement_type="PRODUCTION_OUT", quantity=8),
+        Movement(warehouse_id=wh, product_id=prod,
+                 movement_type="PRODUCTION_IN", quantity=12),
+        # Booked in, then written off: must not fail as a negative balance.
+        Movement(warehouse_id=wh, product_id=prod,
+                 movement_type="PRODUCTION_IN", quantity=3),
+        Movement(warehouse_id=wh, product_id=prod,
+                 movement_type="DAMAGE", quantity=3),
+    ])
+    await session.commit()
+
+    assert len(set(ids)) == 5
+    assert await get_available_stock(
+        session, warehouse_id=wh, raw_material_id=rm_a) == Decimal("20")
+    assert await get_available_stock(
+        session, warehouse_id=wh, raw_material_id=rm_b) == Decimal("0")
+    assert await get_available_stock(
+        session, warehouse_id=wh, product_id=prod) == Decimal("12")
+    fourth = (await session.execute(text(
+        "SELECT movement_type FROM stock_movements WHERE id = :id"
+    ), {"id": str(ids[3])})).scalar()
+    assert fourth == "PRODUCTION_IN", "ids come back in input order"
+    assert await _count_movements(session, wh) == 7
+
+
+@pytest.mark.asyncio
+async def test_batch_is_rejected_whole_when_one_line_is_short(session, wh, prod):
+    rm = uuid.uuid4()
+    await apply_stock_movement(session, warehouse_id=wh, raw_material_id=rm,
+                               movement_type="IN", quantity=5)
+    await session.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        await apply_stock_movements(session, [
+            Movement(warehouse_id=wh, product_id=prod,
+                     movement_type="PRODUCTION_IN", quantity=10),
+            Movement(warehouse_id=wh, raw_material_id=rm,
+                     movement_type="PRODUCTION_OUT", quantity=6),
+        ])
+    assert exc.value.status_code == 400
+    assert "Insufficient stock" in exc.value.detail
+    await session.rollback()
+
+    assert await get_available_stock(
+        session, warehouse_id=wh, raw_material_id=rm) == Decimal("5")
+    assert await get_available_stock(
+        session, warehouse_id=wh, product_id=prod) == Decimal("0")
+    assert await _count_movements(session, wh) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_batches_do_not_oversell(engine, wh):
+    materials = [uuid.uuid4() for _ in range(4)]
+    maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as s:
+        await apply_stock_movements(s, [
+            Movement(warehouse_id=wh, raw_material_id=m,
+                     movement_type="IN", quantity=10) for m in materials])
+        await s.commit()
+
+    async def consume(order):
+        async with maker() as s:
+            try:
+                await apply_stock_movements(s, [
+                    Movement(warehouse_id=wh, raw_material_id=m,
+                             movement_type="PRODUCTION_OUT", quantity=4)
+                    for m in order])
+                await s.commit()
+                return True
+            except HTTPException:
+                await s.rollback()
+                return False
+
+    # Opposite orders would deadlock if locks were taken in input order.
+    results = await asyncio.gather(*(
+        consume(materials if i % 2 else materials[::-1]) for i in range(4)))
+    assert results.count(True) == 2
+
+    async with maker() as s:
+        for m in materials:
+            assert await get_available_stock(
+                s, warehouse_id=wh, raw_material_id=m) == Decimal("2")
@@ -18,21 +18,20 @@ from sqlalchemy.orm import sessionmaker
 
 from app.services.ledger import (
     Line, post_entry, reverse_entry, trial_balance, profit_and_loss,
-    balance_sheet, account_ledger, money)
+    balance_sheet, account_ledger, iter_account_ledger, money)
 
 TEST_DB = os.getenv("TEST_DATABASE_URL")
 pytestmark = pytest.mark.skipif(
     not TEST_DB, reason="TEST_DATABASE_URL not set")
 
 
-def _apply_migration(conn):
+def _apply_migration(conn, name="m2345678901l_general_ledger.py"):
     import importlib.util
     from pathlib import Path
     from alembic.migration import MigrationContext
     from alembic.operations import Operations
-    path = Path(__file__).resolve().parents[1] / "alembic" / "versions" / \
-        "m2345678901l_general_ledger.py"
-    spec = importlib.util.spec_from_file_location("mig_m", path)
+    path = Path(__file__).resolve().parents[1] / "alembic" / "versions" / name
+    spec = importlib.util.spec_from_file_location(f"mig_{name[:6]}", path)
     mod = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(mod)
     ctx = MigrationContext.configure(conn)
@@ -47,11 +46,13 @@ async def engine():
     seng = create_engine(sync_url, future=True)
     with seng.connect() as c:
         c.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
-        for t in ("gl_journal_lines", "gl_journal_entries",
-                  "gl_periods", "gl_accounts"):
+        for t in ("gl_account_daily_balances", "gl_journal_lines",
+                  "gl_journal_entries", "gl_periods", "gl_accounts"):
             c.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
         c.commit()
         _apply_migration(c)
+        # The account ledger reads its opening balances from here.
+        _apply_migration(c, "u0123456789t_gl_daily_balances.py")
         c.commit()
     seng.dispose()
 
@@ -375,6 +376,37 @@ async def test_account_ledger_running_balance(session):
     assert led["closing_balance"] == 400.00
 
 
+@pytest.mark.asyncio
+async def test_account_ledger_pages_carry_the_balance(session):
+    days = [TODAY - timedelta(days=3), TODAY - timedelta(days=1), TODAY]
+    for n, on in enumerate(days + [TODAY], start=1):
+        await post_entry(
+            session, entry_date=on, description=f"Sale {n}",
+            source_module="sales",
+            lines=[Line("1100", debit=f"{n}00.00"), Line("4100", credit=f"{n}00.00")])
+    await session.commit()
+
+    # Income is credit-normal; the window opens after the first sale.
+    first = await account_ledger(session, account_code="4100",
+                                 start=days[1], limit=2)
+    assert first["opening_balance"] == 100.0
+    assert first["closing_balance"] == 1000.0
+    assert [e["balance"] for e in first["entries"]] == [300.0, 600.0]
+
+    second = await account_ledger(session, account_code="4100", start=days[1],
+                                  cursor=first["next_cursor"], limit=2)
+    assert [e["balance"] for e in second["entries"]] == [1000.0]
+    assert second["next_cursor"] is None
+
+    with pytest.raises(HTTPException) as bad:
+        await account_ledger(session, account_code="4100", cursor="not-a-cursor")
+    assert bad.value.status_code == 400
+
+    streamed = [e["balance"] async for e in iter_account_ledger(
+        session, account_code="4100", start=days[1])]
+    assert streamed == [300.0, 600.0, 1000.0]
+
+
 @pytest.mark.asyncio
 async def test_period_filtered_reports(session):
     await post_entry(
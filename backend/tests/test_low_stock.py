@@ -0,0 +1,217 @@
+"""Low-stock alerts from the stock write path.
+
+Properties guarded:
+  * a movement that takes a balance across its reorder level puts it on the
+    live list and alerts once, after commit; movements that stay on one side
+    of the level touch nothing;
+  * a new balance whose first intake leaves it at or below the level is low
+    from the start, though it never crossed anything;
+  * alerts for the same (warehouse, item) are debounced, even across a
+    recovery and a second dip;
+  * a rolled-back movement alerts nobody and leaves the list as it was;
+  * `rebuild` resynchronises the list with edited reorder levels.
+
+Requires real PostgreSQL (TEST_DATABASE_URL).
+"""
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.api import notifications
+from app.services import low_stock
+from app.services.inventory import apply_stock_movement
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(
+    not TEST_DB, reason="TEST_DATABASE_URL not set")
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+SCHEMA = """
+DROP TABLE IF EXISTS low_stock_items CASCADE;
+DROP TABLE IF EXISTS stock_movements CASCADE;
+DROP TABLE IF EXISTS stock_levels CASCADE;
+DROP TABLE IF EXISTS products CASCADE;
+DROP TABLE IF EXISTS raw_materials CASCADE;
+DROP TABLE IF EXISTS warehouses CASCADE;
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+CREATE TABLE warehouses (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                         name VARCHAR(255));
+CREATE TABLE products (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                       sku VARCHAR(64), name VARCHAR(255));
+CREATE TABLE raw_materials (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                            sku VARCHAR(64), name VARCHAR(255),
+                            reorder_level NUMERIC(18,6));
+CREATE TABLE stock_levels (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    warehouse_id UUID NOT NULL, product_id UUID, raw_material_id UUID,
+    current_stock NUMERIC(18,6) NOT NULL DEFAULT 0,
+    reserved_stock NUMERIC(18,6) DEFAULT 0,
+    min_stock NUMERIC(18,6) DEFAULT 0, max_stock NUMERIC(18,6) DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW());
+CREATE UNIQUE INDEX uq_stock_levels_wh_product
+    ON stock_levels (warehouse_id, product_id) WHERE product_id IS NOT NULL;
+CREATE UNIQUE INDEX uq_stock_levels_wh_raw_material
+    ON stock_levels (warehouse_id, raw_material_id)
+ WHERE raw_material_id IS NOT NULL;
+CREATE TABLE stock_movements (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    warehouse_id UUID NOT NULL, product_id UUID, raw_material_id UUID,
+    movement_type VARCHAR(32) NOT NULL, quantity NUMERIC(18,6) NOT NULL,
+    unit_cost NUMERIC(18,6), reference VARCHAR(255), notes TEXT,
+    created_by UUID, created_at TIMESTAMPTZ DEFAULT NOW())
+"""
+
+
+def _apply_migration(conn, filename: str):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    spec = importlib.util.spec_from_file_location(
+        f"mig_{filename[:12]}", VERSIONS / filename)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    with Operations.context(MigrationContext.configure(conn)):
+        mod.upgrade()
+
+
+@pytest_asyncio.fixture
+async def maker():
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        for stmt in SCHEMA.strip().split(";"):
+            if stmt.strip():
+                c.execute(text(stmt))
+        c.commit()
+        _apply_migration(c, "a6789012345z_low_stock_items.py")
+        c.commit()
+    seng.dispose()
+    low_stock._ready = None
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    # Other ledger tests build stock tables without the list.
+    async with eng.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS low_stock_items"))
+    await eng.dispose()
+    low_stock._ready = None
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    alerts = []
+
+    def fake_notify(name, current_stock, reorder_level):
+        return name
+
+    monkeypatch.setattr(notifications, "notify_low_stock", fake_notify)
+    monkeypatch.setattr(notifications, "fire_notification", alerts.append)
+    return alerts
+
+
+async def _seed(s):
+    wh = (await s.execute(text(
+        "INSERT INTO warehouses (name) VALUES ('Main') RETURNING id"))).scalar()
+    gauze = (await s.execute(text(
+        "INSERT INTO products (sku, name) VALUES ('G', 'Gauze') RETURNING id"
+    ))).scalar()
+    await s.execute(text("""
+        INSERT INTO stock_levels (warehouse_id, product_id, current_stock,
+                                  min_stock)
+        VALUES (:w, :p, 30, 20)"""), {"w": wh, "p": gauze})
+    await s.commit()
+    return wh, gauze
+
+
+async def _move(s, wh, product, mtype, qty):
+    await apply_stock_movement(s, warehouse_id=wh, product_id=product,
+                               movement_type=mtype, quantity=qty)
+    await s.commit()
+
+
+async def _live(s):
+    items, _ = await low_stock.live_items(s)
+    return [(i["item_name"], i["current_stock"]) for i in items]
+
+
+@pytest.mark.asyncio
+async def test_crossing_alerts_once_and_recovery_clears(maker, sent):
+    async with maker() as s:
+        wh, gauze = await _seed(s)
+
+        await _move(s, wh, gauze, "OUT", 5)          # 25: still above 20
+        assert await _live(s) == [] and sent == []
+
+        await _move(s, wh, gauze, "OUT", 8)          # 17: crossed
+        assert await _live(s) == [("Gauze", 17.0)]
+        assert sent == ["Gauze"]
+
+        await _move(s, wh, gauze, "OUT", 2)          # 15: still low
+        assert await _live(s) == [("Gauze", 15.0)] and sent == ["Gauze"]
+
+        await _move(s, wh, gauze, "IN", 10)          # 25: recovered
+        assert await _live(s) == []
+
+        await _move(s, wh, gauze, "OUT", 10)         # 15: dipped again
+        assert await _live(s) == [("Gauze", 15.0)]
+        assert sent == ["Gauze"], "second dip inside the window is debounced"
+        assert (await low_stock.counts(s)) == {"products": 1,
+                                               "raw_materials": 0}
+
+
+@pytest.mark.asyncio
+async def test_a_first_intake_below_the_level_alerts(maker, sent):
+    async with maker() as s:
+        wh, _ = await _seed(s)
+        swabs = (await s.execute(text(
+            "INSERT INTO products (sku, name) VALUES ('S', 'Swabs') RETURNING id"
+        ))).scalar()
+        await s.commit()
+
+        await _move(s, wh, swabs, "IN", 5)           # 0 -> 5, level 10
+        assert await _live(s) == [("Swabs", 5.0)] and sent == ["Swabs"]
+
+        await _move(s, wh, swabs, "IN", 2)           # 7: still low
+        assert await _live(s) == [("Swabs", 7.0)] and sent == ["Swabs"]
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_crossing_alerts_nobody(maker, sent):
+    async with maker() as s:
+        wh, gauze = await _seed(s)
+        await apply_stock_movement(s, warehouse_id=wh, product_id=gauze,
+                                   movement_type="OUT", quantity=20)
+        await s.rollback()
+        assert sent == [] and await _live(s) == []
+
+        await _move(s, wh, gauze, "OUT", 20)
+        assert sent == ["Gauze"]
+
+
+@pytest.mark.asyncio
+async def test_raw_materials_and_rebuild(maker, sent):
+    async with maker() as s:
+        wh, gauze = await _seed(s)
+        cotton = (await s.execute(text("""
+            INSERT INTO raw_materials (sku, name, reorder_level)
+            VALUES ('C', 'Cotton', 0) RETURNING id"""))).scalar()
+        await s.commit()
+        await apply_stock_movement(s, warehouse_id=wh, raw_material_id=cotton,
+                                   movement_type="IN", quantity=12)
+        await apply_stock_movement(s, warehouse_id=wh, raw_material_id=cotton,
+                                   movement_type="OUT", quantity=3)
+        await s.commit()
+        # An unset reorder level means 10, as on the stock screens.
+        assert await _live(s) == [("Cotton", 9.0)] and sent == ["Cotton"]
+
+        await s.execute(text("UPDATE stock_levels SET min_stock = 40"))
+        await s.execute(text("UPDATE raw_materials SET reorder_level = 5"))
+        assert await low_stock.rebuild(s) == 1
+        await s.commit()
+        assert await _live(s) == [("Gauze", 30.0)]
+        assert sent == ["Cotton"], "a rebuild sends no alerts"
@@ -44,11 +44,13 @@ async def engine():
     with seng.connect() as c:
         c.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
         for t in ("budget_lines", "budgets", "cost_centres", "qc_inspections",
-                  "vat_returns", "gl_journal_lines", "gl_journal_entries",
+                  "vat_returns", "gl_account_daily_balances",
+                  "gl_journal_lines", "gl_journal_entries",
                   "gl_periods", "gl_accounts"):
             c.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
         c.commit()
         _apply(c, "m2345678901l_general_ledger.py")
+        _apply(c, "u0123456789t_gl_daily_balances.py")  # ledger balances
         _apply(c, "q6789012345p_budgeting.py")   # cost centre master
         _apply(c, "r7890123456q_tax_qc_costing.py")
         c.commit()
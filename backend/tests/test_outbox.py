@@ -0,0 +1,200 @@
+"""The transactional outbox.
+
+Properties guarded:
+  * an event exists only if the transaction that enqueued it committed;
+  * each event is delivered once, however many dispatchers claim at the
+    same moment;
+  * a failing handler's writes are rolled back and the event is retried
+    with backoff, then marked failed; `RetryLater` keeps the writes;
+  * a push that did not reach a subscription is retried for that
+    subscription alone, while gone subscriptions are still dropped;
+  * unknown kinds and notifiers are refused at enqueue time.
+
+The dispatch tests require real PostgreSQL (TEST_DATABASE_URL).
+"""
+import asyncio
+import importlib.util
+import json
+import os
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import outbox
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+
+def _apply_migration(conn, filename: str):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    spec = importlib.util.spec_from_file_location(
+        f"mig_{filename[:12]}", VERSIONS / filename)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    with Operations.context(MigrationContext.configure(conn)):
+        mod.upgrade()
+
+
+def test_backoff_doubles_up_to_an_hour(monkeypatch):
+    monkeypatch.setattr(outbox, "RETRY_SECONDS", 30)
+    assert [outbox.backoff_seconds(n) for n in (1, 2, 3)] == [30, 60, 120]
+    assert outbox.backoff_seconds(20) == outbox.MAX_RETRY_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_unknown_kinds_are_refused_before_touching_the_database():
+    with pytest.raises(ValueError):
+        await outbox.enqueue(None, "carrier_pigeon", {})
+    with pytest.raises(ValueError):
+        await outbox.enqueue_push(None, "fax_sent", order_number="SO-1")
+
+
+@pytest.mark.asyncio
+async def test_a_retried_push_goes_only_to_the_unreached(monkeypatch):
+    pywebpush = pytest.importorskip("pywebpush")
+    from app.api import notifications
+
+    class Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    down = {"https://push.example/503"}
+    received = []
+
+    def webpush(subscription_info, **_kw):
+        endpoint = subscription_info["endpoint"]
+        if endpoint.endswith("410"):
+            raise pywebpush.WebPushException("gone", response=Response(410))
+        if endpoint in down:
+            raise pywebpush.WebPushException("busy", response=Response(503))
+        received.append(endpoint)
+
+    monkeypatch.setattr(pywebpush, "webpush", webpush)
+    monkeypatch.setattr(notifications, "VAPID_PRIVATE_KEY", "raw-key")
+    monkeypatch.setattr(notifications, "_save_subscriptions", lambda: None)
+    subs = {e: {"subscription": {"endpoint": e}}
+            for e in (f"https://push.example/{n}" for n in (201, 410, 503))}
+    monkeypatch.setattr(notifications, "push_subscriptions", subs)
+
+    class Session:
+        payload = None
+
+        async def execute(self, _sql, params):
+            self.payload = json.loads(params["p"])
+
+    session = Session()
+    push = outbox.Event(7, "push", {
+        "notifier": "order_update",
+        "kwargs": {"order_number": "SO-1", "status": "shipped",
+                   "customer_name": "Ada"}})
+    with pytest.raises(outbox.RetryLater):
+        await outbox.HANDLERS["push"](session, push)
+    assert "https://push.example/410" not in subs, "410 is dropped"
+    assert session.payload["endpoints"] == ["https://push.example/503"]
+
+    down.clear()
+    await outbox.HANDLERS["push"](session, outbox.Event(7, "push",
+                                                        session.payload))
+    assert received == ["https://push.example/201",
+                        "https://push.example/503"], "each gets it once"
+
+
+@pytest.fixture
+def delivered(monkeypatch):
+    calls = []
+
+    async def record(session, ev):
+        await asyncio.sleep(0.05)
+        calls.append(ev.payload["n"])
+
+    async def flaky(session, ev):
+        await session.execute(text(
+            "INSERT INTO outbox_probe (n) VALUES (:n)"), {"n": ev.payload["n"]})
+        raise (outbox.RetryLater("later") if ev.payload.get("keep")
+               else RuntimeError("boom"))
+
+    monkeypatch.setitem(outbox.HANDLERS, "test", record)
+    monkeypatch.setitem(outbox.HANDLERS, "flaky", flaky)
+    return calls
+
+
+@pytest_asyncio.fixture
+async def maker():
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        c.execute(text("DROP TABLE IF EXISTS outbox_events"))
+        c.execute(text("DROP TABLE IF EXISTS outbox_probe"))
+        c.execute(text("CREATE TABLE outbox_probe (n INTEGER)"))
+        c.commit()
+        _apply_migration(c, "b7890123456a_outbox_events.py")
+        c.commit()
+    seng.dispose()
+    outbox._ready = None
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    async with eng.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS outbox_events"))
+        await conn.execute(text("DROP TABLE IF EXISTS outbox_probe"))
+    await eng.dispose()
+    outbox._ready = None
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_committed_events_are_delivered_once(maker, delivered):
+    async with maker() as s:
+        await outbox.enqueue(s, "test", {"n": 0})
+        await s.rollback()
+        for n in range(1, 6):
+            await outbox.enqueue(s, "test", {"n": n})
+        await s.commit()
+
+    async def dispatcher():
+        async with maker() as s:
+            return await outbox.dispatch_batch(s, limit=2)
+
+    while sum(await asyncio.gather(*(dispatcher() for _ in range(3)))):
+        pass
+    assert sorted(delivered) == [1, 2, 3, 4, 5]
+
+    async with maker() as s:
+        pending = (await s.execute(text(
+            "SELECT COUNT(*) FROM outbox_events WHERE dispatched_at IS NULL"
+        ))).scalar()
+        assert pending == 0
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_failures_back_off_then_give_up(maker, delivered, monkeypatch):
+    monkeypatch.setattr(outbox, "RETRY_SECONDS", 0)
+    monkeypatch.setattr(outbox, "MAX_ATTEMPTS", 2)
+    async with maker() as s:
+        await outbox.enqueue(s, "flaky", {"n": 1})
+        await outbox.enqueue(s, "flaky", {"n": 2, "keep": True})
+        await s.commit()
+
+        assert await outbox.dispatch_batch(s) == 2
+        assert await outbox.dispatch_batch(s) == 2
+        assert await outbox.dispatch_batch(s) == 0, "both have given up"
+
+        rows = (await s.execute(text("""
+            SELECT payload->>'n' AS n, attempts, last_error,
+                   failed_at IS NOT NULL AS failed
+              FROM outbox_events ORDER BY id
+        """))).fetchall()
+        assert [(r.n, r.attempts, r.failed) for r in rows] == [
+            ("1", 2, True), ("2", 2, True)]
+        assert rows[0].last_error == "RuntimeError: boom"
+
+        probes = (await s.execute(text(
+            "SELECT n FROM outbox_probe ORDER BY n"))).scalars().all()
+        assert probes == [2, 2], "only RetryLater keeps the handler's writes"
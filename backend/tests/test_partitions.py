@@ -0,0 +1,234 @@
+"""Monthly partitions and their archive.
+
+Properties guarded:
+  * month arithmetic and partition names agree with the SQL side;
+  * the migration rebuilds a plain table as monthly partitions without
+    losing a row, an index or a trigger, and widens its key with the month;
+  * future months are created ahead, and a row outside every month is
+    moved out of the default partition when its month is created;
+  * moving journal lines out of the default leaves the daily balances
+    their trigger keeps exactly as they were, and back-dated lines get a
+    month of their own too;
+  * a cold month archives to a verified file and restores intact, and a
+    hot month is refused.
+
+The conversion tests require real PostgreSQL (TEST_DATABASE_URL).
+"""
+import gzip
+import importlib.util
+import os
+from datetime import date
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import partitions
+from app.services.ledger import Line, post_entry
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+
+def _apply_migration(conn, filename: str):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    spec = importlib.util.spec_from_file_location(
+        f"mig_{filename[:12]}", VERSIONS / filename)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    with Operations.context(MigrationContext.configure(conn)):
+        mod.upgrade()
+
+
+def test_month_arithmetic_and_names():
+    assert partitions.add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert partitions.add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partitions.partition_name("audit_logs", date(2026, 3, 1)) == "audit_logs_202603"
+    assert partitions.archivable_before(
+        "wifi_auth_logs", today=date(2026, 10, 19)) == date(2026, 4, 1)
+    assert set(partitions.HOT_MONTHS) == set(partitions.TABLES)
+
+
+@pytest_asyncio.fixture
+async def maker():
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        for t in partitions.TABLES:
+            c.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
+        c.execute(text("DROP TABLE IF EXISTS partition_archives"))
+        c.execute(text("DROP TABLE IF EXISTS chat_probe"))
+        c.execute(text("CREATE TABLE chat_probe (n INTEGER)"))
+        c.execute(text("""
+            CREATE TABLE chat_messages (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                channel VARCHAR(50) NOT NULL DEFAULT 'general',
+                text TEXT NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW())
+        """))
+        c.execute(text(
+            "CREATE INDEX ix_chat_messages_channel ON chat_messages (channel)"))
+        c.execute(text("""
+            CREATE OR REPLACE FUNCTION chat_probe_count() RETURNS trigger AS $$
+            BEGIN INSERT INTO chat_probe VALUES (1); RETURN NULL; END
+            $$ LANGUAGE plpgsql
+        """))
+        c.execute(text("""
+            CREATE TRIGGER trg_chat_probe AFTER INSERT ON chat_messages
+                FOR EACH ROW EXECUTE FUNCTION chat_probe_count()
+        """))
+        c.execute(text("""
+            INSERT INTO chat_messages (text, created_at)
+            SELECT 'm' || g, TIMESTAMPTZ '2025-01-15 12:00+00' + g * INTERVAL '20 days'
+              FROM generate_series(0, 9) g
+        """))
+        c.execute(text("DELETE FROM chat_probe"))
+        c.commit()
+        _apply_migration(c, "d9012345678c_monthly_partitions.py")
+        c.commit()
+    seng.dispose()
+    partitions._ready = None
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    async with eng.begin() as conn:
+        for t in partitions.TABLES:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
+        await conn.execute(text("DROP TABLE IF EXISTS partition_archives"))
+        await conn.execute(text("DROP TABLE IF EXISTS chat_probe"))
+    await eng.dispose()
+    partitions._ready = None
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_conversion_keeps_rows_indexes_and_triggers(maker):
+    async with maker() as s:
+        assert await partitions.partitioned_tables(s) == ["chat_messages"]
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM chat_messages"))).scalar() == 10
+        months = [p.month for p in await partitions.list_partitions(s, "chat_messages")]
+        assert months[0] == date(2025, 1, 1) and months[-1] is None
+
+        pk = (await s.execute(text("""
+            SELECT pg_get_constraintdef(oid) FROM pg_constraint
+             WHERE conrelid = 'chat_messages'::regclass AND contype = 'p'
+        """))).scalar()
+        assert pk == "PRIMARY KEY (id, created_at)"
+        assert (await s.execute(text(
+            "SELECT to_regclass('ix_chat_messages_channel') IS NOT NULL"))).scalar()
+
+        await s.execute(text("INSERT INTO chat_messages (text) VALUES ('now')"))
+        assert (await s.execute(text("SELECT COUNT(*) FROM chat_probe"))).scalar() == 1
+
+        # A row past every month waits in the default partition until its
+        # month is created, then moves there.
+        await s.execute(text("""
+            INSERT INTO chat_messages (text, created_at)
+            VALUES ('later', TIMESTAMPTZ '2040-05-02 00:00+00')
+        """))
+        created = await partitions.ensure_partitions(s, today=date(2040, 5, 1), ahead=1)
+        assert created == ["chat_messages_204005", "chat_messages_204006"]
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM chat_messages_default"))).scalar() == 0
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM chat_messages_204005"))).scalar() == 1
+        assert await partitions.ensure_partitions(
+            s, today=date(2040, 5, 1), ahead=1) == []
+        await s.commit()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_cold_month_archives_and_restores(maker, tmp_path):
+    async with maker() as s:
+        with pytest.raises(HTTPException):
+            await partitions.archive_partition(
+                s, "chat_messages", date(2025, 1, 1), today=date(2025, 6, 1))
+
+        a = await partitions.archive_partition(
+            s, "chat_messages", date(2025, 1, 1), directory=tmp_path,
+            today=date(2026, 10, 19))
+        await s.commit()
+        assert (a.name, a.rows) == ("chat_messages_202501", 2)
+        with gzip.open(a.path, "rt") as f:
+            assert f.readline().startswith("id,channel,text,created_at")
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM chat_messages"))).scalar() == 8
+        assert (await s.execute(text(
+            "SELECT to_regclass('chat_messages_202501')"))).scalar() is None
+
+        assert await partitions.restore_partition(
+            s, "chat_messages", date(2025, 1, 1)) == 2
+        await s.commit()
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM chat_messages"))).scalar() == 10
+        restored = (await s.execute(text(
+            "SELECT restored_at IS NOT NULL FROM partition_archives"))).scalar()
+        assert restored
+
+
+@pytest_asyncio.fixture
+async def books():
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        c.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
+        for t in ("gl_account_daily_balances", "gl_journal_lines",
+                  "gl_journal_entries", "gl_periods", "gl_accounts",
+                  "partition_archives"):
+            c.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
+        c.commit()
+        _apply_migration(c, "m2345678901l_general_ledger.py")
+        _apply_migration(c, "u0123456789t_gl_daily_balances.py")
+        _apply_migration(c, "d9012345678c_monthly_partitions.py")
+        c.commit()
+    seng.dispose()
+    partitions._ready = None
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    async with eng.begin() as conn:
+        for t in ("gl_account_daily_balances", "gl_journal_lines",
+                  "gl_journal_entries", "gl_periods", "gl_accounts",
+                  "partition_archives"):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
+    await eng.dispose()
+    partitions._ready = None
+
+
+async def _daily_balances(s):
+    return (await s.execute(text("""
+        SELECT account_id, entry_date, debit, credit
+          FROM gl_account_daily_balances ORDER BY 1, 2
+    """))).fetchall()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_moving_lines_out_of_default_keeps_daily_balances(books):
+    async with books() as s:
+        for day in (date(2040, 5, 10), date(2001, 3, 4)):
+            await post_entry(
+                s, entry_date=day, description="Outside every month",
+                source_module="test",
+                lines=[Line("1100", debit="250.00"),
+                       Line("4100", credit="250.00")])
+        await s.commit()
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM gl_journal_lines_default"))).scalar() == 4
+        before = await _daily_balances(s)
+        assert len(before) == 4
+
+        created = await partitions.ensure_partitions(s)
+        await s.commit()
+        assert {"gl_journal_lines_204005",
+                "gl_journal_lines_200103"} <= set(created)
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM gl_journal_lines_default"))).scalar() == 0
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM gl_journal_lines_204005"))).scalar() == 2
+        assert await _daily_balances(s) == before
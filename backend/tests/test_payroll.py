@@ -25,7 +25,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.services.payroll import (
-    compute_paye, load_rate_config, calculate_payslip, money)
+    attendance_totals, compute_paye, load_rate_config, calculate_payslip, money)
 from app.services.payroll_run import create_payroll_run, approve_payroll_run
 from app.services.ledger import trial_balance
 
@@ -94,6 +94,7 @@ async def engine():
         c.commit()
         _apply(c, "m2345678901l_general_ledger.py")
         _apply(c, "o4567890123n_payroll.py")
+        _apply(c, "y4567890123x_attendance_clock_in_index.py")
         c.commit()
     seng.dispose()
     eng = create_async_engine(TEST_DB, future=True)
@@ -319,6 +320,34 @@ async def test_overtime_paid_at_multiplier(session):
     assert slip.gross == Decimal("190000.00")
 
 
+@pytest.mark.asyncio
+async def test_attendance_totals_cover_the_whole_period_in_one_query(session):
+    a = await make_staff(session, basic="0", mode="hourly", hourly="1000")
+    b = await make_staff(session, basic="0", mode="hourly", hourly="1000")
+    for sid, clock_in, hours, status in [
+        (a, "2026-07-01 08:00", "8", "completed"),
+        (a, "2026-07-31 22:30", "6", "completed"),   # last day counts
+        (a, "2026-08-01 08:00", "9", "completed"),   # next period
+        (a, "2026-07-15 08:00", "5", "open"),        # not clocked out
+        (b, "2026-07-10 08:00", "7.5", "completed"),
+    ]:
+        await session.execute(text("""
+            INSERT INTO attendance (staff_id, clock_in, hours_worked, status)
+            VALUES (:s, CAST(:c AS timestamp), :h, :st)
+        """), {"s": str(sid), "c": clock_in, "h": hours, "st": status})
+    await session.commit()
+
+    totals = await attendance_totals(
+        session, period_start=date(2026, 7, 1), period_end=date(2026, 7, 31))
+    assert totals[str(a)] == (Decimal("14"), 2)
+    assert totals[str(b)] == (Decimal("7.5"), 1)
+
+    only_b = await attendance_totals(
+        session, period_start=date(2026, 7, 1), period_end=date(2026, 7, 31),
+        staff_ids=[b])
+    assert set(only_b) == {str(b)}
+
+
 @pytest.mark.asyncio
 async def test_tax_exempt_staff_pay_no_paye(session):
     await confirm_rates(session)
@@ -0,0 +1,75 @@
+"""Per-request query profiling.
+
+Properties guarded:
+  * statements are attributed to the request that ran them, and statements
+    outside any request are not counted;
+  * the response carries the count and database time;
+  * the per-endpoint window keys on the route template, not the raw path,
+    and ranks endpoints by p95.
+
+Runs against an in-memory SQLite engine, so it needs no database server.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.services import perf
+
+
+@pytest.fixture
+def client():
+    engine = create_engine("sqlite://")
+    perf.install(engine)
+    stats = perf.EndpointStats(window=50)
+
+    app = FastAPI()
+    app.add_middleware(perf.QueryProfilerMiddleware, stats=stats)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        with engine.connect() as conn:
+            for _ in range(item_id):
+                conn.execute(text("SELECT 1"))
+        return {"ok": True}
+
+    with TestClient(app) as c:
+        c.engine, c.stats = engine, stats
+        yield c
+    engine.dispose()
+
+
+def test_counts_statements_of_the_request(client):
+    r = client.get("/items/3")
+    assert r.status_code == 200
+    assert r.headers["x-db-queries"] == "3"
+    assert float(r.headers["x-db-time-ms"]) >= 0
+    assert r.headers["server-timing"].startswith("db;dur=")
+
+
+def test_statements_outside_a_request_are_not_counted(client):
+    with client.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert perf.current() is None
+    assert client.get("/items/1").headers["x-db-queries"] == "1"
+
+
+def test_window_keys_on_route_template_and_ranks_by_queries(client):
+    for n in (1, 2, 9):
+        client.get(f"/items/{n}")
+    client.get("/nope")
+
+    rows = {r["endpoint"]: r for r in client.stats.summary(sort="max_queries")}
+    assert set(rows) == {"GET /items/{item_id}", "GET <unmatched>"}
+    items = rows["GET /items/{item_id}"]
+    assert items["requests"] == 3
+    assert items["max_queries"] == 9
+    assert items["p95_queries"] == 9
+
+
+def test_slowest_statements_are_kept_in_order():
+    s = perf.RequestStats()
+    for ms in (5, 1, 9, 3, 7):
+        s.record(f"SELECT {ms}", float(ms))
+    assert s.queries == 5 and s.db_ms == 25.0
+    assert [ms for ms, _ in s.slowest] == [9.0, 7.0, 5.0]
@@ -0,0 +1,151 @@
+"""Type-ahead search.
+
+Properties guarded:
+  * exact, then prefix, then word-prefix matches rank above plain substrings;
+  * a term with nothing to match never reaches the database;
+  * extending a term whose cached result was complete is answered from the
+    cache, and an incomplete result is never used that way;
+  * against PostgreSQL, one statement returns ranked hits per kind, and
+    staff match on their full name, so a first and last name typed
+    together find them.
+"""
+import os
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import search as search_svc
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+needs_db = pytest.mark.skipif(not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+
+class _NoDatabase:
+    async def execute(self, *a, **kw):
+        raise AssertionError("search should not have queried the database")
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    search_svc.clear_cache()
+    yield
+    search_svc.clear_cache()
+
+
+def test_tiers_rank_exact_prefix_word_then_substring():
+    t = search_svc._tier
+    assert t("amox", ["amox"]) == 3
+    assert t("amox", ["Amoxicillin 500mg", None]) == 2
+    assert t("amox", ["Co amoxiclav"]) == 1
+    assert t("amox", ["Co-amoxiclav"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_blank_or_punctuation_term_short_circuits():
+    out = await search_svc.search(_NoDatabase(), term="  -- ", kinds=["products"])
+    assert out["source"] == "none"
+    assert out["results"] == {"products": []}
+
+
+@pytest.mark.asyncio
+async def test_longer_term_filters_a_complete_cached_result():
+    hits = [
+        {"kind": "products", "id": "1", "label": "Co-amoxiclav", "detail": "P1",
+         "tier": 0, "_values": ["Co-amoxiclav", "P1"]},
+        {"kind": "products", "id": "2", "label": "Amoxicillin", "detail": "P2",
+         "tier": 2, "_values": ["Amoxicillin", "P2"]},
+        {"kind": "products", "id": "3", "label": "Amodiaquine", "detail": "P3",
+         "tier": 2, "_values": ["Amodiaquine", "P3"]},
+    ]
+    search_svc._remember(("amo", ("products",), 10), True, hits)
+
+    out = await search_svc.search(_NoDatabase(), term="Amox", kinds=["products"])
+    assert out["source"] == "prefix"
+    assert [h["id"] for h in out["results"]["products"]] == ["2", "1"]
+    assert out["results"]["products"][0]["match"] == "prefix"
+
+
+@pytest.mark.asyncio
+async def test_incomplete_cached_result_is_not_reused():
+    search_svc._remember(("amo", ("products",), 1), False, [
+        {"kind": "products", "id": "2", "label": "Amoxicillin", "detail": "P2",
+         "tier": 2, "_values": ["Amoxicillin", "P2"]}])
+    with pytest.raises(AssertionError):
+        await search_svc.search(
+            _NoDatabase(), term="amox", kinds=["products"], limit=1)
+
+
+@pytest_asyncio.fixture
+async def session():
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    async with eng.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for t in ("products", "customers", "employees"):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
+        await conn.execute(text("""
+            CREATE TABLE products (id UUID PRIMARY KEY, sku VARCHAR(64),
+                                   name VARCHAR(255))"""))
+        await conn.execute(text("""
+            CREATE TABLE customers (id UUID PRIMARY KEY, customer_code
+                                    VARCHAR(32), name VARCHAR(255),
+                                    phone VARCHAR(50), email VARCHAR(255),
+                                    is_active BOOLEAN DEFAULT TRUE)"""))
+        await conn.execute(text("""
+            CREATE TABLE employees (id UUID PRIMARY KEY,
+                                    employee_number VARCHAR(32),
+                                    first_name VARCHAR(128) NOT NULL,
+                                    last_name VARCHAR(128) NOT NULL,
+                                    is_active BOOLEAN DEFAULT TRUE)"""))
+    maker = sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as s:
+        yield s
+    await eng.dispose()
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_ranked_results_per_kind(session):
+    for sku, name in (("P-1", "Co-amoxiclav 625"), ("P-2", "Amoxicillin 500"),
+                      ("AMOX", "Capsule shell"), ("P-4", "Paracetamol")):
+        await session.execute(text(
+            "INSERT INTO products (id, sku, name) VALUES (:i, :s, :n)"),
+            {"i": uuid.uuid4(), "s": sku, "n": name})
+    await session.execute(text("""
+        INSERT INTO customers (id, customer_code, name, phone)
+        VALUES (:i, 'C-1', 'Amoxil Pharmacy', '0803')"""), {"i": uuid.uuid4()})
+    await session.commit()
+
+    out = await search_svc.search(
+        session, term="amox", kinds=["products", "customers"])
+    assert out["source"] == "database"
+    assert [h["detail"] for h in out["results"]["products"]] == [
+        "AMOX", "P-2", "P-1"]
+    assert out["results"]["customers"][0]["label"] == "Amoxil Pharmacy"
+
+    again = await search_svc.search(
+        session, term="amox", kinds=["products", "customers"])
+    assert again["source"] == "cache"
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_staff_match_on_the_full_name(session):
+    for number, first, last in (("E-1", "Ada", "Obi"), ("E-2", "Grace", "Adams")):
+        await session.execute(text("""
+            INSERT INTO employees (id, employee_number, first_name, last_name)
+            VALUES (:i, :n, :f, :l)"""),
+            {"i": uuid.uuid4(), "n": number, "f": first, "l": last})
+    await session.commit()
+
+    out = await search_svc.search(session, term="ada obi", kinds=["staff"])
+    assert [(h["label"], h["match"]) for h in out["results"]["staff"]] == [
+        ("Ada Obi", "exact")]
+
+    out = await search_svc.search(session, term="ada", kinds=["staff"])
+    assert [(h["label"], h["match"]) for h in out["results"]["staff"]] == [
+        ("Ada Obi", "prefix"), ("Grace Adams", "word")]
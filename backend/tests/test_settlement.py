@@ -32,6 +32,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.services.ledger import money
 from app.services.receivables import record_payment
+from app.services import settlement_rollup
 from app.services.settlement import (
     apportion, build_plan, distribute_payment, refund_settlement,
     retry_failed_settlements, settlement_health)
@@ -44,6 +45,7 @@ pytestmark = pytest.mark.skipif(
 # importing the whole application schema: a test that needs 60 tables to
 # demonstrate a payment split is testing the wrong thing.
 SCHEMA = """
+DROP TABLE IF EXISTS settlement_daily_rollup CASCADE;
 DROP TABLE IF EXISTS mapd_audit_logs CASCADE;
 DROP TABLE IF EXISTS mapd_refunds CASCADE;
 DROP TABLE IF EXISTS settlement_details CASCADE;
@@ -159,6 +161,8 @@ async def engine():
         c.commit()
         _apply_migration(c, "s8901234567r_mapd_settlement.py")
         c.commit()
+        _apply_migration(c, "x3456789012w_settlement_daily_rollup.py")
+        c.commit()
     seng.dispose()
     eng = create_async_engine(TEST_DB, future=True)
     yield eng
@@ -983,3 +987,82 @@ async def test_plan_writes_nothing(session):
     count = (await session.execute(
         text("SELECT COUNT(*) FROM settlements"))).scalar()
     assert count == 0
+
+
+# ---------------------------------------------------------------------------
+# the daily rollup behind the reports
+# ---------------------------------------------------------------------------
+
+async def rollup_rows(session, dimension):
+    rows = (await session.execute(text("""
+        SELECT key_id, cash, obligations, settlements
+          FROM settlement_daily_rollup WHERE dimension = :d
+    """), {"d": dimension})).fetchall()
+    return {str(r.key_id): (money(r.cash), money(r.obligations),
+                            r.settlements) for r in rows}
+
+
+@pytest.mark.asyncio
+async def test_rollup_follows_distribution_and_full_refund(session):
+    """Distributing adds to the day; a full refund takes it back out."""
+    hera = await make_account(session, "HERA", "Hera", gl="1250")
+    honey = await make_account(session, "HONEY", "Honey", gl="1100")
+    p1 = await make_product(session, "P1", "Hera Gel")
+    p2 = await make_product(session, "P2", "Honey Gauze")
+    await map_product(session, p1, hera)
+    await map_product(session, p2, honey)
+
+    sids = []
+    for ref in ("ROLL-1", "ROLL-2"):
+        invoice_id, _, total = await make_invoice(
+            session, [(p1, 1, "600.00"), (p2, 2, "200.00")])
+        result = await record_payment(
+            session, invoice_id=invoice_id, amount=total,
+            payment_method="bank_transfer", reference=ref)
+        await session.commit()
+        sids.append(result["settlement"]["settlement_id"])
+
+    by_account = await rollup_rows(session, "account")
+    assert by_account[str(hera)] == (Decimal("1200.00"), Decimal("0.00"), 2)
+    assert by_account[str(honey)] == (Decimal("800.00"), Decimal("0.00"), 2)
+    # Two settlements, each touching two accounts: counted once per day.
+    total_row = (await rollup_rows(session, "total"))[settlement_rollup.NIL]
+    assert total_row == (Decimal("2000.00"), Decimal("0.00"), 2)
+
+    items = await settlement_rollup.revenue(session, group_by="product")
+    assert [(i["label"], money(i["cash"]), i["settlements"]) for i in items] == [
+        ("Hera Gel", Decimal("1200.00"), 2), ("Honey Gauze", Decimal("800.00"), 2)]
+
+    await refund_settlement(session, settlement_id=sids[0],
+                            reason="Whole order returned")
+    await session.commit()
+    total_row = (await rollup_rows(session, "total"))[settlement_rollup.NIL]
+    assert total_row == (Decimal("1000.00"), Decimal("0.00"), 1)
+
+
+@pytest.mark.asyncio
+async def test_rollup_rebuild_matches_the_incremental_figures(session):
+    bank = await make_account(session, "BANK", "Main Bank", gl="1200")
+    commission = await make_account(
+        session, "COMM", "Distributor Commission", gl="6310",
+        kind="OBLIGATION", contra="2510")
+    pid = await make_product(session, "P1", "Product")
+    await map_product(session, pid, bank)
+    await make_rule(session, "COMM-RULE", pid, [
+        (bank, 'CASH', 100, False),
+        (commission, 'OBLIGATION', 10, False),
+    ])
+    invoice_id, _, total = await make_invoice(session, [(pid, 3, "1000.00")])
+    await record_payment(session, invoice_id=invoice_id, amount=total,
+                         payment_method="cash", reference="REBUILD")
+    await session.commit()
+
+    before = {d: await rollup_rows(session, d)
+              for d in ("product", "account", "business_unit", "total")}
+    assert before["total"][settlement_rollup.NIL] == (
+        Decimal("3000.00"), Decimal("300.00"), 1)
+
+    await settlement_rollup.rebuild(session)
+    await session.commit()
+    after = {d: await rollup_rows(session, d) for d in before}
+    assert after == before
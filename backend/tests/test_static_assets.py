@@ -0,0 +1,114 @@
+"""The static asset server.
+
+Properties guarded:
+  * hashed bundle files are sent immutable, everything else revalidates;
+  * a pre-built `.br`/`.gz` copy is served to clients that accept it, and
+    textual files without one are compressed once at index time;
+  * If-None-Match and If-Modified-Since are answered with 304;
+  * only indexed files are served, so traversal finds nothing;
+  * the compression middleware leaves the encoded responses alone.
+
+No database needed.
+"""
+import gzip
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient
+
+from app.services import compression, static_assets
+
+BUNDLE = ("console.log('wound care');\n" * 400).encode()
+
+
+@pytest.fixture
+def build(tmp_path):
+    (tmp_path / "static" / "js").mkdir(parents=True)
+    js = tmp_path / "static" / "js" / "main.51fd89a1.js"
+    js.write_bytes(BUNDLE)
+    br = tmp_path / "static" / "js" / "main.51fd89a1.js.br"
+    br.write_bytes(b"pretend-brotli")
+    os.utime(br, (js.stat().st_mtime + 1,) * 2)
+    (tmp_path / "manifest.json").write_text('{"name": "AstroBSM"}')
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + b"\x00" * 4000)
+    return tmp_path
+
+
+@pytest.fixture
+def client(build):
+    index = static_assets.AssetIndex.build(build)
+    app = FastAPI()
+    app.add_middleware(compression.CompressionMiddleware)
+
+    @app.get("/{full_path:path}")
+    async def serve(full_path: str, request: Request):
+        response = index.response(request, full_path)
+        if response is None:
+            return JSONResponse({"error": "File not found"}, status_code=404)
+        return response
+
+    return AsyncClient(transport=ASGITransport(app=app),
+                       base_url="http://test")
+
+
+def test_index_keeps_sidecars_and_compresses_text_once(build):
+    index = static_assets.AssetIndex.build(build)
+    assert len(index) == 3, "sidecars are variants, not files"
+    js = index.get("static/js/main.51fd89a1.js")
+    assert js.media_type == "application/javascript"
+    assert js.cache_control == static_assets.IMMUTABLE
+    assert js.variants["br"].body == b"pretend-brotli"
+    assert gzip.decompress(js.variants["gzip"].body) == BUNDLE
+    logo = index.get("logo.png")
+    assert set(logo.variants) == {None}
+    assert logo.cache_control == static_assets.REVALIDATE
+
+
+@pytest.mark.asyncio
+async def test_variants_follow_accept_encoding(client):
+    async with client as ac:
+        r = await ac.get("/static/js/main.51fd89a1.js",
+                         headers={"Accept-Encoding": "gzip, br"})
+        assert r.headers["content-encoding"] == "br"
+        assert r.headers["cache-control"] == static_assets.IMMUTABLE
+        assert r.headers["vary"] == "Accept-Encoding"
+
+        r = await ac.get("/static/js/main.51fd89a1.js",
+                         headers={"Accept-Encoding": "gzip"})
+        assert r.headers["content-encoding"] == "gzip"
+        assert r.content == BUNDLE
+
+        r = await ac.get("/static/js/main.51fd89a1.js",
+                         headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in r.headers
+        assert r.content == BUNDLE
+
+
+@pytest.mark.asyncio
+async def test_conditional_requests_get_304(client):
+    async with client as ac:
+        first = await ac.get("/logo.png")
+        assert first.status_code == 200
+        etag, modified = first.headers["etag"], first.headers["last-modified"]
+
+        again = await ac.get("/logo.png", headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.content == b""
+        assert again.headers["etag"] == etag
+
+        again = await ac.get("/logo.png", headers={"If-Modified-Since": modified})
+        assert again.status_code == 304
+
+        stale = await ac.get("/logo.png", headers={"If-None-Match": '"other"'})
+        assert stale.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_only_indexed_files_are_served(client, build):
+    (build.parent / "secret.env").write_text("SECRET_KEY=x")
+    async with client as ac:
+        for path in ("/../secret.env", "/static/js/main.51fd89a1.js.br",
+                     "/missing.js"):
+            r = await ac.get(path)
+            assert r.status_code == 404, path
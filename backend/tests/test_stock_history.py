@@ -0,0 +1,262 @@
+"""Point-in-time stock positions from monthly checkpoints.
+
+Properties guarded:
+  * each month's checkpoint equals a replay of every movement before it,
+    and no month is built before its grace period has passed;
+  * a position on any day is the checkpoint plus the movements since, valued
+    at the weighted average cost of the costed inbound movements so far;
+  * deleting a movement behind a checkpoint rewrites the checkpoints from
+    that month on, and answers change accordingly;
+  * checkpoints fall on the stock_movements partition bounds, so once a
+    month is archived every day of the next month still answers;
+  * a correction inside an archived month leaves the checkpoints alone
+    until the month is restored, and no first build starts without it.
+
+Requires real PostgreSQL (TEST_DATABASE_URL).
+"""
+import importlib.util
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import partitions, stock_history
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(
+    not TEST_DB, reason="TEST_DATABASE_URL not set")
+VERSIONS = Path(__file__).resolve().parent.parent / "alembic" / "versions"
+
+SCHEMA = """
+DROP TABLE IF EXISTS stock_checkpoints CASCADE;
+DROP TABLE IF EXISTS stock_checkpoint_months CASCADE;
+DROP TABLE IF EXISTS stock_checkpoint_stale CASCADE;
+DROP TABLE IF EXISTS partition_archives CASCADE;
+DROP TABLE IF EXISTS stock_movements CASCADE;
+DROP TABLE IF EXISTS products CASCADE;
+DROP TABLE IF EXISTS raw_materials CASCADE;
+DROP TABLE IF EXISTS warehouses CASCADE;
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+CREATE TABLE warehouses (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                         name VARCHAR(255));
+CREATE TABLE products (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                       sku VARCHAR(64), name VARCHAR(255));
+CREATE TABLE raw_materials (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                            sku VARCHAR(64), name VARCHAR(255));
+CREATE TABLE stock_movements (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    warehouse_id UUID NOT NULL, product_id UUID, raw_material_id UUID,
+    movement_type VARCHAR(32) NOT NULL, quantity NUMERIC(18,6) NOT NULL,
+    unit_cost NUMERIC(18,6), reference VARCHAR(255), notes TEXT,
+    created_by UUID, created_at TIMESTAMPTZ DEFAULT NOW())
+"""
+
+WH = uuid.uuid4()
+SOAP = uuid.uuid4()
+
+# (business day, type, quantity, unit cost). Noon Lagos time.
+MOVES = [
+    (date(2026, 1, 10), "IN", 100, 2),
+    (date(2026, 1, 20), "OUT", 30, None),
+    (date(2026, 2, 5), "IN", 50, 5),
+    (date(2026, 2, 28), "DAMAGE", 20, None),
+    (date(2026, 3, 15), "OUT", 40, None),
+]
+
+
+def _apply_migration(conn, filename: str):
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    spec = importlib.util.spec_from_file_location(
+        f"mig_{filename[:12]}", VERSIONS / filename)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    with Operations.context(MigrationContext.configure(conn)):
+        mod.upgrade()
+
+
+def _at(day: date) -> datetime:
+    return stock_history.starts_at(day) + timedelta(hours=12)
+
+
+def _engine(partition: bool):
+    seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
+    with seng.connect() as c:
+        for stmt in SCHEMA.split(";"):
+            if stmt.strip():
+                c.execute(text(stmt))
+        c.commit()
+        if partition:
+            _apply_migration(c, "d9012345678c_monthly_partitions.py")
+        _apply_migration(c, "e0123456789d_stock_checkpoints.py")
+        c.execute(text("INSERT INTO warehouses (id, name) VALUES (:w, 'Main')"),
+                  {"w": str(WH)})
+        c.execute(text(
+            "INSERT INTO products (id, sku, name) VALUES (:p, 'SP-1', 'Soap')"),
+            {"p": str(SOAP)})
+        for day, kind, qty, cost in MOVES:
+            c.execute(text("""
+                INSERT INTO stock_movements (warehouse_id, product_id,
+                    movement_type, quantity, unit_cost, reference, created_at)
+                VALUES (:w, :p, :k, :q, :c, :ref, :at)
+            """), {"w": str(WH), "p": str(SOAP), "k": kind, "q": qty,
+                   "c": cost, "ref": f"{kind}-{day}", "at": _at(day)})
+        c.commit()
+    seng.dispose()
+    stock_history._ready = partitions._ready = None
+    return create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+
+
+@pytest_asyncio.fixture
+async def maker():
+    eng = _engine(partition=False)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    await eng.dispose()
+    stock_history._ready = partitions._ready = None
+
+
+@pytest_asyncio.fixture
+async def partitioned():
+    eng = _engine(partition=True)
+    yield sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    await eng.dispose()
+    stock_history._ready = partitions._ready = None
+
+
+async def _on_hand(s, day: date):
+    result = await stock_history.stock_as_of(s, day, warehouse_id=WH)
+    assert len(result.positions) <= 1
+    return result.positions[0] if result.positions else None
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_and_positions_match_a_full_replay(maker):
+    async with maker() as s:
+        built = await stock_history.build_checkpoints(
+            s, now=datetime(2026, 3, 31, 23, 30, tzinfo=timezone.utc))
+        await s.commit()
+        assert built == [date(2026, 2, 1), date(2026, 3, 1)], \
+            "April starts at UTC midnight, as the partitions do"
+
+        rows = dict((await s.execute(text(
+            "SELECT as_of, quantity FROM stock_checkpoints ORDER BY as_of"
+        ))).fetchall())
+        assert rows == {date(2026, 2, 1): Decimal("70"),
+                        date(2026, 3, 1): Decimal("100")}
+
+        jan = await _on_hand(s, date(2026, 1, 31))
+        assert (jan.quantity, jan.unit_cost, jan.value) == (
+            Decimal("70"), Decimal("2.000000"), Decimal("140.00"))
+
+        mid_feb = await stock_history.stock_as_of(s, date(2026, 2, 10))
+        assert mid_feb.checkpoint == date(2026, 2, 1)
+        # (100 * 2 + 50 * 5) / 150
+        assert mid_feb.positions[0].quantity == Decimal("120")
+        assert mid_feb.positions[0].unit_cost == Decimal("3.000000")
+
+        assert (await _on_hand(s, date(2026, 3, 20))).quantity == Decimal("60")
+        assert await _on_hand(s, date(2025, 12, 31)) is None
+
+
+@pytest.mark.asyncio
+async def test_a_deleted_movement_rewrites_later_checkpoints(maker):
+    async with maker() as s:
+        await stock_history.build_checkpoints(
+            s, now=datetime(2026, 4, 2, tzinfo=timezone.utc))
+        await s.commit()
+        assert (await _on_hand(s, date(2026, 2, 28))).quantity == Decimal("100")
+
+        await s.execute(text(
+            "DELETE FROM stock_movements WHERE reference = 'OUT-2026-01-20'"))
+        await s.commit()
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM stock_checkpoint_stale"))).scalar() == 1
+
+        rebuilt = await stock_history.build_checkpoints(
+            s, now=datetime(2026, 4, 2, tzinfo=timezone.utc))
+        await s.commit()
+        assert rebuilt == [date(2026, 2, 1), date(2026, 3, 1), date(2026, 4, 1)]
+        assert (await _on_hand(s, date(2026, 2, 28))).quantity == Decimal("130")
+        assert (await _on_hand(s, date(2026, 4, 1))).quantity == Decimal("90")
+
+        # Writes stamped now are ahead of every checkpoint and mark nothing.
+        await s.execute(text("""
+            INSERT INTO stock_movements (warehouse_id, product_id,
+                                         movement_type, quantity)
+            VALUES (:w, :p, 'IN', 1)
+        """), {"w": str(WH), "p": str(SOAP)})
+        await s.commit()
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM stock_checkpoint_stale"))).scalar() == 0
+
+
+@pytest.mark.asyncio
+async def test_days_after_an_archived_month_still_answer(partitioned, tmp_path):
+    async with partitioned() as s:
+        # The movements went in after the migration, into the default.
+        await partitions.ensure_partitions(s, today=date(2026, 4, 2))
+        await stock_history.build_checkpoints(
+            s, now=datetime(2026, 4, 2, tzinfo=timezone.utc))
+        await s.commit()
+        await partitions.archive_partition(
+            s, "stock_movements", date(2026, 1, 1), directory=tmp_path,
+            today=date(2033, 6, 1))
+        await s.commit()
+
+        assert (await _on_hand(s, date(2026, 2, 1))).quantity == Decimal("70")
+        mid_feb = await stock_history.stock_as_of(s, date(2026, 2, 10))
+        assert mid_feb.checkpoint == date(2026, 2, 1)
+        assert mid_feb.positions[0].quantity == Decimal("120")
+
+        with pytest.raises(HTTPException) as archived:
+            await stock_history.stock_as_of(s, date(2026, 1, 20))
+        assert archived.value.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_over_an_archived_month_are_kept(partitioned, tmp_path):
+    async with partitioned() as s:
+        await partitions.ensure_partitions(s, today=date(2026, 4, 2))
+        await stock_history.build_checkpoints(
+            s, now=datetime(2026, 4, 2, tzinfo=timezone.utc))
+        await s.commit()
+        await partitions.archive_partition(
+            s, "stock_movements", date(2026, 1, 1), directory=tmp_path,
+            today=date(2033, 6, 1))
+        await s.commit()
+        before = (await s.execute(text(
+            "SELECT as_of, quantity FROM stock_checkpoints ORDER BY as_of"
+        ))).fetchall()
+
+        # Back-dated into January: it lands in the default partition.
+        await s.execute(text("""
+            INSERT INTO stock_movements (warehouse_id, product_id,
+                                         movement_type, quantity, created_at)
+            VALUES (:w, :p, 'OUT', 10, :at)
+        """), {"w": str(WH), "p": str(SOAP), "at": _at(date(2026, 1, 25))})
+        await s.commit()
+
+        assert await stock_history.build_checkpoints(
+            s, now=datetime(2026, 4, 2, tzinfo=timezone.utc)) == []
+        await s.commit()
+        assert (await s.execute(text(
+            "SELECT as_of, quantity FROM stock_checkpoints ORDER BY as_of"
+        ))).fetchall() == before
+        assert (await s.execute(text(
+            "SELECT COUNT(*) FROM stock_checkpoint_stale"))).scalar() == 1, \
+            "the mark waits for January to be restored"
+
+        await s.execute(text("DELETE FROM stock_checkpoint_months"))
+        await s.commit()
+        assert await stock_history.build_checkpoints(
+            s, now=datetime(2026, 4, 2, tzinfo=timezone.utc)) == []
@@ -0,0 +1,144 @@
+"""Stock-level lists.
+
+Properties guarded:
+  * the low-stock and warehouse filters are applied in SQL, and the match
+    count covers every matching row, not just the page returned;
+  * pages follow a stable item-then-warehouse order;
+  * each product row carries its priced units, aggregated once per page;
+  * raw materials without a stock row are listed at zero.
+
+Requires real PostgreSQL (TEST_DATABASE_URL).
+"""
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.services import stock_levels
+
+TEST_DB = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(
+    not TEST_DB, reason="TEST_DATABASE_URL not set")
+
+SCHEMA = """
+DROP TABLE IF EXISTS stock_levels CASCADE;
+DROP TABLE IF EXISTS product_pricing CASCADE;
+DROP TABLE IF EXISTS products CASCADE;
+DROP TABLE IF EXISTS raw_materials CASCADE;
+DROP TABLE IF EXISTS warehouses CASCADE;
+
+CREATE TABLE warehouses (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                         name VARCHAR(255));
+CREATE TABLE products (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                       sku VARCHAR(64), name VARCHAR(255), unit VARCHAR(32));
+CREATE TABLE product_pricing (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                              product_id UUID, unit VARCHAR(50));
+CREATE TABLE raw_materials (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                            sku VARCHAR(64), name VARCHAR(255),
+                            unit VARCHAR(50), reorder_level NUMERIC(18,6));
+CREATE TABLE stock_levels (id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                           warehouse_id UUID NOT NULL, product_id UUID,
+                           raw_material_id UUID,
+                           current_stock NUMERIC(18,6) NOT NULL DEFAULT 0,
+                           min_stock NUMERIC(18,6) DEFAULT 0,
+                           updated_at TIMESTAMPTZ DEFAULT NOW())
+"""
+
+
+@pytest_asyncio.fixture
+async def session():
+    eng = create_async_engine(TEST_DB, future=True, poolclass=NullPool)
+    async with eng.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
+        for stmt in SCHEMA.strip().split(";"):
+            if stmt.strip():
+                await conn.execute(text(stmt))
+    maker = sessionmaker(eng, class_=AsyncSession, expire_on_commit=False)
+    async with maker() as s:
+        yield s
+    await eng.dispose()
+
+
+async def _id(session, sql, params=None):
+    return (await session.execute(text(sql), params or {})).scalar()
+
+
+@pytest.mark.asyncio
+async def test_product_filters_and_pages_run_in_sql(session):
+    main = await _id(session, "INSERT INTO warehouses (name) VALUES ('Main') RETURNING id")
+    depot = await _id(session, "INSERT INTO warehouses (name) VALUES ('Depot') RETURNING id")
+    products = {}
+    for name in ("Bandage", "Gauze", "Plaster"):
+        products[name] = await _id(session, """
+            INSERT INTO products (sku, name, unit) VALUES (:n, :n, 'each')
+            RETURNING id""", {"n": name})
+    await session.execute(text("""
+        INSERT INTO product_pricing (product_id, unit)
+        VALUES (:g, 'pack'), (:g, 'box')"""), {"g": products["Gauze"]})
+    for name, wh, qty, min_stock in (("Bandage", main, 5, 0),
+                                     ("Bandage", depot, 50, 0),
+                                     ("Gauze", main, 20, 25),
+                                     ("Plaster", main, 100, 0)):
+        await session.execute(text("""
+            INSERT INTO stock_levels (warehouse_id, product_id, current_stock,
+                                      min_stock)
+            VALUES (:w, :p, :q, :m)"""),
+            {"w": wh, "p": products[name], "q": qty, "m": min_stock})
+    await session.commit()
+
+    rows, total = await stock_levels.product_levels(session)
+    assert total == 4
+    assert [(r["product_name"], r["warehouse_name"]) for r in rows] == [
+        ("Bandage", "Depot"), ("Bandage", "Main"),
+        ("Gauze", "Main"), ("Plaster", "Main")]
+    gauze = rows[2]
+    assert gauze["available_units"] == "box, pack"
+    assert gauze["reorder_level"] == 25 and gauze["is_low_stock"]
+    assert rows[0]["available_units"] == "each"
+
+    low, total = await stock_levels.product_levels(session, low_stock_only=True)
+    assert total == 2
+    assert {r["product_name"] for r in low} == {"Bandage", "Gauze"}
+
+    page, total = await stock_levels.product_levels(
+        session, warehouse_id=main, limit=2, offset=1)
+    assert total == 3
+    assert [r["product_name"] for r in page] == ["Gauze", "Plaster"]
+
+    past_end, total = await stock_levels.product_levels(
+        session, limit=2, offset=10)
+    assert past_end == [] and total == 4
+
+
+@pytest.mark.asyncio
+async def test_raw_materials_without_stock_are_listed_at_zero(session):
+    main = await _id(session, "INSERT INTO warehouses (name) VALUES ('Main') RETURNING id")
+    cotton = await _id(session, """
+        INSERT INTO raw_materials (sku, name, unit, reorder_level)
+        VALUES ('RM-1', 'Cotton', 'kg', 0) RETURNING id""")
+    await session.execute(text("""
+        INSERT INTO raw_materials (sku, name, unit, reorder_level)
+        VALUES ('RM-2', 'Zinc oxide', 'kg', 5)"""))
+    await session.execute(text("""
+        INSERT INTO stock_levels (warehouse_id, raw_material_id, current_stock)
+        VALUES (:w, :c, 40)"""), {"w": main, "c": cotton})
+    await session.commit()
+
+    rows, total = await stock_levels.raw_material_levels(session)
+    assert total == 2
+    assert [(r["raw_material_name"], r["current_stock"]) for r in rows] == [
+        ("Cotton", 40.0), ("Zinc oxide", 0.0)]
+    # A zero reorder level falls back to 10, as the screen always showed.
+    assert rows[0]["reorder_level"] == 10
+
+    low, total = await stock_levels.raw_material_levels(
+        session, low_stock_only=True)
+    assert total == 1 and low[0]["raw_material_name"] == "Zinc oxide"
+
+    in_main, total = await stock_levels.raw_material_levels(
+        session, warehouse_id=main)
+    assert total == 1 and in_main[0]["warehouse_name"] == "Main"
@@ -7,6 +7,8 @@ Properties guarded:
   * a period cannot be filed twice;
   * a filed return is a frozen snapshot -- a later ledger change does not
     rewrite it;
+  * computing a filed period returns the filed snapshot;
+  * the monthly comparison agrees with computing each month on its own;
   * remittance clears the VAT liability and only posts when posting is enabled.
 """
 import os
@@ -22,7 +24,8 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.services.tax import (
-    compute_vat_return, file_vat_return, record_vat_payment, list_vat_returns)
+    compute_vat_return, file_vat_return, record_vat_payment, list_vat_returns,
+    vat_returns_by_month)
 from app.services.ledger import Line, post_entry, account_ledger
 
 TEST_DB = os.getenv("TEST_DATABASE_URL")
@@ -48,13 +51,15 @@ async def engine():
     seng = create_engine(TEST_DB.replace("+asyncpg", ""), future=True)
     with seng.connect() as c:
         c.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
-        for t in ("vat_returns", "qc_inspections", "purchase_invoices",
+        for t in ("gl_account_daily_balances", "vat_returns", "qc_inspections",
+                  "purchase_invoices",
                   "gl_journal_lines", "gl_journal_entries", "gl_periods",
                   "gl_accounts"):
             c.execute(text(f"DROP TABLE IF EXISTS {t} CASCADE"))
         c.commit()
         _apply(c, "m2345678901l_general_ledger.py")
         _apply(c, "r7890123456q_tax_qc_costing.py")
+        _apply(c, "u0123456789t_gl_daily_balances.py")
         # A minimal purchase_invoices, since it is a runtime table the VAT
         # return reads from for input VAT.
         c.execute(text("""
@@ -194,6 +199,49 @@ async def test_filed_return_is_frozen_against_later_ledger_change(session):
     assert filed["output_vat"] == 7500.00
 
 
+@pytest.mark.asyncio
+async def test_compute_of_filed_period_returns_the_snapshot(session):
+    await _charge_output_vat(session, "7500")
+    await session.commit()
+    await file_vat_return(
+        session, start=date(2026, 7, 1), end=date(2026, 7, 31),
+        filed_by="Accountant")
+    await session.commit()
+    await _charge_output_vat(session, "9999", on=date(2026, 7, 25))
+    await session.commit()
+
+    filed = await compute_vat_return(
+        session, start=date(2026, 7, 1), end=date(2026, 7, 31))
+    assert filed["frozen"] is True and filed["output_vat"] == 7500.00
+
+    live = await compute_vat_return(
+        session, start=date(2026, 7, 1), end=date(2026, 7, 31),
+        use_filed=False)
+    assert live["frozen"] is False and live["output_vat"] == 17499.00
+
+
+@pytest.mark.asyncio
+async def test_monthly_comparison_matches_each_month(session):
+    await _charge_output_vat(session, "7500", on=date(2026, 7, 10))
+    await _charge_output_vat(session, "1200", on=date(2026, 8, 31))
+    await session.execute(text("""
+        INSERT INTO purchase_invoices (invoice_number, invoice_date, tax_amount)
+        VALUES ('PI-1', '2026-08-01', 300)
+    """))
+    await session.commit()
+
+    year = await vat_returns_by_month(session, year=2026)
+    assert len(year["months"]) == 12
+    for m in year["months"]:
+        one = await compute_vat_return(
+            session, start=date.fromisoformat(m["period"]["start"]),
+            end=date.fromisoformat(m["period"]["end"]))
+        assert (m["output_vat"], m["input_vat"], m["net_payable"]) == (
+            one["output_vat"], one["input_vat"], one["net_payable"])
+    assert year["months"][7]["net_payable"] == 900.00
+    assert year["totals"]["output_vat"] == 8700.00
+
+
 @pytest.mark.asyncio
 async def test_remittance_clears_the_liability_and_posts(session):
     await _charge_output_vat(session, "7500")
@@ -246,3 +246,94 @@ async def test_session_lifecycle_and_dashboard():
         )
         assert logout.status_code == 200
         assert logout.json()["sessions_closed"] == 1
+
+
+# --------------------------------------------------------------------------- #
+# Shared rate limiter / login lookup / buffered auth logs
+# --------------------------------------------------------------------------- #
+from app.services import rate_limit as rl_mod                      # noqa: E402
+from app.services import radius_service as radius_mod              # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limit_store_blocks_after_limit():
+    store = rl_mod.MemoryRateLimitStore()
+    results = [await store.hit("ip:1", limit=3, window_seconds=60)
+               for _ in range(4)]
+    assert results == [True, True, True, False]
+    # Keys are independent.
+    assert await store.hit("ip:2", limit=3, window_seconds=60) is True
+
+
+@pytest.mark.asyncio
+async def test_postgres_rate_limit_is_shared_between_workers():
+    """Two store instances stand in for two workers: the budget is shared, not
+    multiplied."""
+    key = f"test:{uuid.uuid4().hex}"
+    worker_a = rl_mod.PostgresRateLimitStore(db_mod.AsyncSessionLocal)
+    worker_b = rl_mod.PostgresRateLimitStore(db_mod.AsyncSessionLocal)
+    assert await worker_a.hit(key, limit=2, window_seconds=60) is True
+    assert await worker_b.hit(key, limit=2, window_seconds=60) is True
+    assert await worker_a.hit(key, limit=2, window_seconds=60) is False
+    assert await worker_b.hit(key, limit=2, window_seconds=60) is False
+
+
+@pytest.mark.asyncio
+async def test_find_user_by_email_or_phone_in_one_lookup():
+    phone = f"080{uuid.uuid4().int % 10**8:08d}"
+    uid, email = await create_user(phone=phone)
+    async with db_mod.AsyncSessionLocal() as s:
+        service = radius_mod.RadiusService(s)
+        by_email = await service._find_user(email.upper())
+        by_phone = await service._find_user(f" {phone} ")
+        missing = await service._find_user("nobody@example.com")
+    assert by_email.id == uid
+    assert by_phone.id == uid
+    assert missing is None
+
+
+@pytest.mark.asyncio
+async def test_auth_logs_are_buffered_then_flushed_in_one_batch():
+    buffer = radius_mod.AuthLogBuffer(
+        batch_size=100, flush_seconds=60,
+        session_factory=db_mod.AsyncSessionLocal)
+    marker = f"buffered_{uuid.uuid4().hex}@example.com"
+    async with db_mod.AsyncSessionLocal() as s:
+        service = radius_mod.RadiusService(s, log_buffer=buffer)
+        for _ in range(3):
+            result = await service.authenticate_user(marker, "whatever")
+            assert result.success is False
+    assert buffer.pending == 3
+
+    assert await buffer.flush() == 3
+    assert buffer.pending == 0
+    async with db_mod.AsyncSessionLocal() as s:
+        from sqlalchemy import select, func
+        n = (await s.execute(
+            select(func.count()).select_from(models_mod.WifiAuthLog)
+            .where(models_mod.WifiAuthLog.username == marker))).scalar()
+    assert n == 3
+
+
+@pytest.mark.asyncio
+async def test_a_full_batch_is_flushed_by_a_task_the_buffer_holds():
+    import asyncio
+    import gc
+
+    buffer = radius_mod.AuthLogBuffer(
+        batch_size=2, flush_seconds=60,
+        session_factory=db_mod.AsyncSessionLocal)
+    marker = f"batched_{uuid.uuid4().hex}@example.com"
+    for _ in range(2):
+        buffer.add({"username": marker, "authentication_result": "failure",
+                    "failure_reason": "invalid_credentials"})
+    assert len(buffer._flushes) == 1
+    gc.collect()
+    await asyncio.gather(*buffer._flushes)
+    assert buffer.pending == 0 and not buffer._flushes
+    async with db_mod.AsyncSessionLocal() as s:
+        from sqlalchemy import select, func
+        n = (await s.execute(
+            select(func.count()).select_from(models_mod.WifiAuthLog)
+            .where(models_mod.WifiAuthLog.username == marker))).scalar()
+    assert n == 2
@@ -7,7 +7,7 @@
 // bug.
 
 import React, { useState, useEffect, useCallback } from 'react';
-import { authedFetch } from './utils/api';
+import { authedFetch, openAuthed } from './utils/api';
 import { color, space, radius, font, naira } from './ui/theme';
 import {
   Icon, Card, SectionTitle, KpiCard, Chip, Btn, DataTable,
@@ -147,6 +147,7 @@ function ReportsTab() {
     ]).then(([a, b, c, e]) => { setTb(a); setPnl(b); setBs(c); setCf(e); }).catch((e) => setErr(e.message)).finally(() => setLoading(false));
   }, [start, end]);
   useEffect(() => { run(); }, []); // eslint-disable-line
+  const exportTb = (fmt) => openAuthed(`/api/exports/trial_balance?format=${fmt}&start=${start}&end=${end}`, { filename: `trial-balance-${start}-${end}.${fmt}` }).catch((e) => setErr(e.message));
   return (
     <div style={{ display: 'flex', flexDirection: 'column', gap: space(2) }}>
       <DateRange start={start} end={end} setStart={setStart} setEnd={setEnd} onGo={run} />
@@ -171,7 +172,11 @@ function ReportsTab() {
       )}
       {tb && (
         <Card>
-          <SectionTitle right={<span style={{ fontSize: 12.5, color: tb.balanced ? color.success : color.danger, fontWeight: 600 }}>Dr {money(tb.total_debit)} · Cr {money(tb.total_credit)}</span>}>Trial balance</SectionTitle>
+          <SectionTitle right={<div style={{ display: 'flex', gap: space(1), alignItems: 'center' }}>
+            <span style={{ fontSize: 12.5, color: tb.balanced ? color.success : color.danger, fontWeight: 600 }}>Dr {money(tb.total_debit)} · Cr {money(tb.total_credit)}</span>
+            <Btn size="sm" variant="secondary" onClick={() => exportTb('csv')}>CSV</Btn>
+            <Btn size="sm" variant="secondary" onClick={() => exportTb('xlsx')}>Excel</Btn>
+          </div>}>Trial balance</SectionTitle>
           <DataTable maxHeight={420}
             cols={[{ key: 'code', label: 'Code' }, { key: 'name', label: 'Account' }, { key: 'debit', label: 'Debit', align: 'right' }, { key: 'credit', label: 'Credit', align: 'right' }]}
             rows={tb.accounts || []} render={(r, c) => (c.key === 'debit' || c.key === 'credit') ? money(r[c.key]) : c.key === 'code' ? <span style={{ fontFamily: font.mono, color: color.textSecondary }}>{r.code}</span> : r[c.key]} />
@@ -210,6 +215,9 @@ function LedgerTab() {
   const [sel, setSel] = useState(null); const [ledger, setLedger] = useState(null);
   useEffect(() => { getJSON('/api/accounting/accounts').then((d) => setAccounts(d.accounts || d)).catch((e) => setErr(e.message)); }, []);
   const open = (code) => { setSel(code); setLedger(null); getJSON(`/api/accounting/accounts/${code}/ledger`).then(setLedger).catch((e) => setErr(e.message)); };
+  const more = () => getJSON(`/api/accounting/accounts/${sel}/ledger?cursor=${encodeURIComponent(ledger.next_cursor)}`)
+    .then((d) => setLedger((l) => ({ ...d, entries: [...l.entries, ...d.entries] }))).catch((e) => setErr(e.message));
+  const exportAs = (fmt) => openAuthed(`/api/accounting/accounts/${sel}/ledger/export?format=${fmt}`, { filename: `ledger-${sel}.${fmt}` }).catch((e) => setErr(e.message));
   return (
     <div style={{ display: 'flex', flexDirection: 'column', gap: space(2) }}>
       <ErrorBox msg={err} />
@@ -224,7 +232,7 @@ function LedgerTab() {
       </Card>
       {sel && (
         <Card>
-          <SectionTitle right={ledger && <span style={{ fontSize: 13, color: color.textSecondary }}>Closing <strong style={{ color: color.text }}>{money(ledger.closing_balance)}</strong></span>}>
+          <SectionTitle right={ledger && <span style={{ fontSize: 13, color: color.textSecondary }}>Opening <strong style={{ color: color.text }}>{money(ledger.opening_balance)}</strong> · Closing <strong style={{ color: color.text }}>{money(ledger.closing_balance)}</strong></span>}>
             Account ledger · {sel} {ledger?.account?.name ? `— ${ledger.account.name}` : ''}
           </SectionTitle>
           {!ledger ? <Loading /> : (
@@ -232,6 +240,13 @@ function LedgerTab() {
               cols={[{ key: 'date', label: 'Date' }, { key: 'description', label: 'Description', wrap: true }, { key: 'debit', label: 'Debit', align: 'right' }, { key: 'credit', label: 'Credit', align: 'right' }, { key: 'balance', label: 'Balance', align: 'right' }]}
               rows={ledger.entries || []} render={(r, c) => ['debit', 'credit', 'balance'].includes(c.key) ? money(r[c.key]) : r[c.key]} />
           )}
+          {ledger && (
+            <div style={{ display: 'flex', gap: space(1), justifyContent: 'flex-end', marginTop: space(1.5) }}>
+              {ledger.next_cursor && <Btn size="sm" variant="secondary" onClick={more}>Load more</Btn>}
+              <Btn size="sm" variant="secondary" onClick={() => exportAs('csv')}>Export CSV</Btn>
+              <Btn size="sm" variant="secondary" onClick={() => exportAs('xlsx')}>Export Excel</Btn>
+            </div>
+          )}
         </Card>
       )}
     </div>